@@ -1,7 +1,6 @@
 """Strategy Advisor (Agent 3) — Conversational chat agent for strategy questions."""
 
-from datetime import datetime
-
+from app import knowledge_cache
 from app.agents.base_agent import BaseAgent
 
 
@@ -18,23 +17,8 @@ class AdvisorAgent(BaseAgent):
             industry = strategy_context.get("industry", "")
             strategy_name = strategy_context.get("strategy_name", "")
 
-        # Load knowledge cache for enriched prompt
-        enrichment = ""
-        try:
-            from app.main import _knowledge_cache
-            cached_prompt = _knowledge_cache.get("system_prompt", "")
-            if cached_prompt:
-                enrichment = cached_prompt
-        except Exception:
-            pass
-
-        base = enrichment or f"""You are Stairs, an AI strategy assistant created by DEVONEERS.
-The current year is {datetime.now().year}.
-You help organizations build, execute, and monitor their strategic plans.
-Expert in: OKR, Balanced Scorecard, OGSM, Hoshin Kanri, Blue Ocean Strategy, Porter's frameworks.
-Philosophy: "Human IS the Loop" — you suggest, humans decide.
-Keep responses concise and actionable. Use Arabic when the user writes in Arabic.
-Format measurable items with clear targets, units, and timeframes."""
+        # Enriched when the Knowledge Engine is loaded, the basic prompt otherwise.
+        base = knowledge_cache.cache.current().system_prompt
 
         advisor_role = f"""
 
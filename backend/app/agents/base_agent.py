@@ -5,25 +5,14 @@ import uuid
 from datetime import datetime
 
 from app.ai_providers import call_ai_with_fallback, PROVIDER_DISPLAY
-from app.db.connection import get_pool
+from app import output_budget, telemetry
+from app.governor import current_org
+from app.singleflight import SingleFlight, key as flight_key
 
 logger = logging.getLogger("stairs.agents")
 
-# True once agent_logs has been seen to exist. Deliberately one-way: a table
-# that exists cannot stop existing under us, so the positive is cached and the
-# information_schema round-trip (once per agent per request, over the public
-# Postgres proxy) disappears. The negative is NOT cached, because
-# ensure_agent_logs_table() warns and continues on failure like every other
-# startup migration — so "missing" is a state the process can recover from, and
-# latching it would silently disable agent logging for the life of the process.
-# A missing table therefore costs one query per call, in an already-broken state.
-_agent_logs_table: bool = False
-
-
-def _reset_agent_logs_table_cache():
-    """Test hook — forget that we have seen the table."""
-    global _agent_logs_table
-    _agent_logs_table = False
+# Identical concurrent calls share one provider call (and one agent_logs row).
+agent_calls = SingleFlight("agent_call")
 
 
 class BaseAgent:
@@ -89,7 +78,15 @@ class BaseAgent:
         Args:
             log: write a row to agent_logs. Pass False when the caller logs a
                  richer row itself, so one AI call does not become two rows.
+
+        Concurrent calls with the same agent, arguments and context are
+        coalesced into one (app/singleflight.py), within one organization:
+        the call is metered and queued under the leader's.
         """
+        k = flight_key(current_org.get(), self.name, messages, strategy_context, max_tokens, task_type, log)
+        return await agent_calls.do(k, lambda: self._call(messages, strategy_context, max_tokens, task_type, log))
+
+    async def _call(self, messages: list, strategy_context: dict, max_tokens: int, task_type: str, log: bool) -> dict:
         system_prompt = self._build_system_prompt(strategy_context)
 
         # Inject Source of Truth context if available
@@ -118,7 +115,8 @@ class BaseAgent:
         result = await call_ai_with_fallback(
             messages=messages,
             system=system_prompt,
-            max_tokens=max_tokens,
+            max_tokens=output_budget.budget.limit(task_type, max_tokens),
+            task_type=task_type,
         )
 
         text = result.get("text", "")
@@ -155,6 +153,7 @@ class BaseAgent:
                 tokens_used=tokens,
                 model_used=model_used,
                 ok=ok,
+                output_tokens=result.get("output_tokens"),
             )
 
         return {
@@ -179,39 +178,25 @@ class BaseAgent:
         model_used: str = "",
         confidence_score: int = None,
         ok: bool = None,
+        output_tokens: int = None,
     ):
-        """Log agent call to the agent_logs database table.
+        """Queue a row for the agent_logs table. Written in the background by
+        app.telemetry, so logging does not hold up the response.
 
         ok is nullable: True/False for calls that went through call(), NULL for
         rows written before the column existed, so the transparency panel can
         separate dead calls from real ones instead of averaging them together.
         """
-        global _agent_logs_table
-        try:
-            pool = await get_pool()
-            async with pool.acquire() as conn:
-                if not _agent_logs_table:
-                    # Re-checked every call until it succeeds once; see the note
-                    # on _agent_logs_table for why the negative isn't cached.
-                    if await conn.fetchval(
-                        "SELECT EXISTS(SELECT 1 FROM information_schema.tables WHERE table_name = 'agent_logs')"
-                    ):
-                        _agent_logs_table = True
-                if _agent_logs_table:
-                    await conn.execute(
-                        "INSERT INTO agent_logs (id, strategy_id, agent_name, task_type, "
-                        "input_summary, output_summary, tokens_used, model_used, confidence_score, ok) "
-                        "VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)",
-                        str(uuid.uuid4()),
-                        strategy_id,
-                        self.name,
-                        task_type,
-                        input_summary[:500],
-                        output_summary[:500],
-                        tokens_used,
-                        model_used,
-                        confidence_score,
-                        ok,
-                    )
-        except Exception as e:
-            logger.warning("Failed to log agent call: %s", e)
+        telemetry.writer.record("agent_logs", (
+            str(uuid.uuid4()),
+            strategy_id,
+            self.name,
+            task_type,
+            (input_summary or "")[:500],
+            (output_summary or "")[:500],
+            tokens_used,
+            model_used,
+            confidence_score,
+            ok,
+            output_tokens,
+        ))
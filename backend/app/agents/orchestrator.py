@@ -10,9 +10,15 @@ from app.agents.advisor_agent import AdvisorAgent
 from app.agents.execution_agent import ExecutionAgent
 from app.agents.validation_agent import ValidationAgent
 from app.db.connection import get_pool
+from app.governor import current_org
+from app.singleflight import SingleFlight, key as flight_key
 
 logger = logging.getLogger("stairs.orchestrator")
 
+# Identical concurrent requests share one run of the whole agent chain,
+# validation and regeneration included.
+process_calls = SingleFlight("orchestrator")
+
 # Matrix/framework keywords that trigger the Strategy Agent
 _FRAMEWORK_KEYWORDS = [
     "ife matrix", "efe matrix", "space matrix", "bcg matrix",
@@ -181,7 +187,17 @@ class Orchestrator:
 
         Returns:
             Agent result dict with text, tokens, provider, plus validation data
+
+        Concurrent calls with the same arguments are coalesced into one run
+        (app/singleflight.py); a caller that goes away does not cancel it
+        for the others.
         """
+        # The organization is part of the key: the shared run bills usage and
+        # takes governor slots under the leader's org.
+        k = flight_key(current_org.get(), task_type, strategy_id, payload, strategy_context)
+        return await process_calls.do(k, lambda: self._process(task_type, strategy_id, payload, strategy_context))
+
+    async def _process(self, task_type: str, strategy_id: str, payload: dict, strategy_context: dict) -> dict:
         payload = payload or {}
         if strategy_context is None:
             strategy_context = await self._build_strategy_context(strategy_id)
@@ -2,6 +2,7 @@
 
 from datetime import datetime
 
+from app import knowledge_cache
 from app.agents.base_agent import BaseAgent
 
 
@@ -17,22 +18,7 @@ class StrategyAgent(BaseAgent):
             industry = strategy_context.get("industry", "")
 
         # Load knowledge cache for frameworks if available
-        frameworks_section = ""
-        try:
-            from app.main import _knowledge_cache
-            fw = _knowledge_cache.get("frameworks", [])
-            if fw:
-                frameworks_section = f"\nYou have access to {len(fw)} strategy frameworks:\n"
-                for f in fw[:20]:
-                    frameworks_section += f"• {f['name']} ({f.get('originator', 'N/A')}, {f.get('year_introduced', 'N/A')}) [{f.get('phase', '')}]\n"
-
-            mt = _knowledge_cache.get("measurement_tools", [])
-            if mt:
-                frameworks_section += f"\nYou can apply {len(mt)} measurement tools:\n"
-                for t in mt[:15]:
-                    frameworks_section += f"• {t['name']} (Stage: {t.get('stage', '')}): {t.get('description', '')[:80]}...\n"
-        except Exception:
-            pass
+        frameworks_section = knowledge_cache.cache.current().frameworks_section
 
         return f"""You are the Strategy Analyst agent for Stairs, an AI strategy platform by DEVONEERS.
 The current year is {datetime.now().year}.
@@ -87,6 +87,26 @@ BASE_RETIRED_MODEL_IDS = frozenset({
 
 RETIRED_MODEL_IDS = set(BASE_RETIRED_MODEL_IDS)
 
+# Model tiers. "balanced" is MODEL_CHAIN above. The others name their
+# preferred models and fall through to the balanced chain, so a retired or
+# unavailable fast/deep model degrades to balanced rather than failing.
+# Override with CLAUDE_FAST_CHAIN / CLAUDE_DEEP_CHAIN (comma-separated).
+TIERS = ("fast", "balanced", "deep")
+DEFAULT_TIER_CHAINS = {
+    "fast": ["claude-haiku-4-5"],
+    "deep": ["claude-opus-4-5"],
+}
+
+# task_type -> tier. A trailing * matches a prefix. Anything unlisted is
+# balanced. Short structured jobs (validation scores, questionnaire JSON)
+# don't need a sonnet-class model and shouldn't wait for one. Override with
+# AI_TASK_TIERS, e.g. "validate_*:fast,framework_*:deep".
+DEFAULT_TASK_TIERS = {
+    "validate_*": "fast",
+    "generate_questionnaire": "fast",
+    "prefill_questionnaire": "fast",
+}
+
 # Populated by reload_config() below — module-level so operators can read
 # them and tests can monkeypatch them.
 ANTHROPIC_API_KEY = ""
@@ -94,6 +114,8 @@ ANTHROPIC_BASE_URL = "https://api.anthropic.com"
 ANTHROPIC_VERSION = "2023-06-01"
 CONFIGURED_MODEL = ""
 MODEL_CHAIN: List[str] = list(DEFAULT_MODEL_CHAIN)
+TIER_CHAINS: Dict[str, List[str]] = {t: list(c) for t, c in DEFAULT_TIER_CHAINS.items()}
+TASK_TIERS: Dict[str, str] = dict(DEFAULT_TASK_TIERS)
 REQUEST_TIMEOUT = 90.0
 MODEL_CACHE_TTL = 21600  # 6h
 MAX_TRANSIENT_RETRIES = 2
@@ -109,7 +131,7 @@ def reload_config() -> None:
     who fixes CLAUDE_MODEL does not have to wait for a redeploy.
     """
     global ANTHROPIC_API_KEY, ANTHROPIC_BASE_URL, ANTHROPIC_VERSION
-    global CONFIGURED_MODEL, MODEL_CHAIN, REQUEST_TIMEOUT
+    global CONFIGURED_MODEL, MODEL_CHAIN, REQUEST_TIMEOUT, TIER_CHAINS, TASK_TIERS
     global MODEL_CACHE_TTL, MAX_TRANSIENT_RETRIES
 
     ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY", "").strip()
@@ -121,6 +143,16 @@ def reload_config() -> None:
     MODEL_CHAIN = [
         m.strip() for m in os.getenv("CLAUDE_MODEL_CHAIN", "").split(",") if m.strip()
     ] or list(DEFAULT_MODEL_CHAIN)
+    TIER_CHAINS = {
+        tier: [m.strip() for m in os.getenv(f"CLAUDE_{tier.upper()}_CHAIN", "").split(",") if m.strip()]
+        or list(chain)
+        for tier, chain in DEFAULT_TIER_CHAINS.items()
+    }
+    TASK_TIERS = dict(DEFAULT_TASK_TIERS)
+    for rule in os.getenv("AI_TASK_TIERS", "").split(","):
+        pattern, _, tier = rule.partition(":")
+        if pattern.strip() and tier.strip() in TIERS:
+            TASK_TIERS[pattern.strip()] = tier.strip()
     REQUEST_TIMEOUT = float(os.getenv("AI_TIMEOUT_SECONDS", "90"))
     MODEL_CACHE_TTL = int(os.getenv("AI_MODEL_CACHE_SECONDS", "21600"))
     MAX_TRANSIENT_RETRIES = int(os.getenv("AI_MAX_RETRIES", "2"))
@@ -158,6 +190,12 @@ USER_MESSAGES = {
         "ar": "هذا الطلب أكبر مما يمكن للمساعد معالجته دفعة واحدة. "
               "جرّب تضييقه إلى هدف واحد وأعد التوليد.",
     },
+    "quota": {
+        "en": "Your workspace has used today's strategy assistant allowance. It resets "
+              "at midnight UTC — your inputs are saved, and you can continue manually.",
+        "ar": "استهلكت مساحة العمل حصة اليوم من مساعد الاستراتيجية. تتجدد الحصة "
+              "عند منتصف الليل بتوقيت UTC — تم حفظ مدخلاتك، ويمكنك المتابعة يدويًا.",
+    },
     "offline": {
         "en": "The strategy assistant can't be reached at the moment. Your inputs are "
               "saved — try again shortly, or continue manually.",
@@ -180,6 +218,7 @@ def user_message(kind: str, lang: str = "en") -> str:
 def _blank_state() -> Dict[str, Any]:
     return {
         "active_model": None,       # model we believe works right now
+        "tier_models": {},          # fast/deep tier -> model we believe works
         "available_models": [],     # what /v1/models reported for this key
         "resolved_at": 0.0,
         "degraded": False,          # True when we're not on the operator's first choice
@@ -250,6 +289,23 @@ async def _list_models() -> List[str]:
         return []
 
 
+def tier_for(task_type: str) -> str:
+    """The model tier TASK_TIERS assigns to a task type; balanced if none."""
+    if task_type in TASK_TIERS:
+        return TASK_TIERS[task_type]
+    for pattern, tier in TASK_TIERS.items():
+        if pattern.endswith("*") and task_type.startswith(pattern[:-1]):
+            return tier
+    return "balanced"
+
+
+def _tier_candidates(tier: str) -> List[str]:
+    """The tier's own models, then the balanced chain as its failover."""
+    balanced = _candidate_order()
+    own = [m for m in TIER_CHAINS.get(tier, []) if m not in RETIRED_MODEL_IDS]
+    return own + [m for m in balanced if m not in own]
+
+
 def _candidate_order() -> List[str]:
     """Operator's pick first, then the preference chain — de-duplicated,
     retired ids stripped out."""
@@ -262,10 +318,24 @@ def _candidate_order() -> List[str]:
     return ordered
 
 
-async def resolve_model(force: bool = False) -> Optional[str]:
-    """Decide which model to use. Cached for MODEL_CACHE_TTL (default 6h)."""
+async def resolve_model(force: bool = False, tier: str = "balanced") -> Optional[str]:
+    """Decide which model to use. Cached for MODEL_CACHE_TTL (default 6h).
+
+    A fast or deep tier takes the first model of its chain that the key can
+    serve, and the balanced model when none can."""
     if not ANTHROPIC_API_KEY:
         return None
+    if tier != "balanced":
+        base = await resolve_model(force)
+        pinned = _state["tier_models"].get(tier)
+        if pinned and not force and pinned not in RETIRED_MODEL_IDS:
+            return pinned
+        available = _state["available_models"]
+        chosen = next((m for m in TIER_CHAINS.get(tier, [])
+                       if m not in RETIRED_MODEL_IDS and (not available or m in available)), None) or base
+        if chosen:
+            _state["tier_models"][tier] = chosen
+        return chosen
 
     fresh = (time.time() - _state["resolved_at"]) < MODEL_CACHE_TTL
     if _state["active_model"] and fresh and not force:
@@ -313,6 +383,7 @@ async def resolve_model(force: bool = False) -> Optional[str]:
             chosen = candidates[0] if candidates else None
 
         _state["active_model"] = chosen
+        _state["tier_models"] = {}  # re-derived from the fresh model list
         _state["resolved_at"] = time.time()
         _state["degraded"] = bool(CONFIGURED_MODEL and chosen and chosen != CONFIGURED_MODEL)
         if _state["configured_model_ok"] is None and CONFIGURED_MODEL:
@@ -394,8 +465,8 @@ def _retry_delay(resp: httpx.Response, attempt: int) -> float:
 def _default_system() -> str:
     """Reuse the Knowledge Engine system prompt when the app has one."""
     try:
-        from app.main import _knowledge_cache, _build_basic_system_prompt
-        return _knowledge_cache.get("system_prompt") or _build_basic_system_prompt()
+        from app.knowledge_cache import system_prompt
+        return system_prompt()
     except Exception:
         return DEFAULT_SYSTEM_PROMPT
 
@@ -405,9 +476,13 @@ async def call_claude(
     system: Optional[str] = None,
     max_tokens: int = 1024,
     lang: str = "en",
+    tier: str = "balanced",
 ) -> Dict[str, Any]:
     """Drop-in replacement for the old call_claude().
 
+    `tier` picks the model tier (see tier_for). Failover walks that tier's
+    chain and then the balanced one; a success pins the model for the tier.
+
     On success returns the Anthropic response dict (so
     result["content"][0]["text"] and result["usage"][...] keep working) with
     ok=True, error_kind=None and model added.
@@ -425,14 +500,14 @@ async def call_claude(
         _state["last_error"] = "ANTHROPIC_API_KEY is not set"
         return _envelope("no_key", lang=lang)
 
-    model = await resolve_model()
+    model = await resolve_model(tier=tier)
     if not model:
         _state["calls_failed"] += 1
         return _envelope("unavailable", lang=lang)
 
     # Try the active model, then walk the chain if it turns out to be dead.
     tried: List[str] = []
-    chain = [model] + [m for m in _candidate_order() if m != model]
+    chain = [model] + [m for m in _tier_candidates(tier) if m != model]
     last_kind = "unavailable"
 
     async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT) as client:
@@ -467,7 +542,11 @@ async def call_claude(
                     break  # next model
 
                 if resp.status_code == 200:
-                    if candidate != _state["active_model"]:
+                    if tier != "balanced":
+                        if candidate != _state["tier_models"].get(tier):
+                            log.warning("[ai] %s tier now on %s", tier, candidate)
+                            _state["tier_models"][tier] = candidate
+                    elif candidate != _state["active_model"]:
                         log.warning("[ai] failed over to %s — pinning it as active", candidate)
                         _state["active_model"] = candidate
                         _state["resolved_at"] = time.time()
@@ -482,6 +561,7 @@ async def call_claude(
                     data["ok"] = True
                     data["error_kind"] = None
                     data["model"] = candidate
+                    data["tier"] = tier
                     return data
 
                 body = resp.text[:800]
@@ -498,6 +578,9 @@ async def call_claude(
                     RETIRED_MODEL_IDS.add(candidate)  # don't try it again this process
                     if _state["active_model"] == candidate:
                         _state["active_model"] = None
+                    for t, m in list(_state["tier_models"].items()):
+                        if m == candidate:
+                            del _state["tier_models"][t]
                     _state["resolved_at"] = 0  # force a fresh resolve next call
                     last_kind = "unavailable"
                     break  # next model in chain
@@ -557,6 +640,8 @@ def status_snapshot() -> Dict[str, Any]:
         "degraded": _state["degraded"],
         "models_available_to_key": list(_state["available_models"]),
         "preference_chain": _candidate_order(),
+        "tier_models": dict(_state["tier_models"]),
+        "task_tiers": dict(TASK_TIERS),
         "calls_ok": _state["calls_ok"],
         "calls_failed": _state["calls_failed"],
         "success_rate": round(_state["calls_ok"] / total * 100, 1) if total else None,
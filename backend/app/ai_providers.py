@@ -13,7 +13,10 @@ from collections import defaultdict
 
 import httpx
 
-from app import ai_client
+from app import ai_client, hedging, knowledge_cache, metrics
+from app.governor import current_org, governor
+from app.usage import HARD, meter
+from app.circuit_breaker import CircuitBreaker, CLOSED
 
 logger = logging.getLogger("stairs.ai_providers")
 
@@ -21,6 +24,11 @@ logger = logging.getLogger("stairs.ai_providers")
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY", "")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "")
+# Point these (and ANTHROPIC_BASE_URL, read by app.ai_client) at
+# benchmarks/mock_provider.py to exercise the whole chain without spending
+# tokens.
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com").rstrip("/")
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com").rstrip("/")
 # NOTE: the Claude model id is no longer pinned here. app.ai_client discovers
 # which models this key can actually serve and fails over when one is retired,
 # so a repeat of the 2026-08-08 `claude-sonnet-4-20250514` outage heals itself.
@@ -32,6 +40,13 @@ PROVIDER_GEMINI = "gemini"
 
 PROVIDER_CHAIN = [PROVIDER_CLAUDE, PROVIDER_OPENAI, PROVIDER_GEMINI]
 
+# Model label on stairs_ai_call_seconds. Claude's comes from ai_client's
+# resolution, per tier.
+PROVIDER_MODELS = {
+    PROVIDER_OPENAI: "gpt-4o",
+    PROVIDER_GEMINI: "gemini-2.0-flash",
+}
+
 PROVIDER_DISPLAY = {
     PROVIDER_CLAUDE: "Claude",
     PROVIDER_OPENAI: "GPT-4o",
@@ -56,6 +71,9 @@ _provider_metrics = {
     for p in PROVIDER_CHAIN
 }
 
+# Routing state; see app/circuit_breaker.py.
+_breakers = {p: CircuitBreaker(p) for p in PROVIDER_CHAIN}
+
 _active_provider = PROVIDER_CLAUDE
 _global_fallback_switches_today = 0
 _global_fallback_date = None
@@ -97,7 +115,11 @@ def get_ai_status() -> dict:
             "last_success": m["last_success"].isoformat() if m["last_success"] else None,
             "failures_last_hour": len(recent_failures),
         }
+        circuit = _breakers[p].snapshot()
+        providers[p]["circuit"] = circuit.pop("state")
+        providers[p].update({f"circuit_{k}": v for k, v in circuit.items()})
     return {
+        "hedging": hedging.hedger.snapshot(),
         "active_provider": _active_provider,
         "active_provider_display": PROVIDER_DISPLAY.get(_active_provider, _active_provider),
         "fallback_switches_today": _global_fallback_switches_today if _global_fallback_date == today else 0,
@@ -105,6 +127,13 @@ def get_ai_status() -> dict:
     }
 
 
+def _model_label(provider: str, task_type: str) -> str:
+    if provider == PROVIDER_CLAUDE:
+        state = ai_client._state
+        return state.get("tier_models", {}).get(ai_client.tier_for(task_type)) or state.get("active_model") or "unresolved"
+    return PROVIDER_MODELS.get(provider, "unknown")
+
+
 def _get_api_key(provider: str) -> str:
     if provider == PROVIDER_CLAUDE:
         return ANTHROPIC_API_KEY
@@ -155,32 +184,38 @@ def adapt_messages(messages: list, provider: str) -> list:
 
 # ─── PROVIDER-SPECIFIC API CALLS ───
 
-async def _call_claude_api(client: httpx.AsyncClient, messages: list, system: str, max_tokens: int) -> tuple:
+async def _call_claude_api(client: httpx.AsyncClient, messages: list, system: str, max_tokens: int,
+                           task_type: str = "") -> tuple:
     """Claude leg of the provider chain.
 
     Delegates to app.ai_client, which resolves a live model id, refuses to
     send to retired ones, fails over on 404, and backs off on 429/5xx. The
     `client` argument is unused — ai_client owns its own transport — but the
-    signature is kept so every provider caller looks the same.
+    signature is kept so every provider caller looks the same. `task_type`
+    picks the model tier.
+
+    Every caller returns (ok, text, total tokens, status, output tokens).
     """
-    result = await ai_client.call_claude(messages=messages, system=system, max_tokens=max_tokens)
+    result = await ai_client.call_claude(messages=messages, system=system, max_tokens=max_tokens,
+                                         tier=ai_client.tier_for(task_type))
     if result.get("ok"):
         content = result.get("content") or []
         text = content[0].get("text", "") if content else ""
         usage = result.get("usage") or {}
         tokens = usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
-        return True, text, tokens, 200
+        return True, text, tokens, 200, usage.get("output_tokens", 0)
     # ai_client already logged the upstream detail; surface only a status hint
     # so the provider chain can decide whether to try OpenAI/Gemini next.
-    return False, None, 0, ai_client._state.get("last_status", 0) or 503
+    return False, None, 0, ai_client._state.get("last_status", 0) or 503, 0
 
 
-async def _call_openai_api(client: httpx.AsyncClient, messages: list, system: str, max_tokens: int) -> tuple:
+async def _call_openai_api(client: httpx.AsyncClient, messages: list, system: str, max_tokens: int,
+                           task_type: str = "") -> tuple:
     oai_messages = [{"role": "system", "content": system}]
     for msg in messages:
         oai_messages.append({"role": msg["role"], "content": msg["content"]})
     resp = await client.post(
-        "https://api.openai.com/v1/chat/completions",
+        f"{OPENAI_BASE_URL}/v1/chat/completions",
         headers={
             "Authorization": f"Bearer {OPENAI_API_KEY}",
             "Content-Type": "application/json",
@@ -194,18 +229,19 @@ async def _call_openai_api(client: httpx.AsyncClient, messages: list, system: st
     if resp.status_code == 200:
         data = resp.json()
         text = data["choices"][0]["message"]["content"] if data.get("choices") else ""
-        tokens = data.get("usage", {}).get("total_tokens", 0)
-        return True, text, tokens, resp.status_code
-    return False, None, 0, resp.status_code
+        usage = data.get("usage", {})
+        return True, text, usage.get("total_tokens", 0), resp.status_code, usage.get("completion_tokens", 0)
+    return False, None, 0, resp.status_code, 0
 
 
-async def _call_gemini_api(client: httpx.AsyncClient, messages: list, system: str, max_tokens: int) -> tuple:
+async def _call_gemini_api(client: httpx.AsyncClient, messages: list, system: str, max_tokens: int,
+                           task_type: str = "") -> tuple:
     contents = []
     for msg in messages:
         role = "user" if msg["role"] == "user" else "model"
         contents.append({"role": role, "parts": [{"text": msg["content"]}]})
     resp = await client.post(
-        f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={GOOGLE_API_KEY}",
+        f"{GEMINI_BASE_URL}/v1beta/models/gemini-2.0-flash:generateContent?key={GOOGLE_API_KEY}",
         headers={"Content-Type": "application/json"},
         json={
             "system_instruction": {"parts": [{"text": system}]},
@@ -222,8 +258,8 @@ async def _call_gemini_api(client: httpx.AsyncClient, messages: list, system: st
             text = parts[0].get("text", "") if parts else ""
         tokens_meta = data.get("usageMetadata", {})
         tokens = tokens_meta.get("totalTokenCount", 0)
-        return True, text, tokens, resp.status_code
-    return False, None, 0, resp.status_code
+        return True, text, tokens, resp.status_code, tokens_meta.get("candidatesTokenCount", 0)
+    return False, None, 0, resp.status_code, 0
 
 
 _PROVIDER_CALLERS = {
@@ -235,17 +271,228 @@ _PROVIDER_CALLERS = {
 
 # ─── MAIN FALLBACK CALL ───
 
+async def _try_provider(
+    client: httpx.AsyncClient,
+    provider: str,
+    messages: list,
+    system: str,
+    max_tokens: int,
+    log_callback,
+    fallback_used: bool,
+    original_provider: str,
+    task_type: str = "",
+    hedge: bool = False,
+):
+    """Every attempt one provider gets for one request: the success result,
+    or None when the chain should move on. The caller has already cleared
+    the provider's breaker. A hedge backup (hedge=True) raced a provider that
+    was slow, not one that failed, so its win is no fallback switch."""
+    global _active_provider
+
+    breaker = _breakers[provider]
+    adapted_system = adapt_system_prompt(system, provider)
+    adapted_messages = adapt_messages(messages, provider)
+    caller = _PROVIDER_CALLERS[provider]
+    # Claude already retries and fails over across model ids inside
+    # ai_client, so retrying it again here just multiplies the wait.
+    # A half-open breaker gets exactly one trial.
+    attempts_allowed = 1 if provider == PROVIDER_CLAUDE or breaker.state != CLOSED else RETRIES_PER_PROVIDER
+
+    for attempt in range(1, attempts_allowed + 1):
+        start_time = time.time()
+        try:
+            success, text, tokens, status_code, output_tokens = await caller(
+                client, adapted_messages, adapted_system, max_tokens, task_type
+            )
+            elapsed = time.time() - start_time
+
+            breaker.record(success, elapsed)
+            metrics.ai_call_seconds.observe(elapsed, provider, _model_label(provider, task_type),
+                                            task_type or "default", "ok" if success else "error")
+            if success:
+                _record_success(provider)
+                hedging.hedger.observe(provider, elapsed)
+                if not hedge:
+                    _active_provider = provider
+
+                if log_callback:
+                    await log_callback(
+                        provider=provider,
+                        success=True,
+                        response_time_ms=int(elapsed * 1000),
+                        tokens_used=tokens,
+                        status_code=status_code,
+                        fallback_used=fallback_used,
+                        fallback_from=original_provider if fallback_used else None,
+                    )
+
+                if fallback_used and not hedge:
+                    logger.warning(
+                        "🔄 AI FALLBACK SWITCH: %s → %s (original provider failed after retries)",
+                        original_provider.upper(), provider.upper(),
+                    )
+                    _record_fallback_switch()
+
+                return {"text": text, "tokens": tokens, "output_tokens": output_tokens, "provider": provider,
+                        "fallback_used": fallback_used}
+
+            # Non-success response
+            _record_failure(provider)
+            if log_callback:
+                await log_callback(
+                    provider=provider,
+                    success=False,
+                    response_time_ms=int(elapsed * 1000),
+                    tokens_used=0,
+                    status_code=status_code,
+                    fallback_used=fallback_used,
+                    fallback_from=None,
+                )
+
+            if status_code not in FALLBACK_STATUS_CODES and status_code < 500:
+                # Client error (4xx except those we handle). Retrying the
+                # same provider cannot help — move to the next one rather
+                # than handing the caller a status code to render.
+                logger.warning(
+                    "AI provider %s returned %d (client error), moving to next provider",
+                    provider, status_code,
+                )
+                return None
+
+            if breaker.state != CLOSED:
+                logger.warning("AI provider %s circuit opened (last status: %d), moving to next provider",
+                               provider, status_code)
+                return None
+
+            if attempt < attempts_allowed:
+                logger.warning(
+                    "AI provider %s returned %d, retrying in %ds (attempt %d/%d)",
+                    provider, status_code, RETRY_DELAY_SECONDS, attempt, attempts_allowed,
+                )
+                await asyncio.sleep(RETRY_DELAY_SECONDS)
+            else:
+                logger.warning(
+                    "AI provider %s failed after %d attempt(s) (last status: %d), moving to next provider",
+                    provider, attempts_allowed, status_code,
+                )
+
+        except asyncio.CancelledError:
+            # Lost a hedge race. Not a failure, but how long it had taken is
+            # still a latency sample; dropping it would leave hedging only
+            # the fast part of the distribution to learn from.
+            hedging.hedger.observe(provider, time.time() - start_time)
+            raise
+        except Exception as exc:
+            elapsed = time.time() - start_time
+            _record_failure(provider)
+            breaker.record(False, elapsed)
+            metrics.ai_call_seconds.observe(elapsed, provider, _model_label(provider, task_type),
+                                            task_type or "default", "error")
+            logger.error("AI provider %s exception: %s", provider, exc)
+
+            if log_callback:
+                await log_callback(
+                    provider=provider,
+                    success=False,
+                    response_time_ms=int(elapsed * 1000),
+                    tokens_used=0,
+                    status_code=0,
+                    fallback_used=fallback_used,
+                    fallback_from=None,
+                    error_message=str(exc),
+                )
+
+            if breaker.state != CLOSED:
+                logger.warning("AI provider %s circuit opened, moving to next provider", provider)
+                return None
+            if attempt < attempts_allowed:
+                logger.warning("Retrying %s in %ds...", provider, RETRY_DELAY_SECONDS)
+                await asyncio.sleep(RETRY_DELAY_SECONDS)
+            else:
+                logger.warning("Provider %s exhausted after %d attempt(s), moving to next", provider, attempts_allowed)
+    return None
+
+
+def _next_open_provider(remaining: list):
+    """Pop providers off `remaining` until one whose breaker lets a request
+    through. Returns (provider or None, whether any were skipped)."""
+    skipped = False
+    while remaining:
+        provider = remaining.pop(0)
+        if _breakers[provider].allow():
+            return provider, skipped
+        # Open circuit: don't spend the user's time on a provider that has
+        # been failing. It gets trial requests on its own schedule.
+        logger.info("AI provider %s skipped (circuit %s)", provider, _breakers[provider].state)
+        skipped = True
+    return None, skipped
+
+
+def _start_backup(client, remaining, primary, messages, system, max_tokens, log_callback, fallback_used,
+                  original_provider, task_type, lane):
+    """Send the hedge, in a governor slot of its own in `lane`. None when no
+    slot is free at once or no other provider is open."""
+    slots = governor
+    if not slots.try_acquire(lane):
+        hedging.hedger.note_slot_denied()
+        return None
+    provider, _ = _next_open_provider(remaining)
+    if provider is None:
+        slots.release(lane)
+        return None
+    logger.info("AI hedge: %s is slow, asking %s as well", primary, provider)
+    task = asyncio.create_task(_try_provider(client, provider, messages, system, max_tokens, log_callback,
+                                             fallback_used, original_provider, task_type, hedge=True))
+    task.add_done_callback(lambda _: slots.release(lane))
+    return task
+
+
+async def _hedged(primary: asyncio.Task, provider: str, start_backup):
+    """Wait for `primary`. If it hasn't answered by the provider's p90 and
+    the hedge budget allows, start_backup() sends the same request to the
+    next provider and the first answer wins; the other is cancelled. A
+    backup that fails first leaves the primary running, and vice versa."""
+    hedger = hedging.hedger
+    hedger.note_eligible()
+    pending, backup = {primary}, None
+    try:
+        done, _ = await asyncio.wait(pending, timeout=hedger.delay(provider))
+        if not done and hedger.can_hedge():
+            backup = start_backup()
+            if backup is not None:
+                hedger.note_hedged()
+                pending.add(backup)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.result() is not None:
+                    if backup is not None:
+                        hedger.note_winner(backup=task is backup)
+                    return task.result()
+        return None
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
 async def call_ai_with_fallback(
     messages: list,
     system: str = None,
     max_tokens: int = 1024,
     log_callback=None,
+    task_type: str = "",
 ) -> dict:
-    global _active_provider
+    """Ask the first healthy provider, falling back down PROVIDER_CHAIN.
 
+    For the interactive task types listed in app/hedging.py, a slow first
+    answer is hedged against the next provider in the chain. Every call
+    first takes a slot from app/governor.py; one that waits too long is
+    answered "busy" without reaching a provider. An organization over its
+    hard daily token limit (app/usage.py) is answered "quota"."""
     if system is None:
-        from app.main import _knowledge_cache, _build_basic_system_prompt
-        system = _knowledge_cache.get("system_prompt") or _build_basic_system_prompt()
+        system = knowledge_cache.system_prompt()
 
     no_keys = all(not _get_api_key(p) for p in PROVIDER_CHAIN)
     if no_keys:
@@ -262,121 +509,73 @@ async def call_ai_with_fallback(
             "error_kind": "no_key",
         }
 
+    org = current_org.get()
+    if meter.check(org) == HARD:
+        logger.warning("Organization %s is over its daily AI token limit; not calling a provider", org)
+        return {
+            "text": ai_client.user_message("quota"),
+            "tokens": 0,
+            "provider": "none",
+            "fallback_used": False,
+            "ok": False,
+            "error_kind": "quota",
+        }
+
+    with metrics.timed("ai_queue"):
+        lane = await governor.acquire(task_type)
+    if lane is None:
+        logger.warning("AI request for %r waited past its lane's limit; answering busy", task_type)
+        return {
+            "text": ai_client.user_message("busy"),
+            "tokens": 0,
+            "provider": "none",
+            "fallback_used": False,
+            "ok": False,
+            "error_kind": "busy",
+        }
+
     fallback_used = False
     original_provider = _active_provider
-
-    async with httpx.AsyncClient(timeout=60) as client:
-        for provider_idx, provider in enumerate(PROVIDER_CHAIN):
-            api_key = _get_api_key(provider)
-            if not api_key:
-                continue
-
-            adapted_system = adapt_system_prompt(system, provider)
-            adapted_messages = adapt_messages(messages, provider)
-            caller = _PROVIDER_CALLERS[provider]
-            # Claude already retries and fails over across model ids inside
-            # ai_client, so retrying it again here just multiplies the wait.
-            attempts_allowed = 1 if provider == PROVIDER_CLAUDE else RETRIES_PER_PROVIDER
-
-            for attempt in range(1, attempts_allowed + 1):
-                start_time = time.time()
-                try:
-                    success, text, tokens, status_code = await caller(
-                        client, adapted_messages, adapted_system, max_tokens
+    remaining = [p for p in PROVIDER_CHAIN if _get_api_key(p)]
+    hedge = hedging.hedger.applies(task_type)
+
+    started = time.perf_counter()
+    try:
+        async with httpx.AsyncClient(timeout=60) as client:
+            while True:
+                provider, skipped = _next_open_provider(remaining)
+                fallback_used = fallback_used or skipped
+                if provider is None:
+                    break
+                attempt = _try_provider(client, provider, messages, system, max_tokens, log_callback,
+                                        fallback_used, original_provider, task_type)
+                if hedge:
+                    hedge = False  # only the first provider asked is hedged
+                    result = await _hedged(
+                        asyncio.create_task(attempt), provider,
+                        lambda: _start_backup(client, remaining, provider, messages, system, max_tokens,
+                                              log_callback, fallback_used, original_provider, task_type,
+                                              lane),
                     )
-                    elapsed = time.time() - start_time
-
-                    if success:
-                        _record_success(provider)
-                        _active_provider = provider
-
-                        if log_callback:
-                            await log_callback(
-                                provider=provider,
-                                success=True,
-                                response_time_ms=int(elapsed * 1000),
-                                tokens_used=tokens,
-                                status_code=status_code,
-                                fallback_used=fallback_used,
-                                fallback_from=original_provider if fallback_used else None,
-                            )
-
-                        if fallback_used:
-                            logger.warning(
-                                "🔄 AI FALLBACK SWITCH: %s → %s (original provider failed after retries)",
-                                original_provider.upper(), provider.upper(),
-                            )
-                            _record_fallback_switch()
-
-                        return {
-                            "text": text,
-                            "tokens": tokens,
-                            "provider": provider,
-                            "fallback_used": fallback_used,
-                            "ok": True,
-                            "error_kind": None,
-                        }
-
-                    # Non-success response
-                    _record_failure(provider)
-                    if log_callback:
-                        await log_callback(
-                            provider=provider,
-                            success=False,
-                            response_time_ms=int(elapsed * 1000),
-                            tokens_used=0,
-                            status_code=status_code,
-                            fallback_used=fallback_used,
-                            fallback_from=None,
-                        )
-
-                    if status_code not in FALLBACK_STATUS_CODES and status_code < 500:
-                        # Client error (4xx except those we handle). Retrying the
-                        # same provider cannot help — move to the next one rather
-                        # than handing the caller a status code to render.
-                        logger.warning(
-                            "AI provider %s returned %d (client error), moving to next provider",
-                            provider, status_code,
-                        )
-                        break
-
-                    if attempt < attempts_allowed:
-                        logger.warning(
-                            "AI provider %s returned %d, retrying in %ds (attempt %d/%d)",
-                            provider, status_code, RETRY_DELAY_SECONDS, attempt, attempts_allowed,
-                        )
-                        await asyncio.sleep(RETRY_DELAY_SECONDS)
-                    else:
-                        logger.warning(
-                            "AI provider %s failed after %d attempt(s) (last status: %d), moving to next provider",
-                            provider, attempts_allowed, status_code,
-                        )
-
-                except Exception as exc:
-                    elapsed = time.time() - start_time
-                    _record_failure(provider)
-                    logger.error("AI provider %s exception: %s", provider, exc)
-
-                    if log_callback:
-                        await log_callback(
-                            provider=provider,
-                            success=False,
-                            response_time_ms=int(elapsed * 1000),
-                            tokens_used=0,
-                            status_code=0,
-                            fallback_used=fallback_used,
-                            fallback_from=None,
-                            error_message=str(exc),
-                        )
-
-                    if attempt < attempts_allowed:
-                        logger.warning("Retrying %s in %ds...", provider, RETRY_DELAY_SECONDS)
-                        await asyncio.sleep(RETRY_DELAY_SECONDS)
-                    else:
-                        logger.warning("Provider %s exhausted after %d attempt(s), moving to next", provider, attempts_allowed)
-
-            # Mark fallback for subsequent providers
-            fallback_used = True
+                else:
+                    result = await attempt
+                if result is not None:
+                    meter.record(org, task_type, result["tokens"] - result["output_tokens"],
+                                 result["output_tokens"])
+                    return {
+                        "text": result["text"],
+                        "tokens": result["tokens"],
+                        "output_tokens": result["output_tokens"],
+                        "provider": result["provider"],
+                        "fallback_used": result["fallback_used"],
+                        "ok": True,
+                        "error_kind": None,
+                    }
+                # Mark fallback for subsequent providers
+                fallback_used = True
+    finally:
+        governor.release(lane)
+        metrics.add("ai", time.perf_counter() - started)
 
     # All providers failed
     logger.error(
@@ -393,3 +592,4 @@ async def call_ai_with_fallback(
         "ok": False,
         "error_kind": kind,
     }
+
@@ -0,0 +1,115 @@
+"""Stairs — Per-Provider Circuit Breaker
+
+call_ai_with_fallback tried every configured provider in order on every
+request, however that provider had been doing. With OpenAI down, each chat
+paid two attempts and a 3-second sleep before Gemini was even asked.
+_provider_metrics counted the failures but nothing read them.
+
+Each provider now has a breaker with three states:
+
+  closed     Calls go through. Every outcome is kept for
+             CIRCUIT_WINDOW_SECONDS. Once the window holds at least
+             CIRCUIT_MIN_CALLS outcomes and CIRCUIT_FAILURE_RATE of them
+             were bad, the breaker opens. A failure is bad, and so is a
+             success slower than CIRCUIT_SLOW_CALL_SECONDS: a provider
+             that answers in 40 seconds is not one to route users to.
+  open       The provider is skipped without a request, for
+             CIRCUIT_OPEN_SECONDS.
+  half_open  One trial request is let through. A good outcome closes the
+             breaker with an empty window; a bad one opens it again. If the
+             trial never reports back, for example because it was
+             cancelled, another is allowed after CIRCUIT_OPEN_SECONDS.
+
+State is per process. Each worker learns about an outage from its own
+traffic, which costs at most CIRCUIT_MIN_CALLS bad calls per worker.
+"""
+
+import os
+import time
+from collections import deque
+from typing import Callable, Optional
+
+CIRCUIT_WINDOW_SECONDS = float(os.getenv("CIRCUIT_WINDOW_SECONDS", "60"))
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "5"))
+CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))
+CIRCUIT_SLOW_CALL_SECONDS = float(os.getenv("CIRCUIT_SLOW_CALL_SECONDS", "30"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self._clock = clock
+        self.reset()
+
+    def reset(self):
+        self.state = CLOSED
+        self._window: deque = deque()  # (at, bad, latency_seconds)
+        self._open_until = 0.0
+        self._trial_started: Optional[float] = None
+        self.opened_count = 0
+        self.skipped_count = 0
+
+    def allow(self) -> bool:
+        """Whether a request may go to this provider now. In half-open,
+        True marks the caller as the trial."""
+        now = self._clock()
+        if self.state == OPEN:
+            if now < self._open_until:
+                self.skipped_count += 1
+                return False
+            self.state = HALF_OPEN
+            self._trial_started = None
+        if self.state == HALF_OPEN:
+            if self._trial_started is not None and now - self._trial_started < CIRCUIT_OPEN_SECONDS:
+                self.skipped_count += 1
+                return False
+            self._trial_started = now
+        return True
+
+    def record(self, ok: bool, latency: float):
+        now = self._clock()
+        bad = not ok or latency > CIRCUIT_SLOW_CALL_SECONDS
+        if self.state == HALF_OPEN:
+            if bad:
+                self._open(now)
+            else:
+                self.state = CLOSED
+                self._window.clear()
+                self._trial_started = None
+            return
+        if self.state == OPEN:
+            return  # a straggler from before the breaker opened
+        self._window.append((now, bad, latency))
+        self._trim(now)
+        calls = len(self._window)
+        if calls >= CIRCUIT_MIN_CALLS and sum(b for _, b, _ in self._window) / calls >= CIRCUIT_FAILURE_RATE:
+            self._open(now)
+
+    def _open(self, now: float):
+        self.state = OPEN
+        self._open_until = now + CIRCUIT_OPEN_SECONDS
+        self._trial_started = None
+        self.opened_count += 1
+
+    def _trim(self, now: float):
+        cutoff = now - CIRCUIT_WINDOW_SECONDS
+        while self._window and self._window[0][0] < cutoff:
+            self._window.popleft()
+
+    def snapshot(self) -> dict:
+        now = self._clock()
+        self._trim(now)
+        calls = len(self._window)
+        latencies = sorted(lat for _, _, lat in self._window)
+        return {
+            "state": self.state,
+            "calls_in_window": calls,
+            "failure_rate": round(sum(b for _, b, _ in self._window) / calls, 3) if calls else 0.0,
+            "p50_latency_ms": int(latencies[calls // 2] * 1000) if calls else None,
+            "retry_in_seconds": round(max(0.0, self._open_until - now), 1) if self.state == OPEN else None,
+            "opened_count": self.opened_count,
+            "skipped_count": self.skipped_count,
+        }
@@ -5,9 +5,17 @@ Compatible with Railway, Docker, and local dev
 """
 
 import asyncpg
+import json
 import os
 from typing import Optional
 
+from app.db.instrument import InstrumentedPool
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib codec is used without it
+    orjson = None
+
 
 DATABASE_URL = os.getenv(
     "DATABASE_URL",
@@ -17,20 +25,55 @@ DATABASE_URL = os.getenv(
 _pool: Optional[asyncpg.Pool] = None
 
 
+def _dsn() -> str:
+    db_url = DATABASE_URL
+    # Railway/Heroku use postgres:// but asyncpg needs postgresql://
+    if db_url.startswith("postgres://"):
+        db_url = db_url.replace("postgres://", "postgresql://", 1)
+    return db_url
+
+
+# ─── TYPE CODECS ───
+# Decode at the protocol layer into what the API returns, so row_to_dict has
+# nothing left to convert per value:
+#   json/jsonb → dict/list (orjson when installed)
+#   uuid       → str
+#   numeric    → float
+# Dates and timestamps stay date/datetime: expiry checks and compute_health do
+# arithmetic on them. helpers.rows_to_dicts formats them per column instead.
+
+def _json_decode(text: str):
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+
+def _json_encode(value) -> str:
+    # Every caller predates the codec and passes json.dumps(...) output; a str
+    # is already JSON and goes through untouched.
+    if isinstance(value, str):
+        return value
+    return orjson.dumps(value).decode() if orjson is not None else json.dumps(value)
+
+
+async def _init_connection(conn: asyncpg.Connection):
+    for typename in ("json", "jsonb"):
+        await conn.set_type_codec(typename, schema="pg_catalog", format="text",
+                                  encoder=_json_encode, decoder=_json_decode)
+    # str() also accepts uuid.UUID and Decimal, so existing parameters still bind.
+    await conn.set_type_codec("uuid", schema="pg_catalog", format="text", encoder=str, decoder=str)
+    await conn.set_type_codec("numeric", schema="pg_catalog", format="text", encoder=str, decoder=float)
+
+
 async def get_pool() -> asyncpg.Pool:
     global _pool
     if _pool is None:
-        db_url = DATABASE_URL
-        # Railway/Heroku use postgres:// but asyncpg needs postgresql://
-        if db_url.startswith("postgres://"):
-            db_url = db_url.replace("postgres://", "postgresql://", 1)
-
-        _pool = await asyncpg.create_pool(
-            db_url,
+        # Timing, query counts, N+1 and slow-query logging: app/db/instrument.py.
+        _pool = InstrumentedPool(await asyncpg.create_pool(
+            _dsn(),
             min_size=2,
             max_size=10,
-            command_timeout=60
-        )
+            command_timeout=60,
+            init=_init_connection,
+        ))
     return _pool
 
 
@@ -40,6 +83,14 @@ async def get_conn():
     return pool
 
 
+async def connect_dedicated() -> asyncpg.Connection:
+    """A connection outside the pool, for work that holds it indefinitely
+    (LISTEN). Borrowing one from the pool would shrink it for everyone else."""
+    conn = await asyncpg.connect(_dsn())
+    await _init_connection(conn)
+    return conn
+
+
 async def close_pool():
     global _pool
     if _pool:
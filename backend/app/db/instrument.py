@@ -0,0 +1,214 @@
+"""Stairs — Query Instrumentation
+
+Several handlers ran one query per item in a loop, and nothing in the tree
+noticed when another one appeared. A page felt slow, and finding the loop
+meant reading code. The pool and its connections are now handed out behind
+thin proxies. Every statement passes through them:
+
+  timing     added to the request's "db" phase and stairs_db_query_seconds
+             (see app/metrics.py). Waiting for a connection is "db_acquire".
+  counting   QueryTracker, an ASGI middleware, gives each HTTP request a
+             QueryStats. The proxies record every statement into it under
+             its normalized shape: literals and $n parameters become ?,
+             IN-lists collapse, whitespace and comments go. At the end of
+             the request, the count goes to stairs_db_queries_per_request
+             by route.
+  N+1        a shape that ran N_PLUS_ONE_THRESHOLD times or more in one
+             request is logged with the route and counted in
+             stairs_db_repeated_statements_total. The loop that causes it
+             almost always belongs in one set-based statement or an
+             executemany, and each of those counts once.
+  slow       a statement at or over SLOW_QUERY_MS is logged with its shape
+             and timing, never its parameters, and counted in
+             stairs_db_slow_queries_total.
+
+Everything else on the pool and connection (transaction(), cursor(),
+get_size() and so on) passes straight through to asyncpg.
+
+Tests hold an endpoint to a query budget with the `max_queries` fixture in
+tests/conftest.py. It wraps the mock pool in an InstrumentedPool bound to
+its own QueryStats, which works across TestClient's thread where a
+ContextVar would not.
+"""
+
+import logging
+import os
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Optional
+
+from app import metrics
+
+logger = logging.getLogger("stairs.queries")
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "250"))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+
+QUERY_METHODS = ("execute", "executemany", "fetch", "fetchrow", "fetchval",
+                 "copy_records_to_table", "copy_to_table", "copy_from_query")
+
+
+# ─── NORMALIZATION ───
+
+_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_PARAM = re.compile(r"\$\d+")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WS = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=4096)
+def normalize(sql: str) -> str:
+    """The statement's shape: the same for every execution of one call site
+    whatever its arguments."""
+    s = _COMMENT.sub(" ", sql)
+    s = _STRING.sub("?", s)
+    s = _PARAM.sub("?", s)
+    s = _NUMBER.sub("?", s)
+    s = _LIST.sub("(?)", s)
+    return _WS.sub(" ", s).strip()
+
+
+def _shape(method: str, query) -> str:
+    if method.startswith("copy_"):
+        # The first argument is a table name (or, for copy_from_query, SQL).
+        return f"COPY {normalize(query) if method == 'copy_from_query' else query}"
+    return normalize(query)
+
+
+# ─── PER-REQUEST STATS ───
+
+class QueryStats:
+    def __init__(self, scope: Optional[dict] = None):
+        self.scope = scope
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes: Counter = Counter()
+
+    def record(self, shape: str, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[shape] += 1
+
+    @property
+    def route(self) -> str:
+        # The router has matched by the time a handler runs a query.
+        return metrics.route_label(self.scope) if self.scope is not None else ""
+
+    def repeated(self, threshold: Optional[int] = None) -> list:
+        """(shape, times) for every shape run at least `threshold` times."""
+        threshold = N_PLUS_ONE_THRESHOLD if threshold is None else threshold
+        return [(s, n) for s, n in self.shapes.most_common() if n >= threshold]
+
+    def report(self) -> str:
+        return "\n".join(f"  {n:4d}x  {s[:200]}" for s, n in self.shapes.most_common())
+
+
+_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def _record(method: str, query, seconds: float, bound: Optional[QueryStats]):
+    metrics.add("db", seconds)
+    metrics.db_query_seconds.observe(seconds)
+    shape = _shape(method, query)
+    current = _stats.get()
+    if current is not None:
+        current.record(shape, seconds)
+    if bound is not None and bound is not current:
+        bound.record(shape, seconds)
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        metrics.slow_queries.inc()
+        logger.warning("Slow query (%.0f ms, %s%s): %s", seconds * 1000, method,
+                       f" on {current.route}" if current is not None and current.scope else "", shape[:500])
+
+
+class QueryTracker:
+    """Per-request QueryStats, reported when the response is done. Plain
+    ASGI, like metrics.TimingMiddleware, and added inside it."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = QueryStats(scope)
+        token = _stats.set(stats)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _stats.reset(token)
+            route = stats.route
+            metrics.queries_per_request.observe(stats.count, route)
+            repeated = stats.repeated()
+            if repeated:
+                metrics.repeated_statements.inc(route)
+                for shape, n in repeated:
+                    logger.warning("Possible N+1 on %s %s: %d runs of %s", scope["method"], route, n, shape[:500])
+
+
+# ─── PROXIES ───
+
+class InstrumentedConnection:
+    __slots__ = ("_conn", "_bound")
+
+    def __init__(self, conn, bound: Optional[QueryStats] = None):
+        self._conn = conn
+        self._bound = bound
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def _instrumented(method: str):
+    async def call(self, query, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await getattr(self._conn, method)(query, *args, **kwargs)
+        finally:
+            _record(method, query, time.perf_counter() - start, self._bound)
+    call.__name__ = method
+    return call
+
+
+for _method in QUERY_METHODS:
+    setattr(InstrumentedConnection, _method, _instrumented(_method))
+
+
+class _InstrumentedAcquire:
+    __slots__ = ("_ctx", "_bound")
+
+    def __init__(self, ctx, bound: Optional[QueryStats]):
+        self._ctx = ctx
+        self._bound = bound
+
+    async def __aenter__(self) -> InstrumentedConnection:
+        with metrics.timed("db_acquire", metrics.db_acquire_seconds):
+            conn = await self._ctx.__aenter__()
+        return InstrumentedConnection(conn, self._bound)
+
+    async def __aexit__(self, *exc):
+        return await self._ctx.__aexit__(*exc)
+
+
+class InstrumentedPool:
+    """`bound`, when given, receives every statement run through this pool
+    in addition to the current request's stats. For query budgets in tests."""
+
+    __slots__ = ("_pool", "_bound")
+
+    def __init__(self, pool, bound: Optional[QueryStats] = None):
+        self._pool = pool
+        self._bound = bound
+
+    def acquire(self, *, timeout: Optional[float] = None) -> _InstrumentedAcquire:
+        ctx = self._pool.acquire() if timeout is None else self._pool.acquire(timeout=timeout)
+        return _InstrumentedAcquire(ctx, self._bound)
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
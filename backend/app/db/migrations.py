@@ -0,0 +1,830 @@
+"""
+Stairs — Migration Ledger
+
+Startup used to run a dozen ensure_* functions in series. Each took its own
+connection and asked information_schema whether its work was done. One of
+them rewrote '2024' to '2026' across the whole stairs table and another
+scanned stairs for orphans, both on every boot. So a cold start, and every
+Railway redeploy, grew with the size of the database.
+
+Each of those is now a numbered migration below. Applied migrations are
+recorded in schema_migrations together with a checksum of their source.
+migrate():
+
+  1. reads the ledger in one query. When everything is applied, as on any
+     boot after the first, that is the only statement it runs;
+  2. otherwise takes a Postgres advisory lock, so several workers or
+     replicas starting together do not race, and re-reads the ledger under
+     the lock;
+  3. runs each pending migration in its own transaction, recording it in the
+     same transaction, and stops at the first failure. A migration that
+     failed is retried on the next boot.
+
+A migration whose source no longer matches its recorded checksum was edited
+after it ran. The source is the function plus any module-level SQL it runs,
+which it names with sql= so an edit there is caught too. It is reported and
+not re-run. Change the schema by adding a new number, never by editing an
+applied one.
+
+The first run against an existing database replays the old ensure_* logic
+once. Every step was already idempotent, so that is the same work as one
+more boot of the old code. After that, none of it runs again.
+
+Out of band (e.g. a Railway release command):
+
+    python -m app.db.migrations
+"""
+
+import asyncio
+import hashlib
+import inspect
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+import asyncpg
+
+from app.db.connection import get_pool, close_pool
+
+
+# Arbitrary, fixed: the key every process locks on while migrating.
+MIGRATION_LOCK_KEY = 727_011_001
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    run: Callable[[asyncpg.Connection], Awaitable[None]]
+    sql: str = ""
+
+    @property
+    def checksum(self) -> str:
+        return hashlib.sha256((inspect.getsource(self.run) + self.sql).encode("utf-8")).hexdigest()
+
+
+MIGRATIONS: list[Migration] = []
+
+
+def migration(version: int, name: str, sql: str = ""):
+    """Register the decorated coroutine as migration `version`. Pass any
+    module-level SQL it executes as `sql`, so it is part of the checksum."""
+    def register(fn):
+        if any(m.version == version for m in MIGRATIONS):
+            raise ValueError(f"duplicate migration version {version}")
+        MIGRATIONS.append(Migration(version, name, fn, sql))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return fn
+    return register
+
+
+async def _applied(conn) -> dict[int, str]:
+    try:
+        rows = await conn.fetch("SELECT version, checksum FROM schema_migrations")
+    except asyncpg.UndefinedTableError:
+        return {}
+    return {r["version"]: r["checksum"] for r in rows}
+
+
+def _report_drift(applied: dict[int, str]):
+    for m in MIGRATIONS:
+        if m.version in applied and applied[m.version] != m.checksum:
+            print(f"  ⚠️ Migration {m.version} ({m.name}) was edited after it was applied — "
+                  f"not re-run; add a new migration instead")
+
+
+async def migrate() -> dict:
+    """Apply every pending migration. Returns the versions applied by this call."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        applied = await _applied(conn)
+        if all(m.version in applied for m in MIGRATIONS):
+            _report_drift(applied)
+            return {"applied": [], "total": len(MIGRATIONS)}
+
+        await conn.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK_KEY)
+        try:
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    name VARCHAR(100) NOT NULL,
+                    checksum VARCHAR(64) NOT NULL,
+                    applied_at TIMESTAMPTZ DEFAULT NOW(),
+                    duration_ms INTEGER
+                )
+            """)
+            # Another process may have finished while we waited for the lock.
+            applied = await _applied(conn)
+            _report_drift(applied)
+            done = []
+            pending = [m for m in MIGRATIONS if m.version not in applied]
+            for m in pending:
+                print(f"  → Migration {m.version}: {m.name}")
+                started = time.monotonic()
+                async with conn.transaction():
+                    await m.run(conn)
+                    await conn.execute(
+                        "INSERT INTO schema_migrations (version, name, checksum, duration_ms) "
+                        "VALUES ($1, $2, $3, $4)",
+                        m.version, m.name, m.checksum, int((time.monotonic() - started) * 1000))
+                done.append(m.version)
+            return {"applied": done, "total": len(MIGRATIONS)}
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_KEY)
+
+
+@migration(1, "strategies")
+async def _strategies_table(conn):
+    exists = await conn.fetchval(
+        "SELECT EXISTS(SELECT 1 FROM information_schema.tables WHERE table_name = 'strategies')"
+    )
+    if not exists:
+        print("  → Creating strategies table...")
+        await conn.execute("""
+            CREATE TABLE strategies (
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                organization_id UUID REFERENCES organizations(id) ON DELETE CASCADE NOT NULL,
+                name VARCHAR(500) NOT NULL,
+                name_ar VARCHAR(500),
+                description TEXT,
+                description_ar TEXT,
+                company VARCHAR(255),
+                industry VARCHAR(255),
+                icon VARCHAR(10) DEFAULT '🎯',
+                color VARCHAR(20) DEFAULT '#B8904A',
+                framework VARCHAR(50) DEFAULT 'okr',
+                status VARCHAR(30) DEFAULT 'active',
+                owner_id UUID REFERENCES users(id) ON DELETE SET NULL,
+                settings JSONB DEFAULT '{}',
+                created_at TIMESTAMPTZ DEFAULT NOW(),
+                updated_at TIMESTAMPTZ DEFAULT NOW()
+            )
+        """)
+        await conn.execute("CREATE INDEX idx_strategies_org ON strategies(organization_id)")
+        await conn.execute("CREATE INDEX idx_strategies_owner ON strategies(owner_id)")
+        await conn.execute("""
+            INSERT INTO strategies (id, organization_id, name, description, company, industry, icon, color, framework, status, owner_id)
+            VALUES ('d0000000-0000-0000-0000-000000000001', 'a0000000-0000-0000-0000-000000000001',
+                    'RootRise Vision 2026', 'DEVONEERS strategic roadmap', 'DEVONEERS / RootRise',
+                    'Technology / AI', '🌱', '#B8904A', 'okr', 'active', 'b0000000-0000-0000-0000-000000000001')
+            ON CONFLICT (id) DO NOTHING
+        """)
+        print("  ✅ strategies table created + default seeded")
+
+    has_col = await conn.fetchval("""
+        SELECT EXISTS(SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'stairs' AND column_name = 'strategy_id')
+    """)
+    if not has_col:
+        await conn.execute("ALTER TABLE stairs ADD COLUMN strategy_id UUID REFERENCES strategies(id) ON DELETE SET NULL")
+        await conn.execute("CREATE INDEX IF NOT EXISTS idx_stairs_strategy ON stairs(strategy_id)")
+        await conn.execute("""
+            UPDATE stairs SET strategy_id = 'd0000000-0000-0000-0000-000000000001'
+            WHERE organization_id = 'a0000000-0000-0000-0000-000000000001' AND strategy_id IS NULL
+        """)
+        print("  ✅ stairs.strategy_id added and linked")
+
+    # Ran over the whole stairs table on every boot before the ledger; now once.
+    await conn.execute("""
+        UPDATE stairs SET
+            description = REPLACE(description, '2024', '2026'),
+            title = REPLACE(title, '2024', '2026')
+        WHERE description LIKE '%2024%' OR title LIKE '%2024%'
+    """)
+
+
+@migration(2, "no_orphan_stairs")
+async def _no_orphan_stairs(conn):
+    """Repair stair elements that were created without a strategy_id.
+
+    The old POST /api/v1/stairs handler dropped strategy_id, leaving
+    elements unattached so the AI advisor leaked them across strategies and
+    the tree under-counted. Resolve each orphan, most reliable signal first:
+
+      1. Inherit strategy_id from the nearest ancestor that has one
+         (handles wizard trees where only the root got linked).
+      2. If the org has exactly one strategy, attach orphans to it.
+      3. Anything still unresolved can't be safely placed — soft-delete it
+         so it stops poisoning AI context (recoverable via deleted_at).
+
+    Idempotent: after a clean run there are no orphans, so re-runs no-op.
+    """
+    has_col = await conn.fetchval("""
+        SELECT EXISTS(SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'stairs' AND column_name = 'strategy_id')
+    """)
+    if not has_col:
+        return
+
+    before = await conn.fetchval(
+        "SELECT COUNT(*) FROM stairs WHERE strategy_id IS NULL AND deleted_at IS NULL"
+    )
+    if not before:
+        return
+    print(f"  → Orphan stair cleanup: {before} element(s) with NULL strategy_id")
+
+    # 1. Inherit from parent, repeatedly, so multi-level trees resolve
+    #    from the linked root down to the deepest descendant.
+    for _ in range(25):
+        result = await conn.execute("""
+            UPDATE stairs c SET strategy_id = p.strategy_id, updated_at = NOW()
+            FROM stairs p
+            WHERE c.parent_id = p.id
+              AND c.strategy_id IS NULL
+              AND c.deleted_at IS NULL
+              AND p.strategy_id IS NOT NULL
+        """)
+        if result == "UPDATE 0":
+            break
+
+    # 2. Single-strategy orgs: the only strategy is the unambiguous home.
+    await conn.execute("""
+        UPDATE stairs s SET strategy_id = one.sid, updated_at = NOW()
+        FROM (
+            SELECT organization_id AS oid, MIN(id::text)::uuid AS sid
+            FROM strategies
+            GROUP BY organization_id
+            HAVING COUNT(*) = 1
+        ) one
+        WHERE s.organization_id = one.oid
+          AND s.strategy_id IS NULL
+          AND s.deleted_at IS NULL
+    """)
+
+    # 3. Unresolvable orphans (multi-strategy org, no linked ancestor):
+    #    soft-delete so they stop leaking into AI context.
+    remaining = await conn.fetch(
+        "SELECT id, organization_id, title FROM stairs "
+        "WHERE strategy_id IS NULL AND deleted_at IS NULL"
+    )
+    if remaining:
+        for r in remaining:
+            print(f"     soft-deleting unassignable orphan {r['id']} \"{r['title']}\" (org {r['organization_id']})")
+        await conn.execute(
+            "UPDATE stairs SET deleted_at = NOW(), updated_at = NOW() "
+            "WHERE strategy_id IS NULL AND deleted_at IS NULL"
+        )
+
+    after = await conn.fetchval(
+        "SELECT COUNT(*) FROM stairs WHERE strategy_id IS NULL AND deleted_at IS NULL"
+    )
+    print(f"  ✅ Orphan stair cleanup complete — remaining orphans: {after}")
+
+
+@migration(3, "notes")
+async def _notes_table(conn):
+    exists = await conn.fetchval(
+        "SELECT EXISTS(SELECT 1 FROM information_schema.tables WHERE table_name = 'notes')"
+    )
+    if not exists:
+        print("  → Creating notes table...")
+        await conn.execute("""
+            CREATE TABLE notes (
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                user_id UUID REFERENCES users(id) ON DELETE CASCADE NOT NULL,
+                organization_id UUID REFERENCES organizations(id) ON DELETE CASCADE NOT NULL,
+                title VARCHAR(500) NOT NULL,
+                content TEXT DEFAULT '',
+                source VARCHAR(50) DEFAULT 'manual',
+                tags TEXT[] DEFAULT '{}',
+                pinned BOOLEAN DEFAULT FALSE,
+                created_at TIMESTAMPTZ DEFAULT NOW(),
+                updated_at TIMESTAMPTZ DEFAULT NOW()
+            )
+        """)
+        await conn.execute("CREATE INDEX idx_notes_user ON notes(user_id, organization_id)")
+        await conn.execute("CREATE INDEX idx_notes_pinned ON notes(user_id, pinned DESC, updated_at DESC)")
+        print("  ✅ notes table created")
+
+
+@migration(4, "action_plans")
+async def _action_plans_table(conn):
+    exists = await conn.fetchval(
+        "SELECT EXISTS(SELECT 1 FROM information_schema.tables WHERE table_name = 'action_plans')"
+    )
+    if not exists:
+        print("  → Creating action_plans table...")
+        await conn.execute("""
+            CREATE TABLE action_plans (
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                stair_id UUID REFERENCES stairs(id) ON DELETE CASCADE NOT NULL,
+                organization_id UUID REFERENCES organizations(id) ON DELETE CASCADE NOT NULL,
+                plan_type VARCHAR(30) NOT NULL DEFAULT 'recommended',
+                raw_text TEXT NOT NULL,
+                tasks JSONB DEFAULT '[]',
+                feedback JSONB,
+                created_by UUID REFERENCES users(id) ON DELETE SET NULL,
+                created_at TIMESTAMPTZ DEFAULT NOW()
+            )
+        """)
+        await conn.execute("CREATE INDEX idx_action_plans_stair ON action_plans(stair_id, created_at DESC)")
+        await conn.execute("CREATE INDEX idx_action_plans_org ON action_plans(organization_id)")
+        print("  ✅ action_plans table created")
+
+    # One plan per (stair, plan_type). Regeneration used to INSERT a new
+    # row every time; reads take the newest, so the older rows never
+    # surfaced in the Execution Room but did show as the same plan repeated
+    # in Action Plans and the Manifest Room. Collapse them to the newest so
+    # the upsert in save_action_plan has a constraint to conflict on.
+    has_uq = await conn.fetchval("""
+        SELECT EXISTS(SELECT 1 FROM pg_indexes
+        WHERE tablename = 'action_plans' AND indexname = 'uq_action_plans_stair_type')
+    """)
+    if not has_uq:
+        dupes = await conn.fetchval("""
+            SELECT COUNT(*) FROM action_plans a
+            WHERE EXISTS (
+                SELECT 1 FROM action_plans b
+                WHERE b.stair_id = a.stair_id AND b.plan_type = a.plan_type
+                  AND (b.created_at, b.id) > (a.created_at, a.id)
+            )
+        """)
+        if dupes:
+            print(f"  → Collapsing {dupes} superseded action plan row(s) — keeping the newest per stair and plan type")
+            await conn.execute("""
+                DELETE FROM action_plans a
+                WHERE EXISTS (
+                    SELECT 1 FROM action_plans b
+                    WHERE b.stair_id = a.stair_id AND b.plan_type = a.plan_type
+                      AND (b.created_at, b.id) > (a.created_at, a.id)
+                )
+            """)
+        await conn.execute(
+            "CREATE UNIQUE INDEX uq_action_plans_stair_type ON action_plans(stair_id, plan_type)")
+        print("  ✅ action_plans unique on (stair_id, plan_type)")
+
+
+@migration(5, "agent_logs")
+async def _agent_logs_table(conn):
+    exists = await conn.fetchval(
+        "SELECT EXISTS(SELECT 1 FROM information_schema.tables WHERE table_name = 'agent_logs')"
+    )
+    if not exists:
+        print("  → Creating agent_logs table...")
+        await conn.execute("""
+            CREATE TABLE agent_logs (
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                strategy_id UUID,
+                agent_name VARCHAR(50) NOT NULL,
+                task_type VARCHAR(100) NOT NULL,
+                input_summary TEXT,
+                output_summary TEXT,
+                tokens_used INTEGER DEFAULT 0,
+                model_used VARCHAR(50),
+                confidence_score INTEGER,
+                ok BOOLEAN,
+                created_at TIMESTAMPTZ DEFAULT NOW()
+            )
+        """)
+        await conn.execute("CREATE INDEX idx_agent_logs_strategy ON agent_logs(strategy_id, created_at DESC)")
+        await conn.execute("CREATE INDEX idx_agent_logs_agent ON agent_logs(agent_name, created_at DESC)")
+        print("  ✅ agent_logs table created")
+
+    # Nullable on purpose: rows written before this column existed stay NULL
+    # ("unknown") rather than being retroactively counted as successes.
+    await conn.execute("ALTER TABLE agent_logs ADD COLUMN IF NOT EXISTS ok BOOLEAN")
+
+
+@migration(6, "ai_usage_logs")
+async def _ai_usage_logs_table(conn):
+    exists = await conn.fetchval(
+        "SELECT EXISTS(SELECT 1 FROM information_schema.tables WHERE table_name = 'ai_usage_logs')"
+    )
+    if not exists:
+        print("  → Creating ai_usage_logs table...")
+        await conn.execute("""
+            CREATE TABLE ai_usage_logs (
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                provider VARCHAR(20) NOT NULL,
+                success BOOLEAN NOT NULL,
+                response_time_ms INTEGER,
+                tokens_used INTEGER DEFAULT 0,
+                status_code INTEGER,
+                fallback_used BOOLEAN DEFAULT FALSE,
+                fallback_from VARCHAR(20),
+                error_message TEXT,
+                created_at TIMESTAMPTZ DEFAULT NOW()
+            )
+        """)
+        await conn.execute("CREATE INDEX idx_ai_usage_logs_created ON ai_usage_logs(created_at DESC)")
+        await conn.execute("CREATE INDEX idx_ai_usage_logs_provider ON ai_usage_logs(provider, created_at DESC)")
+        await conn.execute("CREATE INDEX idx_ai_usage_logs_fallback ON ai_usage_logs(fallback_used) WHERE fallback_used = TRUE")
+        print("  ✅ ai_usage_logs table created")
+
+
+@migration(7, "strategy_sources")
+async def _strategy_sources_table(conn):
+    exists = await conn.fetchval(
+        "SELECT EXISTS(SELECT 1 FROM information_schema.tables WHERE table_name = 'strategy_sources')"
+    )
+    if not exists:
+        print("  → Creating strategy_sources table...")
+        await conn.execute("""
+            CREATE TABLE strategy_sources (
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                strategy_id UUID NOT NULL,
+                source_type VARCHAR(50) NOT NULL,
+                content TEXT NOT NULL,
+                metadata JSONB DEFAULT '{}',
+                created_by UUID REFERENCES users(id) ON DELETE SET NULL,
+                created_at TIMESTAMPTZ DEFAULT NOW(),
+                updated_at TIMESTAMPTZ DEFAULT NOW()
+            )
+        """)
+        await conn.execute("CREATE INDEX idx_strategy_sources_strategy ON strategy_sources(strategy_id, created_at DESC)")
+        await conn.execute("CREATE INDEX idx_strategy_sources_type ON strategy_sources(strategy_id, source_type)")
+        print("  ✅ strategy_sources table created")
+
+
+@migration(8, "generated_artifacts")
+async def _generated_artifacts_table(conn):
+    """Home for generated/created content that used to live only in React state
+    or localStorage — Execution Room solutions, explanations, implementation
+    guides, per-task chats, staircase explain/enhance, matrix worksheets."""
+    exists = await conn.fetchval(
+        "SELECT EXISTS(SELECT 1 FROM information_schema.tables WHERE table_name = 'generated_artifacts')"
+    )
+    if not exists:
+        print("  → Creating generated_artifacts table...")
+        await conn.execute("""
+            CREATE TABLE generated_artifacts (
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                organization_id UUID REFERENCES organizations(id) ON DELETE CASCADE NOT NULL,
+                strategy_id UUID,
+                stair_id UUID REFERENCES stairs(id) ON DELETE CASCADE,
+                artifact_type VARCHAR(50) NOT NULL,
+                scope_key VARCHAR(200) NOT NULL,
+                content TEXT,
+                payload JSONB DEFAULT '{}',
+                generated_at TIMESTAMPTZ DEFAULT NOW(),
+                updated_at TIMESTAMPTZ DEFAULT NOW(),
+                created_by UUID REFERENCES users(id) ON DELETE SET NULL,
+                UNIQUE (organization_id, artifact_type, scope_key)
+            )
+        """)
+        await conn.execute("CREATE INDEX idx_generated_artifacts_stair ON generated_artifacts(stair_id, artifact_type)")
+        await conn.execute("CREATE INDEX idx_generated_artifacts_strategy ON generated_artifacts(strategy_id, artifact_type)")
+        print("  ✅ generated_artifacts table created")
+
+
+@migration(9, "organization_invites")
+async def _organization_invites_table(conn):
+    """Invitations are the only supported way into an existing organization.
+
+    Registration now creates a new organization per signup, so without this
+    there would be no way to add a colleague to your own tenant.
+    """
+    exists = await conn.fetchval(
+        "SELECT EXISTS(SELECT 1 FROM information_schema.tables WHERE table_name = 'organization_invites')"
+    )
+    if not exists:
+        print("  → Creating organization_invites table...")
+        await conn.execute("""
+            CREATE TABLE organization_invites (
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                organization_id UUID REFERENCES organizations(id) ON DELETE CASCADE NOT NULL,
+                email VARCHAR(255),
+                role VARCHAR(50) NOT NULL DEFAULT 'member',
+                token VARCHAR(128) UNIQUE NOT NULL,
+                created_by UUID REFERENCES users(id) ON DELETE SET NULL,
+                created_at TIMESTAMPTZ DEFAULT NOW(),
+                expires_at TIMESTAMPTZ NOT NULL,
+                accepted_at TIMESTAMPTZ,
+                accepted_by UUID REFERENCES users(id) ON DELETE SET NULL,
+                revoked_at TIMESTAMPTZ
+            )
+        """)
+        await conn.execute("CREATE INDEX idx_org_invites_org ON organization_invites(organization_id, created_at DESC)")
+        await conn.execute("CREATE INDEX idx_org_invites_token ON organization_invites(token) WHERE accepted_at IS NULL AND revoked_at IS NULL")
+        print("  ✅ organization_invites table created")
+
+
+@migration(10, "password_resets")
+async def _password_resets_table(conn):
+    """Admin-issued, single-use password reset links.
+
+    Until now there was no way to change a password at all — no endpoint, and a
+    "Forgot Password?" link that told users to contact an administrator who had
+    no mechanism either. Same shape as organization_invites deliberately: random
+    token, expiry, single use, revocable.
+    """
+    exists = await conn.fetchval(
+        "SELECT EXISTS(SELECT 1 FROM information_schema.tables WHERE table_name = 'password_resets')")
+    if not exists:
+        print("  → Creating password_resets table...")
+        await conn.execute("""
+            CREATE TABLE password_resets (
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                user_id UUID REFERENCES users(id) ON DELETE CASCADE NOT NULL,
+                organization_id UUID REFERENCES organizations(id) ON DELETE CASCADE NOT NULL,
+                token VARCHAR(128) UNIQUE NOT NULL,
+                created_by UUID REFERENCES users(id) ON DELETE SET NULL,
+                created_at TIMESTAMPTZ DEFAULT NOW(),
+                expires_at TIMESTAMPTZ NOT NULL,
+                used_at TIMESTAMPTZ,
+                revoked_at TIMESTAMPTZ
+            )
+        """)
+        await conn.execute("CREATE INDEX idx_password_resets_org ON password_resets(organization_id, created_at DESC)")
+        await conn.execute("CREATE INDEX idx_password_resets_token ON password_resets(token) WHERE used_at IS NULL AND revoked_at IS NULL")
+        print("  ✅ password_resets table created")
+
+
+@migration(11, "tenancy_columns")
+async def _tenancy_columns(conn):
+    """Give every tenant-owned table its own organization_id.
+
+    Three tables carried no tenancy column and were reachable only through a
+    join the handler had to remember to write:
+
+      stair_relationships — no column and no filter anywhere, so any
+        authenticated caller could read another organization's dependency
+        graph and write edges into it.
+      strategy_sources    — tenancy came from the parent strategy, and four
+        handlers filtered on (source_id, strategy_id) without checking who
+        owned the strategy, allowing cross-organization overwrite and delete.
+      agent_logs          — strategy_id with no foreign key, so a deleted
+        strategy leaves rows with no owner at all.
+
+    A column the query planner can filter on directly is harder to forget than
+    a join, and it survives the parent row being deleted. Backfilled from the
+    parent; rows whose parent is already gone keep NULL and are excluded by
+    every org filter, which fails closed.
+    """
+    for table, backfill_sql, parent in [
+        ("stair_relationships", """
+            UPDATE stair_relationships r SET organization_id = s.organization_id
+            FROM stairs s WHERE s.id = r.source_stair_id AND r.organization_id IS NULL
+        """, "source stair"),
+        ("strategy_sources", """
+            UPDATE strategy_sources ss SET organization_id = s.organization_id
+            FROM strategies s WHERE s.id = ss.strategy_id AND ss.organization_id IS NULL
+        """, "strategy"),
+        ("agent_logs", """
+            UPDATE agent_logs al SET organization_id = s.organization_id
+            FROM strategies s WHERE s.id = al.strategy_id AND al.organization_id IS NULL
+        """, "strategy"),
+    ]:
+        has_col = await conn.fetchval("""
+            SELECT EXISTS(SELECT 1 FROM information_schema.columns
+            WHERE table_name = $1 AND column_name = 'organization_id')
+        """, table)
+        if has_col:
+            continue
+        print(f"  → Adding organization_id to {table}...")
+        await conn.execute(
+            f"ALTER TABLE {table} ADD COLUMN organization_id UUID "
+            f"REFERENCES organizations(id) ON DELETE CASCADE")
+        await conn.execute(backfill_sql)
+        await conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{table}_org ON {table}(organization_id)")
+        orphaned = await conn.fetchval(
+            f"SELECT COUNT(*) FROM {table} WHERE organization_id IS NULL")
+        if orphaned:
+            print(f"     ⚠️ {orphaned} row(s) in {table} have no {parent} to inherit from — "
+                  f"left NULL, so org-filtered queries exclude them")
+        print(f"  ✅ {table}.organization_id added and backfilled")
+
+    # An edge must not span two organizations. Enforced in the handler; this
+    # reports any pre-existing violation so it can't hide behind the check.
+    has_rel_org = await conn.fetchval("""
+        SELECT EXISTS(SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'stair_relationships' AND column_name = 'organization_id')
+    """)
+    if has_rel_org:
+        crossing = await conn.fetchval("""
+            SELECT COUNT(*) FROM stair_relationships r
+            JOIN stairs a ON a.id = r.source_stair_id
+            JOIN stairs b ON b.id = r.target_stair_id
+            WHERE a.organization_id IS DISTINCT FROM b.organization_id
+        """)
+        if crossing:
+            print(f"  ⚠️ {crossing} relationship(s) join stairs in different organizations — "
+                  f"pre-existing, review before trusting the graph")
+
+
+@migration(12, "realtime")
+async def _realtime_tables(conn):
+    """realtime_events existed (created by run_migration.py) but nothing wrote
+    to it. The realtime bridge persists every websocket event there under a
+    per-organization sequence number, handed out by realtime_org_seq, so
+    listeners can order, deduplicate and backfill. See app/realtime.py."""
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS realtime_events (
+            id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+            organization_id UUID,
+            event_type VARCHAR(100) NOT NULL,
+            entity_type VARCHAR(50),
+            entity_id UUID,
+            payload JSONB DEFAULT '{}',
+            created_by UUID,
+            created_at TIMESTAMPTZ DEFAULT NOW()
+        )
+    """)
+    await conn.execute("ALTER TABLE realtime_events ADD COLUMN IF NOT EXISTS seq BIGINT")
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_realtime_org_seq ON realtime_events(organization_id, seq)")
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_realtime_created ON realtime_events(created_at)")
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS realtime_org_seq (
+            organization_id UUID PRIMARY KEY,
+            seq BIGINT NOT NULL DEFAULT 0
+        )
+    """)
+
+
+@migration(13, "keyset_pagination")
+async def _keyset_pagination(conn):
+    """Indexes behind app/pagination.py: each list's sort columns plus id, all
+    DESC, after its equality filters, so any page is one range scan. The sort
+    columns defaulted to NOW() but were nullable, and a NULL never satisfies a
+    row comparison, so they are backfilled and made NOT NULL first."""
+    for table, column, fill in [
+        ("strategy_sources", "created_at", "NOW()"),
+        ("notes", "updated_at", "COALESCE(created_at, NOW())"),
+        ("notes", "pinned", "FALSE"),
+        ("ai_alerts", "created_at", "NOW()"),
+        ("generated_artifacts", "generated_at", "COALESCE(updated_at, NOW())"),
+        ("strategies", "updated_at", "COALESCE(created_at, NOW())"),
+    ]:
+        await conn.execute(f"UPDATE {table} SET {column} = {fill} WHERE {column} IS NULL")
+        await conn.execute(f"ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL")
+    for ddl in [
+        "idx_strategy_sources_keyset ON strategy_sources(strategy_id, created_at DESC, id DESC)",
+        "idx_notes_keyset ON notes(user_id, organization_id, pinned DESC, updated_at DESC, id DESC)",
+        "idx_alerts_keyset ON ai_alerts(organization_id, (CASE severity WHEN 'critical' THEN 3 "
+        "WHEN 'high' THEN 2 WHEN 'medium' THEN 1 ELSE 0 END) DESC, created_at DESC, id DESC)",
+        "idx_progress_keyset ON stair_progress(stair_id, snapshot_date DESC, id DESC)",
+        "idx_kpi_keyset ON kpi_measurements(stair_id, measured_at DESC, id DESC)",
+        "idx_generated_artifacts_stair_keyset ON generated_artifacts(stair_id, generated_at DESC, id DESC)",
+        "idx_generated_artifacts_strategy_keyset ON generated_artifacts(strategy_id, generated_at DESC, id DESC)",
+        "idx_strategies_keyset ON strategies(organization_id, owner_id, updated_at DESC, id DESC)",
+    ]:
+        await conn.execute(f"CREATE INDEX IF NOT EXISTS {ddl}")
+    # Superseded: each is a prefix of its keyset index.
+    for name in ("idx_strategy_sources_strategy", "idx_notes_pinned", "idx_progress_stair", "idx_kpi_stair_time"):
+        await conn.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+KPI_ROLLUPS_SQL = """
+CREATE TABLE IF NOT EXISTS kpi_stats (
+    stair_id UUID PRIMARY KEY REFERENCES stairs(id) ON DELETE CASCADE,
+    latest_value DECIMAL(20,4),
+    latest_at TIMESTAMPTZ,
+    measurement_count BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS kpi_rollups (
+    stair_id UUID NOT NULL REFERENCES stairs(id) ON DELETE CASCADE,
+    bucket VARCHAR(5) NOT NULL CHECK (bucket IN ('day', 'week', 'month')),
+    bucket_start TIMESTAMPTZ NOT NULL,
+    n BIGINT NOT NULL,
+    total DECIMAL(30,4) NOT NULL,
+    min_value DECIMAL(20,4) NOT NULL,
+    max_value DECIMAL(20,4) NOT NULL,
+    first_at TIMESTAMPTZ NOT NULL,
+    first_value DECIMAL(20,4) NOT NULL,
+    last_at TIMESTAMPTZ NOT NULL,
+    last_value DECIMAL(20,4) NOT NULL,
+    PRIMARY KEY (stair_id, bucket, bucket_start)
+);
+
+-- Fold a batch of new measurements into kpi_stats and kpi_rollups.
+CREATE OR REPLACE FUNCTION kpi_rollup_insert()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO kpi_stats (stair_id, latest_value, latest_at, measurement_count)
+    SELECT DISTINCT ON (stair_id) stair_id, value, measured_at, COUNT(*) OVER (PARTITION BY stair_id)
+    FROM new_rows ORDER BY stair_id, measured_at DESC, id DESC
+    ON CONFLICT (stair_id) DO UPDATE SET
+        measurement_count = kpi_stats.measurement_count + EXCLUDED.measurement_count,
+        latest_value = CASE WHEN kpi_stats.latest_at IS NULL OR EXCLUDED.latest_at >= kpi_stats.latest_at
+                            THEN EXCLUDED.latest_value ELSE kpi_stats.latest_value END,
+        latest_at = GREATEST(kpi_stats.latest_at, EXCLUDED.latest_at);
+
+    INSERT INTO kpi_rollups (stair_id, bucket, bucket_start, n, total, min_value, max_value,
+                             first_at, first_value, last_at, last_value)
+    SELECT r.stair_id, b.bucket, date_trunc(b.bucket, r.measured_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+           COUNT(*), SUM(r.value), MIN(r.value), MAX(r.value),
+           MIN(r.measured_at), (array_agg(r.value ORDER BY r.measured_at, r.id))[1],
+           MAX(r.measured_at), (array_agg(r.value ORDER BY r.measured_at DESC, r.id DESC))[1]
+    FROM new_rows r CROSS JOIN (VALUES ('day'), ('week'), ('month')) AS b(bucket)
+    GROUP BY 1, 2, 3
+    ON CONFLICT (stair_id, bucket, bucket_start) DO UPDATE SET
+        n = kpi_rollups.n + EXCLUDED.n,
+        total = kpi_rollups.total + EXCLUDED.total,
+        min_value = LEAST(kpi_rollups.min_value, EXCLUDED.min_value),
+        max_value = GREATEST(kpi_rollups.max_value, EXCLUDED.max_value),
+        first_value = CASE WHEN EXCLUDED.first_at < kpi_rollups.first_at
+                           THEN EXCLUDED.first_value ELSE kpi_rollups.first_value END,
+        first_at = LEAST(kpi_rollups.first_at, EXCLUDED.first_at),
+        last_value = CASE WHEN EXCLUDED.last_at >= kpi_rollups.last_at
+                          THEN EXCLUDED.last_value ELSE kpi_rollups.last_value END,
+        last_at = GREATEST(kpi_rollups.last_at, EXCLUDED.last_at);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Recompute the rollups of some stairs from scratch: the backfill, and the
+-- rare UPDATE or DELETE of a measurement (MIN/MAX can't be un-folded).
+CREATE OR REPLACE FUNCTION kpi_rollup_rebuild(ids UUID[])
+RETURNS VOID AS $$
+    DELETE FROM kpi_stats WHERE stair_id = ANY(ids);
+    DELETE FROM kpi_rollups WHERE stair_id = ANY(ids);
+    INSERT INTO kpi_stats (stair_id, latest_value, latest_at, measurement_count)
+    SELECT DISTINCT ON (stair_id) stair_id, value, measured_at, COUNT(*) OVER (PARTITION BY stair_id)
+    FROM kpi_measurements WHERE stair_id = ANY(ids) ORDER BY stair_id, measured_at DESC, id DESC;
+    INSERT INTO kpi_rollups (stair_id, bucket, bucket_start, n, total, min_value, max_value,
+                             first_at, first_value, last_at, last_value)
+    SELECT r.stair_id, b.bucket, date_trunc(b.bucket, r.measured_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+           COUNT(*), SUM(r.value), MIN(r.value), MAX(r.value),
+           MIN(r.measured_at), (array_agg(r.value ORDER BY r.measured_at, r.id))[1],
+           MAX(r.measured_at), (array_agg(r.value ORDER BY r.measured_at DESC, r.id DESC))[1]
+    FROM kpi_measurements r CROSS JOIN (VALUES ('day'), ('week'), ('month')) AS b(bucket)
+    WHERE r.stair_id = ANY(ids)
+    GROUP BY 1, 2, 3;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION kpi_rollup_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        PERFORM kpi_rollup_rebuild(ARRAY(SELECT stair_id FROM old_rows UNION SELECT stair_id FROM new_rows));
+    ELSE
+        PERFORM kpi_rollup_rebuild(ARRAY(SELECT DISTINCT stair_id FROM old_rows));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_kpi_rollup_insert ON kpi_measurements;
+CREATE TRIGGER trg_kpi_rollup_insert AFTER INSERT ON kpi_measurements
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION kpi_rollup_insert();
+DROP TRIGGER IF EXISTS trg_kpi_rollup_update ON kpi_measurements;
+CREATE TRIGGER trg_kpi_rollup_update AFTER UPDATE ON kpi_measurements
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION kpi_rollup_change();
+DROP TRIGGER IF EXISTS trg_kpi_rollup_delete ON kpi_measurements;
+CREATE TRIGGER trg_kpi_rollup_delete AFTER DELETE ON kpi_measurements
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION kpi_rollup_change();
+"""
+
+
+@migration(14, "kpi_rollups", sql=KPI_ROLLUPS_SQL)
+async def _kpi_rollups(conn):
+    """kpi_summary ran three correlated subqueries per KPI stair, and a chart
+    had to pull every raw measurement. kpi_stats holds each stair's latest
+    value, time and count; kpi_rollups holds day/week/month aggregates. Both
+    are maintained by statement-level triggers on kpi_measurements, so a bulk
+    insert folds in with two set-based upserts. Existing history is backfilled."""
+    await conn.execute(KPI_ROLLUPS_SQL)
+    await conn.execute("SELECT kpi_rollup_rebuild(ARRAY(SELECT DISTINCT stair_id FROM kpi_measurements))")
+
+
+@migration(15, "agent_logs_output_tokens")
+async def _agent_logs_output_tokens(conn):
+    """Output tokens per call, so app/output_budget.py can size max_tokens
+    from what each task type actually produces. Nullable: older rows only
+    have the combined tokens_used."""
+    await conn.execute("ALTER TABLE agent_logs ADD COLUMN IF NOT EXISTS output_tokens INTEGER")
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_agent_logs_task ON agent_logs(task_type, created_at DESC)")
+
+
+@migration(16, "ai_usage_daily")
+async def _ai_usage_daily(conn):
+    """Token usage per organization, UTC day and task type, added into by
+    app/usage.py. ai_usage_logs gains organization_id so a single call can
+    be traced back to its tenant."""
+    await conn.execute("ALTER TABLE ai_usage_logs ADD COLUMN IF NOT EXISTS organization_id UUID")
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS ai_usage_daily (
+            organization_id UUID NOT NULL REFERENCES organizations(id) ON DELETE CASCADE,
+            day DATE NOT NULL,
+            task_type VARCHAR(100) NOT NULL DEFAULT '',
+            input_tokens BIGINT NOT NULL DEFAULT 0,
+            output_tokens BIGINT NOT NULL DEFAULT 0,
+            calls INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (organization_id, day, task_type)
+        )
+    """)
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_ai_usage_daily_day ON ai_usage_daily(day)")
+
+
+@migration(17, "stairs_health_set_at")
+async def _stairs_health_set_at(conn):
+    """When a stair's health was last set by hand. The scheduled refresh in
+    app/health_refresh.py leaves those stairs alone; writing progress without
+    a health clears it."""
+    await conn.execute("ALTER TABLE stairs ADD COLUMN IF NOT EXISTS health_set_at TIMESTAMPTZ")
+
+
+async def _main():
+    try:
+        result = await migrate()
+        print(f"✅ {len(result['applied'])} migration(s) applied, {result['total']} known")
+    finally:
+        await close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,174 @@
+"""Stairs — Progress Forecasting
+
+The only completion probability a stair had was the one ai_analyze asked the
+model to invent: a paid call per stair, and a different number each time for
+the same history. stair_progress already holds a daily snapshot per stair,
+which is enough for a plain trend fit.
+
+For each stair the last FORECAST_WINDOW_DAYS of snapshots are fitted with an
+ordinary least-squares line, progress against day. That gives:
+
+  - velocity_per_day: the slope, in percentage points per day.
+  - projected_completion: today plus (100 - current progress) / velocity,
+    when velocity is positive.
+  - completion_probability: the chance (0-100) of reaching 100% by end_date.
+    Progress at end_date is taken as normal, centred on the projection, with
+    the slope's standard error scaled by the horizon plus the scatter of the
+    snapshots around the line.
+
+A whole strategy is one query: snapshots come back already aggregated into
+one array pair per stair. With NumPy installed the fits are batched. All
+points go into flat arrays, and the per-stair sums come from np.bincount,
+so 1,000 stairs is a few milliseconds. Without NumPy the same sums are
+computed in a Python loop, which is slower but gives the same numbers.
+
+Stairs with fewer than FORECAST_MIN_POINTS snapshots (never fewer than 3)
+get no velocity and no probability. That is reported as insufficient
+history rather than guessed.
+"""
+
+import math
+import os
+from datetime import date, timedelta
+from itertools import chain
+from typing import Optional
+
+try:
+    import numpy as np
+except ImportError:  # optional; falls back to a per-stair loop
+    np = None
+
+FORECAST_WINDOW_DAYS = int(os.getenv("FORECAST_WINDOW_DAYS", "90"))
+# At least 3: the residual variance divides by n - 2.
+FORECAST_MIN_POINTS = max(3, int(os.getenv("FORECAST_MIN_POINTS", "3")))
+
+# One row per stair; `days` are snapshot dates relative to today (<= 0).
+_HISTORY_SQL = """SELECT s.id, s.progress_percent::float8 AS progress, s.end_date,
+        COALESCE(array_agg(p.snapshot_date - CURRENT_DATE ORDER BY p.snapshot_date)
+                 FILTER (WHERE p.progress_percent IS NOT NULL), '{}') AS days,
+        COALESCE(array_agg(p.progress_percent::float8 ORDER BY p.snapshot_date)
+                 FILTER (WHERE p.progress_percent IS NOT NULL), '{}') AS points
+    FROM stairs s
+    LEFT JOIN stair_progress p ON p.stair_id = s.id AND p.snapshot_date >= CURRENT_DATE - $3::int
+    WHERE $scope AND s.organization_id = $2 AND s.deleted_at IS NULL
+    GROUP BY s.id"""
+
+
+async def strategy_forecasts(conn, strategy_id: str, org_id: str) -> list[dict]:
+    rows = await conn.fetch(_HISTORY_SQL.replace("$scope", "s.strategy_id = $1"), strategy_id, org_id, FORECAST_WINDOW_DAYS)
+    return forecast([dict(r) for r in rows])
+
+
+async def stair_forecast(conn, stair_id: str, org_id: str) -> Optional[dict]:
+    rows = await conn.fetch(_HISTORY_SQL.replace("$scope", "s.id = $1"), stair_id, org_id, FORECAST_WINDOW_DAYS)
+    out = forecast([dict(r) for r in rows])
+    return out[0] if out else None
+
+
+# ─── FITTING ───
+
+def _fit_numpy(histories: list[dict]) -> list[tuple]:
+    lengths = np.fromiter((len(h["days"]) for h in histories), dtype=np.int64, count=len(histories))
+    group = np.repeat(np.arange(len(histories)), lengths)
+    total_points = int(lengths.sum())
+    x = np.fromiter(chain.from_iterable(h["days"] for h in histories), dtype=np.float64, count=total_points)
+    y = np.fromiter(chain.from_iterable(h["points"] for h in histories), dtype=np.float64, count=total_points)
+
+    def total(w):
+        return np.bincount(group, weights=w, minlength=len(histories))
+
+    n = lengths.astype(np.float64)
+    sx, sy, sxx, sxy, syy = total(x), total(y), total(x * x), total(x * y), total(y * y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ssx = sxx - sx * sx / n
+        ssxy = sxy - sx * sy / n
+        ssy = syy - sy * sy / n
+        slope = ssxy / ssx
+        resid_var = np.maximum(ssy - slope * ssxy, 0.0) / (n - 2)
+        se = np.sqrt(resid_var / ssx)
+        noise = np.sqrt(resid_var)
+    ok = (n >= FORECAST_MIN_POINTS) & (ssx > 0)
+    return [(count, b, e, s) if fit else (count, None, None, None)
+            for count, b, e, s, fit in zip(lengths.tolist(), slope.tolist(), se.tolist(), noise.tolist(), ok.tolist())]
+
+
+def _fit_python(histories: list[dict]) -> list[tuple]:
+    fits = []
+    for h in histories:
+        xs, ys, n = h["days"], h["points"], len(h["days"])
+        if n < FORECAST_MIN_POINTS:
+            fits.append((n, None, None, None))
+            continue
+        mx, my = sum(xs) / n, sum(ys) / n
+        ssx = sum((x - mx) ** 2 for x in xs)
+        if ssx <= 0:
+            fits.append((n, None, None, None))
+            continue
+        ssxy = sum((x - mx) * (y - my) for x, y in zip(xs, ys))
+        ssy = sum((y - my) ** 2 for y in ys)
+        slope = ssxy / ssx
+        resid_var = max(ssy - slope * ssxy, 0.0) / (n - 2)
+        fits.append((n, slope, math.sqrt(resid_var / ssx), math.sqrt(resid_var)))
+    return fits
+
+
+def forecast(histories: list[dict], today: Optional[date] = None) -> list[dict]:
+    """histories: dicts with id, progress (current %), end_date, and the
+    parallel lists `days` (relative to today) and `points` (%)."""
+    if not histories:
+        return []
+    today = today or date.today()
+    fits = (_fit_numpy if np is not None else _fit_python)(histories)
+    return [_describe(h, fit, today) for h, fit in zip(histories, fits)]
+
+
+def _describe(h: dict, fit: tuple, today: date) -> dict:
+    n, slope, se, noise = fit
+    points = h["points"]
+    current = h.get("progress")
+    if current is None:
+        current = points[-1] if points else 0.0
+    end_date = h.get("end_date")
+    out = {"stair_id": str(h["id"]), "samples": n, "current_progress": round(current, 2),
+           "velocity_per_day": None, "projected_completion": None, "days_to_completion": None,
+           "end_date": end_date, "completion_probability": None}
+
+    if current >= 100:
+        out.update(projected_completion=today, days_to_completion=0,
+                   completion_probability=100.0 if end_date else None)
+        return out
+    if slope is None:
+        return out
+
+    out["velocity_per_day"] = round(slope, 4)
+    if slope > 0:
+        days = math.ceil((100 - current) / slope)
+        out["days_to_completion"] = days
+        out["projected_completion"] = today + timedelta(days=days)
+    if end_date:
+        horizon = (end_date - today).days
+        if horizon < 0:
+            out["completion_probability"] = 0.0
+        else:
+            expected = current + slope * horizon
+            spread = math.hypot(se * horizon, noise)
+            if spread == 0:
+                p = 1.0 if expected >= 100 else 0.0
+            else:
+                p = 0.5 * (1 + math.erf((expected - 100) / (spread * math.sqrt(2))))
+            out["completion_probability"] = round(100 * p, 1)
+    return out
+
+
+def prompt_facts(f: Optional[dict]) -> str:
+    """One line for an AI prompt, stating the forecast as given facts."""
+    if not f or f["velocity_per_day"] is None and f["projected_completion"] is None:
+        return "FORECAST: insufficient progress history for a trend"
+    parts = []
+    if f["velocity_per_day"] is not None:
+        parts.append(f"velocity {f['velocity_per_day']} pts/day over {f['samples']} snapshots")
+    if f["projected_completion"]:
+        parts.append(f"projected completion {f['projected_completion'].isoformat()}")
+    if f["completion_probability"] is not None:
+        parts.append(f"probability of finishing by end date {f['completion_probability']}%")
+    return "FORECAST (computed from history; use these numbers as given): " + ", ".join(parts)
@@ -0,0 +1,228 @@
+"""Stairs — Outbound AI Concurrency Governor
+
+Nothing limited how many provider calls a worker had open at once. A burst
+of document analyses or a multi-agent framework run could use up the
+provider's rate limit on its own. Every chat behind it then got 429s and sat
+in call_claude's backoff sleeps.
+
+call_ai_with_fallback now asks this governor for a slot before it contacts
+any provider. There are AI_CONCURRENCY slots per process, and each request
+waits in one of three lanes, chosen by task type:
+
+  interactive  Everything a person is watching a spinner for. It may use
+               every slot and is always served first.
+  background   AI_BACKGROUND_TASKS. Long analyses the UI polls or streams.
+               At most AI_BACKGROUND_SLOTS at once.
+  batch        AI_BATCH_TASKS. At most AI_BATCH_SLOTS at once.
+
+Task lists are comma-separated; a trailing * matches a prefix, as in
+AI_TASK_TIERS, so "framework_*" covers every framework_<name> the strategy
+agent sends.
+
+Because the capped lanes together stay below AI_CONCURRENCY, there are
+always slots only interactive work can take. Background load can slow
+background work, but it cannot queue a chat behind it.
+
+Within a lane, organizations are served by start-time fair queuing. Each
+waiter is tagged with max(lane clock, its org's last tag) and the lowest tag
+goes first. A tenant that queues fifty analyses takes turns with one that
+queues a single analysis instead of going ahead of it. AI_ORG_WEIGHTS
+("org_id:2,...") gives an org a larger share. The org comes from the
+request's auth (see helpers.get_auth); calls with no request share one
+queue.
+
+A hedged request (app/hedging.py) sends a second provider call, and that
+call needs a slot of its own in the same lane. try_acquire() gives it one
+only if one is free right away with nobody waiting for it; otherwise the
+request is not hedged. Hedges therefore stay inside AI_CONCURRENCY.
+
+A request that waits longer than its lane's maximum gets the "busy"
+envelope instead of a provider call. Failing fast with honest copy is
+better than a chat that answers after the user has given up. Queue depth,
+waits and timeouts per lane are on /api/v1/ai/health.
+
+State is per process, like the circuit breakers.
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import time
+from collections import deque
+from typing import Optional
+
+INTERACTIVE, BACKGROUND, BATCH = "interactive", "background", "batch"
+LANES = (INTERACTIVE, BACKGROUND, BATCH)  # priority order
+
+
+def _names(var: str, default: str) -> frozenset:
+    return frozenset(t.strip() for t in os.getenv(var, default).split(",") if t.strip())
+
+
+def _weights(raw: str) -> dict:
+    out = {}
+    for rule in raw.split(","):
+        org, _, weight = rule.partition(":")
+        try:
+            if org.strip() and float(weight) > 0:
+                out[org.strip()] = float(weight)
+        except ValueError:
+            continue
+    return out
+
+
+AI_CONCURRENCY = int(os.getenv("AI_CONCURRENCY", "8"))
+AI_BACKGROUND_SLOTS = int(os.getenv("AI_BACKGROUND_SLOTS", "4"))
+AI_BATCH_SLOTS = int(os.getenv("AI_BATCH_SLOTS", "2"))
+AI_BACKGROUND_TASKS = _names("AI_BACKGROUND_TASKS", "document_analysis,framework_*,validate_framework_*,risk_analysis")
+AI_BATCH_TASKS = _names("AI_BATCH_TASKS", "generate_strategy")
+AI_ORG_WEIGHTS = _weights(os.getenv("AI_ORG_WEIGHTS", ""))
+MAX_WAIT_SECONDS = {
+    INTERACTIVE: float(os.getenv("AI_INTERACTIVE_MAX_WAIT_SECONDS", "20")),
+    BACKGROUND: float(os.getenv("AI_BACKGROUND_MAX_WAIT_SECONDS", "120")),
+    BATCH: float(os.getenv("AI_BATCH_MAX_WAIT_SECONDS", "600")),
+}
+WAIT_SAMPLES = int(os.getenv("AI_GOVERNOR_WAIT_SAMPLES", "500"))
+
+# Set per request by helpers.get_auth / require_auth. Tasks created while
+# handling the request inherit it.
+current_org: contextvars.ContextVar[str] = contextvars.ContextVar("ai_org", default="")
+
+
+def _matches(task_type: str, names: frozenset) -> bool:
+    if task_type in names:
+        return True
+    return any(n.endswith("*") and task_type.startswith(n[:-1]) for n in names)
+
+
+def lane_for(task_type: str) -> str:
+    if _matches(task_type, AI_BATCH_TASKS):
+        return BATCH
+    if _matches(task_type, AI_BACKGROUND_TASKS):
+        return BACKGROUND
+    return INTERACTIVE
+
+
+class _Lane:
+    def __init__(self, cap: int):
+        self.cap = cap
+        self.running = 0
+        self.clock = 0.0                 # start tag of the waiter served last
+        self.org_tags: dict[str, float] = {}
+        self.heap: list = []             # (start tag, seq, future)
+        self.waits: deque = deque(maxlen=WAIT_SAMPLES)
+        self.admitted = 0
+        self.timed_out = 0
+        self.hedges = 0
+
+    def waiting(self) -> int:
+        return sum(1 for _, _, f in self.heap if not f.done())
+
+
+class Governor:
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self.reset()
+
+    def reset(self):
+        self._seq = itertools.count()
+        self.lanes = {
+            INTERACTIVE: _Lane(AI_CONCURRENCY),
+            BACKGROUND: _Lane(min(AI_BACKGROUND_SLOTS, AI_CONCURRENCY)),
+            BATCH: _Lane(min(AI_BATCH_SLOTS, AI_CONCURRENCY)),
+        }
+
+    def _running(self) -> int:
+        return sum(lane.running for lane in self.lanes.values())
+
+    def _has_room(self, name: str) -> bool:
+        lane = self.lanes[name]
+        return self._running() < AI_CONCURRENCY and lane.running < lane.cap
+
+    async def acquire(self, task_type: str = "") -> Optional[str]:
+        """Wait for a slot. Returns the lane to pass to release(), or None
+        when the lane's maximum wait ran out."""
+        name = lane_for(task_type)
+        lane = self.lanes[name]
+        if self._has_room(name) and not lane.waiting():
+            lane.running += 1
+            lane.admitted += 1
+            lane.waits.append(0.0)
+            return name
+
+        org = current_org.get()
+        start = max(lane.clock, lane.org_tags.get(org, 0.0))
+        lane.org_tags[org] = start + 1.0 / AI_ORG_WEIGHTS.get(org, 1.0)
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(lane.heap, (start, next(self._seq), fut))
+        queued_at = self._clock()
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), MAX_WAIT_SECONDS[name])
+        except asyncio.TimeoutError:
+            if not fut.done():
+                fut.cancel()
+                lane.timed_out += 1
+                return None
+            # Granted just as the timer fired: the slot is ours, keep it.
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release(name)
+            else:
+                fut.cancel()
+            raise
+        lane.waits.append(self._clock() - queued_at)
+        return name
+
+    def try_acquire(self, name: str) -> bool:
+        """Take a slot in lane `name` only if one is free now and nobody in
+        the lane is waiting for it. For hedges, which are only worth sending
+        when they cost nobody a turn. Release it with release(name)."""
+        lane = self.lanes[name]
+        if not self._has_room(name) or lane.waiting():
+            return False
+        lane.running += 1
+        lane.hedges += 1
+        return True
+
+    def release(self, name: str):
+        self.lanes[name].running -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        for name in LANES:
+            lane = self.lanes[name]
+            while lane.heap and self._has_room(name):
+                start, _, fut = heapq.heappop(lane.heap)
+                if fut.done():
+                    continue  # timed out or cancelled while queued
+                lane.clock = start
+                lane.running += 1
+                lane.admitted += 1
+                fut.set_result(True)
+            if not lane.heap:
+                # Nobody is behind anybody any more; forget old tags.
+                lane.clock = 0.0
+                lane.org_tags.clear()
+
+    def snapshot(self) -> dict:
+        out = {"limit": AI_CONCURRENCY, "running": self._running()}
+        for name, lane in self.lanes.items():
+            waits = sorted(lane.waits)
+            n = len(waits)
+            out[name] = {
+                "slots": lane.cap,
+                "running": lane.running,
+                "queued": lane.waiting(),
+                "admitted": lane.admitted,
+                "timed_out": lane.timed_out,
+                "hedges": lane.hedges,
+                "wait_p50_ms": int(waits[n // 2] * 1000) if n else None,
+                "wait_p95_ms": int(waits[min(n - 1, int(n * 0.95))] * 1000) if n else None,
+                "max_wait_seconds": MAX_WAIT_SECONDS[name],
+            }
+        return out
+
+
+governor = Governor()
@@ -0,0 +1,114 @@
+"""Stairs — Scheduled Health Refresh
+
+compute_health compares progress with how much of a stair's start_date to
+end_date window has elapsed. It only ran when someone wrote progress or
+edited the stair, so a stair nobody touched stayed "on_track" long after
+its calendar said otherwise. The dashboard's GROUP BY health, top_risks
+and the alerts were all reading that stale value.
+
+A background task now re-evaluates every active, dated stair each
+HEALTH_REFRESH_INTERVAL_SECONDS (and once at startup) with one UPDATE. The
+statement implements compute_health's thresholds in SQL and touches only the
+rows whose health actually changes. What changed is returned, grouped by
+organization, and announced as one health_refreshed event per org rather
+than one per stair.
+
+Stairs without both dates are left alone. Their health depends on progress
+alone, which is recomputed whenever progress is written. So are stairs whose
+health somebody set by hand, through log_progress or update_stair: those
+carry health_set_at, and keep that health until progress is written again
+without one, which clears it.
+
+With several workers or replicas, each tick takes a transaction-scoped
+advisory lock. Whoever gets it does the update; the others skip that tick.
+"""
+
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from datetime import date
+from typing import Optional
+
+from app.db.connection import get_pool
+from app.routers.websocket import ws_manager
+
+logger = logging.getLogger("stairs.health")
+
+HEALTH_REFRESH = os.getenv("HEALTH_REFRESH", "on").lower() not in ("off", "0", "false", "no")
+HEALTH_REFRESH_INTERVAL_SECONDS = float(os.getenv("HEALTH_REFRESH_INTERVAL_SECONDS", "3600"))
+
+# Arbitrary, fixed: held for the length of one refresh.
+HEALTH_REFRESH_LOCK_KEY = 727_011_002
+
+# helpers.compute_health, for the dated case, as one statement. $1 is today
+# as the application sees it, so both agree on where the day boundary is.
+REFRESH_SQL = """WITH calc AS (
+        SELECT id, CASE
+            WHEN COALESCE(progress_percent, 0) >= 100 THEN 'achieved'
+            WHEN COALESCE(progress_percent, 0) >= time_pct - 10 THEN 'on_track'
+            WHEN COALESCE(progress_percent, 0) >= time_pct - 30 THEN 'at_risk'
+            ELSE 'off_track' END AS health
+        FROM (SELECT id, progress_percent,
+                     LEAST(100, ($1::date - start_date) * 100.0
+                                / COALESCE(NULLIF(end_date - start_date, 0), 1)) AS time_pct
+              FROM stairs
+              WHERE status = 'active' AND deleted_at IS NULL AND health_set_at IS NULL
+                AND start_date IS NOT NULL AND end_date IS NOT NULL) t
+    )
+    UPDATE stairs s SET health = c.health, updated_at = NOW()
+    FROM calc c
+    WHERE s.id = c.id AND s.health IS DISTINCT FROM c.health
+    RETURNING s.id, s.organization_id, s.health"""
+
+
+class HealthRefresher:
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.metrics = {"runs": 0, "skipped": 0, "changed": 0, "failed": 0}
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.metrics["failed"] += 1
+                logger.warning("Health refresh failed: %s", e)
+            await asyncio.sleep(HEALTH_REFRESH_INTERVAL_SECONDS)
+
+    async def refresh(self, today: Optional[date] = None) -> Optional[int]:
+        """One pass. Returns how many stairs changed, or None when another
+        process held the lock."""
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                if not await conn.fetchval("SELECT pg_try_advisory_xact_lock($1)", HEALTH_REFRESH_LOCK_KEY):
+                    self.metrics["skipped"] += 1
+                    return None
+                changed = await conn.fetch(REFRESH_SQL, today or date.today())
+        self.metrics["runs"] += 1
+        self.metrics["changed"] += len(changed)
+
+        by_org = defaultdict(list)
+        for r in changed:
+            by_org[str(r["organization_id"])].append({"id": str(r["id"]), "health": r["health"]})
+        for org_id, stairs in by_org.items():
+            await ws_manager.broadcast_to_org(org_id, {"event": "health_refreshed",
+                                                       "data": {"count": len(stairs), "stairs": stairs}})
+        if changed:
+            logger.info("Health refresh: %d stair(s) changed across %d org(s)", len(changed), len(by_org))
+        return len(changed)
+
+
+refresher = HealthRefresher()
@@ -0,0 +1,107 @@
+"""Stairs — Hedged AI Requests
+
+Provider latency has a long tail: most chat answers take about six seconds,
+and now and then one takes forty. The caller just waited, and those
+stragglers were most of our p99.
+
+For the interactive task types in HEDGE_TASK_TYPES, call_ai_with_fallback
+gives the first provider until that provider's observed p90. A request
+still outstanding then is hedged: the same request goes to the next
+provider in the chain whose circuit is closed. The first valid answer is
+used and the other request is cancelled. A hedge that fails leaves the
+original running, so hedging never makes an answer less likely.
+
+A hedge doubles the cost of the request it covers, so it is capped. At most
+HEDGE_MAX_FRACTION of eligible requests in the last
+HEDGE_BUDGET_WINDOW_SECONDS are hedged. Past that, slow requests just wait
+as before. The backup also needs a free governor slot in the request's lane
+(app/governor.py); when none is free, the request is not hedged.
+
+The p90 comes from the last HEDGE_LATENCY_SAMPLES completed calls per
+provider, including those cancelled after losing a race. Until
+HEDGE_MIN_SAMPLES have been seen, HEDGE_DEFAULT_DELAY_SECONDS is used.
+
+Off unless AI_HEDGING is set. Metrics (hedge rate, backup win rate, current
+delays) are on /api/v1/ai/health.
+"""
+
+import os
+import time
+from collections import defaultdict, deque
+
+AI_HEDGING = os.getenv("AI_HEDGING", "off").lower() in ("on", "1", "true", "yes")
+HEDGE_TASK_TYPES = frozenset(
+    t.strip() for t in os.getenv("HEDGE_TASK_TYPES", "advisor_chat,explain_action").split(",") if t.strip()
+)
+HEDGE_MAX_FRACTION = float(os.getenv("HEDGE_MAX_FRACTION", "0.1"))
+HEDGE_BUDGET_WINDOW_SECONDS = float(os.getenv("HEDGE_BUDGET_WINDOW_SECONDS", "300"))
+HEDGE_LATENCY_SAMPLES = int(os.getenv("HEDGE_LATENCY_SAMPLES", "200"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("HEDGE_DEFAULT_DELAY_SECONDS", "12"))
+
+
+class Hedger:
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self.reset()
+
+    def reset(self):
+        self._latency = defaultdict(lambda: deque(maxlen=HEDGE_LATENCY_SAMPLES))
+        self._eligible: deque = deque()
+        self._hedges: deque = deque()
+        self.metrics = {"eligible": 0, "hedged": 0, "backup_wins": 0, "primary_wins": 0, "budget_denied": 0,
+                        "slot_denied": 0}
+
+    def applies(self, task_type: str) -> bool:
+        return AI_HEDGING and task_type in HEDGE_TASK_TYPES
+
+    def observe(self, provider: str, seconds: float):
+        self._latency[provider].append(seconds)
+
+    def delay(self, provider: str) -> float:
+        """Seconds to wait on `provider` before hedging: its p90."""
+        samples = self._latency[provider]
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY_SECONDS
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))]
+
+    def _trim(self, now: float):
+        cutoff = now - HEDGE_BUDGET_WINDOW_SECONDS
+        for q in (self._eligible, self._hedges):
+            while q and q[0] < cutoff:
+                q.popleft()
+
+    def note_eligible(self):
+        self._eligible.append(self._clock())
+        self.metrics["eligible"] += 1
+
+    def can_hedge(self) -> bool:
+        self._trim(self._clock())
+        if len(self._hedges) + 1 > HEDGE_MAX_FRACTION * len(self._eligible):
+            self.metrics["budget_denied"] += 1
+            return False
+        return True
+
+    def note_slot_denied(self):
+        self.metrics["slot_denied"] += 1
+
+    def note_hedged(self):
+        self._hedges.append(self._clock())
+        self.metrics["hedged"] += 1
+
+    def note_winner(self, backup: bool):
+        self.metrics["backup_wins" if backup else "primary_wins"] += 1
+
+    def snapshot(self) -> dict:
+        m = self.metrics
+        return {
+            "enabled": AI_HEDGING,
+            **m,
+            "hedge_rate": round(m["hedged"] / m["eligible"], 3) if m["eligible"] else 0.0,
+            "backup_win_rate": round(m["backup_wins"] / m["hedged"], 3) if m["hedged"] else None,
+            "delay_seconds": {p: round(self.delay(p), 2) for p in self._latency},
+        }
+
+
+hedger = Hedger()
@@ -4,17 +4,17 @@ Row conversion, health computation, code generation, and auth utilities.
 """
 
 import os
-import json
 import uuid
 from datetime import datetime, date, timedelta, timezone
 from typing import Optional
-from decimal import Decimal
 
-from fastapi import Depends, HTTPException, Header, status as http_status
+from fastapi import Depends, HTTPException, Header, Request, Response, status as http_status
 from jose import JWTError, jwt
 import bcrypt
 
+from app import metrics
 from app.db.connection import get_pool
+from app.governor import current_org
 
 # ─── CONFIG ───
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY", "")
@@ -72,42 +72,47 @@ def require_jwt_secret():
 DEFAULT_ORG_ID = "a0000000-0000-0000-0000-000000000001"
 DEFAULT_USER_ID = "b0000000-0000-0000-0000-000000000001"
 
-JSONB_FIELDS = frozenset({
-    'metadata', 'ai_insights', 'settings', 'preferences',
-    'hierarchy_template', 'recommended_actions', 'changes', 'actions_taken',
-    'template_structure', 'scoring_guide', 'example_factors', 'framework_mappings',
-    'tasks', 'feedback', 'payload',
-})
+# ─── ROW HELPERS ───
 
+def _temporal_columns(dicts: list) -> list:
+    """Columns holding dates/timestamps, judged by their first non-NULL value."""
+    temporal = []
+    for key in dicts[0]:
+        for d in dicts:
+            v = d[key]
+            if v is not None:
+                if isinstance(v, (datetime, date)):
+                    temporal.append(key)
+                break
+    return temporal
+
+
+def rows_to_dicts(rows):
+    """Records → JSON-ready dicts.
+
+    The pool's codecs (db/connection.py) already decode jsonb, uuid and
+    numeric, so the only conversion left is dates and timestamps to ISO
+    strings, decided once per column rather than per value."""
+    if not rows:
+        return []
+    dicts = [dict(r) for r in rows]
+    for key in _temporal_columns(dicts):
+        for d in dicts:
+            v = d[key]
+            if v is not None:
+                d[key] = v.isoformat()
+    return dicts
 
-# ─── ROW HELPERS ───
 
 def row_to_dict(row):
     if row is None:
         return None
-    d = dict(row)
-    for k, v in d.items():
-        if isinstance(v, Decimal):
-            d[k] = float(v)
-        elif isinstance(v, uuid.UUID):
-            d[k] = str(v)
-        elif isinstance(v, datetime):
-            d[k] = v.isoformat()
-        elif isinstance(v, date):
-            d[k] = v.isoformat()
-        elif isinstance(v, str) and k in JSONB_FIELDS:
-            try:
-                d[k] = json.loads(v)
-            except (json.JSONDecodeError, TypeError):
-                pass
-    return d
-
-
-def rows_to_dicts(rows):
-    return [row_to_dict(r) for r in rows]
+    return rows_to_dicts([row])[0]
 
 
 def compute_health(progress: float, start_date=None, end_date=None) -> str:
+    # The dated branch is mirrored in SQL by health_refresh.REFRESH_SQL;
+    # change both together.
     if progress >= 100:
         return "achieved"
     if start_date and end_date:
@@ -139,6 +144,28 @@ def generate_code(element_type: str) -> str:
     return f"{prefix}-{datetime.now().strftime('%y%m')}-{str(uuid.uuid4())[:4].upper()}"
 
 
+# ─── CONDITIONAL RESPONSES ───
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses weak comparison (RFC 9110 §13.1.2)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    strong = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == strong for tag in if_none_match.split(","))
+
+
+def conditional_response(request: Request, body: bytes, etag: str, cache_control: str) -> Response:
+    """Preserialized JSON, or a bodiless 304 when the client already has it."""
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        metrics.cache_requests.inc("etag", "hit")
+        return Response(status_code=304, headers=headers)
+    metrics.cache_requests.inc("etag", "miss")
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
 # ─── PASSWORD ───
 
 def hash_password(password: str) -> str:
@@ -210,6 +237,7 @@ async def get_auth(authorization: Optional[str] = Header(None)) -> AuthContext:
             detail="Invalid token: missing user or organization",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    current_org.set(org_id)  # fair queuing for this request's AI calls
     return AuthContext(user_id, org_id, payload.get("role", "member"))
 
 
@@ -224,6 +252,7 @@ async def require_auth(authorization: Optional[str] = Header(None)) -> AuthConte
     if not user_id or not org_id:
         raise HTTPException(status_code=401, detail="Invalid token: missing user or organization",
                             headers={"WWW-Authenticate": "Bearer"})
+    current_org.set(org_id)  # fair queuing for this request's AI calls
     return AuthContext(user_id, org_id, payload.get("role", "member"))
 
 
@@ -0,0 +1,426 @@
+"""Stairs — Knowledge Engine Cache
+
+The kb_* tables change only when someone reloads them, but every AI call
+builds its system prompt from them. This module owns the in-memory copy.
+
+It used to be a dict in main.py filled by five sequential queries, reachable
+only by lazily importing app.main, and POST /knowledge/reload refreshed only
+the worker that received the request. Every other worker kept serving the
+old prompt until it restarted.
+
+  - load() runs the kb_* queries concurrently, one pooled connection per
+    table, but never more than KNOWLEDGE_LOAD_CONCURRENCY at once, so a
+    reload during request traffic cannot drain the pool. A missing table
+    reads as absent; any other failure (a dropped connection, a timeout)
+    fails the load and leaves the current snapshot installed.
+  - The result is stamped with a content hash (`version`). A reload that
+    finds the same content changes nothing.
+  - The prompt variants (enriched, basic, the Strategy Analyst's framework
+    list, the failure-pattern names ai_analyze cites) are built once per
+    load, not once per AI call.
+  - Everything lives in one immutable KnowledgeSnapshot, swapped in with a
+    single assignment. A reader sees the old snapshot or the new one, never
+    half of each.
+  - reload() NOTIFYs the new version on 'stairs_knowledge'. Every process
+    hears it on the realtime bridge's listener connection and reloads
+    itself unless it already has that version. With the bridge disabled,
+    a reload reaches only the worker that received it, as before.
+
+The same load also preserializes the read-only listings the frontend asks
+for on every app load: /api/v1/knowledge/{frameworks, books,
+failure-patterns, measurement-tools, kpis, mena-intel, stats} and
+/api/v1/frameworks. Each is held as ready-to-send JSON bytes with a strong
+ETag, so serving one costs no database round trip, and a client that sends
+If-None-Match gets a 304 with no body. The listings are rebuilt only when
+the snapshot is, i.e. on a knowledge reload. The prompt data is read from
+the same rows, so a load is one query per table.
+
+The prompts state the current year. A snapshot that outlives New Year's Eve
+is recompiled from the same data on first use.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Optional
+
+import asyncpg
+from fastapi import Request, Response
+
+from app.db.connection import get_pool
+from app.helpers import conditional_response, rows_to_dicts
+from app.models.schemas import FrameworkOut
+
+logger = logging.getLogger("stairs.knowledge")
+
+CHANNEL = "stairs_knowledge"
+# Browsers may reuse a listing this long before revalidating it with If-None-Match.
+KNOWLEDGE_MAX_AGE_SECONDS = int(os.getenv("KNOWLEDGE_MAX_AGE_SECONDS", "300"))
+# Pool connections one load may hold at a time.
+KNOWLEDGE_LOAD_CONCURRENCY = int(os.getenv("KNOWLEDGE_LOAD_CONCURRENCY", "3"))
+
+# name -> SQL alternatives, tried in order; None when none of them can be read.
+_QUERIES = {
+    "frameworks": ("SELECT * FROM kb_frameworks ORDER BY phase, year_introduced",),
+    "books": (
+        """SELECT b.*, string_agg(a.name, ', ') as authors
+           FROM kb_books b
+           LEFT JOIN kb_book_authors ba ON ba.book_id = b.id
+           LEFT JOIN kb_authors a ON a.id = ba.author_id
+           GROUP BY b.id
+           ORDER BY b.integration_tier, b.year_published DESC""",
+        "SELECT * FROM kb_books ORDER BY integration_tier, year_published DESC",
+    ),
+    "failure_patterns": ("SELECT * FROM kb_failure_patterns ORDER BY severity DESC, name",),
+    "measurement_tools": ("SELECT * FROM kb_measurement_tools ORDER BY stage, year_introduced",),
+    "kpis": ("SELECT * FROM kb_leading_lagging_kpis ORDER BY perspective, kpi_type",),
+    "mena_intel": ("SELECT * FROM kb_mena_market_intel ORDER BY category, year DESC",),
+    "platform_frameworks": ("SELECT * FROM frameworks WHERE is_active = true ORDER BY code",),
+    # Counted for /stats only.
+    "authors": ("SELECT COUNT(*) AS n FROM kb_authors",),
+    "ontology_terms": ("SELECT COUNT(*) AS n FROM kb_ontology_terms",),
+    "review_cadences": ("SELECT COUNT(*) AS n FROM kb_review_cadences",),
+}
+
+# The listings served straight from the snapshot.
+LISTINGS = ("frameworks", "books", "failure_patterns", "measurement_tools", "kpis", "mena_intel",
+            "platform_frameworks", "stats")
+
+KEY_FACTS = [
+    {"label": "Strategy Execution Gap", "value": "63%", "source": "Mankins & Steele (Bain)"},
+    {"label": "Employees Understanding Strategy", "value": "5%", "source": "Kaplan & Norton"},
+    {"label": "MENA AI Market by 2030", "value": "$166B", "source": "Industry projections"},
+    {"label": "Cross-functional Trust", "value": "9%", "source": "MIT/HBR (Sull, Homkes, Sull)"},
+]
+
+
+# ─── PROMPT BUILDERS ───
+
+def build_basic_prompt() -> str:
+    return f"""You are Stairs, an AI strategy assistant created by DEVONEERS.
+The current year is {datetime.now().year}.
+You help organizations build, execute, and monitor their strategic plans.
+Expert in: OKR, Balanced Scorecard, OGSM, Hoshin Kanri, Blue Ocean Strategy, Porter's frameworks.
+Philosophy: "Human IS the Loop" — you suggest, humans decide.
+Keep responses concise and actionable. Use Arabic when the user writes in Arabic.
+Format measurable items with clear targets, units, and timeframes.
+
+When performing a SPACE Matrix analysis, include a markdown table: | Dimension | Factor | Score | (FS/IS: +1 to +6, CA/ES: -1 to -6).
+When performing a BCG Matrix analysis, include a markdown table: | Product/Unit | Market Growth Rate (%) | Relative Market Share | Quadrant |.
+When performing a Porter's Five Forces analysis, include a markdown table: | Force | Intensity (1-5) | Key Factors |."""
+
+
+def build_enriched_prompt(frameworks: list, failure_patterns: list, measurement_tools: list,
+                          books_summary: str) -> str:
+    parts = [
+        "You are Stairs, an AI strategy assistant created by DEVONEERS.",
+        f"The current year is {datetime.now().year}.",
+        'Philosophy: "Human IS the Loop" — you suggest, humans decide.',
+        "You help ANY organization build, execute, and monitor their strategic plans.",
+        "Keep responses concise and actionable. Use Arabic when the user writes in Arabic.",
+        "",
+        "═══ YOUR KNOWLEDGE BASE ═══",
+    ]
+
+    fw = frameworks
+    if fw:
+        parts.append(f"\nYou know {len(fw)} strategy frameworks:")
+        for f in fw:
+            parts.append(f"• {f['name']} ({f['originator']}, {f['year_introduced']}) [{f['phase']}]: {f['description']}")
+
+    fp = failure_patterns
+    if fp:
+        parts.append(f"\nYou detect {len(fp)} strategy failure patterns:")
+        for p in fp:
+            signals = p.get('detection_signals') or []
+            parts.append(f"• {p['name']} [{p['severity']}]: {p['description'][:120]}...")
+            if signals:
+                parts.append(f"  Signals: {', '.join(signals[:3])}")
+            if p.get('statistic'):
+                parts.append(f"  Research: {p['statistic']}")
+
+    mt = measurement_tools
+    if mt:
+        parts.append(f"\nYou can guide users through {len(mt)} strategy measurement tools:")
+        for t in mt:
+            parts.append(f"• {t['name']} (Stage: {t['stage']}): {t['description'][:100]}...")
+
+    bs = books_summary
+    if bs:
+        parts.append(f"\nKnowledge library: {bs}")
+
+    parts.extend([
+        "",
+        "═══ RULES ═══",
+        "• When analyzing strategy, actively check for failure patterns and warn the user.",
+        "• When a user asks about measuring or evaluating strategy, suggest relevant measurement tools (IFE, EFE, CPM, SPACE, IE, Grand Strategy, QSPM).",
+        "• Reference specific frameworks by name when they apply.",
+        "• Cite research statistics when relevant (e.g., '63% strategy execution gap').",
+        "• Format measurable items with clear targets, units, and timeframes.",
+        "• Never hardcode to any specific organization — adapt advice to the user's context.",
+        "",
+        "═══ STRUCTURED TABLE OUTPUT ═══",
+        "When performing a SPACE Matrix analysis, ALWAYS include a markdown table with these columns:",
+        "| Dimension | Factor | Score |",
+        "|-----------|--------|-------|",
+        "Dimension must be one of: Financial Strength, Competitive Advantage, Environmental Stability, Industry Strength.",
+        "Scores: Financial Strength and Industry Strength use +1 to +6. Competitive Advantage and Environmental Stability use -1 to -6.",
+        "",
+        "When performing a BCG Matrix analysis, ALWAYS include a markdown table with these columns:",
+        "| Product/Unit | Market Growth Rate (%) | Relative Market Share | Quadrant |",
+        "|--------------|----------------------|----------------------|----------|",
+        "Market Growth Rate is a percentage. Relative Market Share is a ratio (>=1.0 means high). Quadrant is Star, Question Mark, Cash Cow, or Dog.",
+        "",
+        "When performing a Porter's Five Forces analysis, ALWAYS include a markdown table with these columns:",
+        "| Force | Intensity (1-5) | Key Factors |",
+        "|-------|----------------|-------------|",
+        "Force must be one of: Competitive Rivalry, Threat of New Entrants, Threat of Substitutes, Bargaining Power of Buyers, Bargaining Power of Suppliers.",
+        "Intensity is 1 (low) to 5 (high).",
+        "",
+        "These tables enable the interactive calculator feature. Always include them alongside your prose analysis.",
+    ])
+
+    return "\n".join(parts)
+
+
+def build_frameworks_section(frameworks: list, measurement_tools: list) -> str:
+    """The framework and tool list the Strategy Analyst agent appends."""
+    section = ""
+    if frameworks:
+        section = f"\nYou have access to {len(frameworks)} strategy frameworks:\n"
+        for f in frameworks[:20]:
+            section += f"• {f['name']} ({f.get('originator', 'N/A')}, {f.get('year_introduced', 'N/A')}) [{f.get('phase', '')}]\n"
+    if measurement_tools:
+        section += f"\nYou can apply {len(measurement_tools)} measurement tools:\n"
+        for t in measurement_tools[:15]:
+            section += f"• {t['name']} (Stage: {t.get('stage', '')}): {(t.get('description') or '')[:80]}...\n"
+    return section
+
+
+def content_version(frameworks: list, failure_patterns: list, measurement_tools: list, books_summary: str,
+                    *extra) -> str:
+    blob = json.dumps([frameworks, failure_patterns, measurement_tools, books_summary, *extra],
+                      sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:16]
+
+
+# ─── LISTINGS ───
+
+@dataclass(frozen=True)
+class Listing:
+    body: bytes
+    etag: str
+
+
+def _listing(payload) -> Listing:
+    # Same bytes FastAPI's JSONResponse would have produced.
+    body = json.dumps(payload, ensure_ascii=False, allow_nan=False, indent=None,
+                      separators=(",", ":")).encode("utf-8")
+    return Listing(body=body, etag='"' + hashlib.sha256(body).hexdigest()[:32] + '"')
+
+
+def build_listings(data: dict) -> dict:
+    """name -> Listing for every endpoint in LISTINGS. Unreadable tables are
+    served as [] (and counted as 0), as the handlers always did."""
+    rows = {name: data.get(name) or [] for name in _QUERIES}
+    listings = {name: _listing(rows[name]) for name in LISTINGS if name not in ("platform_frameworks", "stats")}
+    # /api/v1/frameworks declares response_model=List[FrameworkOut]; keep its shape.
+    listings["platform_frameworks"] = _listing(
+        [FrameworkOut.model_validate(r).model_dump(mode="json") for r in rows["platform_frameworks"]])
+
+    def count(name):
+        return rows[name][0]["n"] if rows[name] else 0
+
+    listings["stats"] = _listing({
+        "frameworks": len(rows["frameworks"]),
+        "books": len(rows["books"]),
+        "failure_patterns": len(rows["failure_patterns"]),
+        "measurement_tools": len(rows["measurement_tools"]),
+        "authors": count("authors"),
+        "kpis": len(rows["kpis"]),
+        "mena_intel": len(rows["mena_intel"]),
+        "ontology_terms": count("ontology_terms"),
+        "review_cadences": count("review_cadences"),
+        "key_facts": KEY_FACTS,
+    })
+    return listings
+
+
+# ─── SNAPSHOT ───
+
+@dataclass(frozen=True)
+class KnowledgeSnapshot:
+    frameworks: list = field(default_factory=list)
+    failure_patterns: list = field(default_factory=list)
+    measurement_tools: list = field(default_factory=list)
+    books_summary: str = ""
+    loaded_at: Optional[datetime] = None
+    version: str = ""
+    # True when the kb_* tables were found; otherwise system_prompt is basic.
+    enriched: bool = False
+    year: int = 0
+    system_prompt: str = ""
+    basic_prompt: str = ""
+    frameworks_section: str = ""
+    failure_pattern_names: tuple = ()
+    listings: dict = field(default_factory=dict)
+    # code -> measurement tool; None when kb_measurement_tools could not be read.
+    tools_by_code: Optional[dict] = None
+
+
+def compile_snapshot(frameworks: list, failure_patterns: list, measurement_tools: list, books_summary: str,
+                     enriched: bool, loaded_at: Optional[datetime] = None, version: str = "",
+                     listings: Optional[dict] = None, tools_by_code: Optional[dict] = None) -> KnowledgeSnapshot:
+    basic = build_basic_prompt()
+    return KnowledgeSnapshot(
+        frameworks=frameworks,
+        failure_patterns=failure_patterns,
+        measurement_tools=measurement_tools,
+        books_summary=books_summary,
+        loaded_at=loaded_at,
+        version=version or content_version(frameworks, failure_patterns, measurement_tools, books_summary),
+        enriched=enriched,
+        year=datetime.now().year,
+        system_prompt=(build_enriched_prompt(frameworks, failure_patterns, measurement_tools, books_summary)
+                       if enriched else basic),
+        basic_prompt=basic,
+        frameworks_section=build_frameworks_section(frameworks, measurement_tools),
+        failure_pattern_names=tuple(p["name"] for p in failure_patterns),
+        listings=listings if listings is not None else build_listings({}),
+        tools_by_code=tools_by_code,
+    )
+
+
+# ─── CACHE ───
+
+class KnowledgeCache:
+    def __init__(self):
+        self._snapshot = compile_snapshot([], [], [], "", enriched=False)
+        self._lock: Optional[asyncio.Lock] = None
+        self.reloads = 0
+
+    def current(self) -> KnowledgeSnapshot:
+        snap = self._snapshot
+        if snap.year != datetime.now().year:
+            snap = self._snapshot = compile_snapshot(
+                snap.frameworks, snap.failure_patterns, snap.measurement_tools, snap.books_summary,
+                enriched=snap.enriched, loaded_at=snap.loaded_at, version=snap.version,
+                listings=snap.listings, tools_by_code=snap.tools_by_code)
+        return snap
+
+    async def ready(self) -> KnowledgeSnapshot:
+        """current(), loading first if this process has never loaded."""
+        snap = self.current()
+        if snap.loaded_at is None:
+            snap = await self.load()
+        return snap
+
+    def install(self, snapshot: KnowledgeSnapshot):
+        """Swap in a snapshot (one assignment; readers never see a mix)."""
+        self._snapshot = snapshot
+
+    async def load(self) -> KnowledgeSnapshot:
+        """Read the kb_* tables and swap in the result if it changed."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            pool = await get_pool()
+            gate = asyncio.Semaphore(KNOWLEDGE_LOAD_CONCURRENCY)
+
+            async def fetch(sqls: tuple) -> Optional[list]:
+                async with gate, pool.acquire() as conn:
+                    return await self._fetch(conn, sqls)
+
+            results = await asyncio.gather(*(fetch(sqls) for sqls in _QUERIES.values()))
+            data = dict(zip(_QUERIES, results))
+            listings = build_listings(data)
+            tools = data["measurement_tools"]
+            tools_by_code = {t["code"]: t for t in tools} if tools is not None else None
+
+            # No kb_frameworks: the Knowledge Engine migration has not run here,
+            # so the prompt stays basic. The listings are served regardless.
+            enriched = data["frameworks"] is not None
+            frameworks = failure_patterns = measurement_tools = []
+            books_summary = ""
+            if enriched:
+                frameworks = data["frameworks"]
+                failure_patterns = data["failure_patterns"] or []
+                measurement_tools = tools or []
+                books = data["books"]
+                if books is not None:
+                    top = [b for b in books if b.get("integration_tier") == "tier_1"][:10]
+                    books_summary = f"{len(books)} strategy books indexed. Key tier-1 references: " + \
+                        ", ".join(f"{b['title']} ({b['category']})" for b in top)
+
+            version = content_version(frameworks, failure_patterns, measurement_tools, books_summary,
+                                      sorted((name, l.etag) for name, l in listings.items()))
+            if version != self._snapshot.version or self._snapshot.loaded_at is None:
+                self.install(compile_snapshot(frameworks, failure_patterns, measurement_tools, books_summary,
+                                              enriched=enriched, loaded_at=datetime.now(timezone.utc),
+                                              version=version, listings=listings, tools_by_code=tools_by_code))
+                self.reloads += 1
+            return self._snapshot
+
+    @staticmethod
+    async def _fetch(conn, sqls: tuple) -> Optional[list]:
+        """One table, trying each query in turn: a query Postgres rejects
+        falls through to the next. None when the last names a missing table,
+        as on a partially migrated database. Anything else raises: treating
+        a dropped connection as "no tables" would install an empty snapshot
+        over a good one."""
+        for sql in sqls[:-1]:
+            try:
+                return rows_to_dicts(await conn.fetch(sql))
+            except asyncpg.PostgresError as e:
+                logger.warning("Knowledge Engine query failed, trying the next: %s", e)
+        try:
+            return rows_to_dicts(await conn.fetch(sqls[-1]))
+        except asyncpg.UndefinedTableError:
+            return None
+
+    async def reload(self) -> KnowledgeSnapshot:
+        """Reload here and tell every other process to do the same."""
+        snap = await self.load()
+        try:
+            pool = await get_pool()
+            async with pool.acquire() as conn:
+                await conn.execute("SELECT pg_notify($1, $2)", CHANNEL, snap.version)
+        except Exception as e:
+            logger.warning("Knowledge reload not announced to other workers: %s", e)
+        return snap
+
+    def on_notify(self, _conn, _pid, _channel, version: str):
+        """Listener callback: another process reloaded to `version`."""
+        if version and version != self._snapshot.version:
+            asyncio.get_running_loop().create_task(self._reload_quietly())
+
+    def on_reconnect(self):
+        """The listener was down and may have missed a notice; check."""
+        asyncio.get_running_loop().create_task(self._reload_quietly())
+
+    async def _reload_quietly(self):
+        try:
+            snap = await self.load()
+            logger.info("Knowledge Engine reloaded on notice from another worker — version %s", snap.version)
+        except Exception as e:
+            logger.warning("Knowledge Engine reload on notice failed, keeping version %s: %s",
+                           self._snapshot.version, e)
+
+
+cache = KnowledgeCache()
+
+
+async def listing_response(request: Request, name: str) -> Response:
+    """Serve one of LISTINGS from the snapshot, honouring If-None-Match."""
+    listing = (await cache.ready()).listings[name]
+    return conditional_response(request, listing.body, listing.etag,
+                                f"public, max-age={KNOWLEDGE_MAX_AGE_SECONDS}")
+
+
+def system_prompt() -> str:
+    """The system prompt every AI call without its own should use."""
+    return cache.current().system_prompt
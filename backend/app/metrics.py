@@ -0,0 +1,302 @@
+"""Stairs — Request Timing and Prometheus Metrics
+
+A slow request used to leave nothing behind but its total. Whether the time
+went to waiting for a pool connection, to SQL, to an AI provider, to the
+websocket broadcast or to rendering JSON meant reproducing it by hand.
+
+Each HTTP request now carries a phase table in a ContextVar, set by
+TimingMiddleware. The code that does each kind of work adds its time:
+
+  db_acquire  waiting for a pool connection     app/db/instrument.py
+  db          statements on that connection     app/db/instrument.py
+  ai_queue    waiting for a governor slot       app/ai_providers.py
+  ai          provider calls, retries, hedges   app/ai_providers.py
+  ws          broadcast_to_org                  app/routers/websocket.py
+  serialize   FastJSONResponse.render           app/responses.py
+
+The middleware sends the table back as a Server-Timing header, so the
+browser's network panel shows the split for any request. It also records
+it per route template in stairs_request_phase_seconds. Whatever is not in
+a phase is reported as "app". Phases can overlap when a handler gathers
+concurrent work, so "app" is clamped at zero rather than going negative.
+Routes that return dicts under response_model are serialized by FastAPI
+and count that time as "app".
+
+GET /metrics serves everything in the Prometheus text format, gated to the
+telemetry roles like the rest of the operator surface:
+
+  stairs_request_seconds          histogram by method, route, status
+  stairs_request_phase_seconds    histogram by route, phase
+  stairs_db_acquire_seconds       histogram
+  stairs_db_query_seconds         histogram
+  stairs_db_queries_per_request   histogram by route
+  stairs_db_repeated_statements_total, stairs_db_slow_queries_total
+                                  counters; see app/db/instrument.py
+  stairs_db_pool_*                pool size, in use, idle, max
+  stairs_ai_call_seconds          histogram by provider, model, task, outcome
+  stairs_ai_lane_*                governor running, queued, timed out
+  stairs_cache_requests_total     counter by cache, result (hit/miss)
+  stairs_ws_*                     connections, queue depth, frame counters
+  stairs_telemetry_*              rows recorded, written, dropped, failed;
+                                  rows pending; see app/telemetry.py
+
+Routes are labelled by template (/api/v1/stairs/{stair_id}), never by the
+raw path, so the series count stays fixed. Unmatched paths share
+"unmatched". Everything is kept in process: with several workers, each
+serves its own numbers and Prometheus should scrape each one.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from starlette.datastructures import MutableHeaders
+
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1").lower() in ("1", "true", "yes")
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+AI_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0, 120.0)
+
+PHASES = ("db_acquire", "db", "ai_queue", "ai", "ws", "serialize")
+INF = 'le="+Inf"'
+
+_phases: ContextVar[Optional[dict]] = ContextVar("request_phases", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _num(x: float) -> str:
+    return repr(float(x)) if x != int(x) else str(int(x))
+
+
+# ─── INSTRUMENTS ───
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, labels, buckets
+        self._series: dict[tuple, list] = {}  # label values -> [bucket counts, sum, count]
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        counts = series[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        series[1] += value
+        series[2] += 1
+
+    def count(self, *labels) -> int:
+        series = self._series.get(labels)
+        return series[2] if series else 0
+
+    def render(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, (counts, total, n) in sorted(self._series.items()):
+            running = 0
+            for bound, c in zip(self.buckets, counts):
+                running += c
+                le = 'le="%s"' % bound
+                out.append(f"{self.name}_bucket{_labels(self.labels, values, le)} {running}")
+            out.append(f"{self.name}_bucket{_labels(self.labels, values, INF)} {n}")
+            out.append(f"{self.name}_sum{_labels(self.labels, values)} {_num(round(total, 6))}")
+            out.append(f"{self.name}_count{_labels(self.labels, values)} {n}")
+        return out
+
+    def reset(self):
+        self._series.clear()
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for values, v in sorted(self._values.items()):
+            out.append(f"{self.name}{_labels(self.labels, values)} {_num(v)}")
+        return out
+
+    def reset(self):
+        self._values.clear()
+
+
+request_seconds = Histogram("stairs_request_seconds", "HTTP request latency.", ("method", "route", "status"))
+phase_seconds = Histogram("stairs_request_phase_seconds", "Time per phase within one HTTP request.",
+                          ("route", "phase"))
+db_acquire_seconds = Histogram("stairs_db_acquire_seconds", "Time waiting for a pool connection.")
+db_query_seconds = Histogram("stairs_db_query_seconds", "Time per SQL statement.")
+ai_call_seconds = Histogram("stairs_ai_call_seconds", "AI provider call latency, one sample per attempt.",
+                            ("provider", "model", "task", "outcome"), AI_BUCKETS)
+queries_per_request = Histogram("stairs_db_queries_per_request", "SQL statements per HTTP request.",
+                                ("route",), (1, 2, 5, 10, 20, 50, 100, 250))
+repeated_statements = Counter("stairs_db_repeated_statements_total",
+                              "Requests that ran one statement shape N_PLUS_ONE_THRESHOLD times or more.",
+                              ("route",))
+slow_queries = Counter("stairs_db_slow_queries_total", "Statements at or over SLOW_QUERY_MS.")
+cache_requests = Counter("stairs_cache_requests_total", "Cache lookups by outcome.", ("cache", "result"))
+
+INSTRUMENTS = [request_seconds, phase_seconds, db_acquire_seconds, db_query_seconds, queries_per_request,
+               repeated_statements, slow_queries, ai_call_seconds, cache_requests]
+
+
+def reset():
+    """Forget every sample. For tests."""
+    for instrument in INSTRUMENTS:
+        instrument.reset()
+
+
+# ─── PHASES ───
+
+def add(phase: str, seconds: float):
+    """Add to the current request's phase. A no-op outside a request."""
+    phases = _phases.get()
+    if phases is not None:
+        phases[phase] = phases.get(phase, 0.0) + seconds
+
+
+@contextmanager
+def timed(phase: str, histogram: Optional[Histogram] = None):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        took = time.perf_counter() - start
+        add(phase, took)
+        if histogram is not None:
+            histogram.observe(took)
+
+
+def route_label(scope) -> str:
+    """The matched route's template, or "unmatched"."""
+    return getattr(scope.get("route"), "path", None) or "unmatched"
+
+
+def _with_app(phases: dict, total: float) -> dict:
+    out = {p: phases[p] for p in PHASES if p in phases}
+    out["app"] = max(0.0, total - sum(out.values()))
+    return out
+
+
+def server_timing(phases: dict, total: float) -> str:
+    parts = [f"{p};dur={v * 1000:.1f}" for p, v in _with_app(phases, total).items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class TimingMiddleware:
+    """Plain ASGI, so the phase table is set in the request's own context
+    and the header is added without buffering the response."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        phases: dict = {}
+        token = _phases.set(phases)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if SERVER_TIMING:
+                    MutableHeaders(scope=message).append(
+                        "Server-Timing", server_timing(phases, time.perf_counter() - start))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _phases.reset(token)
+            total = time.perf_counter() - start
+            route = route_label(scope)
+            request_seconds.observe(total, scope["method"], route, str(status))
+            for phase, seconds in _with_app(phases, total).items():
+                phase_seconds.observe(seconds, route, phase)
+
+
+# ─── EXPOSITION ───
+
+def _gauge(name: str, help: str, samples: list) -> list[str]:
+    """samples: [(labels dict, value)]"""
+    out = [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+    for labels, value in samples:
+        out.append(f"{name}{_labels(tuple(labels), tuple(labels.values()))} {_num(value or 0)}")
+    return out
+
+
+def _app_gauges() -> list[str]:
+    # Imported here: these modules import this one.
+    from app.db import connection
+    from app.governor import governor
+    from app.routers.websocket import ws_manager
+    from app.telemetry import writer
+
+    out = []
+    pool = connection._pool
+    if pool is not None:
+        size, idle = pool.get_size(), pool.get_idle_size()
+        out += _gauge("stairs_db_pool_connections", "Open pool connections by state.",
+                      [({"state": "in_use"}, size - idle), ({"state": "idle"}, idle)])
+        out += _gauge("stairs_db_pool_max", "Pool max_size.", [({}, pool.get_max_size())])
+
+    lanes = {name: snap for name, snap in governor.snapshot().items() if isinstance(snap, dict)}
+    for key, help in (("running", "AI calls running per lane."), ("queued", "AI calls waiting per lane."),
+                      ("slots", "Slots reserved per lane.")):
+        out += _gauge(f"stairs_ai_lane_{key}", help, [({"lane": n}, s[key]) for n, s in lanes.items()])
+    out += ["# HELP stairs_ai_lane_timed_out_total AI calls answered busy per lane.",
+            "# TYPE stairs_ai_lane_timed_out_total counter"]
+    out += [f"stairs_ai_lane_timed_out_total{_labels(('lane',), (n,))} {s['timed_out']}" for n, s in lanes.items()]
+
+    ws = ws_manager.stats()
+    out += _gauge("stairs_ws_connections", "Open websocket connections in this process.", [({}, ws["connections"])])
+    out += _gauge("stairs_ws_organizations", "Organizations with an open websocket.", [({}, ws["organizations"])])
+    out += _gauge("stairs_ws_queued_frames", "Frames waiting in send queues.", [({}, ws["queued_frames"])])
+    out += _gauge("stairs_ws_max_queue_depth", "Deepest send queue.", [({}, ws["max_queue_depth"])])
+    out += _gauge("stairs_ws_queue_capacity", "Send queue size per connection.", [({}, ws["queue_capacity"])])
+    out += ["# HELP stairs_ws_frames_total Websocket frame counters since boot.",
+            "# TYPE stairs_ws_frames_total counter"]
+    for key in ("frames_enqueued", "frames_sent", "frames_dropped", "send_errors", "slow_consumers_disconnected"):
+        out.append(f"stairs_ws_frames_total{_labels(('result',), (key,))} {ws[key]}")
+
+    telemetry = writer.stats()
+    out += _gauge("stairs_telemetry_pending_rows", "Telemetry rows waiting to be written.",
+                  [({}, telemetry["pending"])])
+    out += ["# HELP stairs_telemetry_rows_total Telemetry rows by outcome since boot.",
+            "# TYPE stairs_telemetry_rows_total counter"]
+    for key in ("recorded", "written", "dropped", "failed"):
+        out.append(f"stairs_telemetry_rows_total{_labels(('result',), (key,))} {telemetry[key]}")
+    return out
+
+
+def render() -> str:
+    lines = []
+    for instrument in INSTRUMENTS:
+        lines += instrument.render()
+    lines += _app_gauges()
+    return "\n".join(lines) + "\n"
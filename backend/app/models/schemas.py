@@ -416,6 +416,54 @@ class KPIMeasurementOut(BaseModel):
     source_system: Optional[str] = None
     created_at: Optional[datetime] = None
 
+class KPIBulkRow(BaseModel):
+    """One measurement in POST /kpis/bulk. Names its stair by id or by code."""
+    stair_id: Optional[UUID] = None
+    code: Optional[str] = Field(None, max_length=50)
+    measured_at: Optional[datetime] = None
+    value: float
+    source: str = Field("integration", max_length=50)
+    source_system: Optional[str] = Field(None, max_length=100)
+
+class KPIBulkRequest(BaseModel):
+    measurements: List[KPIBulkRow] = Field(..., min_length=1)
+
+class KPIBulkRowResult(BaseModel):
+    index: int
+    status: str  # inserted | rejected
+    id: Optional[str] = None
+    stair_id: Optional[str] = None
+    error: Optional[str] = None
+
+class KPIBulkResult(BaseModel):
+    inserted: int
+    rejected: int
+    results: List[KPIBulkRowResult]
+
+class KPISeriesPoint(BaseModel):
+    """One bucket of /stairs/{id}/kpi/series, read from kpi_rollups."""
+    bucket_start: datetime
+    count: int
+    sum: float
+    avg: float
+    min: float
+    max: float
+    first: float
+    first_at: datetime
+    last: float
+    last_at: datetime
+
+class StairForecast(BaseModel):
+    """A stair's progress trend, fitted from stair_progress (app/forecasting.py)."""
+    stair_id: str
+    samples: int
+    current_progress: float
+    velocity_per_day: Optional[float] = None
+    projected_completion: Optional[date] = None
+    days_to_completion: Optional[int] = None
+    end_date: Optional[date] = None
+    completion_probability: Optional[float] = None
+
 class RegisterRequest(BaseModel):
     email: str
     password: str
@@ -0,0 +1,87 @@
+"""Stairs — Adaptive max_tokens
+
+Every agent hardcoded its max_tokens, 1024 or 2048, whatever the task
+actually produces. A validation score that is never longer than 300 tokens
+still reserved 1024 against the output-token rate limit. A runaway
+generation could run to the full 2048 before anything stopped it.
+
+agent_logs now records output_tokens per call. Every
+OUTPUT_BUDGET_REFRESH_SECONDS a background task reads that column's p99
+per task_type over the last OUTPUT_BUDGET_LOOKBACK_DAYS. A task type with at
+least OUTPUT_BUDGET_MIN_SAMPLES successful calls is then capped at p99 ×
+OUTPUT_BUDGET_HEADROOM, never below OUTPUT_BUDGET_FLOOR.
+
+The agent's own max_tokens stays the ceiling. The budget only ever lowers
+it, so a prompt change that makes a task wordier is bounded by what the
+agent asked for and shows up in the next refresh. Task types without enough
+history keep their hardcoded value.
+"""
+
+import asyncio
+import logging
+import math
+import os
+from typing import Optional
+
+from app.db.connection import get_pool
+
+logger = logging.getLogger("stairs.output_budget")
+
+OUTPUT_BUDGET = os.getenv("OUTPUT_BUDGET", "on").lower() not in ("off", "0", "false", "no")
+OUTPUT_BUDGET_REFRESH_SECONDS = float(os.getenv("OUTPUT_BUDGET_REFRESH_SECONDS", "600"))
+OUTPUT_BUDGET_LOOKBACK_DAYS = int(os.getenv("OUTPUT_BUDGET_LOOKBACK_DAYS", "14"))
+OUTPUT_BUDGET_MIN_SAMPLES = int(os.getenv("OUTPUT_BUDGET_MIN_SAMPLES", "50"))
+OUTPUT_BUDGET_HEADROOM = float(os.getenv("OUTPUT_BUDGET_HEADROOM", "1.3"))
+OUTPUT_BUDGET_FLOOR = int(os.getenv("OUTPUT_BUDGET_FLOOR", "256"))
+
+DISTRIBUTION_SQL = """SELECT task_type, COUNT(*) AS n,
+        percentile_cont(0.99) WITHIN GROUP (ORDER BY output_tokens) AS p99
+    FROM agent_logs
+    WHERE ok AND output_tokens > 0 AND created_at > NOW() - make_interval(days => $1)
+    GROUP BY task_type"""
+
+
+class OutputBudget:
+    def __init__(self):
+        self._caps: dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def limit(self, task_type: str, requested: int) -> int:
+        cap = self._caps.get(task_type)
+        return min(requested, cap) if cap else requested
+
+    def load(self, rows) -> None:
+        self._caps = {
+            r["task_type"]: max(OUTPUT_BUDGET_FLOOR, math.ceil(float(r["p99"]) * OUTPUT_BUDGET_HEADROOM))
+            for r in rows if r["n"] >= OUTPUT_BUDGET_MIN_SAMPLES and r["p99"] is not None
+        }
+
+    async def refresh(self) -> None:
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            self.load(await conn.fetch(DISTRIBUTION_SQL, OUTPUT_BUDGET_LOOKBACK_DAYS))
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Output budget refresh failed: %s", e)
+            await asyncio.sleep(OUTPUT_BUDGET_REFRESH_SECONDS)
+
+    def snapshot(self) -> dict:
+        return dict(self._caps)
+
+
+budget = OutputBudget()
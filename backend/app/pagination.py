@@ -0,0 +1,124 @@
+"""Stairs — Keyset Pagination
+
+The list endpoints returned everything (sources, notes, artifacts,
+strategies, confidence) or cut off at a LIMIT with no way to ask for what
+came next (alerts, progress history, KPI measurements). A large strategy
+was either silently truncated or shipped whole.
+
+Each list is now ordered by a Keyset: its sort columns plus the primary key
+as a tie-breaker, all descending, with a matching index (migration 13). A
+page is
+
+    ... WHERE <filters> AND (k1, k2, id) < (<last row's values>)
+        ORDER BY k1 DESC, k2 DESC, id DESC LIMIT n + 1
+
+so every page, first or five-hundredth, is one index range scan of n + 1
+rows. OFFSET would read and discard everything before the page.
+
+The response body keeps its old shape, a plain list. When there is more,
+the cursor for the next page is in the X-Next-Cursor header. The client
+passes it back as ?cursor=. It is opaque (base64 JSON of the last row's
+key values) and bound to the list it came from. Endpoints that used to
+return everything still do when called without `limit` or `cursor`, so
+existing clients see no difference until they opt in.
+"""
+
+import base64
+import json
+import os
+from typing import Optional
+
+from fastapi import HTTPException, Response
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", "100"))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "500"))
+
+
+class Keyset:
+    def __init__(self, name: str, *columns: tuple):
+        """columns: (sql expression, sql type, row key), most significant
+        first, ending with a unique column. All are ordered DESC."""
+        self.name = name
+        self.columns = columns
+
+    def cursor(self, row: dict) -> str:
+        values = [_text(row[key]) for _, _, key in self.columns]
+        raw = json.dumps([self.name, values], separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    def decode(self, cursor: str) -> list:
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            name, values = json.loads(raw)
+        except Exception:
+            raise HTTPException(400, "Invalid cursor")
+        if name != self.name or not isinstance(values, list) or len(values) != len(self.columns):
+            raise HTTPException(400, "Invalid cursor")
+        return values
+
+    def apply(self, q: str, params: list, cursor: Optional[str], limit: Optional[int]) -> tuple[str, list]:
+        """Append the seek condition, ORDER BY and LIMIT to a query that
+        already has a WHERE clause. Asks for one extra row to learn whether
+        there is a next page."""
+        params = list(params)
+        if cursor:
+            placeholders = []
+            for value, (_, sqltype, _) in zip(self.decode(cursor), self.columns):
+                params.append(value)
+                # Bound as text and cast, so one cursor format serves every type.
+                placeholders.append(f"${len(params)}::text::{sqltype}")
+            q += f" AND ({', '.join(expr for expr, _, _ in self.columns)}) < ({', '.join(placeholders)})"
+        q += " ORDER BY " + ", ".join(f"{expr} DESC" for expr, _, _ in self.columns)
+        if limit:
+            params.append(limit + 1)
+            q += f" LIMIT ${len(params)}"
+        return q, params
+
+    def page(self, rows: list, limit: Optional[int]) -> tuple[list, Optional[str]]:
+        """Trim the extra row; return the page and the next cursor (or None)."""
+        if limit and len(rows) > limit:
+            rows = rows[:limit]
+            return rows, self.cursor(rows[-1])
+        return rows, None
+
+
+def _text(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def page_limit(limit: Optional[int], cursor: Optional[str]) -> Optional[int]:
+    """The page size: as asked, the default when only a cursor was sent, or
+    None (everything) for a caller that uses neither."""
+    if limit is None and cursor:
+        return PAGE_SIZE_DEFAULT
+    return limit
+
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]):
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+
+# ─── ORDERINGS ───
+# Each is backed by an index created in migration 13.
+
+SOURCES = Keyset("sources", ("created_at", "timestamptz", "created_at"), ("id", "uuid", "id"))
+NOTES = Keyset("notes", ("pinned", "boolean", "pinned"), ("updated_at", "timestamptz", "updated_at"),
+               ("id", "uuid", "id"))
+ALERT_RANK_SQL = "(CASE severity WHEN 'critical' THEN 3 WHEN 'high' THEN 2 WHEN 'medium' THEN 1 ELSE 0 END)"
+ALERTS = Keyset("alerts", (ALERT_RANK_SQL, "int", "severity_rank"), ("created_at", "timestamptz", "created_at"),
+                ("id", "uuid", "id"))
+PROGRESS = Keyset("progress", ("p.snapshot_date", "date", "snapshot_date"), ("p.id", "uuid", "id"))
+KPI_MEASUREMENTS = Keyset("kpi", ("m.measured_at", "timestamptz", "measured_at"), ("m.id", "uuid", "id"))
+STAIR_ARTIFACTS = Keyset("stair_artifacts", ("a.generated_at", "timestamptz", "generated_at"),
+                         ("a.id", "uuid", "id"))
+STRATEGY_ARTIFACTS = Keyset("strategy_artifacts", ("generated_at", "timestamptz", "generated_at"),
+                            ("id", "uuid", "id"))
+STRATEGIES = Keyset("strategies", ("s.updated_at", "timestamptz", "updated_at"), ("s.id", "uuid", "id"))
@@ -0,0 +1,413 @@
+"""Stairs — Realtime Bridge (Postgres LISTEN/NOTIFY)
+
+ws_manager only knows the sockets held by its own process. With more than
+one uvicorn worker, or more than one Railway replica, an update handled by
+worker A never reached a browser connected to worker B. This bridge makes
+broadcast_to_org cluster-wide using only the Postgres we already run:
+
+    writer ──▶ outbox ──▶ publisher task ──▶ realtime_events + pg_notify
+                                                      │
+    every process: dedicated LISTEN connection ◀──────┘
+                   └─▶ dispatcher ──▶ ws_manager.deliver() ──▶ local sockets
+
+Publishing. A handler never waits on the database to announce an event: it
+drops it into a bounded outbox, and one publisher task per process writes the
+outbox in batches. Each event takes the next per-organization sequence number
+from realtime_org_seq and is stored in realtime_events in the same statement
+that NOTIFYs it. The upsert's row lock is held until commit and Postgres
+delivers notifications in commit order, so per-org sequence order and
+delivery order are the same on every listener.
+
+Postgres caps a NOTIFY payload at 8000 bytes. Anything near that is announced
+by reference (org, seq, id) and the listener reads the row back.
+
+Receiving. Every process holds one connection outside the pool that does
+nothing but LISTEN. Notifications go through a single dispatcher task, which
+is what keeps them ordered. It remembers the last sequence number delivered
+per org. A number at or below that has been seen already and is dropped. A
+number that skips ahead means something was missed, such as a dropped
+listener connection, and the missing rows are read back from realtime_events
+before the new one is delivered. When the listener connection drops it
+reconnects with backoff and catches up the same way for every org that has
+sockets here.
+
+If the bridge cannot start, or the publisher cannot reach the database,
+events are delivered locally: single-process behaviour, never silence.
+
+Other cluster-wide notices (knowledge reloads, for one) ride on the same
+listener connection through subscribe() rather than opening their own.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Optional
+
+from app.db.connection import get_pool, connect_dedicated
+from app.routers.websocket import ConnectionManager, ws_manager, serialize
+
+logger = logging.getLogger("stairs.realtime")
+
+CHANNEL = "stairs_realtime"
+
+REALTIME_BRIDGE = os.getenv("REALTIME_BRIDGE", "on").lower() not in ("off", "0", "false", "no")
+REALTIME_OUTBOX_SIZE = int(os.getenv("REALTIME_OUTBOX_SIZE", "1000"))
+REALTIME_PUBLISH_BATCH = int(os.getenv("REALTIME_PUBLISH_BATCH", "100"))
+# Rows older than this are pruned. It is also how far back a listener can
+# catch up after losing its connection, and a client can replay from.
+REALTIME_RETENTION_HOURS = float(os.getenv("REALTIME_RETENTION_HOURS", "24"))
+REALTIME_PRUNE_INTERVAL_SECONDS = 600
+# The most events a reconnecting client is sent; further behind, it resyncs.
+REALTIME_REPLAY_MAX = int(os.getenv("REALTIME_REPLAY_MAX", "500"))
+# A proxy can drop an idle connection without the client noticing. Pinging
+# the listener this often is how the bridge finds out.
+REALTIME_KEEPALIVE_SECONDS = float(os.getenv("REALTIME_KEEPALIVE_SECONDS", "30"))
+RECONNECT_MAX_SECONDS = 30
+# Postgres rejects NOTIFY payloads of 8000 bytes or more. This leaves room
+# for the envelope around the message.
+NOTIFY_INLINE_LIMIT = 7000
+
+
+# One statement per event: take the next per-org sequence number, persist the
+# event and announce it. Every parameter is declared text so asyncpg does not
+# deduce conflicting types for a parameter that appears twice.
+PUBLISH_SQL = f"""
+    WITH next AS (
+        INSERT INTO realtime_org_seq (organization_id, seq) VALUES ($1::text::uuid, 1)
+        ON CONFLICT (organization_id) DO UPDATE SET seq = realtime_org_seq.seq + 1
+        RETURNING seq
+    ), ev AS (
+        INSERT INTO realtime_events (organization_id, seq, event_type, payload)
+        SELECT $1::text::uuid, next.seq, $2::text, $3::text::jsonb FROM next
+        RETURNING id, seq
+    )
+    SELECT pg_notify('{CHANNEL}', json_build_object(
+        'org', $1::text, 'seq', ev.seq, 'id', ev.id,
+        'message', CASE WHEN $4::boolean THEN $3::text::json END
+    )::text)
+    FROM ev
+"""
+
+
+def _as_dict(payload) -> dict:
+    # JSONB comes back as text unless the pool registers a codec.
+    return json.loads(payload) if isinstance(payload, str) else payload
+
+
+class RealtimeBridge:
+    def __init__(self, manager: ConnectionManager):
+        self.manager = manager
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=REALTIME_OUTBOX_SIZE)
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self.last_seq: dict[str, int] = {}
+        self.listener = None
+        self.running = False
+        self._lost: Optional[asyncio.Event] = None
+        self._tasks: list[asyncio.Task] = []
+        self._last_prune = 0.0
+        self._subscriptions: dict[str, tuple] = {}
+        self.metrics = {
+            "published": 0,
+            "publish_failures": 0,
+            "outbox_overflow": 0,
+            "notifications": 0,
+            "delivered": 0,
+            "duplicates": 0,
+            "gaps_backfilled": 0,
+            "listener_reconnects": 0,
+        }
+
+    # ─── LIFECYCLE ───
+
+    async def start(self):
+        """Open the listener and start the tasks. Raises if the listener
+        cannot connect; the caller then keeps local-only delivery."""
+        await self._connect()
+        self.running = True
+        self._tasks = [
+            asyncio.create_task(self._supervise()),
+            asyncio.create_task(self._dispatch()),
+            asyncio.create_task(self._publish_loop()),
+        ]
+        self.manager.bridge = self
+
+    async def stop(self):
+        """Detach, publish whatever is still in the outbox, close the listener."""
+        if self.manager.bridge is self:
+            self.manager.bridge = None
+        self.running = False
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        pending = []
+        while not self.outbox.empty():
+            pending.append(self.outbox.get_nowait())
+        if pending:
+            try:
+                await asyncio.wait_for(self._publish(pending), timeout=5)
+            except Exception as e:
+                logger.warning("[realtime] %d event(s) unpublished at shutdown: %s", len(pending), e)
+        if self.listener is not None:
+            try:
+                await self.listener.close()
+            except Exception:
+                pass
+            self.listener = None
+
+    def subscribe(self, channel: str, callback, on_reconnect=None):
+        """LISTEN on another channel over the bridge's connection. `callback`
+        takes asyncpg's (connection, pid, channel, payload); `on_reconnect`,
+        if given, is called after the listener comes back, since anything
+        sent while it was down is gone."""
+        self._subscriptions[channel] = (callback, on_reconnect)
+
+    async def _connect(self):
+        conn = await connect_dedicated()
+        lost = asyncio.Event()
+        conn.add_termination_listener(lambda _conn: lost.set())
+        await conn.add_listener(CHANNEL, self._on_notify)
+        for channel, (callback, _) in self._subscriptions.items():
+            await conn.add_listener(channel, callback)
+        self.listener, self._lost = conn, lost
+
+    async def _supervise(self):
+        """Keep the listener alive; reconnect with backoff and catch up."""
+        while True:
+            try:
+                await asyncio.wait_for(self._lost.wait(), timeout=REALTIME_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                try:
+                    await asyncio.wait_for(self.listener.fetchval("SELECT 1"), timeout=5)
+                    continue
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    pass
+            logger.warning("[realtime] listener connection lost — reconnecting")
+            old, self.listener = self.listener, None
+            if old is not None:
+                try:
+                    old.terminate()
+                except Exception:
+                    pass
+            delay = 1
+            while True:
+                try:
+                    await self._connect()
+                    break
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning("[realtime] listener reconnect failed: %s — retrying in %ss", e, delay)
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, RECONNECT_MAX_SECONDS)
+            self.metrics["listener_reconnects"] += 1
+            for _, on_reconnect in self._subscriptions.values():
+                if on_reconnect is not None:
+                    on_reconnect()
+            try:
+                await self._catch_up()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("[realtime] catch-up after reconnect failed: %s", e)
+
+    # ─── PUBLISH ───
+
+    def publish(self, org_id: str, message: dict) -> bool:
+        """Queue an event for the cluster. False when the outbox is full, in
+        which case the caller should deliver locally."""
+        try:
+            self.outbox.put_nowait((org_id, message))
+            return True
+        except asyncio.QueueFull:
+            self.metrics["outbox_overflow"] += 1
+            return False
+
+    async def _publish_loop(self):
+        while True:
+            batch = [await self.outbox.get()]
+            while len(batch) < REALTIME_PUBLISH_BATCH and not self.outbox.empty():
+                batch.append(self.outbox.get_nowait())
+            try:
+                await self._publish(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.metrics["publish_failures"] += len(batch)
+                logger.warning("[realtime] publish failed for %d event(s), delivering locally: %s",
+                               len(batch), e)
+                for org_id, message in batch:
+                    await self.manager.deliver(org_id, message)
+            try:
+                await self._maybe_prune()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("[realtime] prune failed: %s", e)
+
+    async def _publish(self, batch: list):
+        rows = []
+        for org_id, message in batch:
+            body = serialize(message)
+            inline = len(body.encode("utf-8")) <= NOTIFY_INLINE_LIMIT
+            rows.append((str(org_id), str(message.get("event") or ""), body, inline))
+        # executemany runs as one transaction, so each org's realtime_org_seq
+        # row stays locked until the batch commits. Taking the locks in org
+        # order keeps two workers from deadlocking on each other's batches;
+        # the sort is stable, so events for one org keep their queue order.
+        rows.sort(key=lambda row: row[0])
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            await conn.executemany(PUBLISH_SQL, rows)
+        self.metrics["published"] += len(rows)
+
+    async def _maybe_prune(self):
+        now = time.monotonic()
+        if now - self._last_prune < REALTIME_PRUNE_INTERVAL_SECONDS:
+            return
+        self._last_prune = now
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            await conn.execute(
+                "DELETE FROM realtime_events WHERE created_at < NOW() - ($1::float8 * INTERVAL '1 hour')",
+                REALTIME_RETENTION_HOURS)
+
+    # ─── RECEIVE ───
+
+    def _on_notify(self, _conn, _pid, _channel, payload: str):
+        try:
+            note = json.loads(payload)
+        except ValueError:
+            logger.warning("[realtime] unparseable notification ignored")
+            return
+        self.metrics["notifications"] += 1
+        self.inbox.put_nowait(note)
+
+    async def _dispatch(self):
+        while True:
+            note = await self.inbox.get()
+            try:
+                await self._receive(note)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("[realtime] dropped notification for org %s seq %s: %s",
+                               note.get("org"), note.get("seq"), e)
+
+    async def _receive(self, note: dict):
+        org_id, seq = note["org"], int(note["seq"])
+        last = self.last_seq.get(org_id)
+        if last is not None and seq <= last:
+            self.metrics["duplicates"] += 1
+            return
+        if org_id not in self.manager.connections:
+            # Nobody here is listening; remember the position and move on.
+            self.last_seq[org_id] = seq
+            return
+        if last is not None and seq > last + 1:
+            try:
+                missed = await self._fetch_range(org_id, last, seq)
+            except Exception as e:
+                logger.warning("[realtime] backfill of org %s seq %d–%d failed: %s", org_id, last + 1, seq - 1, e)
+                missed = []
+            for row in missed:
+                self.metrics["gaps_backfilled"] += 1
+                await self._deliver(org_id, row["seq"], _as_dict(row["payload"]))
+        message = note.get("message")
+        if message is None:
+            message = await self._fetch_one(note["id"])
+        await self._deliver(org_id, seq, message)
+
+    async def _deliver(self, org_id: str, seq: int, message: dict):
+        if seq <= self.last_seq.get(org_id, 0):
+            self.metrics["duplicates"] += 1
+            return
+        self.last_seq[org_id] = seq
+        self.metrics["delivered"] += 1
+        await self.manager.deliver(org_id, {**message, "seq": seq})
+
+    async def _fetch_range(self, org_id: str, after: int, before: int) -> list:
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            return await conn.fetch("""
+                SELECT seq, payload FROM realtime_events
+                WHERE organization_id = $1::text::uuid AND seq > $2 AND seq < $3
+                ORDER BY seq
+            """, org_id, after, before)
+
+    async def _fetch_one(self, event_id: str) -> dict:
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            payload = await conn.fetchval(
+                "SELECT payload FROM realtime_events WHERE id = $1::text::uuid", str(event_id))
+        if payload is None:
+            raise LookupError(f"event {event_id} already pruned")
+        return _as_dict(payload)
+
+    async def _catch_up(self):
+        """After a reconnect, queue every event each locally-watched org
+        missed. They go through the dispatcher like any notification, so
+        anything a live notification already delivered is dropped as a
+        duplicate."""
+        orgs = [o for o in self.manager.connections if o in self.last_seq]
+        if not orgs:
+            return
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT c.org, e.seq, e.payload
+                FROM unnest($1::text[], $2::bigint[]) AS c(org, last_seq)
+                JOIN realtime_events e
+                  ON e.organization_id = c.org::uuid AND e.seq > c.last_seq
+                ORDER BY c.org, e.seq
+            """, orgs, [self.last_seq[o] for o in orgs])
+        for row in rows:
+            self.inbox.put_nowait({"org": row["org"], "seq": row["seq"],
+                                   "message": _as_dict(row["payload"])})
+
+    # ─── REPLAY ───
+
+    async def cursor(self, org_id: str) -> int:
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            seq = await conn.fetchval(
+                "SELECT seq FROM realtime_org_seq WHERE organization_id = $1::text::uuid", org_id)
+        return seq or 0
+
+    async def replay(self, org_id: str, since: int) -> Optional[list[dict]]:
+        """Events after `since` from realtime_events, or None when some of them
+        have been pruned (or there are more than a replay will carry)."""
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            head = await conn.fetchval(
+                "SELECT seq FROM realtime_org_seq WHERE organization_id = $1::text::uuid", org_id) or 0
+            if since > head:
+                return None
+            if since == head:
+                return []
+            if head - since > REALTIME_REPLAY_MAX:
+                return None
+            rows = await conn.fetch("""
+                SELECT seq, payload FROM realtime_events
+                WHERE organization_id = $1::text::uuid AND seq > $2 AND seq <= $3
+                ORDER BY seq
+            """, org_id, since, head)
+        if len(rows) != head - since:
+            return None
+        return [{**_as_dict(r["payload"]), "seq": r["seq"]} for r in rows]
+
+    def stats(self) -> dict:
+        return {
+            **self.metrics,
+            "listening": self.listener is not None,
+            "outbox_depth": self.outbox.qsize(),
+            "outbox_capacity": REALTIME_OUTBOX_SIZE,
+            "tracked_organizations": len(self.last_seq),
+        }
+
+
+bridge = RealtimeBridge(ws_manager)
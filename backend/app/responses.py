@@ -0,0 +1,85 @@
+"""Stairs — Fast JSON Responses
+
+A handler that returns plain dicts under `response_model=` pays for the data
+twice after building it: FastAPI validates every row against the model, then
+runs jsonable_encoder over the result before json.dumps. For the stair tree
+of a large organization that second and third walk cost about as much as the
+query did. The rows are already API-shaped by then: the pool's codecs decode
+jsonb, uuid and numeric, and rows_to_dicts formats timestamps.
+
+The large reads return `fast_response(...)` instead. It:
+
+  - projects each row onto the model's fields (one dict comprehension per
+    row), so the output has exactly the keys response_model would have
+    produced. Internal columns from `SELECT *` are dropped and missing ones
+    get their defaults.
+  - renders the result with orjson (stdlib json if it is not installed).
+  - returns a Response, which FastAPI sends as-is, skipping validation and
+    jsonable_encoder.
+
+`response_model=` stays on the route for the OpenAPI schema. The schema is
+still enforced: with VALIDATE_RESPONSES set (the test suite sets it, and so
+should any debug deployment), fast_response validates the content against
+the model first and raises on a mismatch.
+
+benchmarks/serialization.py compares the two paths.
+"""
+
+import json
+import os
+from functools import lru_cache
+from typing import Any, Optional
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, TypeAdapter
+from pydantic.fields import FieldInfo
+
+from app import metrics
+
+try:
+    import orjson
+except ImportError:  # optional; falls back to the stdlib encoder
+    orjson = None
+
+VALIDATE_RESPONSES = os.getenv("VALIDATE_RESPONSES", "").lower() in ("1", "true", "yes")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        with metrics.timed("serialize"):
+            if orjson is not None:
+                return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+            return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+@lru_cache(maxsize=None)
+def _fields(model: type[BaseModel]) -> tuple:
+    return tuple(model.model_fields.items())
+
+
+def _default(model: type[BaseModel], name: str, field: FieldInfo) -> Any:
+    """The default for a field the row lacks. Built per row, so no two rows
+    share a default list or dict."""
+    if field.is_required():
+        raise ValueError(f"{model.__name__}.{name} is required but the row has no {name!r} column")
+    return field.get_default(call_default_factory=True)
+
+
+def project(model: type[BaseModel], rows: list[dict]) -> list[dict]:
+    """Each row cut down to `model`'s fields, defaults filled in. Raises
+    ValueError when a row lacks a required field."""
+    fields = _fields(model)
+    return [{name: row[name] if name in row else _default(model, name, f) for name, f in fields} for row in rows]
+
+
+@lru_cache(maxsize=None)
+def _adapter(model) -> TypeAdapter:
+    return TypeAdapter(model)
+
+
+def fast_response(content: Any, model: Optional[Any] = None, status_code: int = 200) -> FastJSONResponse:
+    """Send `content` without a second pass through pydantic; `model` is the
+    route's response_model, checked only when VALIDATE_RESPONSES is set."""
+    if VALIDATE_RESPONSES and model is not None:
+        _adapter(model).validate_python(content)
+    return FastJSONResponse(content, status_code=status_code)
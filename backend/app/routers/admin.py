@@ -3,11 +3,13 @@
 import logging
 from datetime import datetime, timezone, timedelta
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 
 from app.db.connection import get_pool
-from app.helpers import get_auth, AuthContext
+from app.helpers import get_auth, require_agent_telemetry, AuthContext
 from app.ai_providers import get_ai_status
+from app.routers.websocket import ws_manager
+from app.usage import meter
 
 logger = logging.getLogger(__name__)
 
@@ -216,3 +218,51 @@ async def agent_stats(auth: AuthContext = Depends(get_auth)):
         ]
 
     return result
+
+
+@router.get("/realtime")
+async def realtime_stats(auth: AuthContext = Depends(require_agent_telemetry)):
+    """Websocket fan-out counters and queue gauges for this process: how many
+    frames were queued, sent and dropped, and how many slow consumers were
+    cut off. A climbing frames_dropped is a client that stopped reading."""
+    return ws_manager.stats()
+
+
+@router.get("/ai-usage")
+async def ai_usage(
+    days: int = Query(30, ge=1, le=366),
+    auth: AuthContext = Depends(require_agent_telemetry),
+):
+    """Token usage for the caller's organization, per UTC day and task type,
+    from the ai_usage_daily rollup, with today's standing against its daily
+    limits. Today's figure includes what this worker has counted but not yet
+    flushed."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            "SELECT day, task_type, input_tokens, output_tokens, calls FROM ai_usage_daily "
+            "WHERE organization_id = $1 AND day > (NOW() AT TIME ZONE 'UTC')::date - $2::int "
+            "ORDER BY day DESC, task_type",
+            auth.org_id, days,
+        )
+    by_day: dict = {}
+    for r in rows:
+        day = by_day.setdefault(r["day"].isoformat(), {"day": r["day"].isoformat(), "input_tokens": 0,
+                                                       "output_tokens": 0, "calls": 0, "by_task": {}})
+        day["input_tokens"] += r["input_tokens"]
+        day["output_tokens"] += r["output_tokens"]
+        day["calls"] += r["calls"]
+        day["by_task"][r["task_type"] or "other"] = {
+            "input_tokens": r["input_tokens"], "output_tokens": r["output_tokens"], "calls": r["calls"],
+        }
+    soft, hard = meter.limits(auth.org_id)
+    return {
+        "organization_id": auth.org_id,
+        "days": list(by_day.values()),
+        "today": {
+            "tokens": meter.used(auth.org_id),
+            "soft_limit": soft or None,
+            "hard_limit": hard or None,
+            "state": meter.state(auth.org_id),
+        },
+    }
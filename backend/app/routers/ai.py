@@ -8,6 +8,7 @@ import uuid
 from typing import List
 
 from fastapi import APIRouter, HTTPException, Depends, UploadFile, File
+from fastapi.encoders import jsonable_encoder
 import httpx
 
 from app.db.connection import get_pool
@@ -16,7 +17,7 @@ from app.helpers import (
     get_auth, require_agent_telemetry, AuthContext,
     ANTHROPIC_API_KEY,
 )
-from app import ai_client
+from app import ai_client, forecasting, knowledge_cache, telemetry
 from app.models.schemas import (
     AIChatRequest, AIChatResponse, AIGenerateRequest,
     QuestionnaireGenerateRequest, QuestionnaireGenerateResponse,
@@ -30,7 +31,9 @@ from app.routers.sources import log_source
 from app.ai_providers import (
     call_ai_with_fallback, PROVIDER_DISPLAY, get_ai_status,
 )
-from app.agents.orchestrator import Orchestrator
+from app.agents.base_agent import agent_calls
+from app.agents.orchestrator import Orchestrator, process_calls
+from app.governor import current_org, governor
 
 logger = logging.getLogger(__name__)
 
@@ -84,22 +87,11 @@ async def _log_ai_usage(
     fallback_from: str = None,
     error_message: str = None,
 ):
-    try:
-        pool = await get_pool()
-        async with pool.acquire() as conn:
-            table_exists = await conn.fetchval(
-                "SELECT EXISTS(SELECT 1 FROM information_schema.tables WHERE table_name = 'ai_usage_logs')"
-            )
-            if table_exists:
-                await conn.execute(
-                    "INSERT INTO ai_usage_logs (id, provider, success, response_time_ms, tokens_used, "
-                    "status_code, fallback_used, fallback_from, error_message) "
-                    "VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)",
-                    str(uuid.uuid4()), provider, success, response_time_ms, tokens_used,
-                    status_code, fallback_used, fallback_from, error_message,
-                )
-    except Exception as e:
-        logger.warning("Failed to log AI usage: %s", e)
+    """Queue an ai_usage_logs row; app.telemetry writes it in the background."""
+    telemetry.writer.record("ai_usage_logs", (
+        str(uuid.uuid4()), provider, success, response_time_ms, tokens_used,
+        status_code, fallback_used, fallback_from, error_message, current_org.get() or None,
+    ))
 
 
 @router.get("/provider")
@@ -135,6 +127,9 @@ async def get_ai_health(auth: AuthContext = Depends(require_agent_telemetry)):
         "last_error": snap["last_error"],
         "fallback_switches_today": status["fallback_switches_today"],
         "providers": status["providers"],
+        "hedging": status["hedging"],
+        "coalescing": {"agent_calls": agent_calls.snapshot(), "orchestrator": process_calls.snapshot()},
+        "concurrency": governor.snapshot(),
     }
 
 
@@ -350,25 +345,27 @@ async def ai_chat(req: AIChatRequest, auth: AuthContext = Depends(get_auth)):
 
 @router.post("/analyze/{stair_id}")
 async def ai_analyze(stair_id: str, auth: AuthContext = Depends(get_auth)):
-    from app.main import _knowledge_cache
     pool = await get_pool()
     async with pool.acquire() as conn:
         stair = await conn.fetchrow("SELECT * FROM stairs WHERE id = $1 AND organization_id = $2 AND deleted_at IS NULL", stair_id, auth.org_id)
         if not stair: raise HTTPException(404, "Stair not found")
         children = await conn.fetch("SELECT title, element_type, health, progress_percent FROM stairs WHERE parent_id = $1 AND deleted_at IS NULL", stair_id)
         history = await conn.fetch("SELECT * FROM stair_progress WHERE stair_id = $1 ORDER BY snapshot_date DESC LIMIT 10", stair_id)
+        forecast = await forecasting.stair_forecast(conn, stair_id, auth.org_id)
     prompt = f"""Analyze for risks:\nELEMENT: {stair['title']} (type: {stair['element_type']})\nDescription: {stair['description'] or 'None'}
 Status: {stair['status']}, Health: {stair['health']}, Progress: {stair['progress_percent']}%, Confidence: {stair['confidence_percent']}%
 Target: {stair['target_value']} {stair['unit'] or ''}, Current: {stair['current_value']}
 Start: {stair['start_date']}, End: {stair['end_date']}
 CHILDREN ({len(list(children))}): {json.dumps([dict(c) for c in children], default=str)[:800]}
 HISTORY: {json.dumps([dict(h) for h in history], default=str)[:800]}
-Check for these failure patterns: {', '.join(p['name'] for p in _knowledge_cache.get('failure_patterns', [])[:6])}
+{forecasting.prompt_facts(forecast)}
+Check for these failure patterns: {', '.join(knowledge_cache.cache.current().failure_pattern_names[:6])}
 Return JSON: risk_score (0-100), risk_level, identified_risks[], recommended_actions[], completion_probability (0-100), summary, summary_ar"""
     result = await call_ai_with_fallback(
         messages=[{"role": "user", "content": prompt}],
         max_tokens=1500,
         log_callback=_log_ai_usage,
+        task_type="risk_analysis",
     )
     text = result.get("text") or "{}"
     if result.get("ok") is False:
@@ -380,6 +377,10 @@ Return JSON: risk_score (0-100), risk_level, identified_risks[], recommended_act
         analysis = {"risk_score": 50, "risk_level": "medium", "identified_risks": [{"pattern": "Analysis", "evidence": text[:200]}],
                     "recommended_actions": [{"action": "Review manually", "urgency": "this_week"}], "completion_probability": 50,
                     "summary": text[:300] if text else "Analysis completed", "summary_ar": ""}
+    if forecast and forecast["completion_probability"] is not None:
+        # The fitted figure, not the model's restatement of it.
+        analysis["completion_probability"] = forecast["completion_probability"]
+    analysis["forecast"] = jsonable_encoder(forecast)
     async with pool.acquire() as conn:
         await conn.execute("UPDATE stairs SET ai_risk_score=$1, ai_health_prediction=$2, ai_insights=$3, updated_at=NOW() WHERE id=$4",
             analysis.get("risk_score", 50), analysis.get("risk_level", "medium"), json.dumps(analysis), stair_id)
@@ -422,6 +423,7 @@ Start with Vision, then Objectives, then Key Results. 3-5 KRs per Objective. Inc
         messages=[{"role": "user", "content": prompt}],
         max_tokens=2048,
         log_callback=_log_ai_usage,
+        task_type="generate_strategy",
     )
     text = result.get("text") or "[]"
     if result.get("ok") is False:
@@ -25,9 +25,11 @@ from typing import List, Optional
 
 from fastapi import APIRouter, HTTPException, Query, Depends
 
+from app import pagination
 from app.db.connection import get_pool
 from app.helpers import row_to_dict, rows_to_dicts, get_auth, AuthContext
 from app.models.schemas import ArtifactUpsert, ArtifactOut
+from app.responses import fast_response, project
 
 router = APIRouter(prefix="/api/v1", tags=["artifacts"])
 
@@ -70,9 +72,12 @@ async def upsert_artifact(art: ArtifactUpsert, auth: AuthContext = Depends(get_a
 async def list_stair_artifacts(
     stair_id: str,
     artifact_type: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None, ge=1, le=pagination.PAGE_SIZE_MAX, description="Page size; omit for everything"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
     auth: AuthContext = Depends(get_auth),
 ):
     """Everything generated for one stair — the Execution Room's mount read."""
+    limit = pagination.page_limit(limit, cursor)
     pool = await get_pool()
     async with pool.acquire() as conn:
         q = """SELECT a.* FROM generated_artifacts a
@@ -82,18 +87,24 @@ async def list_stair_artifacts(
         if artifact_type:
             q += " AND a.artifact_type = $3"
             p.append(artifact_type)
-        q += " ORDER BY a.generated_at DESC"
-        return rows_to_dicts(await conn.fetch(q, *p))
+        q, p = pagination.STAIR_ARTIFACTS.apply(q, p, cursor, limit)
+        rows, next_cursor = pagination.STAIR_ARTIFACTS.page(rows_to_dicts(await conn.fetch(q, *p)), limit)
+        response = fast_response(project(ArtifactOut, rows), List[ArtifactOut])
+        pagination.set_next_cursor(response, next_cursor)
+        return response
 
 
 @router.get("/strategies/{strategy_id}/artifacts", response_model=List[ArtifactOut])
 async def list_strategy_artifacts(
     strategy_id: str,
     artifact_type: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None, ge=1, le=pagination.PAGE_SIZE_MAX, description="Page size; omit for everything"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
     auth: AuthContext = Depends(get_auth),
 ):
     """Everything generated under one strategy — Manifest Room and the matrix
     toolkit read this so results follow the account, not the browser."""
+    limit = pagination.page_limit(limit, cursor)
     pool = await get_pool()
     async with pool.acquire() as conn:
         q = """SELECT * FROM generated_artifacts
@@ -102,8 +113,11 @@ async def list_strategy_artifacts(
         if artifact_type:
             q += " AND artifact_type = $3"
             p.append(artifact_type)
-        q += " ORDER BY generated_at DESC"
-        return rows_to_dicts(await conn.fetch(q, *p))
+        q, p = pagination.STRATEGY_ARTIFACTS.apply(q, p, cursor, limit)
+        rows, next_cursor = pagination.STRATEGY_ARTIFACTS.page(rows_to_dicts(await conn.fetch(q, *p)), limit)
+        response = fast_response(project(ArtifactOut, rows), List[ArtifactOut])
+        pagination.set_next_cursor(response, next_cursor)
+        return response
 
 
 @router.delete("/artifacts/{artifact_type}/{scope_key:path}")
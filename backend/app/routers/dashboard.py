@@ -4,9 +4,10 @@ import uuid
 from datetime import datetime, date
 from typing import Optional, List
 
-from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi import APIRouter, HTTPException, Query, Depends, Request
 from fastapi.responses import Response
 
+from app import knowledge_cache, pagination
 from app.db.connection import get_pool
 from app.helpers import (
     row_to_dict, rows_to_dicts, generate_code,
@@ -55,16 +56,19 @@ async def executive_dashboard(auth: AuthContext = Depends(get_auth)):
 # ─── ALERTS ───
 
 @router.get("/alerts", response_model=List[AlertOut])
-async def list_alerts(auth: AuthContext = Depends(get_auth), severity: Optional[str] = None, status: Optional[str] = None, limit: int = 20):
+async def list_alerts(response: Response, auth: AuthContext = Depends(get_auth), severity: Optional[str] = None, status: Optional[str] = None,
+                      limit: int = Query(20, ge=1, le=pagination.PAGE_SIZE_MAX), cursor: Optional[str] = None):
     pool = await get_pool()
     async with pool.acquire() as conn:
-        q = "SELECT * FROM ai_alerts WHERE organization_id = $1"; p = [auth.org_id]; idx = 2
+        q = f"SELECT *, {pagination.ALERT_RANK_SQL} AS severity_rank FROM ai_alerts WHERE organization_id = $1"; p = [auth.org_id]; idx = 2
         if severity: q += f" AND severity = ${idx}"; p.append(severity); idx += 1
         if status: q += f" AND status = ${idx}"; p.append(status); idx += 1
         else: q += " AND status != 'dismissed'"
-        q += f" ORDER BY CASE severity WHEN 'critical' THEN 0 WHEN 'high' THEN 1 WHEN 'medium' THEN 2 ELSE 3 END, created_at DESC LIMIT ${idx}"
-        p.append(limit)
-        return rows_to_dicts(await conn.fetch(q, *p))
+        # Most severe first, newest first within a severity.
+        q, p = pagination.ALERTS.apply(q, p, cursor, limit)
+        rows, next_cursor = pagination.ALERTS.page(rows_to_dicts(await conn.fetch(q, *p)), limit)
+        pagination.set_next_cursor(response, next_cursor)
+        return rows
 
 
 @router.put("/alerts/{alert_id}", response_model=AlertOut)
@@ -81,10 +85,9 @@ async def update_alert(alert_id: str, update: AlertUpdate, auth: AuthContext = D
 # ─── FRAMEWORKS ───
 
 @router.get("/frameworks", response_model=List[FrameworkOut])
-async def list_frameworks():
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        return rows_to_dicts(await conn.fetch("SELECT * FROM frameworks WHERE is_active = true ORDER BY code"))
+async def list_frameworks(request: Request):
+    # Seeded data: served from the Knowledge Engine snapshot with an ETag.
+    return await knowledge_cache.listing_response(request, "platform_frameworks")
 
 
 # ─── TEAMS ───
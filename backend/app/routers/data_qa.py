@@ -16,9 +16,10 @@ import uuid
 from datetime import datetime, timezone
 from typing import List, Optional
 
-from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi import APIRouter, HTTPException, Query, Depends, Response
 from pydantic import BaseModel
 
+from app import pagination
 from app.db.connection import get_pool
 from app.helpers import row_to_dict, rows_to_dicts, get_auth, AuthContext
 
@@ -350,6 +351,24 @@ async def check_contradictions(
     }
 
 
+def _canonical_id(value) -> str:
+    """UUIDs compare as text below, so spell them the way Postgres does. An
+    invalid one is left alone and rejected by the ::uuid[] cast."""
+    try:
+        return str(uuid.UUID(str(value)))
+    except ValueError:
+        return str(value)
+
+
+def _metadata_dict(meta) -> dict:
+    if isinstance(meta, str):
+        try:
+            meta = json.loads(meta)
+        except Exception:
+            meta = {}
+    return meta if isinstance(meta, dict) else {}
+
+
 def _source_label(source: dict) -> str:
     meta = source.get("metadata") or {}
     if isinstance(meta, str):
@@ -384,60 +403,50 @@ async def resolve_conflicts(
         if not strat:
             raise HTTPException(404, "Strategy not found")
 
+        # One read and one write however many resolutions the request
+        # carries; this used to be a SELECT and an UPDATE per mention.
+        ids = {_canonical_id(r.chosen_source_id) for r in req.resolutions}
+        for resolution in req.resolutions:
+            ids.update(_canonical_id(i) for i in resolution.rejected_source_ids)
+        rows = await conn.fetch(
+            "SELECT id, metadata FROM strategy_sources WHERE id = ANY($1::uuid[]) AND strategy_id = $2",
+            list(ids), strategy_id,
+        )
+        metas = {_canonical_id(r["id"]): _metadata_dict(r["metadata"]) for r in rows}
+
         resolved_count = 0
         now = datetime.now(timezone.utc)
+        changed = set()
 
         for resolution in req.resolutions:
             # Mark chosen source as verified
-            chosen = await conn.fetchrow(
-                "SELECT metadata FROM strategy_sources WHERE id = $1 AND strategy_id = $2",
-                resolution.chosen_source_id, strategy_id,
-            )
-            if chosen:
-                meta = chosen["metadata"]
-                if isinstance(meta, str):
-                    try:
-                        meta = json.loads(meta)
-                    except Exception:
-                        meta = {}
-                elif meta is None:
-                    meta = {}
+            chosen_id = _canonical_id(resolution.chosen_source_id)
+            meta = metas.get(chosen_id)
+            if meta is not None:
                 meta["user_verified"] = True
                 meta["verified_at"] = now.isoformat()
                 meta["verified_by"] = auth.user_id
                 meta["verification_status"] = "verified"
-                await conn.execute(
-                    'UPDATE strategy_sources SET "metadata" = $1, updated_at = $2 WHERE id = $3',
-                    json.dumps(meta), now, resolution.chosen_source_id,
-                )
+                changed.add(chosen_id)
 
             # Mark rejected sources as disputed
-            for rejected_id in resolution.rejected_source_ids:
-                rejected = await conn.fetchrow(
-                    "SELECT metadata FROM strategy_sources WHERE id = $1 AND strategy_id = $2",
-                    rejected_id, strategy_id,
-                )
-                if rejected:
-                    meta = rejected["metadata"]
-                    if isinstance(meta, str):
-                        try:
-                            meta = json.loads(meta)
-                        except Exception:
-                            meta = {}
-                    elif meta is None:
-                        meta = {}
+            for rejected_id in map(_canonical_id, resolution.rejected_source_ids):
+                meta = metas.get(rejected_id)
+                if meta is not None:
                     meta["verification_status"] = "disputed"
-                    dispute_count = meta.get("dispute_count", 0) + 1
-                    meta["dispute_count"] = dispute_count
+                    meta["dispute_count"] = meta.get("dispute_count", 0) + 1
                     meta["disputed_at"] = now.isoformat()
                     meta["disputed_field"] = resolution.field
-                    await conn.execute(
-                        'UPDATE strategy_sources SET "metadata" = $1, updated_at = $2 WHERE id = $3',
-                        json.dumps(meta), now, rejected_id,
-                    )
+                    changed.add(rejected_id)
 
             resolved_count += 1
 
+        if changed:
+            await conn.executemany(
+                'UPDATE strategy_sources SET "metadata" = $1, updated_at = $2 WHERE id = $3',
+                [(json.dumps(metas[i]), now, i) for i in sorted(changed)],
+            )
+
     return {"resolved": resolved_count}
 
 
@@ -446,9 +455,13 @@ async def resolve_conflicts(
 @router.get("/{strategy_id}/confidence")
 async def get_source_confidence(
     strategy_id: str,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=pagination.PAGE_SIZE_MAX, description="Page size; omit for everything"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
     auth: AuthContext = Depends(get_auth),
 ):
-    """Get confidence scores for all sources in a strategy."""
+    """Get confidence scores for all sources in a strategy (newest first, pageable)."""
+    limit = pagination.page_limit(limit, cursor)
     pool = await get_pool()
     async with pool.acquire() as conn:
         strat = await conn.fetchrow(
@@ -458,12 +471,14 @@ async def get_source_confidence(
         if not strat:
             raise HTTPException(404, "Strategy not found")
 
-        rows = await conn.fetch(
-            "SELECT * FROM strategy_sources WHERE strategy_id = $1 ORDER BY created_at DESC",
-            strategy_id,
-        )
+        # Scoring reads only these; content can be megabytes of extracted text.
+        q, params = pagination.SOURCES.apply(
+            "SELECT id, source_type, metadata, created_at FROM strategy_sources WHERE strategy_id = $1",
+            [strategy_id], cursor, limit)
+        rows = await conn.fetch(q, *params)
 
-    sources = rows_to_dicts(rows)
+    sources, next_cursor = pagination.SOURCES.page(rows_to_dicts(rows), limit)
+    pagination.set_next_cursor(response, next_cursor)
     result = []
     for source in sources:
         conf = _compute_confidence(source, sources)
@@ -3,10 +3,11 @@
 import json
 import uuid
 from datetime import datetime, timezone
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
 
+from app import pagination
 from app.db.connection import get_pool
 from app.helpers import row_to_dict, rows_to_dicts, get_auth, AuthContext
 from app.models.schemas import NoteCreate, NoteUpdate, NoteOut
@@ -15,15 +16,21 @@ router = APIRouter(prefix="/api/v1", tags=["notes"])
 
 
 @router.get("/notes", response_model=List[NoteOut])
-async def list_notes(auth: AuthContext = Depends(get_auth)):
+async def list_notes(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=pagination.PAGE_SIZE_MAX, description="Page size; omit for everything"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
+    auth: AuthContext = Depends(get_auth),
+):
+    limit = pagination.page_limit(limit, cursor)
     pool = await get_pool()
     async with pool.acquire() as conn:
-        rows = await conn.fetch(
-            "SELECT * FROM notes WHERE user_id = $1 AND organization_id = $2 "
-            "ORDER BY pinned DESC, updated_at DESC",
-            auth.user_id, auth.org_id,
-        )
-        return rows_to_dicts(rows)
+        q, params = pagination.NOTES.apply(
+            "SELECT * FROM notes WHERE user_id = $1 AND organization_id = $2",
+            [auth.user_id, auth.org_id], cursor, limit)
+        rows, next_cursor = pagination.NOTES.page(rows_to_dicts(await conn.fetch(q, *params)), limit)
+        pagination.set_next_cursor(response, next_cursor)
+        return rows
 
 
 @router.post("/notes", response_model=NoteOut, status_code=201)
@@ -6,10 +6,11 @@ import uuid
 from datetime import datetime, timezone
 from typing import List, Optional
 
-from fastapi import APIRouter, HTTPException, Query, Depends, UploadFile, File
+from fastapi import APIRouter, HTTPException, Query, Depends, Response, UploadFile, File
 from pydantic import BaseModel
 
 from app.db.connection import get_pool
+from app import pagination, telemetry
 from app.helpers import row_to_dict, rows_to_dicts, get_auth, AuthContext
 from app.models.schemas import SourceCreate, SourceUpdate, SourceOut
 from app.storage import (
@@ -47,12 +48,16 @@ async def require_strategy(conn, strategy_id: str, org_id: str):
 @router.get("/{strategy_id}/sources")
 async def list_sources(
     strategy_id: str,
+    response: Response,
     source_type: Optional[str] = Query(None, description="Filter by source type"),
     search: Optional[str] = Query(None, description="Search across source content"),
     include_quarantined: Optional[bool] = Query(False, description="Include quarantined sources"),
     quarantined_only: Optional[bool] = Query(False, description="Show only quarantined sources"),
+    limit: Optional[int] = Query(None, ge=1, le=pagination.PAGE_SIZE_MAX, description="Page size; omit for everything"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
     auth: AuthContext = Depends(get_auth),
 ):
+    limit = pagination.page_limit(limit, cursor)
     pool = await get_pool()
     async with pool.acquire() as conn:
         strat = await conn.fetchrow(
@@ -81,9 +86,10 @@ async def list_sources(
         elif not include_quarantined:
             q += " AND (metadata::text NOT LIKE '%\"quarantined\": true%' OR metadata IS NULL)"
 
-        q += " ORDER BY created_at DESC"
-        rows = await conn.fetch(q, *params)
-        return rows_to_dicts(rows)
+        q, params = pagination.SOURCES.apply(q, params, cursor, limit)
+        rows, next_cursor = pagination.SOURCES.page(rows_to_dicts(await conn.fetch(q, *params)), limit)
+        pagination.set_next_cursor(response, next_cursor)
+        return rows
 
 
 @router.get("/{strategy_id}/sources/count")
@@ -498,52 +504,44 @@ async def approve_extractions(
     parent_meta = parent.get("metadata") or {}
     parent_filename = parent_meta.get("filename", "Document")
 
-    created = []
+    created, rows = [], []
     now = datetime.now(timezone.utc)
-    async with pool.acquire() as conn:
-        for item in req.items:
-            category = item.get("category", "")
-            text = item.get("text", "")
-            confidence = item.get("confidence", "medium")
-            if not text or not category:
-                continue
-
-            new_id = str(uuid.uuid4())
-            item_metadata = {
-                "context": "ai_extraction",
-                "category": category,
-                "confidence": confidence,
-                "parent_source_id": source_id,
-                "parent_filename": parent_filename,
-            }
-            await conn.execute(
+    for item in req.items:
+        category = item.get("category", "")
+        text = item.get("text", "")
+        confidence = item.get("confidence", "medium")
+        if not text or not category:
+            continue
+
+        new_id = str(uuid.uuid4())
+        item_metadata = {
+            "context": "ai_extraction",
+            "category": category,
+            "confidence": confidence,
+            "parent_source_id": source_id,
+            "parent_filename": parent_filename,
+        }
+        rows.append((new_id, strategy_id, "ai_extraction", text, json.dumps(item_metadata), auth.user_id, now))
+        created.append({"id": new_id, "category": category, "text": text[:200]})
+
+    if rows:
+        # One executemany for the batch rather than an INSERT per item.
+        async with pool.acquire() as conn:
+            await conn.executemany(
                 "INSERT INTO strategy_sources (id, strategy_id, source_type, content, metadata, created_by, created_at, updated_at) "
                 "VALUES ($1, $2, $3, $4, $5, $6, $7, $7)",
-                new_id, strategy_id, "ai_extraction", text,
-                json.dumps(item_metadata), auth.user_id, now,
+                rows,
             )
-            created.append({"id": new_id, "category": category, "text": text[:200]})
 
     return {"approved": len(created), "items": created}
 
 
 async def log_source(strategy_id: str, source_type: str, content: str, metadata: dict = None, user_id: str = None):
-    """Helper to auto-log a source entry. Used by other routers for integration."""
-    try:
-        pool = await get_pool()
-        async with pool.acquire() as conn:
-            table_exists = await conn.fetchval(
-                "SELECT EXISTS(SELECT 1 FROM information_schema.tables WHERE table_name = 'strategy_sources')"
-            )
-            if not table_exists:
-                return
-            source_id = str(uuid.uuid4())
-            now = datetime.now(timezone.utc)
-            await conn.execute(
-                "INSERT INTO strategy_sources (id, strategy_id, source_type, content, metadata, created_by, created_at, updated_at) "
-                "VALUES ($1, $2, $3, $4, $5, $6, $7, $7)",
-                source_id, strategy_id, source_type, content,
-                json.dumps(metadata or {}), user_id, now,
-            )
-    except Exception:
-        pass  # Non-critical — never break the main flow
+    """Helper to auto-log a source entry. Used by other routers for integration.
+
+    Queued for app.telemetry's background writer rather than inserted inline:
+    it is non-critical and must never hold up or break the main flow."""
+    telemetry.writer.record("strategy_sources", (
+        str(uuid.uuid4()), strategy_id, source_type, content,
+        json.dumps(metadata or {}), user_id, datetime.now(timezone.utc),
+    ))
@@ -1,28 +1,40 @@
 """Stairs — Stairs CRUD Router"""
 
+import csv
+import io
 import json
+import math
+import os
 import uuid
+from collections import defaultdict
 from datetime import datetime, date, timezone
 from typing import Optional, List
 
-from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi import APIRouter, HTTPException, Query, Depends, Response
 
+from app import pagination
 from app.db.connection import get_pool
 from app.helpers import (
     row_to_dict, rows_to_dicts, compute_health, generate_code,
     get_auth, AuthContext,
 )
+from app.responses import fast_response, project
 from app.models.schemas import (
     StairCreate, StairUpdate, StairOut, StairTree,
     ProgressCreate, ProgressOut,
     RelationshipCreate, RelationshipOut,
-    KPIMeasurementCreate, KPIMeasurementOut,
+    KPIMeasurementCreate, KPIMeasurementOut, KPISeriesPoint, KPIBulkRequest, KPIBulkResult,
     ActionPlanCreate, ActionPlanOut, ActionPlanSummary, ActionPlanTaskUpdate,
 )
 from app.routers.websocket import ws_manager
 
 router = APIRouter(prefix="/api/v1", tags=["stairs"])
 
+KPI_BULK_MAX = int(os.getenv("KPI_BULK_MAX", "10000"))
+# kpi_measurements.value is DECIMAL(20,4): 16 digits before the point.
+KPI_VALUE_PRECISION, KPI_VALUE_SCALE = 20, 4
+KPI_VALUE_LIMIT = 10 ** (KPI_VALUE_PRECISION - KPI_VALUE_SCALE)
+
 
 # ─── STAIRS CRUD ───
 
@@ -49,7 +61,7 @@ async def list_stairs(
         if search: q += f" AND (s.title ILIKE ${idx} OR s.title_ar ILIKE ${idx} OR s.description ILIKE ${idx})"; p.append(f"%{search}%"); idx += 1
         q += f' ORDER BY s.level, s.sort_order, s.created_at LIMIT ${idx} OFFSET ${idx+1}'
         p.extend([limit, offset])
-        return rows_to_dicts(await conn.fetch(q, *p))
+        return fast_response(project(StairOut, rows_to_dicts(await conn.fetch(q, *p))), List[StairOut])
 
 
 @router.post("/stairs", response_model=StairOut, status_code=201)
@@ -103,15 +115,12 @@ async def get_stair_tree(auth: AuthContext = Depends(get_auth)):
         rows = await conn.fetch("""SELECT s.*, (SELECT COUNT(*) FROM stairs c WHERE c.parent_id = s.id AND c.deleted_at IS NULL) as children_count,
             u.full_name as owner_name FROM stairs s LEFT JOIN users u ON s.owner_id = u.id
             WHERE s.organization_id = $1 AND s.deleted_at IS NULL ORDER BY s.level, s.sort_order, s.created_at""", auth.org_id)
-        all_stairs = rows_to_dicts(rows)
+        children_of = defaultdict(list)
+        for s in project(StairOut, rows_to_dicts(rows)):
+            children_of[s["parent_id"]].append(s)
         def build_tree(parent_id=None):
-            children = []
-            for s in all_stairs:
-                pid = str(s["parent_id"]) if s.get("parent_id") else None
-                if pid == parent_id:
-                    children.append({"stair": s, "children": build_tree(str(s["id"]))})
-            return children
-        return build_tree(None)
+            return [{"stair": s, "children": build_tree(s["id"])} for s in children_of.get(parent_id, ())]
+        return fast_response(build_tree(None), List[StairTree])
 
 
 @router.get("/stairs/{stair_id}", response_model=StairOut)
@@ -133,7 +142,8 @@ async def update_stair(stair_id: str, updates: StairUpdate, auth: AuthContext =
         if not existing: raise HTTPException(404, "Stair not found")
         update_data = updates.model_dump(exclude_unset=True)
         if not update_data: raise HTTPException(400, "No fields to update")
-        if "progress_percent" in update_data and "health" not in update_data:
+        health_by_hand = "health" in update_data
+        if "progress_percent" in update_data and not health_by_hand:
             sd = update_data.get("start_date", existing["start_date"])
             ed = update_data.get("end_date", existing["end_date"])
             update_data["health"] = compute_health(update_data["progress_percent"], sd, ed)
@@ -142,6 +152,8 @@ async def update_stair(stair_id: str, updates: StairUpdate, auth: AuthContext =
             if k == "parent_id" and v is not None: v = str(v)
             if k == "metadata" and isinstance(v, dict): v = json.dumps(v)
             sets.append(f'"{k}" = ${idx}'); params.append(v); idx += 1
+        # A hand-set health is kept by the scheduled refresh (app/health_refresh.py).
+        if "health" in update_data: sets.append("health_set_at = NOW()" if health_by_hand else "health_set_at = NULL")
         sets.append(f"updated_at = ${idx}"); params.append(datetime.now(timezone.utc)); idx += 1
         params.append(stair_id)
         await conn.execute(f'UPDATE stairs SET {", ".join(sets)} WHERE id = ${idx}', *params)
@@ -197,7 +209,9 @@ async def log_progress(stair_id: str, progress: ProgressCreate, auth: AuthContex
             VALUES ($1,$2,$3,$4,$5,$6,$7,$8,$9) ON CONFLICT (stair_id, snapshot_date) DO UPDATE SET
             progress_percent=$4, confidence_percent=$5, health=$6, notes=$9, updated_by=$8""",
             snap_id, stair_id, today, progress.progress_percent, progress.confidence_percent, health_val, stair["status"], auth.user_id, progress.notes)
-        ups = ["progress_percent=$1", "health=$2", "updated_at=NOW()"]; up = [progress.progress_percent, health_val]; idx = 3
+        ups = ["progress_percent=$1", "health=$2", "updated_at=NOW()",
+               "health_set_at=NOW()" if progress.health else "health_set_at=NULL"]
+        up = [progress.progress_percent, health_val]; idx = 3
         if progress.confidence_percent is not None: ups.append(f"confidence_percent=${idx}"); up.append(progress.confidence_percent); idx += 1
         if progress.current_value is not None: ups.append(f"current_value=${idx}"); up.append(progress.current_value); idx += 1
         up.append(stair_id)
@@ -208,12 +222,16 @@ async def log_progress(stair_id: str, progress: ProgressCreate, auth: AuthContex
 
 
 @router.get("/stairs/{stair_id}/history", response_model=List[ProgressOut])
-async def get_progress_history(stair_id: str, limit: int = 30, auth: AuthContext = Depends(get_auth)):
+async def get_progress_history(stair_id: str, response: Response,
+                               limit: int = Query(30, ge=1, le=pagination.PAGE_SIZE_MAX), cursor: Optional[str] = None,
+                               auth: AuthContext = Depends(get_auth)):
     pool = await get_pool()
     async with pool.acquire() as conn:
-        rows = await conn.fetch("""SELECT p.* FROM stair_progress p JOIN stairs s ON s.id = p.stair_id
-            WHERE p.stair_id = $1 AND s.organization_id = $2 ORDER BY p.snapshot_date DESC LIMIT $3""", stair_id, auth.org_id, limit)
-        return rows_to_dicts(rows)
+        q, p = pagination.PROGRESS.apply("""SELECT p.* FROM stair_progress p JOIN stairs s ON s.id = p.stair_id
+            WHERE p.stair_id = $1 AND s.organization_id = $2""", [stair_id, auth.org_id], cursor, limit)
+        rows, next_cursor = pagination.PROGRESS.page(rows_to_dicts(await conn.fetch(q, *p)), limit)
+        pagination.set_next_cursor(response, next_cursor)
+        return rows
 
 
 # ─── RELATIONSHIPS ───
@@ -276,24 +294,121 @@ async def log_kpi(stair_id: str, m: KPIMeasurementCreate, auth: AuthContext = De
         return row_to_dict(await conn.fetchrow("SELECT * FROM kpi_measurements WHERE id = $1", m_id))
 
 
+@router.post("/kpis/bulk", response_model=KPIBulkResult)
+async def log_kpi_bulk(batch: KPIBulkRequest, auth: AuthContext = Depends(get_auth)):
+    """Many measurements in one request, for source systems that push daily
+    numbers for hundreds of KPIs. Each row names its stair by id or code.
+
+    Ownership of every referenced stair is checked in one query. The accepted
+    rows go in with a single COPY, which the kpi_rollups triggers fold in per
+    statement. current_value is then set from kpi_stats for all touched stairs
+    in one UPDATE, so it is the value with the latest measured_at, not the
+    last row in the batch. One kpi_bulk_logged event goes out instead of one
+    kpi_logged per row. Rows that cannot be placed, or whose value does not
+    fit the column, are rejected individually; the rest are stored. A
+    measured_at without an offset is UTC."""
+    rows = batch.measurements
+    if len(rows) > KPI_BULK_MAX:
+        raise HTTPException(413, f"At most {KPI_BULK_MAX} measurements per request")
+    ids = list({str(r.stair_id) for r in rows if r.stair_id})
+    codes = list({r.code for r in rows if r.stair_id is None and r.code})
+
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        owned = await conn.fetch("""SELECT id, code FROM stairs
+            WHERE organization_id = $1 AND deleted_at IS NULL AND (id = ANY($2::uuid[]) OR code = ANY($3::text[]))""",
+            auth.org_id, ids, codes)
+        known_ids = {str(s["id"]) for s in owned}
+        by_code = defaultdict(list)
+        for s in owned:
+            if s["code"] in codes:
+                by_code[s["code"]].append(str(s["id"]))
+
+        now = datetime.now(timezone.utc)
+        results, records = [], []
+        for i, r in enumerate(rows):
+            if r.stair_id is not None:
+                stair_id = str(r.stair_id)
+                error = None if stair_id in known_ids else "Stair not found"
+            elif r.code:
+                matches = by_code.get(r.code, [])
+                stair_id = matches[0] if len(matches) == 1 else None
+                error = None if stair_id else ("Stair code is ambiguous" if matches else "Stair not found")
+            else:
+                stair_id, error = None, "stair_id or code is required"
+            if error is None and not math.isfinite(r.value):
+                error = "value must be a finite number"
+            elif error is None and abs(r.value) >= KPI_VALUE_LIMIT:
+                error = f"value must be less than 1e{KPI_VALUE_PRECISION - KPI_VALUE_SCALE} in magnitude"
+            if error:
+                results.append({"index": i, "status": "rejected", "error": error})
+                continue
+            m_id = str(uuid.uuid4())
+            # Written as text through COPY, where a naive time would be read in
+            # the session's timezone; asyncpg parameters take naive as UTC.
+            measured_at = r.measured_at or now
+            if measured_at.tzinfo is None:
+                measured_at = measured_at.replace(tzinfo=timezone.utc)
+            records.append((m_id, stair_id, measured_at.isoformat(), r.value, r.source, r.source_system))
+            results.append({"index": i, "status": "inserted", "id": m_id, "stair_id": stair_id})
+
+        touched = list({rec[1] for rec in records})
+        if records:
+            # CSV rather than copy_records_to_table: binary COPY needs binary
+            # codecs, and the pool decodes uuid and numeric as text.
+            buf = io.StringIO()
+            csv.writer(buf, quoting=csv.QUOTE_NONNUMERIC).writerows(records)
+            async with conn.transaction():
+                await conn.copy_to_table("kpi_measurements", source=io.BytesIO(buf.getvalue().encode()),
+                    columns=["id", "stair_id", "measured_at", "value", "source", "source_system"], format="csv",
+                    force_null=["source_system"])
+                await conn.execute("""UPDATE stairs s SET current_value = k.latest_value, updated_at = NOW()
+                    FROM kpi_stats k WHERE k.stair_id = s.id AND s.id = ANY($1::uuid[])""", touched)
+            await ws_manager.broadcast_to_org(auth.org_id, {"event": "kpi_bulk_logged",
+                "data": {"count": len(records), "stair_ids": touched}})
+        return {"inserted": len(records), "rejected": len(rows) - len(records), "results": results}
+
+
 @router.get("/stairs/{stair_id}/kpi", response_model=List[KPIMeasurementOut])
-async def get_kpi(stair_id: str, limit: int = 50, auth: AuthContext = Depends(get_auth)):
+async def get_kpi(stair_id: str, response: Response,
+                  limit: int = Query(50, ge=1, le=pagination.PAGE_SIZE_MAX), cursor: Optional[str] = None,
+                  auth: AuthContext = Depends(get_auth)):
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        q, p = pagination.KPI_MEASUREMENTS.apply("""SELECT m.* FROM kpi_measurements m JOIN stairs s ON s.id = m.stair_id
+            WHERE m.stair_id = $1 AND s.organization_id = $2""", [stair_id, auth.org_id], cursor, limit)
+        rows, next_cursor = pagination.KPI_MEASUREMENTS.page(rows_to_dicts(await conn.fetch(q, *p)), limit)
+        pagination.set_next_cursor(response, next_cursor)
+        return rows
+
+
+@router.get("/stairs/{stair_id}/kpi/series", response_model=List[KPISeriesPoint])
+async def kpi_series(stair_id: str, bucket: str = Query("day", pattern="^(day|week|month)$"),
+                     from_: Optional[datetime] = Query(None, alias="from"), to: Optional[datetime] = None,
+                     auth: AuthContext = Depends(get_auth)):
+    """Bucketed history for charting, from kpi_rollups (kept current by a
+    trigger on kpi_measurements). `from` is rounded down to its bucket; `to`
+    is exclusive."""
     pool = await get_pool()
     async with pool.acquire() as conn:
-        return rows_to_dicts(await conn.fetch("""SELECT m.* FROM kpi_measurements m JOIN stairs s ON s.id = m.stair_id
-            WHERE m.stair_id = $1 AND s.organization_id = $2 ORDER BY m.measured_at DESC LIMIT $3""", stair_id, auth.org_id, limit))
+        return rows_to_dicts(await conn.fetch("""SELECT r.bucket_start, r.n AS count, r.total AS sum, r.total / r.n AS avg,
+                r.min_value AS min, r.max_value AS max, r.first_value AS first, r.first_at, r.last_value AS last, r.last_at
+            FROM kpi_rollups r JOIN stairs s ON s.id = r.stair_id
+            WHERE r.stair_id = $1 AND s.organization_id = $2 AND r.bucket = $3
+              AND ($4::timestamptz IS NULL OR r.bucket_start >= date_trunc($3, $4::timestamptz AT TIME ZONE 'UTC') AT TIME ZONE 'UTC')
+              AND ($5::timestamptz IS NULL OR r.bucket_start < $5)
+            ORDER BY r.bucket_start""", stair_id, auth.org_id, bucket, from_, to))
 
 
 @router.get("/kpis/summary")
 async def kpi_summary(auth: AuthContext = Depends(get_auth)):
     pool = await get_pool()
     async with pool.acquire() as conn:
-        return rows_to_dicts(await conn.fetch("""SELECT s.id, s.code, s.title, s.title_ar, s.target_value, s.current_value,
+        return fast_response(rows_to_dicts(await conn.fetch("""SELECT s.id, s.code, s.title, s.title_ar, s.target_value, s.current_value,
             s.unit, s.health, s.progress_percent, s.measurement_direction,
-            (SELECT value FROM kpi_measurements km WHERE km.stair_id = s.id ORDER BY measured_at DESC LIMIT 1) as latest_value,
-            (SELECT measured_at FROM kpi_measurements km WHERE km.stair_id = s.id ORDER BY measured_at DESC LIMIT 1) as latest_at,
-            (SELECT COUNT(*) FROM kpi_measurements km WHERE km.stair_id = s.id) as measurement_count
-            FROM stairs s WHERE s.organization_id = $1 AND s.element_type IN ('kpi','key_result','measure') AND s.deleted_at IS NULL ORDER BY s.code""", auth.org_id))
+            k.latest_value, k.latest_at, COALESCE(k.measurement_count, 0) as measurement_count
+            FROM stairs s LEFT JOIN kpi_stats k ON k.stair_id = s.id
+            WHERE s.organization_id = $1 AND s.element_type IN ('kpi','key_result','measure') AND s.deleted_at IS NULL ORDER BY s.code""", auth.org_id)))
 
 
 # ─── ACTION PLANS ───
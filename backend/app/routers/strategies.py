@@ -2,12 +2,14 @@
 
 import uuid
 from datetime import datetime, timezone
+from typing import List, Optional
 
-from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi import APIRouter, HTTPException, Query, Depends, Response
 
+from app import forecasting, pagination
 from app.db.connection import get_pool
 from app.helpers import row_to_dict, rows_to_dicts, get_auth, AuthContext
-from app.models.schemas import StrategyCreate, StrategyUpdate
+from app.models.schemas import StrategyCreate, StrategyUpdate, StairForecast
 from app.routers.websocket import ws_manager
 
 router = APIRouter(prefix="/api/v1/strategies", tags=["strategies"])
@@ -15,9 +17,13 @@ router = APIRouter(prefix="/api/v1/strategies", tags=["strategies"])
 
 @router.get("")
 async def list_strategies(
+    response: Response,
     auth: AuthContext = Depends(get_auth),
     include_archived: bool = Query(False, description="Include archived strategies"),
+    limit: Optional[int] = Query(None, ge=1, le=pagination.PAGE_SIZE_MAX, description="Page size; omit for everything"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
 ):
+    limit = pagination.page_limit(limit, cursor)
     pool = await get_pool()
     async with pool.acquire() as conn:
         q = """
@@ -31,9 +37,9 @@ async def list_strategies(
         """
         if not include_archived:
             q += " AND (s.status != 'archived' OR s.status IS NULL)"
-        q += " ORDER BY s.updated_at DESC"
-        rows = await conn.fetch(q, auth.org_id, auth.user_id)
-        results = rows_to_dicts(rows)
+        q, params = pagination.STRATEGIES.apply(q, [auth.org_id, auth.user_id], cursor, limit)
+        results, next_cursor = pagination.STRATEGIES.page(rows_to_dicts(await conn.fetch(q, *params)), limit)
+        pagination.set_next_cursor(response, next_cursor)
         for r in results:
             r["avg_progress"] = round(float(r.get("avg_progress") or 0), 1)
         return results
@@ -79,6 +85,21 @@ async def get_strategy(strategy_id: str, auth: AuthContext = Depends(get_auth)):
         return result
 
 
+@router.get("/{strategy_id}/forecast", response_model=List[StairForecast])
+async def get_strategy_forecast(strategy_id: str, auth: AuthContext = Depends(get_auth)):
+    """Velocity, projected completion and completion probability for every
+    stair in the strategy, fitted from progress history. No AI call."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        owner_check = await conn.fetchval(
+            "SELECT id FROM strategies WHERE id = $1 AND organization_id = $2 AND owner_id = $3",
+            strategy_id, auth.org_id, auth.user_id
+        )
+        if not owner_check:
+            raise HTTPException(404, "Strategy not found")
+        return await forecasting.strategy_forecasts(conn, strategy_id, auth.org_id)
+
+
 @router.put("/{strategy_id}")
 async def update_strategy(strategy_id: str, updates: StrategyUpdate, auth: AuthContext = Depends(get_auth)):
     pool = await get_pool()
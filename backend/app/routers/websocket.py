@@ -1,77 +1,424 @@
-"""Stairs — WebSocket Connection Manager & Endpoint"""
+"""Stairs — WebSocket Connection Manager & Endpoint
+
+Every socket gets a bounded send queue and a writer task of its own. A
+broadcast serialises the message once and drops the frame into each queue
+without awaiting anybody, so a browser on a stalled mobile link delays only
+itself — not the rest of its organization, and not the HTTP handler
+(update_stair, log_progress, log_kpi) that produced the event. It used to
+await send_json on every socket in turn, which made write latency a function
+of how many tabs were watching.
+
+A queue that fills up means the client is not reading. WS_OVERFLOW_POLICY
+decides what that costs:
+
+    drop_oldest   discard the oldest queued frame and keep going (default).
+                  Every event here is a "something changed, refetch" hint, so
+                  the newest frames are the ones worth keeping.
+    disconnect    close the socket with 1013 (try again later); the client
+                  reconnects and refetches.
+
+Events are coalesced per organization before they become frames. The first
+event for an org opens a window of WS_COALESCE_WINDOW_MS; everything that
+arrives for that org inside it is merged and sent together:
+
+    stair_updated         several for the same id become one, carrying the
+                          union of the changed fields.
+    progress_logged,      only the latest per stair survives — the client
+    kpi_logged            refetches the stair either way.
+    anything else         exact repeats collapse to one.
+
+A window that ends with a single event sends it as it always was. More than
+one goes out as one frame, {"event": "batch", "data": {"events": [...]}}, in
+arrival order. ai_generate_strategy and a burst of progress edits used to
+cost one frame and one client refetch per change. Set the window to 0 to
+turn coalescing off.
+
+Every event carries a per-organization "seq", so a client can resume. The
+"connected" frame reports the current seq. A client that reconnects with
+?since=<last seq it saw> gets only what it missed, as one batch frame marked
+"replay", before any live traffic. If the cursor is older than what is
+retained, it gets {"event": "resync_required"} and refetches. Mobile clients
+drop the socket whenever the 30 s ping times out, and a deploy reconnects
+everyone at once; both used to refetch the tree, the dashboard and the
+sources. With the bridge attached, seq comes from Postgres and history is
+realtime_events. Without it, seq is counted here and the last
+WS_REPLAY_BUFFER events per org are kept in memory.
+
+broadcast_to_org is cluster-wide. When app.realtime has attached its bridge,
+the event goes to Postgres and comes back to every process (this one
+included) through deliver(). Without a bridge, deliver() is called directly.
+"""
 
 import asyncio
+import json
+import logging
+import os
+from collections import deque
 from typing import Optional
 
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
 
+from app import metrics
 from app.helpers import decode_jwt
 
+logger = logging.getLogger("stairs.websocket")
+
 router = APIRouter(tags=["websocket"])
 
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+WS_OVERFLOW_POLICY = os.getenv("WS_OVERFLOW_POLICY", "drop_oldest")
+# A send that has not completed in this long is a client that stopped reading
+# with its TCP window full. Without a bound the writer would wait forever and
+# the queue behind it would just overflow.
+WS_SEND_TIMEOUT_SECONDS = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "10"))
+
+OVERFLOW_POLICIES = ("drop_oldest", "disconnect")
+
+WS_COALESCE_WINDOW_MS = float(os.getenv("WS_COALESCE_WINDOW_MS", "40"))
+# A window that collects this many events is flushed early, so a storm is
+# split into a few large frames rather than building one unbounded one.
+WS_COALESCE_MAX_EVENTS = int(os.getenv("WS_COALESCE_MAX_EVENTS", "200"))
+
+# Events kept per org for replay when there is no bridge. Also the most a
+# replay will send; a client further behind than this is told to resync.
+WS_REPLAY_BUFFER = int(os.getenv("WS_REPLAY_BUFFER", "500"))
+
+# event -> field naming the stair it is about; the latest one per stair wins.
+_LATEST_WINS = {"progress_logged": "stair_id", "kpi_logged": "stair_id"}
+
+
+def serialize(message: dict) -> str:
+    """One frame, encoded the way Starlette's send_json would encode it."""
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def frame_for(events: list[dict]) -> str:
+    """A lone event is sent as itself; several go out as one batch frame."""
+    if len(events) == 1:
+        return serialize(events[0])
+    return serialize({"event": "batch", "data": {"events": events}})
+
+
+def coalesce(events: list[dict]) -> list[dict]:
+    """Merge redundant events, keeping each survivor at the position of the
+    latest event it absorbed so the result stays in arrival order."""
+    merged: dict = {}
+    for message in events:
+        name = message.get("event")
+        data = message.get("data") if isinstance(message.get("data"), dict) else {}
+        if name == "stair_updated" and "id" in data:
+            key = (name, data["id"])
+            previous = merged.pop(key, None)
+            if previous is not None:
+                changes = list(previous["data"].get("changes") or [])
+                changes += [c for c in data.get("changes") or [] if c not in changes]
+                message = {**message, "data": {**data, "changes": changes}}
+        elif name in _LATEST_WINS and _LATEST_WINS[name] in data:
+            key = (name, data[_LATEST_WINS[name]])
+            merged.pop(key, None)
+        else:
+            key = ("exact", serialize({k: v for k, v in message.items() if k != "seq"}))
+            merged.pop(key, None)
+        merged[key] = message
+    return list(merged.values())
+
+
+class _Connection:
+    """One socket, its bounded send queue, and the task that drains it."""
+
+    def __init__(self, ws: WebSocket, org_id: str, user_id: str, manager: "ConnectionManager"):
+        self.ws = ws
+        self.org_id = org_id
+        self.user_id = user_id
+        self.manager = manager
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=WS_SEND_QUEUE_SIZE)
+        self.closed = False
+        self.writer: Optional[asyncio.Task] = None
+        # While a replay is being assembled, live frames wait here so they
+        # cannot overtake it. Events at or below `floor` were in the replay.
+        self.held: Optional[list] = None
+        self.floor = 0
+
+    def start(self):
+        self.writer = asyncio.create_task(self._drain())
+
+    def send(self, message: dict) -> bool:
+        """Queue a frame for this socket alone, ahead of any held traffic."""
+        return self._put(serialize(message))
+
+    def offer(self, frame: str, seq: Optional[int] = None, events: Optional[list] = None) -> bool:
+        """Queue a broadcast frame without waiting. `seq` is the highest seq
+        in the frame and `events` what it was built from. False when the frame
+        was not queued."""
+        if self.closed or (seq is not None and seq <= self.floor):
+            return False
+        if self.held is not None:
+            self.held.append((frame, seq, events))
+            return True
+        if events and self.floor and any(e.get("seq") is not None and e["seq"] <= self.floor for e in events):
+            # A batch straddling the replay cursor: send only what it missed.
+            frame = frame_for([e for e in events if e.get("seq") is None or e["seq"] > self.floor])
+        return self._put(frame)
+
+    def resume(self, floor: int = 0):
+        """End a replay: release held frames, skipping the events it already
+        covered."""
+        held, self.held = self.held or [], None
+        self.floor = floor
+        for frame, seq, events in held:
+            self.offer(frame, seq, events)
+
+    def _put(self, frame: str) -> bool:
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            if WS_OVERFLOW_POLICY == "disconnect":
+                self.manager.metrics["slow_consumers_disconnected"] += 1
+                logger.warning("[ws] send queue full for user %s in org %s — disconnecting slow consumer",
+                               self.user_id, self.org_id)
+                self.manager._evict(self, code=1013, reason="Slow consumer")
+                return False
+            self.queue.get_nowait()
+            self.queue.put_nowait(frame)
+            self.manager.metrics["frames_dropped"] += 1
+        self.manager.metrics["frames_enqueued"] += 1
+        return True
+
+    async def _drain(self):
+        try:
+            while True:
+                frame = await self.queue.get()
+                await asyncio.wait_for(self.ws.send_text(frame), WS_SEND_TIMEOUT_SECONDS)
+                self.manager.metrics["frames_sent"] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            self.manager.metrics["send_errors"] += 1
+            logger.info("[ws] writer for user %s in org %s stopped: %s",
+                        self.user_id, self.org_id, type(exc).__name__)
+            self.manager._evict(self)
+
+    def stop(self):
+        self.closed = True
+        if self.writer and not self.writer.done():
+            self.writer.cancel()
+
 
 class ConnectionManager:
     def __init__(self):
-        self.connections: dict[str, dict[str, list[WebSocket]]] = {}
+        self.connections: dict[str, dict[str, list[_Connection]]] = {}
+        # Set by app.realtime.RealtimeBridge.start(); None means single-process.
+        self.bridge = None
+        self._pending: dict[str, list[dict]] = {}
+        self._timers: dict[str, asyncio.TimerHandle] = {}
+        # Sequence and history when there is no bridge to keep them.
+        self._seq: dict[str, int] = {}
+        self._history: dict[str, deque] = {}
+        self.metrics = {
+            "frames_enqueued": 0,
+            "frames_sent": 0,
+            "frames_dropped": 0,
+            "slow_consumers_disconnected": 0,
+            "send_errors": 0,
+            "events_coalesced": 0,
+            "batches_sent": 0,
+        }
 
-    async def connect(self, ws: WebSocket, org_id: str, user_id: str):
+    async def connect(self, ws: WebSocket, org_id: str, user_id: str, hold: bool = False) -> _Connection:
+        """Register a socket. With hold=True, broadcasts are kept back until
+        conn.resume(), so a replay can be sent first."""
         await ws.accept()
-        self.connections.setdefault(org_id, {}).setdefault(user_id, []).append(ws)
+        conn = _Connection(ws, org_id, user_id, self)
+        if hold:
+            conn.held = []
+        self.connections.setdefault(org_id, {}).setdefault(user_id, []).append(conn)
+        conn.start()
+        return conn
 
     def disconnect(self, ws: WebSocket, org_id: str, user_id: str):
-        if org_id in self.connections and user_id in self.connections[org_id]:
-            self.connections[org_id][user_id] = [
-                c for c in self.connections[org_id][user_id] if c is not ws
-            ]
+        for conn in list(self.connections.get(org_id, {}).get(user_id, [])):
+            if conn.ws is ws:
+                self._remove(conn)
+
+    def _remove(self, conn: _Connection):
+        conn.stop()
+        users = self.connections.get(conn.org_id)
+        if users is None:
+            return
+        sockets = users.get(conn.user_id)
+        if sockets is not None:
+            users[conn.user_id] = [c for c in sockets if c is not conn]
+            if not users[conn.user_id]:
+                del users[conn.user_id]
+        if not users:
+            del self.connections[conn.org_id]
+
+    def _evict(self, conn: _Connection, code: int = 1011, reason: str = ""):
+        """Drop a connection from the registry and close its socket in the
+        background — the caller is a broadcast or a writer, neither of which
+        may wait on a client."""
+        if conn.closed:
+            return
+        self._remove(conn)
+
+        async def _close():
+            try:
+                await conn.ws.close(code=code, reason=reason)
+            except Exception:
+                pass  # already gone
+        asyncio.create_task(_close())
 
     async def broadcast_to_org(self, org_id: str, message: dict):
-        if org_id not in self.connections:
+        """Announce an event to every socket in the organization, in every
+        process. Never waits on a client or on the database."""
+        with metrics.timed("ws"):
+            if self.bridge is not None and self.bridge.publish(org_id, message):
+                return
+            await self.deliver(org_id, message)
+
+    async def deliver(self, org_id: str, message: dict):
+        """Queue one event for every socket in the organization held by this
+        process, after the coalescing window."""
+        if "seq" not in message and self.bridge is None:
+            seq = self._seq.get(org_id, 0) + 1
+            self._seq[org_id] = seq
+            message = {**message, "seq": seq}
+            history = self._history.get(org_id)
+            if history is None:
+                history = self._history[org_id] = deque(maxlen=WS_REPLAY_BUFFER)
+            history.append(message)
+        if not self.connections.get(org_id):
+            return
+        if WS_COALESCE_WINDOW_MS <= 0:
+            self._fan_out(org_id, [message])
+            return
+        pending = self._pending.get(org_id)
+        if pending is None:
+            self._pending[org_id] = [message]
+            self._timers[org_id] = asyncio.get_running_loop().call_later(
+                WS_COALESCE_WINDOW_MS / 1000, self._flush, org_id)
             return
-        for user_id, sockets in self.connections[org_id].items():
-            dead = []
-            for ws in sockets:
-                try:
-                    await ws.send_json(message)
-                except Exception:
-                    dead.append(ws)
-            for ws in dead:
-                sockets.remove(ws)
+        pending.append(message)
+        if len(pending) >= WS_COALESCE_MAX_EVENTS:
+            self._flush(org_id)
+
+    def _flush(self, org_id: str):
+        timer = self._timers.pop(org_id, None)
+        if timer is not None:
+            timer.cancel()
+        events = self._pending.pop(org_id, None)
+        if events:
+            self._fan_out(org_id, events)
+
+    def _fan_out(self, org_id: str, events: list[dict]):
+        users = self.connections.get(org_id)
+        if not users:
+            return
+        merged = coalesce(events) if len(events) > 1 else events
+        self.metrics["events_coalesced"] += len(events) - len(merged)
+        frame = frame_for(merged)
+        if len(merged) > 1:
+            self.metrics["batches_sent"] += 1
+        seq = max((m["seq"] for m in merged if m.get("seq") is not None), default=None)
+        for sockets in list(users.values()):
+            for conn in list(sockets):
+                conn.offer(frame, seq, merged)
+
+    async def cursor(self, org_id: str) -> int:
+        """The seq of the organization's most recent event."""
+        if self.bridge is not None:
+            return await self.bridge.cursor(org_id)
+        return self._seq.get(org_id, 0)
+
+    async def replay(self, org_id: str, since: int) -> Optional[list[dict]]:
+        """Events after `since`, oldest first, or None when they are no longer
+        all retained and the client has to resync."""
+        if self.bridge is not None:
+            return await self.bridge.replay(org_id, since)
+        head = self._seq.get(org_id, 0)
+        if since > head:
+            return None  # a cursor from before this process started
+        if since == head:
+            return []
+        history = self._history.get(org_id)
+        if not history or history[0]["seq"] > since + 1:
+            return None
+        return [m for m in history if m["seq"] > since]
 
     async def send_to_user(self, org_id: str, user_id: str, message: dict):
         sockets = self.connections.get(org_id, {}).get(user_id, [])
-        dead = []
-        for ws in sockets:
-            try:
-                await ws.send_json(message)
-            except Exception:
-                dead.append(ws)
-        for ws in dead:
-            sockets.remove(ws)
+        if not sockets:
+            return
+        frame = serialize(message)
+        for conn in list(sockets):
+            conn.offer(frame)
+
+    def stats(self) -> dict:
+        """Counters since boot plus the current gauges, for operators."""
+        conns = [c for users in self.connections.values() for sockets in users.values() for c in sockets]
+        depths = [c.queue.qsize() for c in conns]
+        return {
+            **self.metrics,
+            "organizations": len(self.connections),
+            "connections": len(conns),
+            "queued_frames": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "queue_capacity": WS_SEND_QUEUE_SIZE,
+            "overflow_policy": WS_OVERFLOW_POLICY,
+            "coalesce_window_ms": WS_COALESCE_WINDOW_MS,
+            "bridge": self.bridge.stats() if self.bridge is not None else None,
+        }
 
 
 ws_manager = ConnectionManager()
 
 
 @router.websocket("/ws/{org_id}/{user_id}")
-async def websocket_endpoint(websocket: WebSocket, org_id: str, user_id: str, token: Optional[str] = Query(None)):
+async def websocket_endpoint(websocket: WebSocket, org_id: str, user_id: str, token: Optional[str] = Query(None),
+                             since: Optional[int] = Query(None, ge=0)):
     from fastapi import HTTPException
-    if token:
-        try:
-            payload = decode_jwt(token)
-            if payload["org"] != org_id:
-                await websocket.close(code=4003, reason="Org mismatch"); return
-        except HTTPException:
-            await websocket.close(code=4001, reason="Invalid token"); return
-    await ws_manager.connect(websocket, org_id, user_id)
+    # Every frame, and with ?since= the org's retained history, is tenant
+    # data: no socket is accepted without a token for this org.
+    if not token:
+        await websocket.close(code=4001, reason="Missing token"); return
     try:
-        await websocket.send_json({"event": "connected", "data": {"org_id": org_id, "user_id": user_id}})
+        payload = decode_jwt(token)
+        if payload["org"] != org_id:
+            await websocket.close(code=4003, reason="Org mismatch"); return
+    except HTTPException:
+        await websocket.close(code=4001, reason="Invalid token"); return
+    conn = await ws_manager.connect(websocket, org_id, user_id, hold=since is not None)
+    try:
+        # Everything goes through the queue, so the writer task is the only
+        # thing that ever sends on this socket.
+        try:
+            head = await ws_manager.cursor(org_id)
+        except Exception as e:
+            logger.warning("[ws] cursor lookup for org %s failed: %s", org_id, e)
+            head = None
+        conn.send({"event": "connected", "data": {"org_id": org_id, "user_id": user_id, "seq": head}})
+        if since is not None:
+            try:
+                missed = await ws_manager.replay(org_id, since)
+            except Exception as e:
+                logger.warning("[ws] replay for org %s failed: %s", org_id, e)
+                missed = None
+            if missed is None:
+                conn.send({"event": "resync_required", "data": {"seq": head}})
+                conn.resume()
+            else:
+                if missed:
+                    conn.send({"event": "batch", "data": {"events": missed, "replay": True}})
+                conn.resume(floor=missed[-1]["seq"] if missed else since)
         while True:
             try:
                 data = await asyncio.wait_for(websocket.receive_json(), timeout=30)
                 if data.get("event") == "ping":
-                    await websocket.send_json({"event": "pong"})
+                    conn.send({"event": "pong"})
             except asyncio.TimeoutError:
-                await websocket.send_json({"event": "ping"})
+                conn.send({"event": "ping"})
     except WebSocketDisconnect:
         ws_manager.disconnect(websocket, org_id, user_id)
     except Exception:
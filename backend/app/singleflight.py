@@ -0,0 +1,101 @@
+"""Stairs — Single-Flight Coalescing
+
+When several people in an organization open the same stair, their browsers
+ask for the same explain-action, implementation guide or questionnaire
+within seconds of each other. Each request paid for its own provider call,
+and often a validation and a regeneration pass too, all to produce the
+same text.
+
+SingleFlight.do(key, fn) runs fn() once per key at a time. The first caller
+(the leader) starts it as a task. Anyone arriving with the same key while
+it is running (a follower) awaits that task instead of starting another.
+When it finishes, every waiter gets its own deep copy of the result, so one
+caller adding fields cannot change what another sees, and the key is free
+again. An exception reaches every waiter. Results are not cached: a
+request arriving after the work finished starts fresh.
+
+Cancellation. The work runs in its own task and each waiter awaits it
+through asyncio.shield, so a waiter that goes away, such as a leader whose
+client disconnected, only stops waiting. The others still get the result.
+The work is cancelled only when the last waiter has gone, because nobody is
+left to pay for.
+
+Keys come from key(), which hashes its arguments after collapsing runs of
+whitespace in strings. The arguments must capture everything that shapes
+the output. Callers include the full prompt, so differing context never
+coalesces. They include the organization too: the shared work runs in the
+leader's context, so its usage and governor slot are the leader's org's,
+and only callers from that org may share it.
+"""
+
+import asyncio
+import copy
+import hashlib
+import json
+import re
+from typing import Any, Awaitable, Callable
+
+from app import metrics
+
+_WS = re.compile(r"\s+")
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return _WS.sub(" ", value).strip()
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def key(*parts) -> str:
+    raw = json.dumps(_normalize(list(parts)), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: dict[str, list] = {}  # key -> [task, waiter count]
+        self.metrics = {"leaders": 0, "followers": 0, "abandoned": 0}
+
+    async def do(self, k: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._inflight.get(k)
+        if entry is None:
+            task = asyncio.create_task(fn())
+            entry = self._inflight[k] = [task, 0]
+            task.add_done_callback(lambda t, k=k: self._forget(k, t))
+            self.metrics["leaders"] += 1
+            metrics.cache_requests.inc(f"singleflight_{self.name}", "miss")
+        else:
+            self.metrics["followers"] += 1
+            metrics.cache_requests.inc(f"singleflight_{self.name}", "hit")
+        task = entry[0]
+        entry[1] += 1
+        try:
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            entry[1] -= 1
+            if entry[1] == 0 and not task.done():
+                # The last one waiting has gone; nobody wants this any more.
+                # Forget it now so a new caller starts fresh rather than
+                # joining a task that is being cancelled.
+                self._forget(k, task)
+                task.cancel()
+                self.metrics["abandoned"] += 1
+            raise
+        entry[1] -= 1
+        return copy.deepcopy(result)
+
+    def _forget(self, k: str, task: asyncio.Task):
+        entry = self._inflight.get(k)
+        if entry is not None and entry[0] is task:
+            del self._inflight[k]
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    def snapshot(self) -> dict:
+        return {**self.metrics, "in_flight": self.in_flight()}
@@ -0,0 +1,185 @@
+"""Stairs — Telemetry Writer
+
+agent_logs, ai_usage_logs and the auto-logged strategy_sources rows used to
+be written inline: each one checked a pool connection out, (for two of
+them) asked information_schema whether the table existed, and INSERTed
+before the request could carry on. A chat with validation and regeneration
+paid for four to six of those in series before it answered.
+
+Callers now hand rows to `writer.record()`, which appends to an in-memory
+buffer and returns. A background task flushes the buffer every
+TELEMETRY_FLUSH_INTERVAL_SECONDS, or sooner once TELEMETRY_BATCH_SIZE rows
+are waiting, with one executemany per table on one connection. lifespan
+starts the task and flushes whatever is left on shutdown. Shutdown asks the
+task to finish rather than cancelling it: a flush has already taken its rows
+out of the buffer, so cancelling one half way would lose them.
+
+These rows are observability, not data anybody entered, so the writer
+favours the request path over completeness:
+
+  - The buffer is bounded by TELEMETRY_MAX_PENDING. Past that, new rows are
+    dropped and counted instead of growing memory while the database is
+    unreachable. The first drop is logged, then at most one warning every
+    TELEMETRY_DROP_LOG_INTERVAL_SECONDS; the counts are on /metrics as
+    stairs_telemetry_rows_total and stairs_telemetry_pending_rows.
+  - A failed batch is retried row by row once, so one bad row loses only
+    itself. Rows that still fail are counted and logged, never raised.
+
+Table existence is cached the same one-way way agent_logs always was. Once a
+table has been seen it is never checked again. "Missing" is re-checked on
+every flush, because a startup migration that failed can still succeed
+later.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Optional
+
+from app.db.connection import get_pool
+
+logger = logging.getLogger("stairs.telemetry")
+
+TELEMETRY_BATCH_SIZE = int(os.getenv("TELEMETRY_BATCH_SIZE", "200"))
+TELEMETRY_FLUSH_INTERVAL_SECONDS = float(os.getenv("TELEMETRY_FLUSH_INTERVAL_SECONDS", "2"))
+TELEMETRY_MAX_PENDING = int(os.getenv("TELEMETRY_MAX_PENDING", "10000"))
+TELEMETRY_DROP_LOG_INTERVAL_SECONDS = float(os.getenv("TELEMETRY_DROP_LOG_INTERVAL_SECONDS", "60"))
+
+# table -> INSERT taking one row tuple, in the column order callers record.
+INSERTS = {
+    "agent_logs": (
+        "INSERT INTO agent_logs (id, strategy_id, agent_name, task_type, "
+        "input_summary, output_summary, tokens_used, model_used, confidence_score, ok, output_tokens) "
+        "VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)"
+    ),
+    "ai_usage_logs": (
+        "INSERT INTO ai_usage_logs (id, provider, success, response_time_ms, tokens_used, "
+        "status_code, fallback_used, fallback_from, error_message, organization_id) "
+        "VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)"
+    ),
+    "strategy_sources": (
+        "INSERT INTO strategy_sources (id, strategy_id, source_type, content, metadata, created_by, created_at, updated_at) "
+        "VALUES ($1, $2, $3, $4, $5, $6, $7, $7)"
+    ),
+}
+
+
+class TelemetryWriter:
+    def __init__(self):
+        self._buffer: list[tuple[str, tuple]] = []
+        self._tables_seen: set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+        self._last_drop_log: Optional[float] = None
+        self.metrics = {
+            "recorded": 0,
+            "written": 0,
+            "dropped": 0,
+            "failed": 0,
+            "flushes": 0,
+        }
+
+    def record(self, table: str, row: tuple) -> bool:
+        """Buffer one row for `table`. Never waits; False when it was dropped."""
+        if len(self._buffer) >= TELEMETRY_MAX_PENDING:
+            self.metrics["dropped"] += 1
+            now = time.monotonic()
+            if self._last_drop_log is None or now - self._last_drop_log >= TELEMETRY_DROP_LOG_INTERVAL_SECONDS:
+                self._last_drop_log = now
+                logger.warning("Telemetry buffer full at %d row(s) — dropping new rows (%d dropped so far)",
+                               TELEMETRY_MAX_PENDING, self.metrics["dropped"])
+            return False
+        self._buffer.append((table, row))
+        self.metrics["recorded"] += 1
+        if len(self._buffer) >= TELEMETRY_BATCH_SIZE and self._wakeup is not None:
+            self._wakeup.set()
+        return True
+
+    async def start(self):
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Let the background task finish its flush, then write what is left."""
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._wakeup = None
+        await self.flush()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=TELEMETRY_FLUSH_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            if self._stopping:
+                return
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Telemetry flush failed: %s", e)
+
+    async def flush(self):
+        """Write everything buffered so far: one executemany per table."""
+        rows, self._buffer = self._buffer, []
+        if not rows:
+            return
+        by_table: dict[str, list[tuple]] = defaultdict(list)
+        for table, row in rows:
+            by_table[table].append(row)
+        self.metrics["flushes"] += 1
+        try:
+            pool = await get_pool()
+            async with pool.acquire() as conn:
+                for table, batch in by_table.items():
+                    await self._write(conn, table, batch)
+        except Exception as e:
+            pending = sum(len(b) for b in by_table.values())
+            self.metrics["failed"] += pending
+            logger.warning("Failed to write %d telemetry row(s): %s", pending, e)
+
+    async def _write(self, conn, table: str, batch: list[tuple]):
+        if table not in self._tables_seen:
+            if not await conn.fetchval(
+                "SELECT EXISTS(SELECT 1 FROM information_schema.tables WHERE table_name = $1)", table
+            ):
+                self.metrics["failed"] += len(batch)
+                logger.warning("Telemetry table %s does not exist — %d row(s) discarded", table, len(batch))
+                return
+            self._tables_seen.add(table)
+        try:
+            await conn.executemany(INSERTS[table], batch)
+            self.metrics["written"] += len(batch)
+            return
+        except Exception as e:
+            if len(batch) == 1:
+                self.metrics["failed"] += 1
+                logger.warning("Failed to write %s row: %s", table, e)
+                return
+        for row in batch:
+            try:
+                await conn.execute(INSERTS[table], *row)
+                self.metrics["written"] += 1
+            except Exception as e:
+                self.metrics["failed"] += 1
+                logger.warning("Failed to write %s row: %s", table, e)
+
+    def _forget_tables(self):
+        """Test hook — forget which tables have been seen."""
+        self._tables_seen.clear()
+
+    def stats(self) -> dict:
+        return {**self.metrics, "pending": len(self._buffer), "max_pending": TELEMETRY_MAX_PENDING}
+
+
+writer = TelemetryWriter()
@@ -0,0 +1,230 @@
+"""Stairs — Per-Organization AI Token Accounting and Quotas
+
+ai_usage_logs recorded tokens per provider call but not which organization
+made the call. Nothing added usage up per tenant, and enforcing a limit
+would have meant scanning that table before every call. One tenant running
+a script against the API could spend the provider budget for everyone.
+
+call_ai_with_fallback now reports every successful call to `meter.record()`
+with input and output tokens by organization and task type. The counters
+live in memory. Every AI_USAGE_FLUSH_SECONDS a background task adds them
+into ai_usage_daily, one row per (organization, UTC day, task type), with a
+single executemany upsert. It then reads back today's total per
+organization, which includes what the other workers wrote. The upsert
+and both reads are one transaction. If any of them fails, nothing was
+added and the counts are kept for the next flush; they are never added
+twice.
+
+`meter.check(org)` is two dictionary lookups: today's flushed total plus
+whatever this worker has recorded since. It is compared against the org's
+daily limits:
+
+  soft  AI_DAILY_TOKEN_SOFT_LIMIT, or the org's settings
+        "ai_daily_token_soft_limit". Logged once per org per day. Calls
+        still go through.
+  hard  AI_DAILY_TOKEN_HARD_LIMIT, or "ai_daily_token_hard_limit". Calls
+        are answered with the "quota" envelope without reaching a provider.
+
+0 means no limit. Both env defaults are 0. An org setting that is not a
+non-negative number is ignored (with a warning) in favour of the default.
+
+Counts are per worker between flushes, so a tenant can overshoot a hard
+limit by whatever the workers spend in one flush interval. A limit that is
+exact to the token would need a round trip per call, which is what this
+replaces. Calls made outside a request, with no organization, are counted
+under "" and never limited.
+"""
+
+import asyncio
+import logging
+import math
+import os
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from typing import Optional
+
+from app.db.connection import get_pool
+
+logger = logging.getLogger("stairs.usage")
+
+AI_USAGE_FLUSH_SECONDS = float(os.getenv("AI_USAGE_FLUSH_SECONDS", "10"))
+AI_DAILY_TOKEN_SOFT_LIMIT = int(os.getenv("AI_DAILY_TOKEN_SOFT_LIMIT", "0"))
+AI_DAILY_TOKEN_HARD_LIMIT = int(os.getenv("AI_DAILY_TOKEN_HARD_LIMIT", "0"))
+
+OK, SOFT, HARD = "ok", "soft", "hard"
+
+UPSERT_SQL = """INSERT INTO ai_usage_daily (organization_id, day, task_type, input_tokens, output_tokens, calls)
+    VALUES ($1, $2, $3, $4, $5, $6)
+    ON CONFLICT (organization_id, day, task_type) DO UPDATE SET
+        input_tokens = ai_usage_daily.input_tokens + EXCLUDED.input_tokens,
+        output_tokens = ai_usage_daily.output_tokens + EXCLUDED.output_tokens,
+        calls = ai_usage_daily.calls + EXCLUDED.calls"""
+
+TODAY_SQL = """SELECT organization_id::text AS org, SUM(input_tokens + output_tokens) AS tokens
+    FROM ai_usage_daily WHERE day = $1 GROUP BY organization_id"""
+
+# Read as text and parsed in Python: a cast in SQL would fail the whole
+# flush on one org's malformed setting.
+LIMITS_SQL = """SELECT id::text AS org,
+        settings->>'ai_daily_token_soft_limit' AS soft,
+        settings->>'ai_daily_token_hard_limit' AS hard
+    FROM organizations
+    WHERE settings ? 'ai_daily_token_soft_limit' OR settings ? 'ai_daily_token_hard_limit'"""
+
+
+def _utc_today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def _parse_limit(org: str, name: str, raw: Optional[str]) -> Optional[int]:
+    """An org's limit setting as tokens, or None to use the default."""
+    if raw is None:
+        return None
+    try:
+        value = float(raw)
+    except ValueError:
+        value = math.nan
+    if not math.isfinite(value) or value < 0:
+        logger.warning("Organization %s has an invalid ai_daily_token_%s_limit %r; using the default",
+                       org, name, raw)
+        return None
+    return int(value)
+
+
+class UsageMeter:
+    def __init__(self, today=_utc_today):
+        self._today_fn = today
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._limits: dict[str, tuple] = {}
+        self._day = today()
+        self._pending: dict[tuple, list] = defaultdict(lambda: [0, 0, 0])  # (org, day, task) -> [in, out, calls]
+        self._flushed: dict[str, int] = {}               # org -> today's total in the table
+        self._local: dict[str, int] = defaultdict(int)   # org -> recorded here since the last flush
+        self._warned: set[str] = set()
+        self.metrics = {"recorded": 0, "flushes": 0, "failed": 0, "rejected": 0}
+
+    def _roll(self):
+        day = self._today_fn()
+        if day != self._day:
+            self._day = day
+            self._flushed = {}
+            self._local = defaultdict(int)
+            self._warned.clear()
+
+    def used(self, org: str) -> int:
+        self._roll()
+        return self._flushed.get(org, 0) + self._local.get(org, 0)
+
+    def limits(self, org: str) -> tuple:
+        soft, hard = self._limits.get(org, (None, None))
+        return (AI_DAILY_TOKEN_SOFT_LIMIT if soft is None else soft,
+                AI_DAILY_TOKEN_HARD_LIMIT if hard is None else hard)
+
+    def state(self, org: str) -> str:
+        if not org:
+            return OK
+        soft, hard = self.limits(org)
+        if not soft and not hard:
+            return OK
+        used = self.used(org)
+        if hard and used >= hard:
+            return HARD
+        if soft and used >= soft:
+            return SOFT
+        return OK
+
+    def check(self, org: str) -> str:
+        """state(), counting rejections and logging the first soft breach."""
+        state = self.state(org)
+        if state == HARD:
+            self.metrics["rejected"] += 1
+        elif state == SOFT and org not in self._warned:
+            self._warned.add(org)
+            logger.warning("Organization %s passed its soft AI token limit: %d of %d today",
+                           org, self.used(org), self.limits(org)[0])
+        return state
+
+    def record(self, org: str, task_type: str, input_tokens: int, output_tokens: int):
+        self._roll()
+        counters = self._pending[(org, self._day, task_type or "")]
+        counters[0] += max(0, input_tokens)
+        counters[1] += max(0, output_tokens)
+        counters[2] += 1
+        self._local[org] += max(0, input_tokens) + max(0, output_tokens)
+        self.metrics["recorded"] += 1
+
+    async def start(self):
+        self._stopping = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Let the background task finish its flush, then write what is
+        still counted. The task is asked to return, not cancelled: a flush
+        cancelled between its commit and its return could neither keep nor
+        safely restore the counts it had taken."""
+        if self._task is not None:
+            self._stopping.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if not self._pending:
+            return
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.warning("Final usage flush failed: %s", e)
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=AI_USAGE_FLUSH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            if self._stopping.is_set():
+                return
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Usage flush failed: %s", e)
+
+    async def flush(self):
+        """Add the counters into ai_usage_daily and re-read today's totals
+        and the per-org limits."""
+        self._roll()
+        pending, self._pending = self._pending, defaultdict(lambda: [0, 0, 0])
+        local, self._local = self._local, defaultdict(int)
+        rows = [(org, day, task, *c) for (org, day, task), c in pending.items() if org]
+        try:
+            pool = await get_pool()
+            async with pool.acquire() as conn:
+                # One transaction: a failed read rolls the upsert back too, so
+                # putting the counts back below can never count them twice.
+                async with conn.transaction():
+                    if rows:
+                        await conn.executemany(UPSERT_SQL, rows)
+                    totals = await conn.fetch(TODAY_SQL, self._day)
+                    limits = await conn.fetch(LIMITS_SQL)
+        except Exception:
+            # Nothing was written. Put the counts back so the next flush
+            # writes them and check() keeps seeing them meanwhile.
+            self.metrics["failed"] += 1
+            for k, c in pending.items():
+                merged = self._pending[k]
+                for i in range(3):
+                    merged[i] += c[i]
+            for org, n in local.items():
+                self._local[org] += n
+            raise
+        self.metrics["flushes"] += 1
+        self._flushed = {r["org"]: int(r["tokens"] or 0) for r in totals}
+        self._limits = {r["org"]: (_parse_limit(r["org"], "soft", r["soft"]), _parse_limit(r["org"], "hard", r["hard"]))
+                        for r in limits}
+
+    def snapshot(self) -> dict:
+        return {**self.metrics, "pending_rows": len(self._pending),
+                "soft_limit": AI_DAILY_TOKEN_SOFT_LIMIT, "hard_limit": AI_DAILY_TOKEN_HARD_LIMIT}
+
+
+meter = UsageMeter()
@@ -0,0 +1,294 @@
+"""End-to-end API benchmarks against a running server and a seeded tenant.
+
+The serialization benchmark times one step in isolation. This one drives the
+real endpoints over HTTP, against a tenant the size of our largest customers
+(benchmarks/seed.py). Each scenario reports p50/p95/p99 latency and
+throughput:
+
+  tree              GET /strategies/{id}/tree, one strategy of ~2,000 stairs
+  org_tree          GET /stairs/tree, the whole organization
+  dashboard         GET /dashboard
+  list_strategies   GET /strategies
+  chat_context      POST /ai/chat with a strategy. Measures the context build
+                    and the round trip. Point the server at
+                    benchmarks.mock_provider so the number is ours and not a
+                    provider's.
+  dqa_confidence    GET /data-qa/{id}/confidence
+  dqa_health        GET /data-qa/{id}/health
+  dqa_impact        GET /data-qa/{id}/sources/{source}/impact
+  ws_fanout         --listeners sockets on the tenant's org. Times POST
+                    /kpis/bulk until every listener has its kpi_bulk_logged
+                    event.
+
+--save writes the results to a JSON file. --compare reads an earlier one and
+marks any scenario whose p95 or p99 rose, or whose throughput fell, by more
+than --tolerance. With --fail-on-regression, marked scenarios make the exit
+status 1, so the comparison can gate a CI job.
+
+    # server: same JWT_SECRET as here, rate limiter out of the way
+    RATE_LIMIT_MAX=1000000 uvicorn app.main:app --workers 4
+    python -m benchmarks.seed --reset
+    python -m benchmarks.api --save benchmarks/results/baseline.json
+    ... change something, restart the server ...
+    python -m benchmarks.api --compare benchmarks/results/baseline.json
+
+Tokens are minted locally with app.helpers.create_jwt for the tenant's admin
+user, so JWT_SECRET must match the server's.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from app.helpers import create_jwt
+
+from benchmarks.seed import DEFAULT_MANIFEST
+
+API = "/api/v1"
+
+
+# ─── STATISTICS ───
+
+def percentile(sorted_values: list, p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies: list, errors: int, elapsed: float) -> dict:
+    ms = sorted(x * 1000 for x in latencies)
+    done = len(ms) + errors
+    return {
+        "requests": done,
+        "errors": errors,
+        "p50_ms": round(percentile(ms, 50), 2),
+        "p95_ms": round(percentile(ms, 95), 2),
+        "p99_ms": round(percentile(ms, 99), 2),
+        "mean_ms": round(sum(ms) / len(ms), 2) if ms else 0.0,
+        "max_ms": round(ms[-1], 2) if ms else 0.0,
+        "throughput_rps": round(len(ms) / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+
+
+def compare(baseline: dict, current: dict, tolerance: float = 0.10) -> list:
+    """Scenarios present in both runs that got slower than tolerance allows.
+    Returns (scenario, metric, before, after) tuples."""
+    regressions = []
+    for name, now in current.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        for metric in ("p95_ms", "p99_ms"):
+            if before.get(metric) and now[metric] > before[metric] * (1 + tolerance):
+                regressions.append((name, metric, before[metric], now[metric]))
+        if before.get("throughput_rps") and now["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+            regressions.append((name, "throughput_rps", before["throughput_rps"], now["throughput_rps"]))
+    return regressions
+
+
+# ─── SCENARIOS ───
+# Each builds one request: (method, path, json body or None).
+
+def _tree(t, rng):
+    return "GET", f"{API}/strategies/{rng.choice(t['strategy_ids'])}/tree", None
+
+
+def _org_tree(t, rng):
+    return "GET", f"{API}/stairs/tree", None
+
+
+def _dashboard(t, rng):
+    return "GET", f"{API}/dashboard", None
+
+
+def _list_strategies(t, rng):
+    return "GET", f"{API}/strategies", None
+
+
+def _chat_context(t, rng):
+    return "POST", f"{API}/ai/chat", {"message": "Which key results are most at risk this quarter and why?",
+                                      "strategy_id": rng.choice(t["strategy_ids"])}
+
+
+def _dqa_confidence(t, rng):
+    return "GET", f"{API}/data-qa/{rng.choice(t['strategy_ids'])}/confidence", None
+
+
+def _dqa_health(t, rng):
+    return "GET", f"{API}/data-qa/{rng.choice(t['strategy_ids'])}/health", None
+
+
+def _dqa_impact(t, rng):
+    strategy_id, source_id = rng.choice(t["sources"])
+    return "GET", f"{API}/data-qa/{strategy_id}/sources/{source_id}/impact", None
+
+
+SCENARIOS = {
+    "tree": _tree,
+    "org_tree": _org_tree,
+    "dashboard": _dashboard,
+    "list_strategies": _list_strategies,
+    "chat_context": _chat_context,
+    "dqa_confidence": _dqa_confidence,
+    "dqa_health": _dqa_health,
+    "dqa_impact": _dqa_impact,
+    "ws_fanout": None,  # run_ws_fanout
+}
+
+
+async def run_http(client: httpx.AsyncClient, build, tenant: dict, requests: int, concurrency: int,
+                   warmup: int, rng: random.Random) -> dict:
+    async def one():
+        method, path, body = build(tenant, rng)
+        t0 = time.perf_counter()
+        try:
+            r = await client.request(method, path, json=body)
+            ok = r.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        return ok, time.perf_counter() - t0
+
+    for _ in range(warmup):
+        await one()
+    latencies, errors = [], 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            ok, took = await one()
+            if ok:
+                latencies.append(took)
+            else:
+                errors += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - t0)
+
+
+def _events(frame: dict):
+    if frame.get("event") == "batch":
+        yield from frame.get("data", {}).get("events", [])
+    else:
+        yield frame
+
+
+async def run_ws_fanout(client: httpx.AsyncClient, base_url: str, token: str, tenant: dict, requests: int,
+                        listeners: int, rng: random.Random) -> dict:
+    import websockets
+
+    ws_url = base_url.replace("http", "ws", 1).rstrip("/")
+    url = f"{ws_url}/ws/{tenant['org_id']}/{tenant['user_id']}?token={token}"
+    sockets = [await websockets.connect(url, max_size=None) for _ in range(listeners)]
+    latencies, errors = [], 0
+    try:
+        async def wait_for_event(ws):
+            while True:
+                frame = json.loads(await ws.recv())
+                if any(e.get("event") == "kpi_bulk_logged" for e in _events(frame)):
+                    return
+
+        await asyncio.sleep(0.5)  # let the "connected" frames go by
+        t_all = time.perf_counter()
+        for _ in range(requests):
+            body = {"measurements": [{"stair_id": rng.choice(tenant["kpi_stair_ids"]),
+                                      "value": round(rng.uniform(10, 1000), 2)}]}
+            waiting = [asyncio.create_task(wait_for_event(ws)) for ws in sockets]
+            t0 = time.perf_counter()
+            try:
+                r = await client.post(f"{API}/kpis/bulk", json=body)
+                r.raise_for_status()
+                await asyncio.wait_for(asyncio.gather(*waiting), timeout=10)
+                latencies.append(time.perf_counter() - t0)
+            except (httpx.HTTPError, asyncio.TimeoutError):
+                errors += 1
+                for task in waiting:
+                    task.cancel()
+                await asyncio.gather(*waiting, return_exceptions=True)
+        elapsed = time.perf_counter() - t_all
+    finally:
+        await asyncio.gather(*(ws.close() for ws in sockets), return_exceptions=True)
+    return {**summarize(latencies, errors, elapsed), "listeners": listeners}
+
+
+# ─── MAIN ───
+
+async def _main(args) -> int:
+    with open(args.manifest) as f:
+        tenant = json.load(f)["tenants"][args.tenant]
+    token = create_jwt(tenant["user_id"], tenant["org_id"], "admin")
+    names = args.scenarios.split(",") if args.scenarios else list(SCENARIOS)
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        print(f"unknown scenario(s): {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    rng = random.Random(args.seed)
+    results = {}
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout,
+                                 headers={"Authorization": f"Bearer {token}"},
+                                 limits=httpx.Limits(max_connections=args.concurrency)) as client:
+        for name in names:
+            if name == "ws_fanout":
+                results[name] = await run_ws_fanout(client, args.base_url, token, tenant,
+                                                    max(1, args.requests // 10), args.listeners, rng)
+            else:
+                results[name] = await run_http(client, SCENARIOS[name], tenant, args.requests,
+                                               args.concurrency, args.warmup, rng)
+            r = results[name]
+            print(f"{name:16s} p50 {r['p50_ms']:9.2f}  p95 {r['p95_ms']:9.2f}  p99 {r['p99_ms']:9.2f} ms"
+                  f"  {r['throughput_rps']:8.2f} req/s  errors {r['errors']}")
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump({"created_at": datetime.now(timezone.utc).isoformat(), "base_url": args.base_url,
+                       "concurrency": args.concurrency, "results": results}, f, indent=2)
+        print(f"saved to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(baseline, results, args.tolerance)
+        for name, metric, before, after in regressions:
+            print(f"REGRESSION {name} {metric}: {before} -> {after}")
+        if not regressions:
+            print(f"no regressions beyond {args.tolerance:.0%} against {args.compare}")
+        if regressions and args.fail_on_regression:
+            return 1
+    return 0
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--base-url", default="http://localhost:8000")
+    ap.add_argument("--manifest", default=DEFAULT_MANIFEST)
+    ap.add_argument("--tenant", type=int, default=0, help="index into the manifest's tenants")
+    ap.add_argument("--scenarios", help=f"comma-separated subset of: {', '.join(SCENARIOS)}")
+    ap.add_argument("--requests", type=int, default=200, help="per scenario; ws_fanout does a tenth")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--warmup", type=int, default=5)
+    ap.add_argument("--listeners", type=int, default=50)
+    ap.add_argument("--timeout", type=float, default=60.0)
+    ap.add_argument("--seed", type=int, default=2026)
+    ap.add_argument("--save")
+    ap.add_argument("--compare")
+    ap.add_argument("--tolerance", type=float, default=0.10)
+    ap.add_argument("--fail-on-regression", action="store_true")
+    sys.exit(asyncio.run(_main(ap.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
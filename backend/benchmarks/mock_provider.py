@@ -0,0 +1,462 @@
+"""A local stand-in for the Anthropic, OpenAI and Gemini APIs.
+
+tests/test_ai_client.py scripts one request at a time. That cannot show
+what the orchestrator, the failover chain, retries, backoff, hedging and
+the concurrency governor do with fifty requests in flight and a provider
+having a bad afternoon. This server speaks enough of each vendor's API
+for our clients, including streaming:
+
+  Anthropic  GET /v1/models, POST /v1/messages ("stream": true gives SSE)
+  OpenAI     POST /v1/chat/completions ("stream": true gives SSE)
+  Gemini     POST /v1beta/models/{model}:generateContent
+             POST /v1beta/models/{model}:streamGenerateContent
+
+For each provider you can set:
+
+  latency_ms         {"p50": ..., "p99": ...}, drawn from a lognormal
+                     distribution with those quantiles. {"p50": 0} means
+                     answer at once.
+  errors             probability per failure: "404" (the requested model is
+                     treated as retired), "429" (sent with Retry-After:
+                     retry_after_seconds), "500", "503", "529", "timeout"
+                     (no answer for timeout_seconds, then a 504).
+  models             what /v1/models lists.
+  retired_models     always 404 with not_found_error, like a retired id.
+  responses          [{"contains": "...", "text": "..."}]. The first entry
+                     whose "contains" appears in the prompt is the answer.
+  default_text       otherwise. Both are string.Template texts that can use
+                     $provider, $model, $prompt and $n.
+
+Configuration is a PRESETS name, a JSON file, or both (the file is laid
+over the preset). GET /_mock/stats returns per-provider outcome counts and
+peak concurrency. POST /_mock/config applies a partial profile at runtime,
+for example to take one provider down in the middle of a load test.
+POST /_mock/reset clears the counters.
+
+    python -m benchmarks.mock_provider [--port 8765] [--preset realistic] [--config profile.json]
+
+then start the API with the variables it prints (ANTHROPIC_BASE_URL,
+OPENAI_BASE_URL, GEMINI_BASE_URL and dummy keys). In-process, use
+`running()`:
+
+    with running("flaky") as mock:
+        monkeypatch.setattr(ai_client, "ANTHROPIC_BASE_URL", mock.base_url)
+"""
+
+import argparse
+import asyncio
+import contextlib
+import copy
+import json
+import math
+import random
+import socket
+import string
+import threading
+import time
+from collections import defaultdict
+from typing import Optional, Union
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+PROVIDERS = ("anthropic", "openai", "gemini")
+
+_BASE = {
+    "latency_ms": {"p50": 0, "p99": 0},
+    "errors": {},
+    "retry_after_seconds": 1,
+    "timeout_seconds": 120,
+    "stream_chunk_chars": 24,
+    "stream_chunk_delay_ms": 0,
+    "models": [],
+    "retired_models": [],
+    "responses": [],
+    "default_text": "[$provider/$model] Mock answer #$n to: $prompt",
+}
+
+PRESETS = {
+    # Instant, always succeeds. For tests.
+    "fast": {p: {} for p in PROVIDERS},
+    # Roughly what production sees on a normal day.
+    "realistic": {
+        "anthropic": {"latency_ms": {"p50": 2500, "p99": 12000}, "errors": {"429": 0.01, "529": 0.01}},
+        "openai": {"latency_ms": {"p50": 3000, "p99": 15000}, "errors": {"429": 0.01, "500": 0.005}},
+        "gemini": {"latency_ms": {"p50": 2000, "p99": 10000}, "errors": {"503": 0.01}},
+    },
+    # A bad afternoon: rate limits, overloads and the odd hang everywhere.
+    "flaky": {
+        "anthropic": {"latency_ms": {"p50": 3000, "p99": 30000},
+                      "errors": {"429": 0.1, "529": 0.1, "timeout": 0.02}},
+        "openai": {"latency_ms": {"p50": 3500, "p99": 25000}, "errors": {"429": 0.1, "503": 0.05}},
+        "gemini": {"latency_ms": {"p50": 2500, "p99": 20000}, "errors": {"503": 0.05}},
+    },
+    # Anthropic is down; everything should land on OpenAI.
+    "claude_down": {
+        "anthropic": {"errors": {"529": 1.0}},
+        "openai": {"latency_ms": {"p50": 800, "p99": 3000}},
+        "gemini": {"latency_ms": {"p50": 800, "p99": 3000}},
+    },
+}
+
+_DEFAULT_MODELS = {
+    "anthropic": ["claude-sonnet-4-6", "claude-sonnet-4-5-20250929", "claude-haiku-4-5", "claude-opus-4-5"],
+    "openai": ["gpt-4o"],
+    "gemini": ["gemini-2.0-flash"],
+}
+
+
+def build_config(preset: Optional[str] = "fast", overrides: Optional[dict] = None, seed: Optional[int] = None) -> dict:
+    """A full profile for every provider: the defaults, then the preset,
+    then `overrides`."""
+    config = {"seed": seed, "providers": {}}
+    for p in PROVIDERS:
+        profile = copy.deepcopy(_BASE)
+        profile["models"] = list(_DEFAULT_MODELS[p])
+        profile.update(copy.deepcopy(PRESETS.get(preset or "fast", {}).get(p, {})))
+        config["providers"][p] = profile
+    _merge(config, overrides or {})
+    return config
+
+
+def _merge(config: dict, overrides: dict):
+    if "seed" in overrides:
+        config["seed"] = overrides["seed"]
+    for p, patch in (overrides.get("providers") or {}).items():
+        if p in config["providers"]:
+            config["providers"][p].update(copy.deepcopy(patch))
+
+
+class MockState:
+    def __init__(self, config: dict):
+        self.config = config
+        self.rng = random.Random(config.get("seed"))
+        self.reset()
+
+    def reset(self):
+        self.counts = defaultdict(lambda: defaultdict(int))  # provider -> outcome -> n
+        self.in_flight = defaultdict(int)
+        self.peak_in_flight = defaultdict(int)
+        self.n = 0
+
+    def profile(self, provider: str) -> dict:
+        return self.config["providers"][provider]
+
+    def latency(self, provider: str) -> float:
+        spec = self.profile(provider)["latency_ms"]
+        p50, p99 = float(spec.get("p50", 0)), float(spec.get("p99", 0))
+        if p50 <= 0:
+            return 0.0
+        sigma = math.log(max(p99, p50) / p50) / 2.326 if p99 > p50 else 0.0
+        return self.rng.lognormvariate(math.log(p50), sigma) / 1000
+
+    def outcome(self, provider: str, model: str) -> str:
+        profile = self.profile(provider)
+        if model in profile["retired_models"]:
+            return "404"
+        roll, edge = self.rng.random(), 0.0
+        for kind, probability in profile["errors"].items():
+            edge += float(probability)
+            if roll < edge:
+                return str(kind)
+        return "ok"
+
+    def answer(self, provider: str, model: str, prompt: str, max_tokens: int) -> tuple:
+        """(text, input_tokens, output_tokens, truncated)"""
+        self.n += 1
+        profile = self.profile(provider)
+        template = next((r["text"] for r in profile["responses"] if r.get("contains", "") in prompt),
+                        profile["default_text"])
+        text = string.Template(template).safe_substitute(
+            provider=provider, model=model, prompt=" ".join(prompt.split())[:120], n=self.n,
+        )
+        truncated = len(text) > max_tokens * 4
+        if truncated:
+            text = text[:max_tokens * 4]
+        return text, max(1, len(prompt) // 4), max(1, len(text) // 4), truncated
+
+    def stats(self) -> dict:
+        return {
+            p: {"outcomes": dict(self.counts[p]), "in_flight": self.in_flight[p],
+                "peak_in_flight": self.peak_in_flight[p]}
+            for p in PROVIDERS
+        }
+
+
+# ─── VENDOR SHAPES ───
+
+def _anthropic_error(status: int, model: str) -> dict:
+    kind = {404: "not_found_error", 429: "rate_limit_error", 529: "overloaded_error"}.get(status, "api_error")
+    message = f"model: {model}" if status == 404 else f"mock {kind}"
+    return {"type": "error", "error": {"type": kind, "message": message}}
+
+
+def _openai_error(status: int, model: str) -> dict:
+    return {"error": {"message": f"mock error for {model}", "type": "mock_error", "code": status}}
+
+
+def _gemini_error(status: int, model: str) -> dict:
+    return {"error": {"code": status, "message": f"mock error for {model}", "status": "UNAVAILABLE"}}
+
+
+_ERRORS = {"anthropic": _anthropic_error, "openai": _openai_error, "gemini": _gemini_error}
+
+
+def _chunks(text: str, size: int):
+    for i in range(0, len(text), max(1, size)):
+        yield text[i:i + size]
+
+
+def _sse(event: Optional[str], data: dict) -> bytes:
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {json.dumps(data)}\n\n".encode()
+
+
+def _prompt_of(messages: list, system: str = "") -> str:
+    parts = [system or ""]
+    for m in messages or []:
+        content = m.get("content", "")
+        if isinstance(content, list):
+            content = " ".join(c.get("text", "") for c in content if isinstance(c, dict))
+        parts.append(str(content))
+    return "\n".join(parts)
+
+
+def create_app(config: Optional[dict] = None) -> FastAPI:
+    state = MockState(config or build_config())
+    app = FastAPI(title="Stairs mock AI providers")
+    app.state.mock = state
+
+    async def handle(provider: str, model: str, prompt: str, max_tokens: int, stream: bool, render, render_stream):
+        state.in_flight[provider] += 1
+        state.peak_in_flight[provider] = max(state.peak_in_flight[provider], state.in_flight[provider])
+        try:
+            profile = state.profile(provider)
+            outcome = state.outcome(provider, model)
+            if outcome == "timeout":
+                await asyncio.sleep(float(profile["timeout_seconds"]))
+                outcome = "504"
+            else:
+                await asyncio.sleep(state.latency(provider))
+        finally:
+            state.in_flight[provider] -= 1
+        state.counts[provider][outcome] += 1
+        if outcome != "ok":
+            status = int(outcome) if outcome.isdigit() else 500
+            headers = {"retry-after": str(profile["retry_after_seconds"])} if status == 429 else None
+            return JSONResponse(_ERRORS[provider](status, model), status_code=status, headers=headers)
+        text, tokens_in, tokens_out, truncated = state.answer(provider, model, prompt, max_tokens)
+        if not stream:
+            return JSONResponse(render(text, tokens_in, tokens_out, truncated))
+
+        async def body():
+            for part in render_stream(text, tokens_in, tokens_out, truncated):
+                yield part
+                delay = profile["stream_chunk_delay_ms"]
+                if delay:
+                    await asyncio.sleep(delay / 1000)
+        return StreamingResponse(body(), media_type="text/event-stream")
+
+    # ─── ANTHROPIC ───
+
+    @app.get("/v1/models")
+    async def anthropic_models():
+        profile = state.profile("anthropic")
+        live = [m for m in profile["models"] if m not in profile["retired_models"]]
+        return {"data": [{"id": m, "type": "model", "display_name": m} for m in live], "has_more": False}
+
+    @app.post("/v1/messages")
+    async def anthropic_messages(request: Request):
+        body = await request.json()
+        model = body.get("model", "")
+        prompt = _prompt_of(body.get("messages"), body.get("system"))
+        max_tokens = int(body.get("max_tokens") or 1024)
+
+        def render(text, tokens_in, tokens_out, truncated):
+            return {
+                "id": f"msg_mock_{state.n}", "type": "message", "role": "assistant", "model": model,
+                "content": [{"type": "text", "text": text}],
+                "stop_reason": "max_tokens" if truncated else "end_turn",
+                "usage": {"input_tokens": tokens_in, "output_tokens": tokens_out},
+            }
+
+        def render_stream(text, tokens_in, tokens_out, truncated):
+            message = render("", tokens_in, 0, False)
+            message["content"] = []
+            yield _sse("message_start", {"type": "message_start", "message": message})
+            yield _sse("content_block_start", {"type": "content_block_start", "index": 0,
+                                               "content_block": {"type": "text", "text": ""}})
+            for part in _chunks(text, state.profile("anthropic")["stream_chunk_chars"]):
+                yield _sse("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                                   "delta": {"type": "text_delta", "text": part}})
+            yield _sse("content_block_stop", {"type": "content_block_stop", "index": 0})
+            yield _sse("message_delta", {"type": "message_delta",
+                                         "delta": {"stop_reason": "max_tokens" if truncated else "end_turn"},
+                                         "usage": {"output_tokens": tokens_out}})
+            yield _sse("message_stop", {"type": "message_stop"})
+
+        return await handle("anthropic", model, prompt, max_tokens, bool(body.get("stream")), render, render_stream)
+
+    # ─── OPENAI ───
+
+    @app.post("/v1/chat/completions")
+    async def openai_chat(request: Request):
+        body = await request.json()
+        model = body.get("model", "")
+        prompt = _prompt_of(body.get("messages"))
+        max_tokens = int(body.get("max_tokens") or body.get("max_completion_tokens") or 1024)
+        created = int(time.time())
+
+        def render(text, tokens_in, tokens_out, truncated):
+            return {
+                "id": f"chatcmpl-mock{state.n}", "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                             "finish_reason": "length" if truncated else "stop"}],
+                "usage": {"prompt_tokens": tokens_in, "completion_tokens": tokens_out,
+                          "total_tokens": tokens_in + tokens_out},
+            }
+
+        def render_stream(text, tokens_in, tokens_out, truncated):
+            base = {"id": f"chatcmpl-mock{state.n}", "object": "chat.completion.chunk", "created": created,
+                    "model": model}
+            yield _sse(None, {**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}}]})
+            for part in _chunks(text, state.profile("openai")["stream_chunk_chars"]):
+                yield _sse(None, {**base, "choices": [{"index": 0, "delta": {"content": part}}]})
+            yield _sse(None, {**base, "choices": [{"index": 0, "delta": {},
+                                                   "finish_reason": "length" if truncated else "stop"}]})
+            yield b"data: [DONE]\n\n"
+
+        return await handle("openai", model, prompt, max_tokens, bool(body.get("stream")), render, render_stream)
+
+    # ─── GEMINI ───
+
+    @app.post("/v1beta/models/{model_action}")
+    async def gemini_generate(model_action: str, request: Request):
+        model, _, action = model_action.partition(":")
+        if action not in ("generateContent", "streamGenerateContent"):
+            return JSONResponse(_gemini_error(404, model), status_code=404)
+        body = await request.json()
+        system = " ".join(p.get("text", "") for p in (body.get("system_instruction") or {}).get("parts", []))
+        prompt = _prompt_of(
+            [{"content": " ".join(p.get("text", "") for p in c.get("parts", []))} for c in body.get("contents") or []],
+            system,
+        )
+        max_tokens = int((body.get("generationConfig") or {}).get("maxOutputTokens") or 1024)
+
+        def candidate(text, truncated):
+            return {"content": {"role": "model", "parts": [{"text": text}]},
+                    "finishReason": "MAX_TOKENS" if truncated else "STOP", "index": 0}
+
+        def usage(tokens_in, tokens_out):
+            return {"promptTokenCount": tokens_in, "candidatesTokenCount": tokens_out,
+                    "totalTokenCount": tokens_in + tokens_out}
+
+        def render(text, tokens_in, tokens_out, truncated):
+            return {"candidates": [candidate(text, truncated)], "usageMetadata": usage(tokens_in, tokens_out),
+                    "modelVersion": model}
+
+        def render_stream(text, tokens_in, tokens_out, truncated):
+            parts = list(_chunks(text, state.profile("gemini")["stream_chunk_chars"])) or [""]
+            for i, part in enumerate(parts):
+                last = i == len(parts) - 1
+                chunk = {"candidates": [candidate(part, truncated and last)], "modelVersion": model}
+                if last:
+                    chunk["usageMetadata"] = usage(tokens_in, tokens_out)
+                yield _sse(None, chunk)
+
+        stream = action == "streamGenerateContent"
+        return await handle("gemini", model, prompt, max_tokens, stream, render, render_stream)
+
+    # ─── CONTROL ───
+
+    @app.get("/_mock/stats")
+    async def mock_stats():
+        return state.stats()
+
+    @app.post("/_mock/config")
+    async def mock_config(request: Request):
+        overrides = await request.json()
+        _merge(state.config, overrides)
+        if "seed" in overrides:
+            state.rng.seed(overrides["seed"])
+        return state.config
+
+    @app.post("/_mock/reset")
+    async def mock_reset():
+        state.reset()
+        return {"ok": True}
+
+    return app
+
+
+def settings(base_url: str) -> dict:
+    """Environment that points the API at a mock running on `base_url`."""
+    return {
+        "ANTHROPIC_BASE_URL": base_url,
+        "OPENAI_BASE_URL": base_url,
+        "GEMINI_BASE_URL": base_url,
+        "ANTHROPIC_API_KEY": "sk-ant-mock",
+        "OPENAI_API_KEY": "sk-mock",
+        "GOOGLE_API_KEY": "mock",
+    }
+
+
+class MockHandle:
+    def __init__(self, base_url: str, state: MockState):
+        self.base_url = base_url
+        self.state = state
+
+    def configure(self, overrides: dict):
+        """Same as POST /_mock/config, without the round trip."""
+        _merge(self.state.config, overrides)
+
+
+@contextlib.contextmanager
+def running(config: Union[str, dict, None] = "fast", host: str = "127.0.0.1", port: int = 0):
+    """Serve the mock on a background thread for the duration of the block.
+    `config` is a preset name or a build_config() result."""
+    if isinstance(config, str) or config is None:
+        config = build_config(config)
+    app = create_app(config)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning", lifespan="off", ws="none"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline or not thread.is_alive():
+            raise RuntimeError("mock provider failed to start")
+        time.sleep(0.01)
+    try:
+        yield MockHandle(f"http://{host}:{sock.getsockname()[1]}", app.state.mock)
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+        sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--preset", default="realistic", choices=sorted(PRESETS))
+    parser.add_argument("--config", help="JSON file laid over the preset")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    overrides = {}
+    if args.config:
+        with open(args.config) as f:
+            overrides = json.load(f)
+    config = build_config(args.preset, overrides, seed=args.seed)
+    base_url = f"http://{args.host}:{args.port}"
+    print("Point the API at this mock with:")
+    for k, v in settings(base_url).items():
+        print(f"  export {k}={v}")
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""Seed a local Postgres with synthetic large tenants for benchmarks/api.py.
+
+Each tenant is about the size of our largest customers (all sizes are
+flags):
+
+  stairs             10,000 across --strategies strategies. Each strategy
+                     is a tree with fan-out 5: vision, objectives, key
+                     results, initiatives, then tasks. stair_closure rows
+                     are written directly.
+  stair_progress     50,000 weekly snapshots, ten per stair for the first
+                     5,000 stairs.
+  kpi_measurements   100,000 hourly readings spread over the key results.
+                     The kpi_stats / kpi_rollups triggers fold them in as
+                     they load.
+  strategy_sources   5,000 with metadata blobs: relevance scores,
+                     verification and dispute state, extraction fields, and
+                     some quarantined.
+
+Everything is generated from --seed, so two runs produce the same tenant.
+Rows go in with COPY. The closure trigger is off while stairs load, since
+the closure rows are part of the load. Tenants are organizations whose slug
+starts with "bench-"; --reset deletes those first, cascading to everything
+they own.
+
+The script writes a manifest (--manifest) for the runner with the ids it
+needs: org, admin user, strategies, and samples of stairs, KPI stairs and
+(strategy, source) pairs.
+
+    DATABASE_URL=postgresql://stairs@localhost:5432/stairs_bench \\
+        python -m benchmarks.seed [--orgs 1] [--stairs 10000] [--reset]
+
+Run the migrations against the database first (python -m app.db.migrations).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import asyncpg
+import bcrypt
+
+from app.db.connection import _dsn
+
+DEFAULT_MANIFEST = os.path.join(os.path.dirname(__file__), "results", "tenant.json")
+
+FANOUT = 5
+LEVEL_TYPES = ["vision", "objective", "key_result", "initiative", "task"]
+CODE_PREFIX = {"vision": "VIS", "objective": "OBJ", "key_result": "KR", "initiative": "INI", "task": "TSK"}
+HEALTH = ["on_track"] * 6 + ["at_risk"] * 3 + ["off_track", "achieved"]
+SOURCE_TYPES = ["ai_extraction"] * 4 + ["document"] * 2 + ["questionnaire", "ai_chat", "feedback", "manual_entry"]
+CATEGORIES = ["market", "financial", "operational", "customer", "people", "technology", "risk"]
+WORDS = ("grow recurring revenue regional expansion retention margin onboarding platform partners "
+         "pipeline compliance hiring automation pricing churn quality delivery launch enterprise").split()
+
+# Column order for each COPY; generate() yields tuples in this order.
+COLUMNS = {
+    "organizations": ("id", "name", "slug", "industry", "subscription_tier"),
+    "users": ("id", "organization_id", "email", "password_hash", "full_name", "role"),
+    "strategies": ("id", "organization_id", "name", "company", "industry", "framework", "status", "owner_id"),
+    "stairs": ("id", "organization_id", "strategy_id", "code", "title", "description", "element_type",
+               "parent_id", "level", "sort_order", "owner_id", "status", "health", "progress_percent",
+               "confidence_percent", "target_value", "current_value", "unit", "priority", "start_date",
+               "end_date", "metadata", "tags"),
+    "stair_closure": ("ancestor_id", "descendant_id", "depth"),
+    "stair_progress": ("id", "stair_id", "snapshot_date", "progress_percent", "confidence_percent", "health",
+                       "status", "current_value"),
+    "kpi_measurements": ("id", "stair_id", "measured_at", "value", "source", "source_system"),
+    "strategy_sources": ("id", "organization_id", "strategy_id", "source_type", "content", "metadata",
+                         "created_by", "created_at"),
+}
+LOAD_ORDER = list(COLUMNS)
+
+
+def _uuid(rng: random.Random) -> uuid.UUID:
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+def _sentence(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n)).capitalize()
+
+
+def _pct(x: float) -> Decimal:
+    return Decimal(str(round(max(0.0, min(100.0, x)), 2)))
+
+
+def generate(rng: random.Random, index: int, stairs: int = 10_000, strategies: int = 5, progress: int = 50_000,
+             kpis: int = 100_000, sources: int = 5_000, now: datetime = None, password_hash: str = "") -> tuple:
+    """One tenant's rows. Returns (tables, manifest): table -> list of
+    tuples in COLUMNS order, and the ids the runner needs."""
+    now = now or datetime.now(timezone.utc).replace(microsecond=0)
+    today = now.date()
+    tables = {name: [] for name in COLUMNS}
+    org_id, user_id = _uuid(rng), _uuid(rng)
+    tables["organizations"].append((org_id, f"Bench Tenant {index}", f"bench-{index}-{org_id.hex[:8]}",
+                                    "Technology", "enterprise"))
+    tables["users"].append((user_id, org_id, f"bench-{index}-{org_id.hex[:8]}@example.com", password_hash,
+                            f"Benchmark Admin {index}", "admin"))
+
+    strategy_ids = [_uuid(rng) for _ in range(strategies)]
+    for i, sid in enumerate(strategy_ids):
+        tables["strategies"].append((sid, org_id, f"Strategy {i + 1}", f"Bench Co {index}", "Technology",
+                                     "okr", "active", user_id))
+
+    # ── stairs: breadth-first per strategy so parents always precede children
+    kpi_stairs, all_stairs = [], []
+    ancestors: dict = {}
+    per_strategy = [stairs // strategies + (1 if i < stairs % strategies else 0) for i in range(strategies)]
+    for sid, count in zip(strategy_ids, per_strategy):
+        frontier, made = [None], 0
+        level = 0
+        while made < count:
+            next_frontier = []
+            for parent in frontier:
+                for k in range(1 if parent is None else FANOUT):
+                    if made >= count:
+                        break
+                    stair_id = _uuid(rng)
+                    etype = LEVEL_TYPES[min(level, len(LEVEL_TYPES) - 1)]
+                    progress_pct = rng.uniform(0, 100)
+                    start = today - timedelta(days=rng.randint(30, 300))
+                    is_kr = etype == "key_result"
+                    target = Decimal(rng.choice([100, 250, 1000, 50_000])) if is_kr else None
+                    current = (target * Decimal(str(round(progress_pct / 100, 2)))) if is_kr else None
+                    tables["stairs"].append((
+                        stair_id, org_id, sid, f"{CODE_PREFIX[etype]}-{index}-{len(all_stairs):05d}",
+                        _sentence(rng, 5), _sentence(rng, 25), etype, parent, level, k, user_id, "active",
+                        rng.choice(HEALTH), _pct(progress_pct), _pct(rng.gauss(60, 15)), target, current,
+                        "%" if is_kr else None, rng.choice(["critical", "high", "medium", "low"]), start,
+                        start + timedelta(days=rng.randint(90, 450)),
+                        json.dumps({"source": "benchmark", "weight_hint": rng.randint(1, 5)}),
+                        [rng.choice(CATEGORIES) for _ in range(2)],
+                    ))
+                    chain = [(stair_id, 0)] + [(a, d + 1) for a, d in ancestors.get(parent, [])]
+                    ancestors[stair_id] = chain
+                    for ancestor, depth in chain:
+                        tables["stair_closure"].append((ancestor, stair_id, depth))
+                    all_stairs.append(stair_id)
+                    if is_kr:
+                        kpi_stairs.append(stair_id)
+                    next_frontier.append(stair_id)
+                    made += 1
+            frontier, level = next_frontier, level + 1
+
+    # ── weekly progress snapshots, UNIQUE (stair_id, snapshot_date)
+    weeks = 10
+    for stair_id in all_stairs[:max(1, progress // weeks)]:
+        p = rng.uniform(0, 40)
+        for w in range(weeks, 0, -1):
+            if len(tables["stair_progress"]) >= progress:
+                break
+            p = min(100.0, p + rng.uniform(0, 6))
+            tables["stair_progress"].append((_uuid(rng), stair_id, today - timedelta(weeks=w), _pct(p),
+                                             _pct(rng.gauss(60, 15)), rng.choice(HEALTH), "active",
+                                             Decimal(str(round(p, 2)))))
+
+    # ── hourly KPI readings, a random walk per key result
+    if kpi_stairs:
+        per_kpi = max(1, kpis // len(kpi_stairs))
+        for n, stair_id in enumerate(kpi_stairs):
+            value = rng.uniform(10, 1000)
+            for h in range(per_kpi if n < len(kpi_stairs) - 1 else kpis - per_kpi * n):
+                value = max(0.0, value + rng.gauss(0, value * 0.02))
+                tables["kpi_measurements"].append((_uuid(rng), stair_id, now - timedelta(hours=h),
+                                                   Decimal(str(round(value, 4))), "integration", "bench-erp"))
+
+    # ── sources with the metadata the data-QA endpoints read
+    for i in range(sources):
+        stype = rng.choice(SOURCE_TYPES)
+        disputed = rng.random() < 0.08
+        meta = {
+            "category": rng.choice(CATEGORIES),
+            "relevance_score": rng.randint(40, 100),
+            "user_verified": rng.random() < 0.3,
+            "verification_status": "disputed" if disputed else rng.choice(["unverified", "verified"]),
+            "dispute_count": rng.randint(1, 3) if disputed else 0,
+            "quarantined": rng.random() < 0.03,
+            "document_name": f"board-pack-{i % 40}.pdf" if stype in ("document", "ai_extraction") else None,
+            "extracted": [{"field": rng.choice(WORDS), "value": _sentence(rng, 6),
+                           "confidence": round(rng.random(), 2)} for _ in range(rng.randint(2, 8))],
+        }
+        tables["strategy_sources"].append((
+            _uuid(rng), org_id, rng.choice(strategy_ids), stype, _sentence(rng, rng.randint(20, 120)),
+            json.dumps(meta), user_id, now - timedelta(minutes=rng.randint(0, 60 * 24 * 180)),
+        ))
+
+    sample = lambda ids, k: [str(x) for x in rng.sample(ids, min(k, len(ids)))]
+    manifest = {
+        "org_id": str(org_id),
+        "user_id": str(user_id),
+        "strategy_ids": [str(s) for s in strategy_ids],
+        "stair_ids": sample(all_stairs, 200),
+        "kpi_stair_ids": sample(kpi_stairs, 50),
+        "sources": [[str(r[2]), str(r[0])] for r in rng.sample(tables["strategy_sources"],
+                                                               min(200, len(tables["strategy_sources"])))],
+        "counts": {name: len(rows) for name, rows in tables.items()},
+    }
+    return tables, manifest
+
+
+async def load(conn, tables: dict):
+    async with conn.transaction():
+        await conn.execute("ALTER TABLE stairs DISABLE TRIGGER trg_stair_closure")
+        for name in LOAD_ORDER:
+            if tables[name]:
+                await conn.copy_records_to_table(name, records=tables[name], columns=COLUMNS[name])
+        await conn.execute("ALTER TABLE stairs ENABLE TRIGGER trg_stair_closure")
+
+
+async def _main(args):
+    rng = random.Random(args.seed)
+    password_hash = bcrypt.hashpw(b"benchmark", bcrypt.gensalt(rounds=4)).decode()
+    # A plain connection: the app pool's text codecs do not apply to binary COPY.
+    conn = await asyncpg.connect(args.database_url or _dsn())
+    try:
+        if args.reset:
+            n = await conn.fetchval("WITH d AS (DELETE FROM organizations WHERE slug LIKE 'bench-%' RETURNING 1) "
+                                    "SELECT COUNT(*) FROM d")
+            print(f"removed {n} benchmark tenant(s)")
+        tenants = []
+        for i in range(args.orgs):
+            t0 = time.perf_counter()
+            tables, manifest = generate(rng, i, stairs=args.stairs, strategies=args.strategies,
+                                        progress=args.progress, kpis=args.kpis, sources=args.sources,
+                                        password_hash=password_hash)
+            t1 = time.perf_counter()
+            await load(conn, tables)
+            t2 = time.perf_counter()
+            print(f"tenant {i}: {manifest['counts']}  generated {t1 - t0:.1f}s, loaded {t2 - t1:.1f}s")
+            tenants.append(manifest)
+        await conn.execute("ANALYZE")
+    finally:
+        await conn.close()
+    os.makedirs(os.path.dirname(os.path.abspath(args.manifest)), exist_ok=True)
+    with open(args.manifest, "w") as f:
+        json.dump({"seed": args.seed, "created_at": datetime.now(timezone.utc).isoformat(),
+                   "tenants": tenants}, f, indent=2)
+    print(f"manifest written to {args.manifest}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--database-url", help="defaults to DATABASE_URL")
+    ap.add_argument("--orgs", type=int, default=1)
+    ap.add_argument("--stairs", type=int, default=10_000)
+    ap.add_argument("--strategies", type=int, default=5)
+    ap.add_argument("--progress", type=int, default=50_000)
+    ap.add_argument("--kpis", type=int, default=100_000)
+    ap.add_argument("--sources", type=int, default=5_000)
+    ap.add_argument("--seed", type=int, default=2026)
+    ap.add_argument("--reset", action="store_true", help="delete existing bench-* tenants first")
+    ap.add_argument("--manifest", default=DEFAULT_MANIFEST)
+    asyncio.run(_main(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Response serialization: the response_model path vs fast_response.
+
+Builds a synthetic stair tree of the size a large organization has, in the
+shape the handler has after rows_to_dicts, then times turning it into bytes
+both ways:
+
+  default  what FastAPI does with a dict returned under response_model —
+           validate against the model, dump to JSON mode, jsonable_encoder,
+           json.dumps
+  fast     app.responses: project onto the model fields, orjson
+
+    python -m benchmarks.serialization [--stairs 5000] [--repeat 20]
+"""
+
+import argparse
+import statistics
+import time
+import uuid
+from collections import defaultdict
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from app.models.schemas import StairOut, StairTree
+from app.responses import fast_response, project
+
+
+def synthetic_rows(n: int, fanout: int = 6) -> list[dict]:
+    rows = []
+    for i in range(n):
+        parent = rows[(i - 1) // fanout]["id"] if i else None
+        rows.append({
+            "id": str(uuid.uuid4()), "parent_id": parent, "organization_id": str(uuid.uuid4()),
+            "code": f"OBJ-2610-{i:04X}", "title": f"Objective {i}", "title_ar": None,
+            "description": "Grow recurring revenue in the GCC mid-market " * 3, "description_ar": None,
+            "element_type": "objective", "strategy_id": str(uuid.uuid4()), "level": 0, "sort_order": i,
+            "owner_id": str(uuid.uuid4()), "team_id": None, "status": "active", "health": "on_track",
+            "progress_percent": 42.5, "confidence_percent": 60.0, "target_value": 100.0, "current_value": 42.5,
+            "baseline_value": None, "unit": "%", "priority": "high", "budget_allocated": None, "budget_spent": None,
+            "ai_risk_score": 0.31, "ai_health_prediction": None, "ai_insights": {"summary": "steady"},
+            "tags": ["growth", "gcc"], "metadata": {"source": "wizard"}, "start_date": "2026-01-01",
+            "end_date": "2026-12-31", "created_at": "2026-01-04T10:12:00+00:00",
+            "updated_at": "2026-03-01T09:30:00+00:00", "deleted_at": None, "children_count": fanout,
+            "owner_name": "Layla Haddad",
+        })
+    return rows
+
+
+def tree(stairs: list[dict]) -> list[dict]:
+    children_of = defaultdict(list)
+    for s in stairs:
+        children_of[s["parent_id"]].append(s)
+
+    def build(parent_id=None):
+        return [{"stair": s, "children": build(s["id"])} for s in children_of.get(parent_id, ())]
+    return build(None)
+
+
+def default_path(rows: list[dict]) -> bytes:
+    adapter = TypeAdapter(List[StairTree])
+    content = adapter.dump_python(adapter.validate_python(tree(rows)), mode="json")
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def fast_path(rows: list[dict]) -> bytes:
+    return fast_response(tree(project(StairOut, rows))).body
+
+
+def timed(fn, rows, repeat: int) -> list[float]:
+    fn(rows)  # warm up (adapter construction, imports)
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(rows)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--stairs", type=int, default=5000)
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    rows = synthetic_rows(args.stairs)
+    print(f"{args.stairs} stairs, {args.repeat} runs each")
+    results = {}
+    for name, fn in (("default", default_path), ("fast", fast_path)):
+        samples = timed(fn, rows, args.repeat)
+        results[name] = statistics.median(samples)
+        print(f"  {name:8} median {results[name]:8.1f} ms   p95 {sorted(samples)[int(len(samples) * 0.95) - 1]:8.1f} ms"
+              f"   {len(fn(rows)) / 1024:8.0f} KiB")
+    print(f"  speedup  {results['default'] / results['fast']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
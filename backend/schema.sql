@@ -146,6 +146,7 @@ CREATE TABLE stairs (
     -- Progress & Status
     status VARCHAR(30) DEFAULT 'active',       -- draft, active, paused, completed, cancelled
     health VARCHAR(20) DEFAULT 'on_track',     -- on_track, at_risk, off_track, achieved
+    health_set_at TIMESTAMPTZ,                 -- health set by hand; NULL while computed
     progress_percent DECIMAL(5,2) DEFAULT 0,   -- 0.00 to 100.00
     confidence_percent DECIMAL(5,2) DEFAULT 50,
 
@@ -274,7 +275,8 @@ CREATE TABLE stair_progress (
     UNIQUE(stair_id, snapshot_date)
 );
 
-CREATE INDEX idx_progress_stair ON stair_progress(stair_id, snapshot_date DESC);
+-- Sort columns plus id, all DESC: keyset pagination (app/pagination.py).
+CREATE INDEX idx_progress_keyset ON stair_progress(stair_id, snapshot_date DESC, id DESC);
 
 -- ─── 9. KPI MEASUREMENTS (High-frequency time-series) ───
 CREATE TABLE kpi_measurements (
@@ -288,7 +290,7 @@ CREATE TABLE kpi_measurements (
     created_at TIMESTAMPTZ DEFAULT NOW()
 );
 
-CREATE INDEX idx_kpi_stair_time ON kpi_measurements(stair_id, measured_at DESC);
+CREATE INDEX idx_kpi_keyset ON kpi_measurements(stair_id, measured_at DESC, id DESC);
 
 -- ─── 10. AI CONVERSATIONS & MESSAGES ───
 CREATE TABLE ai_conversations (
@@ -331,11 +333,14 @@ CREATE TABLE ai_alerts (
     acknowledged_by UUID REFERENCES users(id),
     acknowledged_at TIMESTAMPTZ,
     expires_at TIMESTAMPTZ,
-    created_at TIMESTAMPTZ DEFAULT NOW()
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
 );
 
 CREATE INDEX idx_alerts_org ON ai_alerts(organization_id, status);
 CREATE INDEX idx_alerts_stair ON ai_alerts(stair_id);
+CREATE INDEX idx_alerts_keyset ON ai_alerts(organization_id,
+    (CASE severity WHEN 'critical' THEN 3 WHEN 'high' THEN 2 WHEN 'medium' THEN 1 ELSE 0 END) DESC,
+    created_at DESC, id DESC);
 
 -- ─── 12. AI FEEDBACK ───
 CREATE TABLE ai_feedback (
@@ -376,6 +381,7 @@ CREATE TABLE ai_usage_logs (
     fallback_used BOOLEAN DEFAULT FALSE,
     fallback_from VARCHAR(20),             -- which provider we fell back from
     error_message TEXT,
+    organization_id UUID,                  -- NULL = no request context, or pre-dates the column
     created_at TIMESTAMPTZ DEFAULT NOW()
 );
 
@@ -383,6 +389,21 @@ CREATE INDEX idx_ai_usage_logs_created ON ai_usage_logs(created_at DESC);
 CREATE INDEX idx_ai_usage_logs_provider ON ai_usage_logs(provider, created_at DESC);
 CREATE INDEX idx_ai_usage_logs_fallback ON ai_usage_logs(fallback_used) WHERE fallback_used = TRUE;
 
+-- Daily token rollup per organization and task type (app/usage.py).
+-- Quotas live in organizations.settings: ai_daily_token_soft_limit /
+-- ai_daily_token_hard_limit.
+CREATE TABLE ai_usage_daily (
+    organization_id UUID NOT NULL REFERENCES organizations(id) ON DELETE CASCADE,
+    day DATE NOT NULL,                     -- UTC
+    task_type VARCHAR(100) NOT NULL DEFAULT '',
+    input_tokens BIGINT NOT NULL DEFAULT 0,
+    output_tokens BIGINT NOT NULL DEFAULT 0,
+    calls INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (organization_id, day, task_type)
+);
+
+CREATE INDEX idx_ai_usage_daily_day ON ai_usage_daily(day);
+
 -- ─── 15. INTEGRATIONS ───
 CREATE TABLE integrations (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
@@ -420,11 +441,11 @@ CREATE TABLE strategy_sources (
     content TEXT NOT NULL,
     metadata JSONB DEFAULT '{}',
     created_by UUID REFERENCES users(id) ON DELETE SET NULL,
-    created_at TIMESTAMPTZ DEFAULT NOW(),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
     updated_at TIMESTAMPTZ DEFAULT NOW()
 );
 
-CREATE INDEX idx_strategy_sources_strategy ON strategy_sources(strategy_id, created_at DESC);
+CREATE INDEX idx_strategy_sources_keyset ON strategy_sources(strategy_id, created_at DESC, id DESC);
 CREATE INDEX idx_strategy_sources_org ON strategy_sources(organization_id);
 CREATE INDEX idx_strategy_sources_type ON strategy_sources(strategy_id, source_type);
 CREATE INDEX idx_strategy_sources_search ON strategy_sources USING GIN(
@@ -444,6 +465,7 @@ CREATE TABLE agent_logs (
     input_summary TEXT,
     output_summary TEXT,
     tokens_used INTEGER DEFAULT 0,
+    output_tokens INTEGER,             -- NULL = unknown (pre-dates the column)
     model_used VARCHAR(50),
     confidence_score INTEGER,
     ok BOOLEAN,                        -- NULL = unknown (pre-dates the column)
@@ -453,6 +475,7 @@ CREATE TABLE agent_logs (
 CREATE INDEX idx_agent_logs_strategy ON agent_logs(strategy_id, created_at DESC);
 CREATE INDEX idx_agent_logs_org ON agent_logs(organization_id);
 CREATE INDEX idx_agent_logs_agent ON agent_logs(agent_name, created_at DESC);
+CREATE INDEX idx_agent_logs_task ON agent_logs(task_type, created_at DESC);
 
 
 -- ─── 19. GENERATED ARTIFACTS (persisted AI output & user-created content) ───
@@ -471,7 +494,7 @@ CREATE TABLE generated_artifacts (
     scope_key VARCHAR(200) NOT NULL,
     content TEXT,
     payload JSONB DEFAULT '{}',
-    generated_at TIMESTAMPTZ DEFAULT NOW(),
+    generated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
     updated_at TIMESTAMPTZ DEFAULT NOW(),
     created_by UUID REFERENCES users(id) ON DELETE SET NULL,
     UNIQUE (organization_id, artifact_type, scope_key)
@@ -479,6 +502,8 @@ CREATE TABLE generated_artifacts (
 
 CREATE INDEX idx_generated_artifacts_stair ON generated_artifacts(stair_id, artifact_type);
 CREATE INDEX idx_generated_artifacts_strategy ON generated_artifacts(strategy_id, artifact_type);
+CREATE INDEX idx_generated_artifacts_stair_keyset ON generated_artifacts(stair_id, generated_at DESC, id DESC);
+CREATE INDEX idx_generated_artifacts_strategy_keyset ON generated_artifacts(strategy_id, generated_at DESC, id DESC);
 
 
 -- ─── 20. ORGANIZATION INVITES ───
@@ -522,6 +547,135 @@ CREATE INDEX idx_password_resets_org ON password_resets(organization_id, created
 CREATE INDEX idx_password_resets_token ON password_resets(token) WHERE used_at IS NULL AND revoked_at IS NULL;
 
 
+
+-- ─── 22. REALTIME EVENTS ───
+-- Every websocket event, persisted by the realtime bridge and announced with
+-- NOTIFY on 'stairs_realtime'. seq is per organization, handed out by
+-- realtime_org_seq; listeners use it to order, deduplicate and backfill.
+CREATE TABLE IF NOT EXISTS realtime_events (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    organization_id UUID,
+    event_type VARCHAR(100) NOT NULL,
+    entity_type VARCHAR(50),
+    entity_id UUID,
+    payload JSONB DEFAULT '{}',
+    created_by UUID,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    seq BIGINT
+);
+
+CREATE INDEX IF NOT EXISTS idx_realtime_org_seq ON realtime_events(organization_id, seq);
+CREATE INDEX IF NOT EXISTS idx_realtime_created ON realtime_events(created_at);
+
+CREATE TABLE IF NOT EXISTS realtime_org_seq (
+    organization_id UUID PRIMARY KEY,
+    seq BIGINT NOT NULL DEFAULT 0
+);
+
+-- ─── 23. KPI ROLLUPS ───
+-- Latest value/time/count per KPI stair, and day/week/month aggregates,
+-- maintained by statement-level triggers on kpi_measurements. Read by
+-- /kpis/summary and /stairs/{id}/kpi/series.
+CREATE TABLE IF NOT EXISTS kpi_stats (
+    stair_id UUID PRIMARY KEY REFERENCES stairs(id) ON DELETE CASCADE,
+    latest_value DECIMAL(20,4),
+    latest_at TIMESTAMPTZ,
+    measurement_count BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS kpi_rollups (
+    stair_id UUID NOT NULL REFERENCES stairs(id) ON DELETE CASCADE,
+    bucket VARCHAR(5) NOT NULL CHECK (bucket IN ('day', 'week', 'month')),
+    bucket_start TIMESTAMPTZ NOT NULL,
+    n BIGINT NOT NULL,
+    total DECIMAL(30,4) NOT NULL,
+    min_value DECIMAL(20,4) NOT NULL,
+    max_value DECIMAL(20,4) NOT NULL,
+    first_at TIMESTAMPTZ NOT NULL,
+    first_value DECIMAL(20,4) NOT NULL,
+    last_at TIMESTAMPTZ NOT NULL,
+    last_value DECIMAL(20,4) NOT NULL,
+    PRIMARY KEY (stair_id, bucket, bucket_start)
+);
+
+-- Fold a batch of new measurements into kpi_stats and kpi_rollups.
+CREATE OR REPLACE FUNCTION kpi_rollup_insert()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO kpi_stats (stair_id, latest_value, latest_at, measurement_count)
+    SELECT DISTINCT ON (stair_id) stair_id, value, measured_at, COUNT(*) OVER (PARTITION BY stair_id)
+    FROM new_rows ORDER BY stair_id, measured_at DESC, id DESC
+    ON CONFLICT (stair_id) DO UPDATE SET
+        measurement_count = kpi_stats.measurement_count + EXCLUDED.measurement_count,
+        latest_value = CASE WHEN kpi_stats.latest_at IS NULL OR EXCLUDED.latest_at >= kpi_stats.latest_at
+                            THEN EXCLUDED.latest_value ELSE kpi_stats.latest_value END,
+        latest_at = GREATEST(kpi_stats.latest_at, EXCLUDED.latest_at);
+
+    INSERT INTO kpi_rollups (stair_id, bucket, bucket_start, n, total, min_value, max_value,
+                             first_at, first_value, last_at, last_value)
+    SELECT r.stair_id, b.bucket, date_trunc(b.bucket, r.measured_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+           COUNT(*), SUM(r.value), MIN(r.value), MAX(r.value),
+           MIN(r.measured_at), (array_agg(r.value ORDER BY r.measured_at, r.id))[1],
+           MAX(r.measured_at), (array_agg(r.value ORDER BY r.measured_at DESC, r.id DESC))[1]
+    FROM new_rows r CROSS JOIN (VALUES ('day'), ('week'), ('month')) AS b(bucket)
+    GROUP BY 1, 2, 3
+    ON CONFLICT (stair_id, bucket, bucket_start) DO UPDATE SET
+        n = kpi_rollups.n + EXCLUDED.n,
+        total = kpi_rollups.total + EXCLUDED.total,
+        min_value = LEAST(kpi_rollups.min_value, EXCLUDED.min_value),
+        max_value = GREATEST(kpi_rollups.max_value, EXCLUDED.max_value),
+        first_value = CASE WHEN EXCLUDED.first_at < kpi_rollups.first_at
+                           THEN EXCLUDED.first_value ELSE kpi_rollups.first_value END,
+        first_at = LEAST(kpi_rollups.first_at, EXCLUDED.first_at),
+        last_value = CASE WHEN EXCLUDED.last_at >= kpi_rollups.last_at
+                          THEN EXCLUDED.last_value ELSE kpi_rollups.last_value END,
+        last_at = GREATEST(kpi_rollups.last_at, EXCLUDED.last_at);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Recompute the rollups of some stairs from scratch: the backfill, and the
+-- rare UPDATE or DELETE of a measurement (MIN/MAX can't be un-folded).
+CREATE OR REPLACE FUNCTION kpi_rollup_rebuild(ids UUID[])
+RETURNS VOID AS $$
+    DELETE FROM kpi_stats WHERE stair_id = ANY(ids);
+    DELETE FROM kpi_rollups WHERE stair_id = ANY(ids);
+    INSERT INTO kpi_stats (stair_id, latest_value, latest_at, measurement_count)
+    SELECT DISTINCT ON (stair_id) stair_id, value, measured_at, COUNT(*) OVER (PARTITION BY stair_id)
+    FROM kpi_measurements WHERE stair_id = ANY(ids) ORDER BY stair_id, measured_at DESC, id DESC;
+    INSERT INTO kpi_rollups (stair_id, bucket, bucket_start, n, total, min_value, max_value,
+                             first_at, first_value, last_at, last_value)
+    SELECT r.stair_id, b.bucket, date_trunc(b.bucket, r.measured_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+           COUNT(*), SUM(r.value), MIN(r.value), MAX(r.value),
+           MIN(r.measured_at), (array_agg(r.value ORDER BY r.measured_at, r.id))[1],
+           MAX(r.measured_at), (array_agg(r.value ORDER BY r.measured_at DESC, r.id DESC))[1]
+    FROM kpi_measurements r CROSS JOIN (VALUES ('day'), ('week'), ('month')) AS b(bucket)
+    WHERE r.stair_id = ANY(ids)
+    GROUP BY 1, 2, 3;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION kpi_rollup_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        PERFORM kpi_rollup_rebuild(ARRAY(SELECT stair_id FROM old_rows UNION SELECT stair_id FROM new_rows));
+    ELSE
+        PERFORM kpi_rollup_rebuild(ARRAY(SELECT DISTINCT stair_id FROM old_rows));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_kpi_rollup_insert ON kpi_measurements;
+CREATE TRIGGER trg_kpi_rollup_insert AFTER INSERT ON kpi_measurements
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION kpi_rollup_insert();
+DROP TRIGGER IF EXISTS trg_kpi_rollup_update ON kpi_measurements;
+CREATE TRIGGER trg_kpi_rollup_update AFTER UPDATE ON kpi_measurements
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION kpi_rollup_change();
+DROP TRIGGER IF EXISTS trg_kpi_rollup_delete ON kpi_measurements;
+CREATE TRIGGER trg_kpi_rollup_delete AFTER DELETE ON kpi_measurements
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION kpi_rollup_change();
+
 -- ═══════════════════════════════════════════════════════════
 -- SEED DATA — DEVONEERS / RootRise
 -- ═══════════════════════════════════════════════════════════
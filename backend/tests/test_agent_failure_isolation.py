@@ -13,13 +13,14 @@ agent_logs, and what reaches the client as a confidence score.
 
 import pytest
 
-from app import ai_client
+from app import ai_client, telemetry
 from app.agents import base_agent as base_agent_module
 from app.agents.base_agent import BaseAgent
 from app.agents.orchestrator import (
     Orchestrator, _failed, _should_regenerate, _validation_feedback,
 )
 from app.agents.validation_agent import ValidationAgent
+from app.telemetry import TelemetryWriter
 
 
 FAILURE_COPY = ai_client.user_message("unavailable")
@@ -271,15 +272,16 @@ class TestFailuresAreLoggedAsFailures:
 class TestAgentLogsTableCheckIsCached:
     async def test_information_schema_is_queried_once_not_per_call(self, monkeypatch):
         """This ran once per agent per request over the public Postgres proxy."""
-        base_agent_module._reset_agent_logs_table_cache()
+        writer = TelemetryWriter()
+        monkeypatch.setattr(telemetry, "writer", writer)
         checks = {"n": 0}
 
         class Conn:
             async def fetchval(self, *a, **kw):
                 checks["n"] += 1
                 return True
-            async def execute(self, *a, **kw):
-                return "INSERT 0 1"
+            async def executemany(self, *a, **kw):
+                return None
 
         class Acquire:
             async def __aenter__(self): return Conn()
@@ -291,26 +293,39 @@ class TestAgentLogsTableCheckIsCached:
         async def fake_pool():
             return Pool()
 
-        monkeypatch.setattr(base_agent_module, "get_pool", fake_pool)
+        monkeypatch.setattr(telemetry, "get_pool", fake_pool)
 
         agent = RecordingAgent()
         for _ in range(5):
             await agent._log(task_type="t", ok=True)
+            await writer.flush()
 
         assert checks["n"] == 1
-        base_agent_module._reset_agent_logs_table_cache()
 
     async def test_a_logging_failure_still_warns_rather_than_raising(self, monkeypatch, caplog):
-        base_agent_module._reset_agent_logs_table_cache()
+        writer = TelemetryWriter()
+        monkeypatch.setattr(telemetry, "writer", writer)
 
         async def exploding_pool():
             raise RuntimeError("connection refused")
 
-        monkeypatch.setattr(base_agent_module, "get_pool", exploding_pool)
-        with caplog.at_level("WARNING", logger="stairs.agents"):
+        monkeypatch.setattr(telemetry, "get_pool", exploding_pool)
+        with caplog.at_level("WARNING", logger="stairs.telemetry"):
             await RecordingAgent()._log(task_type="t", ok=True)   # must not raise
-        assert any("Failed to log agent call" in r.getMessage() for r in caplog.records)
-        base_agent_module._reset_agent_logs_table_cache()
+            await writer.flush()                                  # nor may this
+        assert any("Failed to write 1 telemetry row" in r.getMessage() for r in caplog.records)
+        assert writer.metrics["failed"] == 1
+
+    async def test_logging_does_not_touch_the_database_on_the_request_path(self, monkeypatch):
+        writer = TelemetryWriter()
+        monkeypatch.setattr(telemetry, "writer", writer)
+
+        async def no_pool():
+            raise AssertionError("_log must only queue the row")
+
+        monkeypatch.setattr(telemetry, "get_pool", no_pool)
+        await RecordingAgent()._log(task_type="t", ok=True)
+        assert writer.stats()["pending"] == 1
 
 
 # ─────────────────────────────────────────────────────────────────
@@ -355,10 +370,10 @@ class TestOrchestratorEndToEnd:
 class TestTableCacheRecoversFromAMissingTable:
     """The positive is cached; the negative deliberately is not.
 
-    ensure_agent_logs_table() warns and continues on failure like every other
-    startup migration, so "table missing" is a state the process can recover
+    A failed startup migration is logged and retried on the next boot rather
+    than stopping the app, so "table missing" is a state the process can recover
     from. Latching it would silently disable agent logging for the life of the
-    process — worse than one wasted query per call in an already-broken state.
+    process — worse than one wasted query per flush in an already-broken state.
     """
 
     def _pool(self, exists_sequence, record):
@@ -366,9 +381,8 @@ class TestTableCacheRecoversFromAMissingTable:
             async def fetchval(self, *a, **kw):
                 record["checks"] += 1
                 return exists_sequence.pop(0) if exists_sequence else True
-            async def execute(self, *a, **kw):
-                record["inserts"] += 1
-                return "INSERT 0 1"
+            async def executemany(self, sql, rows, **kw):
+                record["inserts"] += len(rows)
 
         class Acquire:
             async def __aenter__(self): return Conn()
@@ -382,37 +396,40 @@ class TestTableCacheRecoversFromAMissingTable:
         return get_pool
 
     async def test_table_missing_then_present_still_inserts(self, monkeypatch):
-        base_agent_module._reset_agent_logs_table_cache()
+        writer = TelemetryWriter()
+        monkeypatch.setattr(telemetry, "writer", writer)
         record = {"checks": 0, "inserts": 0}
-        monkeypatch.setattr(base_agent_module, "get_pool",
-                            self._pool([False, True], record))
+        monkeypatch.setattr(telemetry, "get_pool", self._pool([False, True], record))
 
         agent = RecordingAgent()
         await agent._log(task_type="t", ok=True)      # table not there yet
+        await writer.flush()
         assert record["inserts"] == 0
 
         await agent._log(task_type="t", ok=True)      # migration has since run
+        await writer.flush()
         assert record["inserts"] == 1, "a missing table must not latch off permanently"
         assert record["checks"] == 2
 
         # ...and now that it has been seen, stop asking.
         await agent._log(task_type="t", ok=True)
+        await writer.flush()
         assert record["checks"] == 2
         assert record["inserts"] == 2
-        base_agent_module._reset_agent_logs_table_cache()
 
     async def test_the_positive_is_still_cached_after_the_first_hit(self, monkeypatch):
-        base_agent_module._reset_agent_logs_table_cache()
+        writer = TelemetryWriter()
+        monkeypatch.setattr(telemetry, "writer", writer)
         record = {"checks": 0, "inserts": 0}
-        monkeypatch.setattr(base_agent_module, "get_pool", self._pool([True], record))
+        monkeypatch.setattr(telemetry, "get_pool", self._pool([True], record))
 
         agent = RecordingAgent()
         for _ in range(5):
             await agent._log(task_type="t", ok=True)
+            await writer.flush()
 
         assert record["checks"] == 1
         assert record["inserts"] == 5
-        base_agent_module._reset_agent_logs_table_cache()
 
 
 class TestOneAiCallIsOneLogRow:
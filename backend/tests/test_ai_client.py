@@ -544,3 +544,59 @@ class TestProviderChainDoesNotLeak:
             if re.search(r"status[^\"'\n]*\{[a-z_]*status", f.read_text())
         ]
         assert offenders == []
+
+
+# ─────────────────────────────────────────────────────────────────
+# MODEL TIERS
+# ─────────────────────────────────────────────────────────────────
+
+FAST = "claude-haiku-4-5"
+
+
+class TestModelTiers:
+    def test_task_types_map_to_tiers(self, ai, monkeypatch):
+        monkeypatch.setattr(ai, "TASK_TIERS", {"validate_*": "fast", "framework_analysis": "deep"})
+        assert ai.tier_for("validate_output") == "fast"
+        assert ai.tier_for("framework_analysis") == "deep"
+        assert ai.tier_for("advisor_chat") == "balanced"
+        assert ai.tier_for("") == "balanced"
+
+    def test_env_rules_extend_the_defaults_and_ignore_unknown_tiers(self, monkeypatch):
+        monkeypatch.setenv("AI_TASK_TIERS", "framework_*:deep, explain_action:turbo")
+        try:
+            ai_client.reload_config()
+            assert ai_client.tier_for("framework_swot") == "deep"
+            assert ai_client.tier_for("validate_output") == "fast"
+            assert ai_client.tier_for("explain_action") == "balanced"
+        finally:
+            monkeypatch.delenv("AI_TASK_TIERS")
+            ai_client.reload_config()
+
+    async def test_fast_tier_uses_its_own_model(self, ai, monkeypatch):
+        monkeypatch.setattr(ai, "TIER_CHAINS", {"fast": [FAST], "deep": []})
+        with FakeAnthropic(available_models=[LIVE, FAST]) as fake:
+            monkeypatch.setattr(ai, "ANTHROPIC_BASE_URL", fake.base_url)
+            result = await ai.call_claude([{"role": "user", "content": "Score"}], tier="fast")
+            assert result["ok"] is True
+            assert result["model"] == FAST
+            assert result["tier"] == "fast"
+            # The balanced pin is untouched.
+            assert ai.status_snapshot()["active_model"] == LIVE
+
+    async def test_dead_fast_model_fails_over_into_the_balanced_chain(self, ai, monkeypatch):
+        monkeypatch.setattr(ai, "TIER_CHAINS", {"fast": [FAST], "deep": []})
+
+        def behaviour(model):
+            return _not_found(model) if model == FAST else (200, _ok_body(model), {})
+
+        with FakeAnthropic(available_models=[LIVE, FAST], behaviour=behaviour) as fake:
+            monkeypatch.setattr(ai, "ANTHROPIC_BASE_URL", fake.base_url)
+            first = await ai.call_claude([{"role": "user", "content": "Score"}], tier="fast")
+            assert first["ok"] is True
+            assert first["model"] == LIVE
+            assert fake.models_sent == [FAST, LIVE]
+
+            # The tier is re-pinned on the model that answered.
+            fake.messages_calls.clear()
+            await ai.call_claude([{"role": "user", "content": "Again"}], tier="fast")
+            assert fake.models_sent == [LIVE]
@@ -0,0 +1,116 @@
+"""The API benchmark suite's own arithmetic (benchmarks/api.py, seed.py).
+
+The suite itself needs Postgres and a running server, but its numbers are
+only worth comparing between runs if the parts that produce them are
+right. These pin the percentile and regression maths, and check that the
+generated tenant is consistent: the closure table matches the parent
+links, the snapshot dates are unique per stair, and a seed always gives
+the same rows.
+"""
+
+import random
+from collections import Counter
+from datetime import datetime, timezone
+
+from benchmarks.api import compare, percentile, summarize
+from benchmarks.seed import COLUMNS, generate
+
+NOW = datetime(2026, 10, 19, 12, 0, tzinfo=timezone.utc)
+
+
+def _tenant(seed=7, **sizes):
+    sizes = {"stairs": 300, "strategies": 3, "progress": 500, "kpis": 1000, "sources": 50, **sizes}
+    return generate(random.Random(seed), 0, now=NOW, **sizes)
+
+
+class TestStatistics:
+    def test_nearest_rank_percentiles(self):
+        values = list(range(1, 101))
+        assert percentile(values, 50) == 50
+        assert percentile(values, 95) == 95
+        assert percentile(values, 99) == 99
+        assert percentile([4.0], 99) == 4.0
+        assert percentile([], 50) == 0.0
+
+    def test_summary_counts_errors_but_not_their_latency(self):
+        s = summarize([0.010, 0.020, 0.030], errors=2, elapsed=1.0)
+        assert s["requests"] == 5
+        assert s["errors"] == 2
+        assert s["p50_ms"] == 20.0
+        assert s["max_ms"] == 30.0
+        assert s["throughput_rps"] == 3.0
+
+
+class TestCompare:
+    BASE = {"tree": {"p95_ms": 100.0, "p99_ms": 200.0, "throughput_rps": 50.0}}
+
+    def test_within_tolerance_is_not_a_regression(self):
+        now = {"tree": {"p95_ms": 109.0, "p99_ms": 150.0, "throughput_rps": 46.0}}
+        assert compare(self.BASE, now, 0.10) == []
+
+    def test_slower_tail_and_lower_throughput_are_flagged(self):
+        now = {"tree": {"p95_ms": 100.0, "p99_ms": 260.0, "throughput_rps": 40.0}}
+        assert compare(self.BASE, now, 0.10) == [
+            ("tree", "p99_ms", 200.0, 260.0),
+            ("tree", "throughput_rps", 50.0, 40.0),
+        ]
+
+    def test_new_scenarios_have_nothing_to_compare_against(self):
+        assert compare(self.BASE, {"dashboard": {"p95_ms": 1.0, "p99_ms": 1.0, "throughput_rps": 1.0}}) == []
+
+
+class TestGeneratedTenant:
+    def test_sizes_follow_the_flags(self):
+        tables, manifest = _tenant()
+        assert len(tables["stairs"]) == 300
+        assert len(tables["strategies"]) == 3
+        assert len(tables["stair_progress"]) == 500
+        assert len(tables["kpi_measurements"]) == 1000
+        assert len(tables["strategy_sources"]) == 50
+        assert manifest["counts"]["stairs"] == 300
+
+    def test_rows_match_their_column_lists(self):
+        tables, _ = _tenant()
+        for name, rows in tables.items():
+            assert all(len(r) == len(COLUMNS[name]) for r in rows), name
+
+    def test_closure_matches_parent_links(self):
+        tables, _ = _tenant()
+        idx = {c: i for i, c in enumerate(COLUMNS["stairs"])}
+        parent = {r[idx["id"]]: r[idx["parent_id"]] for r in tables["stairs"]}
+        expected = set()
+        for stair in parent:
+            node, depth = stair, 0
+            while node is not None:
+                expected.add((node, stair, depth))
+                node, depth = parent[node], depth + 1
+        assert set(tables["stair_closure"]) == expected
+        assert len(tables["stair_closure"]) == len(expected)
+
+    def test_parents_are_loaded_before_children(self):
+        tables, _ = _tenant()
+        idx = {c: i for i, c in enumerate(COLUMNS["stairs"])}
+        seen = set()
+        for r in tables["stairs"]:
+            assert r[idx["parent_id"]] is None or r[idx["parent_id"]] in seen
+            seen.add(r[idx["id"]])
+
+    def test_progress_snapshots_are_unique_per_stair_and_date(self):
+        tables, _ = _tenant()
+        keys = Counter((r[1], r[2]) for r in tables["stair_progress"])
+        assert max(keys.values()) == 1
+
+    def test_kpis_only_land_on_key_results(self):
+        tables, manifest = _tenant()
+        idx = {c: i for i, c in enumerate(COLUMNS["stairs"])}
+        krs = {r[idx["id"]] for r in tables["stairs"] if r[idx["element_type"]] == "key_result"}
+        assert {r[1] for r in tables["kpi_measurements"]} <= krs
+        assert {str(s) for s in krs} >= set(manifest["kpi_stair_ids"])
+
+    def test_same_seed_same_tenant(self):
+        a, _ = _tenant(seed=3)
+        b, _ = _tenant(seed=3)
+        c, _ = _tenant(seed=4)
+        assert a["stairs"] == b["stairs"]
+        assert a["strategy_sources"] == b["strategy_sources"]
+        assert a["stairs"] != c["stairs"]
@@ -0,0 +1,118 @@
+"""Per-provider circuit breaker.
+
+call_ai_with_fallback used to try a provider that had been failing for an
+hour on every request, with retries and a fixed sleep, before reaching one
+that worked. These pin the breaker's states and that the provider chain
+skips an open provider without spending a request or a sleep on it.
+"""
+
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app import ai_providers, circuit_breaker
+from app.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker("test", clock=clock)
+
+
+def _fail(breaker, n):
+    for _ in range(n):
+        breaker.record(False, 0.2)
+
+
+class TestStates:
+    def test_opens_on_the_failure_rate_not_on_one_error(self, breaker):
+        _fail(breaker, circuit_breaker.CIRCUIT_MIN_CALLS - 1)
+        assert breaker.state == CLOSED
+        _fail(breaker, 1)
+        assert breaker.state == OPEN and not breaker.allow()
+
+    def test_mostly_healthy_traffic_stays_closed(self, breaker):
+        for _ in range(10):
+            breaker.record(True, 0.5)
+        _fail(breaker, 3)
+        assert breaker.state == CLOSED
+
+    def test_slow_successes_count_against_the_provider(self, breaker):
+        for _ in range(circuit_breaker.CIRCUIT_MIN_CALLS):
+            breaker.record(True, circuit_breaker.CIRCUIT_SLOW_CALL_SECONDS + 1)
+        assert breaker.state == OPEN
+
+    def test_old_outcomes_fall_out_of_the_window(self, breaker, clock):
+        _fail(breaker, circuit_breaker.CIRCUIT_MIN_CALLS - 1)
+        clock.now += circuit_breaker.CIRCUIT_WINDOW_SECONDS + 1
+        _fail(breaker, 1)
+        assert breaker.state == CLOSED
+
+    def test_one_trial_after_the_cool_off(self, breaker, clock):
+        _fail(breaker, circuit_breaker.CIRCUIT_MIN_CALLS)
+        clock.now += circuit_breaker.CIRCUIT_OPEN_SECONDS
+        assert breaker.allow() and breaker.state == HALF_OPEN
+        assert not breaker.allow()  # the trial is in flight
+        breaker.record(True, 0.3)
+        assert breaker.state == CLOSED and breaker.allow()
+
+    def test_a_failed_trial_reopens(self, breaker, clock):
+        _fail(breaker, circuit_breaker.CIRCUIT_MIN_CALLS)
+        clock.now += circuit_breaker.CIRCUIT_OPEN_SECONDS
+        breaker.allow()
+        breaker.record(False, 0.3)
+        assert breaker.state == OPEN and breaker.snapshot()["opened_count"] == 2
+
+
+class TestProviderChain:
+    @pytest.fixture
+    def chain(self, monkeypatch):
+        monkeypatch.setattr(ai_providers, "ANTHROPIC_API_KEY", "")
+        monkeypatch.setattr(ai_providers, "OPENAI_API_KEY", "sk-test")
+        monkeypatch.setattr(ai_providers, "GOOGLE_API_KEY", "g-test")
+        openai = AsyncMock(return_value=(False, None, 0, 503, 0))
+        gemini = AsyncMock(return_value=(True, "ok", 10, 200, 4))
+        monkeypatch.setitem(ai_providers._PROVIDER_CALLERS, ai_providers.PROVIDER_OPENAI, openai)
+        monkeypatch.setitem(ai_providers._PROVIDER_CALLERS, ai_providers.PROVIDER_GEMINI, gemini)
+        sleep = AsyncMock()
+        monkeypatch.setattr(ai_providers.asyncio, "sleep", sleep)
+        for b in ai_providers._breakers.values():
+            b.reset()
+        yield openai, gemini, sleep
+        for b in ai_providers._breakers.values():
+            b.reset()
+
+    async def _call(self):
+        return await ai_providers.call_ai_with_fallback(messages=[{"role": "user", "content": "hi"}], system="s")
+
+    async def test_an_open_provider_is_skipped_without_a_request_or_a_sleep(self, chain):
+        openai, gemini, sleep = chain
+        while ai_providers._breakers[ai_providers.PROVIDER_OPENAI].state == CLOSED:
+            assert (await self._call())["provider"] == ai_providers.PROVIDER_GEMINI
+        openai.reset_mock(), sleep.reset_mock()
+
+        result = await self._call()
+        assert result["ok"] and result["provider"] == ai_providers.PROVIDER_GEMINI
+        openai.assert_not_awaited()
+        sleep.assert_not_awaited()
+
+    async def test_the_state_is_reported(self, chain):
+        for _ in range(circuit_breaker.CIRCUIT_MIN_CALLS):
+            await self._call()
+        status = ai_providers.get_ai_status()["providers"]
+        assert status[ai_providers.PROVIDER_OPENAI]["circuit"] == OPEN
+        assert status[ai_providers.PROVIDER_GEMINI]["circuit"] == CLOSED
+        assert status[ai_providers.PROVIDER_OPENAI]["circuit_failure_rate"] == 1.0
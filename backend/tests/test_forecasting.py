@@ -0,0 +1,117 @@
+"""Progress forecasting.
+
+Completion probability only ever came from ai_analyze's model output: a paid
+call per stair and a different number each run. app/forecasting.py fits it
+from stair_progress instead. These pin the fit on histories with known
+answers, that a strategy is one query, and that ai_analyze states the
+forecast as a fact and reports the fitted probability, not the model's.
+"""
+
+import importlib
+from datetime import date, timedelta
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import forecasting
+from app.helpers import DEFAULT_ORG_ID, DEFAULT_USER_ID, AuthContext, get_auth
+from app.main import app
+
+TODAY = date(2026, 3, 1)
+STAIR = "c0000000-0000-0000-0000-000000000003"
+STRATEGY = "d0000000-0000-0000-0000-000000000001"
+
+
+def _history(points, progress=None, end_date=None, id=STAIR):
+    """points: progress per day, oldest first, ending today."""
+    days = list(range(-len(points) + 1, 1))
+    return {"id": id, "progress": progress if progress is not None else points[-1], "end_date": end_date,
+            "days": days, "points": list(points)}
+
+
+@pytest.fixture
+def client():
+    app.dependency_overrides[get_auth] = lambda: AuthContext(DEFAULT_USER_ID, DEFAULT_ORG_ID, "admin")
+    yield TestClient(app)
+    app.dependency_overrides.pop(get_auth, None)
+    from app.main import _rate_limit_store
+    _rate_limit_store.clear()
+
+
+class TestFit:
+    def test_a_straight_line_projects_exactly(self):
+        [f] = forecasting.forecast([_history([40, 42, 44, 46, 48, 50])], TODAY)
+        assert f["velocity_per_day"] == 2.0
+        assert f["days_to_completion"] == 25
+        assert f["projected_completion"] == TODAY + timedelta(days=25)
+
+    def test_probability_follows_the_deadline(self):
+        h = [40, 43, 44, 47, 48, 51, 52]  # ~2/day with scatter, 25 days of work left
+        early, late = forecasting.forecast([_history(h, end_date=TODAY + timedelta(days=15)),
+                                            _history(h, end_date=TODAY + timedelta(days=60))], TODAY)
+        assert early["completion_probability"] < 5
+        assert late["completion_probability"] > 95
+
+    def test_stalled_or_overdue_work_is_unlikely(self):
+        stalled, overdue = forecasting.forecast([
+            _history([30, 30, 30, 30], end_date=TODAY + timedelta(days=30)),
+            _history([10, 20, 30], end_date=TODAY - timedelta(days=1)),
+        ], TODAY)
+        assert stalled["projected_completion"] is None and stalled["completion_probability"] == 0.0
+        assert overdue["completion_probability"] == 0.0
+
+    def test_too_little_history_is_not_guessed(self):
+        [f] = forecasting.forecast([_history([10, 20], end_date=TODAY + timedelta(days=30))], TODAY)
+        assert f["velocity_per_day"] is None and f["completion_probability"] is None
+        assert "insufficient" in forecasting.prompt_facts(f)
+
+    def test_the_minimum_never_drops_below_three_points(self, monkeypatch):
+        monkeypatch.setenv("FORECAST_MIN_POINTS", "2")
+        try:
+            assert importlib.reload(forecasting).FORECAST_MIN_POINTS == 3
+        finally:
+            monkeypatch.undo()
+            importlib.reload(forecasting)
+
+    def test_numpy_and_the_fallback_agree(self, monkeypatch):
+        pytest.importorskip("numpy")
+        histories = [_history([40, 43, 44, 47, 48], end_date=TODAY + timedelta(days=20), id=str(i))
+                     for i in range(3)] + [_history([5])]
+        batched = forecasting.forecast(histories, TODAY)
+        monkeypatch.setattr(forecasting, "np", None)
+        assert forecasting.forecast(histories, TODAY) == batched
+
+
+class TestEndpoints:
+    def test_a_strategy_is_one_history_query(self, client, pool, conn):
+        conn.fetchval.return_value = STRATEGY
+        conn.fetch.return_value = [_history([40, 42, 44, 46], end_date=TODAY + timedelta(days=90))]
+        with patch("app.routers.strategies.get_pool", AsyncMock(return_value=pool)):
+            r = client.get(f"/api/v1/strategies/{STRATEGY}/forecast")
+        assert r.status_code == 200 and r.json()[0]["velocity_per_day"] == 2.0
+        assert conn.fetch.await_count == 1
+        sql, *params = conn.fetch.await_args.args
+        assert "s.strategy_id = $1" in sql and "array_agg" in sql
+        assert params == [STRATEGY, DEFAULT_ORG_ID, forecasting.FORECAST_WINDOW_DAYS]
+
+    def test_an_unknown_or_foreign_strategy_404s(self, client, pool, conn):
+        conn.fetchval.return_value = None
+        with patch("app.routers.strategies.get_pool", AsyncMock(return_value=pool)):
+            r = client.get(f"/api/v1/strategies/{STRATEGY}/forecast")
+        assert r.status_code == 404
+        conn.fetch.assert_not_awaited()
+
+    def test_ai_analyze_uses_the_fitted_probability(self, client, pool, conn):
+        stair = {"title": "Grow ARR", "element_type": "key_result", "description": None, "status": "active",
+                 "health": "on_track", "progress_percent": 46, "confidence_percent": 50, "target_value": None,
+                 "unit": None, "current_value": None, "start_date": None, "end_date": None, "strategy_id": None}
+        conn.fetchrow.return_value = stair
+        conn.fetch.side_effect = [[], [], [_history([40, 42, 44, 46], end_date=date.today() + timedelta(days=90))]]
+        ai = AsyncMock(return_value={"text": '{"risk_score": 20, "completion_probability": 35}', "ok": True})
+        with patch("app.routers.ai.get_pool", AsyncMock(return_value=pool)), \
+             patch("app.routers.ai.call_ai_with_fallback", ai):
+            r = client.post(f"/api/v1/ai/analyze/{STAIR}")
+        assert "FORECAST (computed from history" in ai.await_args.kwargs["messages"][0]["content"]
+        body = r.json()
+        assert body["completion_probability"] == body["forecast"]["completion_probability"] != 35
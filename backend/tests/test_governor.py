@@ -0,0 +1,186 @@
+"""Outbound AI concurrency governor.
+
+Nothing limited concurrent provider calls, so a burst of background analyses
+could use up the provider rate limit and push chats into 429 backoff.
+app/governor.py admits calls through prioritised lanes with per-org fair
+queuing. These pin the lane caps and priority, the fairness between orgs,
+the busy answer on timeout, and that no slot leaks when a waiter goes away.
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app import ai_providers, governor as governor_module, telemetry
+from app.agents.strategy_agent import StrategyAgent
+from app.governor import BACKGROUND, BATCH, INTERACTIVE, Governor, current_org, lane_for
+from app.telemetry import TelemetryWriter
+
+
+@pytest.fixture
+def small(monkeypatch):
+    monkeypatch.setattr(governor_module, "AI_CONCURRENCY", 2)
+    monkeypatch.setattr(governor_module, "AI_BACKGROUND_SLOTS", 1)
+    monkeypatch.setattr(governor_module, "AI_BATCH_SLOTS", 1)
+    return Governor()
+
+
+async def _settle():
+    """Let woken waiters get through shield/wait_for."""
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+async def _queue(g, task_type, org="", served=None, tag=None):
+    """Start a waiter for `org` and return its task. Appends `tag` to
+    `served` once admitted."""
+    async def waiter():
+        current_org.set(org)
+        name = await g.acquire(task_type)
+        if served is not None:
+            served.append(tag)
+        return name
+    task = asyncio.create_task(waiter())
+    await asyncio.sleep(0)
+    return task
+
+
+class TestLanes:
+    def test_task_types_pick_lanes(self):
+        assert lane_for("advisor_chat") == INTERACTIVE
+        assert lane_for("document_analysis") == BACKGROUND
+        assert lane_for("generate_strategy") == BATCH
+
+    def test_prefix_patterns_cover_framework_runs(self):
+        assert lane_for("framework_auto") == BACKGROUND
+        assert lane_for("framework_swot") == BACKGROUND
+        assert lane_for("validate_framework_analysis") == BACKGROUND
+        assert lane_for("validate_advisor_chat") == INTERACTIVE
+
+    async def test_background_cannot_take_the_interactive_headroom(self, small):
+        assert await small.acquire("document_analysis") == BACKGROUND
+        queued = await _queue(small, "document_analysis")
+        assert not queued.done()
+        # The second slot is still free for a chat.
+        assert await small.acquire("advisor_chat") == INTERACTIVE
+        assert small.snapshot()[BACKGROUND]["queued"] == 1
+        small.release(BACKGROUND)
+        assert await queued == BACKGROUND
+
+    async def test_interactive_is_served_before_background(self, small):
+        await small.acquire("advisor_chat")
+        await small.acquire("advisor_chat")
+        served = []
+        bg = await _queue(small, "document_analysis", served=served, tag="bg")
+        chat = await _queue(small, "advisor_chat", served=served, tag="chat")
+        small.release(INTERACTIVE)
+        await _settle()
+        assert served == ["chat"]
+        small.release(INTERACTIVE)
+        await asyncio.gather(bg, chat)
+        assert served == ["chat", "bg"]
+
+
+class TestFairness:
+    async def test_a_noisy_org_takes_turns(self, small):
+        await small.acquire("advisor_chat")
+        await small.acquire("advisor_chat")
+        served = []
+        tasks = [await _queue(small, "advisor_chat", "noisy", served, f"noisy{i}") for i in range(3)]
+        tasks.append(await _queue(small, "advisor_chat", "quiet", served, "quiet"))
+        for _ in range(4):
+            small.release(INTERACTIVE)
+            await _settle()
+        await asyncio.gather(*tasks)
+        assert served.index("quiet") == 1
+
+    async def test_weights_give_a_bigger_share(self, small, monkeypatch):
+        monkeypatch.setattr(governor_module, "AI_ORG_WEIGHTS", {"big": 2.0})
+        await small.acquire("advisor_chat")
+        await small.acquire("advisor_chat")
+        served = []
+        tasks = [await _queue(small, "advisor_chat", "big", served, "big") for _ in range(4)]
+        tasks += [await _queue(small, "advisor_chat", "small", served, "small") for _ in range(2)]
+        for _ in range(6):
+            small.release(INTERACTIVE)
+            await _settle()
+        await asyncio.gather(*tasks)
+        assert served[:3].count("big") == 2
+
+
+class TestTryAcquire:
+    async def test_takes_a_free_slot_and_never_waits(self, small):
+        await small.acquire("advisor_chat")
+        assert small.try_acquire(INTERACTIVE) is True
+        assert small.try_acquire(INTERACTIVE) is False  # AI_CONCURRENCY is 2
+        assert small.snapshot()["running"] == 2
+        small.release(INTERACTIVE)
+        assert small.snapshot()[INTERACTIVE]["hedges"] == 1
+
+    async def test_does_not_jump_the_queue(self, small):
+        assert await small.acquire("document_analysis") == BACKGROUND
+        queued = await _queue(small, "document_analysis")
+        assert small.try_acquire(BACKGROUND) is False
+        small.release(BACKGROUND)
+        await _settle()
+        assert await queued == BACKGROUND
+
+
+class TestTimeouts:
+    async def test_waiting_too_long_returns_none_and_frees_nothing(self, small, monkeypatch):
+        monkeypatch.setitem(governor_module.MAX_WAIT_SECONDS, INTERACTIVE, 0.01)
+        await small.acquire("advisor_chat")
+        await small.acquire("advisor_chat")
+        assert await small.acquire("advisor_chat") is None
+        snap = small.snapshot()
+        assert snap[INTERACTIVE]["timed_out"] == 1
+        assert snap["running"] == 2
+
+    async def test_cancelled_waiter_does_not_hold_a_slot(self, small):
+        await small.acquire("advisor_chat")
+        await small.acquire("advisor_chat")
+        gone = await _queue(small, "advisor_chat")
+        gone.cancel()
+        await asyncio.gather(gone, return_exceptions=True)
+        small.release(INTERACTIVE)
+        assert small.snapshot()["running"] == 1
+        assert await small.acquire("advisor_chat") == INTERACTIVE
+
+    @pytest.fixture
+    def openai_only(self, monkeypatch):
+        monkeypatch.setattr(ai_providers, "ANTHROPIC_API_KEY", "")
+        monkeypatch.setattr(ai_providers, "OPENAI_API_KEY", "sk-test")
+        monkeypatch.setattr(ai_providers, "GOOGLE_API_KEY", "")
+        openai = AsyncMock(return_value=(True, "ok", 10, 200, 4))
+        monkeypatch.setitem(ai_providers._PROVIDER_CALLERS, ai_providers.PROVIDER_OPENAI, openai)
+        for b in ai_providers._breakers.values():
+            b.reset()
+        return openai
+
+    async def _call(self):
+        return await ai_providers.call_ai_with_fallback(messages=[{"role": "user", "content": "hi"}], system="s")
+
+    async def test_busy_envelope_without_touching_a_provider(self, openai_only):
+        with patch.object(ai_providers.governor, "acquire", AsyncMock(return_value=None)):
+            result = await self._call()
+        assert result["ok"] is False
+        assert result["error_kind"] == "busy"
+        openai_only.assert_not_awaited()
+
+    async def test_the_slot_is_released_after_the_call(self, openai_only):
+        g = Governor()
+        with patch.object(ai_providers, "governor", g):
+            result = await self._call()
+        assert result["ok"] is True
+        assert g.snapshot()["running"] == 0
+        assert g.snapshot()[INTERACTIVE]["admitted"] == 1
+
+    async def test_a_framework_run_queues_in_the_background_lane(self, openai_only, monkeypatch):
+        monkeypatch.setattr(telemetry, "writer", TelemetryWriter())
+        g = Governor()
+        with patch.object(ai_providers, "governor", g):
+            result = await StrategyAgent().run_framework("auto", "Run a SWOT")
+        assert result["ok"] is True
+        assert g.snapshot()[BACKGROUND]["admitted"] == 1
+        assert g.snapshot()[INTERACTIVE]["admitted"] == 0
@@ -0,0 +1,127 @@
+"""Scheduled health refresh.
+
+Stored health was only recomputed on writes, so an untouched stair kept the
+health it had on its last edit while its deadline approached. A background
+pass now recomputes it in one statement. These pin that the pass writes only
+changed rows, runs in one worker at a time, and sends one event per
+organization.
+"""
+
+from datetime import date
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import health_refresh
+from app.health_refresh import HealthRefresher
+from app.helpers import DEFAULT_ORG_ID, DEFAULT_USER_ID, AuthContext, get_auth
+from app.main import app, _rate_limit_store
+
+ORG_A = "a0000000-0000-0000-0000-000000000001"
+ORG_B = "a0000000-0000-0000-0000-000000000002"
+
+
+@pytest.fixture
+def conn(conn):
+    conn.fetchval.return_value = True
+    return conn
+
+
+async def _refresh(pool, today=date(2026, 3, 1)):
+    with patch("app.health_refresh.get_pool", AsyncMock(return_value=pool)), \
+         patch("app.health_refresh.ws_manager.broadcast_to_org", AsyncMock()) as broadcast:
+        n = await HealthRefresher().refresh(today)
+    return n, broadcast
+
+
+class TestRefresh:
+    async def test_one_statement_and_one_event_per_org(self, pool, conn):
+        conn.fetch.return_value = [
+            {"id": "s1", "organization_id": ORG_A, "health": "at_risk"},
+            {"id": "s2", "organization_id": ORG_A, "health": "off_track"},
+            {"id": "s3", "organization_id": ORG_B, "health": "at_risk"},
+        ]
+        n, broadcast = await _refresh(pool)
+        assert n == 3
+        assert conn.fetch.await_count == 1
+        assert conn.fetch.await_args.args[1] == date(2026, 3, 1)
+        events = {c.args[0]: c.args[1] for c in broadcast.await_args_list}
+        assert set(events) == {ORG_A, ORG_B}
+        assert events[ORG_A]["event"] == "health_refreshed" and events[ORG_A]["data"]["count"] == 2
+
+    async def test_nothing_changed_is_silent(self, pool, conn):
+        conn.fetch.return_value = []
+        n, broadcast = await _refresh(pool)
+        assert n == 0
+        broadcast.assert_not_awaited()
+
+    async def test_another_worker_holding_the_lock_skips_the_tick(self, pool, conn):
+        conn.fetchval.return_value = False
+        n, _ = await _refresh(pool)
+        assert n is None
+        conn.fetch.assert_not_awaited()
+
+
+class TestStatement:
+    def test_writes_only_rows_whose_health_changes(self):
+        assert "s.health IS DISTINCT FROM c.health" in health_refresh.REFRESH_SQL
+
+    def test_covers_active_dated_stairs_only(self):
+        sql = health_refresh.REFRESH_SQL
+        assert "status = 'active' AND deleted_at IS NULL" in sql
+        assert "health_set_at IS NULL" in sql
+        assert "start_date IS NOT NULL AND end_date IS NOT NULL" in sql
+
+    def test_uses_compute_healths_thresholds(self):
+        sql = health_refresh.REFRESH_SQL
+        assert ">= time_pct - 10 THEN 'on_track'" in sql and ">= time_pct - 30 THEN 'at_risk'" in sql
+        assert "LEAST(100," in sql and "NULLIF(end_date - start_date, 0), 1)" in sql
+
+
+class TestHealthSetByHand:
+    STAIR = "c0000000-0000-0000-0000-000000000003"
+
+    @pytest.fixture
+    def client(self):
+        app.dependency_overrides[get_auth] = lambda: AuthContext(DEFAULT_USER_ID, DEFAULT_ORG_ID, "admin")
+        # Only the statements matter here, not the mocked rows' response shape.
+        yield TestClient(app, raise_server_exceptions=False)
+        app.dependency_overrides.pop(get_auth, None)
+        _rate_limit_store.clear()
+
+    @pytest.fixture
+    def conn(self, conn):
+        conn.fetchrow.return_value = {"id": self.STAIR, "status": "active", "start_date": date(2026, 1, 1),
+                                      "end_date": date(2026, 12, 31)}
+        return conn
+
+    def _stairs_update(self, conn):
+        [sql] = [c.args[0] for c in conn.execute.await_args_list if c.args[0].startswith("UPDATE stairs")]
+        return sql
+
+    @pytest.mark.parametrize("body, marker", [
+        ({"progress_percent": 10, "health": "at_risk"}, "health_set_at=NOW()"),
+        ({"progress_percent": 10}, "health_set_at=NULL"),
+    ])
+    def test_progress_marks_or_clears_the_override(self, client, pool, conn, body, marker):
+        with patch("app.routers.stairs.get_pool", AsyncMock(return_value=pool)), \
+             patch("app.routers.stairs.ws_manager.broadcast_to_org", AsyncMock()):
+            client.post(f"/api/v1/stairs/{self.STAIR}/progress", json=body)
+        assert marker in self._stairs_update(conn)
+
+    @pytest.mark.parametrize("body, marker", [
+        ({"health": "off_track"}, "health_set_at = NOW()"),
+        ({"progress_percent": 10}, "health_set_at = NULL"),
+    ])
+    def test_update_marks_or_clears_the_override(self, client, pool, conn, body, marker):
+        with patch("app.routers.stairs.get_pool", AsyncMock(return_value=pool)), \
+             patch("app.routers.stairs.ws_manager.broadcast_to_org", AsyncMock()):
+            client.put(f"/api/v1/stairs/{self.STAIR}", json=body)
+        assert marker in self._stairs_update(conn)
+
+    def test_an_unrelated_update_leaves_it_alone(self, client, pool, conn):
+        with patch("app.routers.stairs.get_pool", AsyncMock(return_value=pool)), \
+             patch("app.routers.stairs.ws_manager.broadcast_to_org", AsyncMock()):
+            client.put(f"/api/v1/stairs/{self.STAIR}", json={"title": "Renamed"})
+        assert "health_set_at" not in self._stairs_update(conn)
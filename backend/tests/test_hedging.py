@@ -0,0 +1,143 @@
+"""Hedged AI requests.
+
+A chat answer that happened to take forty seconds held the user for all
+forty. Interactive calls are now hedged: past the provider's p90 the next
+provider is asked too and the first answer wins. These pin when a hedge goes
+out, that the loser is cancelled, and the budget that caps it.
+"""
+
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app import ai_providers, governor as governor_module, hedging
+from app.governor import INTERACTIVE, Governor
+from app.hedging import Hedger
+
+
+class TestDelay:
+    def test_default_until_enough_samples(self):
+        h = Hedger()
+        for _ in range(hedging.HEDGE_MIN_SAMPLES - 1):
+            h.observe("openai", 1.0)
+        assert h.delay("openai") == hedging.HEDGE_DEFAULT_DELAY_SECONDS
+
+    def test_p90_of_observed_latency(self):
+        h = Hedger()
+        for s in range(1, 101):
+            h.observe("openai", float(s))
+        assert h.delay("openai") == 91.0
+
+
+class TestBudget:
+    def test_caps_the_fraction_of_requests_hedged(self, monkeypatch):
+        monkeypatch.setattr(hedging, "HEDGE_MAX_FRACTION", 0.2)
+        h = Hedger()
+        hedged = 0
+        for _ in range(20):
+            h.note_eligible()
+            if h.can_hedge():
+                h.note_hedged()
+                hedged += 1
+        assert hedged == 4
+        assert h.snapshot()["hedge_rate"] == 0.2
+
+
+class TestChain:
+    @pytest.fixture
+    def chain(self, monkeypatch):
+        monkeypatch.setattr(ai_providers, "ANTHROPIC_API_KEY", "")
+        monkeypatch.setattr(ai_providers, "OPENAI_API_KEY", "sk-test")
+        monkeypatch.setattr(ai_providers, "GOOGLE_API_KEY", "g-test")
+        monkeypatch.setattr(hedging, "AI_HEDGING", True)
+        monkeypatch.setattr(hedging, "HEDGE_MAX_FRACTION", 1.0)
+        monkeypatch.setattr(hedging, "HEDGE_DEFAULT_DELAY_SECONDS", 0.05)
+        hedging.hedger.reset()
+        for b in ai_providers._breakers.values():
+            b.reset()
+        state = {"primary_cancelled": False}
+
+        def caller(seconds, text):
+            async def call(client, messages, system, max_tokens, task_type=""):
+                try:
+                    await asyncio.sleep(seconds)
+                except asyncio.CancelledError:
+                    state["primary_cancelled"] = True
+                    raise
+                return True, text, 10, 200, 4
+            return AsyncMock(side_effect=call)
+
+        def install(primary_seconds, backup_seconds=0.0):
+            primary, backup = caller(primary_seconds, "primary"), caller(backup_seconds, "backup")
+            monkeypatch.setitem(ai_providers._PROVIDER_CALLERS, ai_providers.PROVIDER_OPENAI, primary)
+            monkeypatch.setitem(ai_providers._PROVIDER_CALLERS, ai_providers.PROVIDER_GEMINI, backup)
+            return primary, backup
+
+        yield install, state
+        hedging.hedger.reset()
+
+    async def _call(self, task_type="advisor_chat"):
+        return await ai_providers.call_ai_with_fallback(
+            messages=[{"role": "user", "content": "hi"}], system="s", task_type=task_type)
+
+    async def test_a_straggler_loses_to_the_hedge(self, chain):
+        install, state = chain
+        install(primary_seconds=5)
+        result = await self._call()
+        assert result["ok"] and result["text"] == "backup"
+        assert state["primary_cancelled"]
+        m = hedging.hedger.metrics
+        assert (m["hedged"], m["backup_wins"]) == (1, 1)
+
+    async def test_a_backup_win_is_not_a_fallback_switch(self, chain, monkeypatch):
+        install, _ = chain
+        install(primary_seconds=5)
+        monkeypatch.setattr(ai_providers, "_active_provider", ai_providers.PROVIDER_OPENAI)
+        switches = ai_providers.get_ai_status()["fallback_switches_today"]
+        result = await self._call()
+        assert result["text"] == "backup"
+        assert result["fallback_used"] is False
+        assert ai_providers.get_ai_status()["fallback_switches_today"] == switches
+        assert ai_providers._active_provider == ai_providers.PROVIDER_OPENAI
+
+    async def test_a_prompt_answer_is_never_hedged(self, chain):
+        install, _ = chain
+        _, backup = install(primary_seconds=0)
+        assert (await self._call())["text"] == "primary"
+        backup.assert_not_awaited()
+
+    async def test_only_interactive_task_types_are_hedged(self, chain):
+        install, _ = chain
+        _, backup = install(primary_seconds=0.2)
+        assert (await self._call(task_type="document_analysis"))["text"] == "primary"
+        backup.assert_not_awaited()
+
+    async def test_no_hedge_once_the_budget_is_spent(self, chain, monkeypatch):
+        install, _ = chain
+        monkeypatch.setattr(hedging, "HEDGE_MAX_FRACTION", 0.0)
+        _, backup = install(primary_seconds=0.2)
+        assert (await self._call())["text"] == "primary"
+        backup.assert_not_awaited()
+        assert hedging.hedger.metrics["budget_denied"] == 1
+
+    async def test_no_hedge_without_a_free_governor_slot(self, chain, monkeypatch):
+        install, _ = chain
+        monkeypatch.setattr(governor_module, "AI_CONCURRENCY", 1)
+        g = Governor()
+        monkeypatch.setattr(ai_providers, "governor", g)
+        _, backup = install(primary_seconds=0.2)
+        assert (await self._call())["text"] == "primary"
+        backup.assert_not_awaited()
+        assert hedging.hedger.metrics["slot_denied"] == 1
+        assert g.snapshot()["running"] == 0
+
+    async def test_the_backup_holds_its_own_slot_until_it_finishes(self, chain, monkeypatch):
+        install, _ = chain
+        g = Governor()
+        monkeypatch.setattr(ai_providers, "governor", g)
+        install(primary_seconds=5)
+        assert (await self._call())["text"] == "backup"
+        snap = g.snapshot()
+        assert snap["running"] == 0
+        assert (snap[INTERACTIVE]["admitted"], snap[INTERACTIVE]["hedges"]) == (1, 1)
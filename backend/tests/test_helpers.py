@@ -1,10 +1,12 @@
 """Tests for Stairs helper functions."""
 
+import asyncio
+import json
 import os
 import pytest
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta, timezone
 from decimal import Decimal
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
 
 
 # Set env before imports
@@ -23,45 +25,61 @@ from app.helpers import (
 
 
 class TestRowToDict:
+    """jsonb, uuid and numeric are decoded by the pool's codecs (see
+    TestPoolCodecs); row_to_dict only formats dates and timestamps."""
+
     def test_none_returns_none(self):
         assert row_to_dict(None) is None
 
-    def test_converts_decimal_to_float(self):
-        row = {"progress": Decimal("42.50"), "name": "Test"}
-        result = row_to_dict(row)
-        assert result["progress"] == 42.5
-        assert isinstance(result["progress"], float)
-
-    def test_parses_jsonb_string_fields(self):
-        row = {"metadata": '{"key": "value"}', "title": "Test"}
+    def test_formats_dates_and_timestamps(self):
+        row = {"created_at": datetime(2026, 3, 1, 9, 30, tzinfo=timezone.utc), "start_date": date(2026, 1, 1)}
         result = row_to_dict(row)
-        assert result["metadata"] == {"key": "value"}
+        assert result == {"created_at": "2026-03-01T09:30:00+00:00", "start_date": "2026-01-01"}
 
-    def test_leaves_non_jsonb_fields_alone(self):
-        row = {"title": "Test", "description": "some text"}
-        result = row_to_dict(row)
-        assert result["title"] == "Test"
-        assert result["description"] == "some text"
-
-    def test_handles_invalid_json_gracefully(self):
-        row = {"metadata": "not-valid-json"}
-        result = row_to_dict(row)
-        assert result["metadata"] == "not-valid-json"
+    def test_leaves_codec_decoded_values_alone(self):
+        row = {"title": "Test", "progress": 42.5, "metadata": {"key": "value"}, "id": "c0000000-0000"}
+        assert row_to_dict(row) == row
 
 
 class TestRowsToDicts:
     def test_empty_list(self):
         assert rows_to_dicts([]) == []
 
-    def test_converts_multiple_rows(self):
+    def test_a_column_that_starts_null_is_still_formatted(self):
         rows = [
-            {"id": 1, "progress": Decimal("10")},
-            {"id": 2, "progress": Decimal("20")},
+            {"id": 1, "completed_at": None},
+            {"id": 2, "completed_at": datetime(2026, 3, 1, tzinfo=timezone.utc)},
         ]
         result = rows_to_dicts(rows)
-        assert len(result) == 2
-        assert result[0]["progress"] == 10.0
-        assert result[1]["progress"] == 20.0
+        assert result[0]["completed_at"] is None
+        assert result[1]["completed_at"] == "2026-03-01T00:00:00+00:00"
+
+
+class TestPoolCodecs:
+    async def test_every_pooled_connection_gets_the_codecs(self):
+        from app.db.connection import _init_connection
+        conn = AsyncMock()
+        await _init_connection(conn)
+        decoders = {c.args[0]: c.kwargs["decoder"] for c in conn.set_type_codec.await_args_list}
+        assert decoders["jsonb"]('{"key": "value"}') == {"key": "value"}
+        assert decoders["json"]("[1, 2]") == [1, 2]
+        assert decoders["numeric"]("42.50") == 42.5
+        assert decoders["uuid"]("c0000000-0000-0000-0000-000000000003") == "c0000000-0000-0000-0000-000000000003"
+
+    def test_json_parameters_already_serialized_pass_through(self):
+        from app.db.connection import _json_encode
+        assert _json_encode('{"key": "value"}') == '{"key": "value"}'
+        assert json.loads(_json_encode({"key": "value"})) == {"key": "value"}
+
+    def test_uuid_and_decimal_parameters_still_bind(self):
+        import uuid
+        from app.db.connection import _init_connection
+        conn = AsyncMock()
+        asyncio.run(_init_connection(conn))
+        encoders = {c.args[0]: c.kwargs["encoder"] for c in conn.set_type_codec.await_args_list}
+        uid = uuid.UUID("c0000000-0000-0000-0000-000000000003")
+        assert encoders["uuid"](uid) == str(uid)
+        assert encoders["numeric"](Decimal("42.50")) == "42.50"
 
 
 class TestComputeHealth:
@@ -0,0 +1,263 @@
+"""Knowledge Engine cache.
+
+The cache was a dict in main.py filled by five sequential queries, and a
+reload refreshed only the worker that received it. These pin the service
+that replaced it: one connection per load, a content version, prompts compiled once
+per load and swapped in whole, and reloads that reach every worker. The
+read-only knowledge listings are served from the same snapshot, with no
+database round trip and a 304 for a client that already has them.
+"""
+
+import asyncio
+import json
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import asyncpg
+import pytest
+from fastapi.testclient import TestClient
+
+import app.knowledge_cache as kc
+from app.knowledge_cache import KnowledgeCache
+
+FRAMEWORKS = [{"code": "okr", "name": "OKR", "phase": "execution", "originator": "Intel",
+               "year_introduced": 1983, "description": "Objectives and Key Results"}]
+PATTERNS = [{"code": "hs", "name": "Hockey Stick", "category": "planning", "description": "Late surge",
+             "detection_signals": ["Late start"], "prevention_strategies": [], "severity": "high",
+             "statistic": "63%"}]
+TOOLS = [{"code": "ife", "name": "IFE Matrix", "stage": "analysis", "description": "Internal Factor Evaluation",
+          "how_it_works": "", "interpretation_guide": ""}]
+
+
+def _pool(results: dict, gate: asyncio.Event = None, seen: list = None):
+    """A pool whose connections answer each kb_* query from `results`."""
+    def make_conn():
+        conn = MagicMock()
+
+        async def fetch(sql):
+            if seen is not None:
+                seen.append(sql)
+            if gate is not None:
+                await gate.wait()
+            for key, alternatives in kc._QUERIES.items():
+                if sql in alternatives:
+                    value = results[key]
+                    if isinstance(value, Exception):
+                        raise value
+                    return value
+            raise AssertionError(sql)
+
+        conn.fetch = fetch
+        conn.execute = AsyncMock()
+        return conn
+
+    pool = MagicMock()
+    conns = []
+    pool.in_use = pool.peak = 0
+
+    def acquire():
+        conn = make_conn()
+        conns.append(conn)
+
+        async def enter():
+            pool.in_use += 1
+            pool.peak = max(pool.peak, pool.in_use)
+            await asyncio.sleep(0)
+            return conn
+
+        async def leave(*exc):
+            pool.in_use -= 1
+            return False
+
+        cm = MagicMock()
+        cm.__aenter__ = AsyncMock(side_effect=enter)
+        cm.__aexit__ = AsyncMock(side_effect=leave)
+        return cm
+
+    pool.acquire = MagicMock(side_effect=acquire)
+    pool.conns = conns
+    return pool
+
+
+def missing_table():
+    return asyncpg.UndefinedTableError("relation does not exist")
+
+
+def _results(**over):
+    books = [{"title": "Good Strategy", "category": "strategy", "integration_tier": "tier_1", "authors": "Rumelt"}]
+    books += [{"title": f"Book {n}", "category": "execution", "integration_tier": "tier_2", "authors": None}
+              for n in range(199)]
+    base = {"frameworks": FRAMEWORKS, "failure_patterns": PATTERNS, "books": books, "measurement_tools": TOOLS,
+            "kpis": [], "mena_intel": [], "authors": [{"n": 150}], "ontology_terms": [{"n": 12}],
+            "review_cadences": missing_table(),
+            "platform_frameworks": [{"id": "5d1c1f0e-8a55-4e43-9c1c-6a8f0b0b7a11", "code": "OKR", "name": "OKR",
+                                     "name_ar": None, "description": None, "hierarchy_template": {},
+                                     "is_active": True}]}
+    base.update(over)
+    return base
+
+
+class TestLoad:
+    async def test_one_query_per_table_on_a_bounded_number_of_connections(self):
+        seen = []
+        pool = _pool(_results(), seen=seen)
+        cache = KnowledgeCache()
+        with patch("app.knowledge_cache.get_pool", AsyncMock(return_value=pool)):
+            snap = await cache.load()
+        assert len(seen) == len(kc._QUERIES)
+        assert pool.peak == kc.KNOWLEDGE_LOAD_CONCURRENCY
+        assert pool.in_use == 0
+        assert snap.enriched
+        assert "OKR" in snap.system_prompt and "200 strategy books" in snap.system_prompt
+
+    async def test_prompt_variants_are_compiled_once_per_load(self):
+        cache = KnowledgeCache()
+        with patch("app.knowledge_cache.get_pool", AsyncMock(return_value=_pool(_results()))):
+            snap = await cache.load()
+        assert "IFE Matrix" in snap.frameworks_section
+        assert snap.failure_pattern_names == ("Hockey Stick",)
+        with patch.object(kc, "build_enriched_prompt", side_effect=AssertionError("rebuilt per call")):
+            assert cache.current() is snap
+            assert kc.system_prompt() is not None
+
+    async def test_missing_tables_fall_back_to_the_basic_prompt(self):
+        cache = KnowledgeCache()
+        pool = _pool({name: missing_table() for name in kc._QUERIES})
+        with patch("app.knowledge_cache.get_pool", AsyncMock(return_value=pool)):
+            snap = await cache.load()
+        assert not snap.enriched
+        assert snap.system_prompt == snap.basic_prompt
+
+    async def test_a_database_error_keeps_the_current_snapshot(self):
+        cache = KnowledgeCache()
+        with patch("app.knowledge_cache.get_pool", AsyncMock(return_value=_pool(_results()))):
+            good = await cache.load()
+        broken = _pool(_results(books=asyncpg.ConnectionDoesNotExistError("connection was closed")))
+        with patch("app.knowledge_cache.get_pool", AsyncMock(return_value=broken)):
+            await cache._reload_quietly()
+            with pytest.raises(asyncpg.ConnectionDoesNotExistError):
+                await cache.load()
+        assert cache.current() is good
+        assert good.enriched and good.listings["books"].body != b"[]"
+
+
+class TestVersion:
+    async def test_same_content_same_version_no_swap(self):
+        cache = KnowledgeCache()
+        with patch("app.knowledge_cache.get_pool", AsyncMock(return_value=_pool(_results()))):
+            first = await cache.load()
+            second = await cache.load()
+        assert second is first
+        assert cache.reloads == 1
+
+    async def test_changed_content_swaps_in_a_new_snapshot(self):
+        cache = KnowledgeCache()
+        with patch("app.knowledge_cache.get_pool", AsyncMock(return_value=_pool(_results()))):
+            first = await cache.load()
+        more = FRAMEWORKS + [{**FRAMEWORKS[0], "code": "bsc", "name": "Balanced Scorecard"}]
+        with patch("app.knowledge_cache.get_pool", AsyncMock(return_value=_pool(_results(frameworks=more)))):
+            second = await cache.load()
+        assert second.version != first.version
+        assert "Balanced Scorecard" in cache.current().system_prompt
+        assert "Balanced Scorecard" not in first.system_prompt  # the old snapshot is untouched
+
+    def test_a_new_year_recompiles_from_the_same_data(self):
+        cache = KnowledgeCache()
+        stale = cache.current()
+        cache.install(kc.KnowledgeSnapshot(**{**stale.__dict__, "year": stale.year - 1,
+                                              "system_prompt": "The current year is last year."}))
+        fresh = cache.current()
+        assert fresh.year == stale.year
+        assert "last year" not in fresh.system_prompt
+
+
+class TestCrossWorker:
+    async def test_reload_announces_its_version(self):
+        cache = KnowledgeCache()
+        pool = _pool(_results())
+        with patch("app.knowledge_cache.get_pool", AsyncMock(return_value=pool)):
+            snap = await cache.reload()
+        notify = [c for c in pool.conns if c.execute.await_count]
+        assert notify[0].execute.await_args.args == ("SELECT pg_notify($1, $2)", kc.CHANNEL, snap.version)
+
+    async def test_a_notice_for_another_version_reloads_this_worker(self):
+        cache = KnowledgeCache()
+        with patch.object(cache, "load", AsyncMock()) as load:
+            cache.on_notify(None, 0, kc.CHANNEL, "some-other-version")
+            await asyncio.sleep(0)
+            await asyncio.sleep(0)
+        load.assert_awaited_once()
+
+    async def test_a_notice_for_the_version_we_have_is_ignored(self):
+        cache = KnowledgeCache()
+        with patch.object(cache, "load", AsyncMock()) as load:
+            cache.on_notify(None, 0, kc.CHANNEL, cache.current().version)
+            await asyncio.sleep(0)
+        load.assert_not_awaited()
+
+
+async def _loaded(**over) -> KnowledgeCache:
+    cache = KnowledgeCache()
+    with patch("app.knowledge_cache.get_pool", AsyncMock(return_value=_pool(_results(**over)))):
+        await cache.load()
+    return cache
+
+
+class TestListings:
+    async def test_stats_come_from_the_loaded_rows(self):
+        cache = await _loaded()
+        stats = json.loads(cache.current().listings["stats"].body)
+        assert stats["books"] == 200 and stats["frameworks"] == 1
+        assert stats["authors"] == 150
+        assert stats["review_cadences"] == 0  # missing table
+        assert stats["key_facts"] == kc.KEY_FACTS
+
+    async def test_platform_frameworks_keep_the_response_model_shape(self):
+        cache = await _loaded()
+        body = json.loads(cache.current().listings["platform_frameworks"].body)
+        assert body == [{"id": "5d1c1f0e-8a55-4e43-9c1c-6a8f0b0b7a11", "code": "OKR", "name": "OKR",
+                         "name_ar": None, "description": None, "hierarchy_template": {}}]
+
+    async def test_same_rows_same_etag(self):
+        first = (await _loaded()).current().listings
+        second = (await _loaded()).current().listings
+        assert {n: l.etag for n, l in first.items()} == {n: l.etag for n, l in second.items()}
+
+    async def test_books_fall_back_when_the_author_join_fails(self, conn):
+        conn.fetch.side_effect = [asyncpg.UndefinedColumnError("column b.id does not exist"), [{"title": "T"}]]
+        assert await KnowledgeCache._fetch(conn, kc._QUERIES["books"]) == [{"title": "T"}]
+
+
+class TestServing:
+    @pytest.fixture
+    def client(self, monkeypatch):
+        from app.main import app, _rate_limit_store
+        cache = asyncio.run(_loaded())
+        monkeypatch.setattr(kc, "cache", cache)
+        with patch("app.knowledge_cache.get_pool", AsyncMock(side_effect=AssertionError("database hit"))):
+            yield TestClient(app)
+        # Sixteen requests a test from one client IP; don't leave them on the limiter.
+        _rate_limit_store.clear()
+
+    @pytest.mark.parametrize("path", [
+        "/api/v1/knowledge/frameworks", "/api/v1/knowledge/books", "/api/v1/knowledge/failure-patterns",
+        "/api/v1/knowledge/measurement-tools", "/api/v1/knowledge/kpis", "/api/v1/knowledge/mena-intel",
+        "/api/v1/knowledge/stats", "/api/v1/frameworks",
+    ])
+    def test_served_from_memory_and_revalidated_with_304(self, client, path):
+        first = client.get(path)
+        assert first.status_code == 200
+        assert first.headers["cache-control"].startswith("public, max-age=")
+        etag = first.headers["etag"]
+        again = client.get(path, headers={"If-None-Match": etag})
+        assert again.status_code == 304
+        assert again.content == b""
+        assert again.headers["etag"] == etag
+
+    def test_a_stale_etag_gets_the_body(self, client):
+        r = client.get("/api/v1/knowledge/frameworks", headers={"If-None-Match": '"stale"'})
+        assert r.status_code == 200
+        assert r.json()[0]["code"] == "okr"
+
+    def test_single_tool_by_code(self, client):
+        assert client.get("/api/v1/knowledge/measurement-tools/ife").json()["name"] == "IFE Matrix"
+        assert client.get("/api/v1/knowledge/measurement-tools/nope").status_code == 404
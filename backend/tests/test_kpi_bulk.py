@@ -0,0 +1,120 @@
+"""Bulk KPI ingestion.
+
+Source systems posted one measurement at a time to /stairs/{id}/kpi, each
+paying for an ownership check, an insert, an update, a broadcast and a
+re-read. POST /kpis/bulk takes the whole batch. These pin its round trips:
+one ownership query, one COPY, one set-based current_value update and one
+event, with a status for every row.
+"""
+
+import csv
+import io
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.helpers import DEFAULT_ORG_ID, DEFAULT_USER_ID, AuthContext, get_auth
+from app.main import app
+
+KR1 = "c0000000-0000-0000-0000-000000000003"
+KR2 = "c0000000-0000-0000-0000-000000000004"
+KR3 = "c0000000-0000-0000-0000-000000000005"
+FOREIGN = "c0000000-0000-0000-0000-0000000000ff"
+
+
+@pytest.fixture
+def client():
+    app.dependency_overrides[get_auth] = lambda: AuthContext(DEFAULT_USER_ID, DEFAULT_ORG_ID, "admin")
+    yield TestClient(app)
+    app.dependency_overrides.pop(get_auth, None)
+    from app.main import _rate_limit_store
+    _rate_limit_store.clear()
+
+
+@pytest.fixture
+def conn(conn):
+    conn.fetch.return_value = [{"id": KR1, "code": "KR-001"}, {"id": KR2, "code": "KR-002"},
+                               {"id": KR3, "code": "KR-002"}]
+    return conn
+
+
+def _post(client, pool, measurements):
+    with patch("app.routers.stairs.get_pool", AsyncMock(return_value=pool)), \
+         patch("app.routers.stairs.ws_manager.broadcast_to_org", AsyncMock()) as broadcast:
+        r = client.post("/api/v1/kpis/bulk", json={"measurements": measurements})
+    return r, broadcast
+
+
+def _copied(conn):
+    kwargs = conn.copy_to_table.await_args.kwargs
+    return list(csv.reader(io.StringIO(kwargs["source"].getvalue().decode())))
+
+
+class TestBulk:
+    def test_a_large_batch_fits_the_same_query_budget(self, client, pool, conn, max_queries):
+        with max_queries(pool, 3) as counted:
+            r, _ = _post(client, counted, [{"stair_id": KR1, "value": i} for i in range(200)])
+        assert r.status_code == 200 and r.json()["inserted"] == 200
+
+    def test_one_round_trip_of_each_kind(self, client, pool, conn):
+        r, broadcast = _post(client, pool, [
+            {"stair_id": KR1, "value": 1, "measured_at": "2026-03-01T00:00:00Z", "source_system": "erp"},
+            {"code": "KR-001", "value": 2},
+            {"stair_id": KR1, "value": 3},
+        ])
+        assert r.status_code == 200 and r.json()["inserted"] == 3
+        assert conn.fetch.await_count == 1
+        assert conn.copy_to_table.await_count == 1 and conn.execute.await_count == 1
+        assert "FROM kpi_stats" in conn.execute.await_args.args[0]
+        assert conn.execute.await_args.args[1] == [KR1]
+        event = broadcast.await_args.args[1]
+        assert event["event"] == "kpi_bulk_logged" and event["data"]["count"] == 3
+
+    def test_rows_are_loaded_as_csv(self, client, pool, conn):
+        _post(client, pool, [{"stair_id": KR1, "value": 1.5, "measured_at": "2026-03-01T00:00:00Z"}])
+        [row] = _copied(conn)
+        assert row[1:] == [KR1, "2026-03-01T00:00:00+00:00", "1.5", "integration", ""]
+        assert conn.copy_to_table.await_args.kwargs["force_null"] == ["source_system"]
+
+    def test_each_row_gets_its_own_status(self, client, pool, conn):
+        r, _ = _post(client, pool, [
+            {"stair_id": KR1, "value": 1},
+            {"stair_id": FOREIGN, "value": 1},
+            {"code": "KR-002", "value": 1},
+            {"code": "NOPE", "value": 1},
+            {"value": 1},
+        ])
+        body = r.json()
+        assert (body["inserted"], body["rejected"]) == (1, 4)
+        assert [x["status"] for x in body["results"]] == ["inserted"] + ["rejected"] * 4
+        assert body["results"][2]["error"] == "Stair code is ambiguous"
+        assert body["results"][1]["error"] == "Stair not found"
+        assert len(_copied(conn)) == 1
+
+    def test_a_naive_measured_at_is_utc(self, client, pool, conn):
+        _post(client, pool, [{"stair_id": KR1, "value": 1, "measured_at": "2026-03-01T09:30:00"}])
+        [row] = _copied(conn)
+        assert row[2] == "2026-03-01T09:30:00+00:00"
+
+    def test_values_the_column_cannot_hold_are_rejected_per_row(self, client, pool, conn):
+        r, _ = _post(client, pool, [
+            {"stair_id": KR1, "value": 9_999_999_999_999_998},
+            {"stair_id": KR1, "value": 1e16},
+            {"stair_id": KR1, "value": -5e20},
+        ])
+        body = r.json()
+        assert r.status_code == 200 and (body["inserted"], body["rejected"]) == (1, 2)
+        assert body["results"][1]["error"] == "value must be less than 1e16 in magnitude"
+        assert len(_copied(conn)) == 1
+
+    def test_nothing_accepted_writes_nothing(self, client, pool, conn):
+        r, broadcast = _post(client, pool, [{"stair_id": FOREIGN, "value": 1}])
+        assert r.json()["inserted"] == 0
+        conn.copy_to_table.assert_not_awaited()
+        broadcast.assert_not_awaited()
+
+    def test_oversized_batches_are_refused(self, client, pool, monkeypatch):
+        monkeypatch.setattr("app.routers.stairs.KPI_BULK_MAX", 2)
+        r, _ = _post(client, pool, [{"stair_id": KR1, "value": 1}] * 3)
+        assert r.status_code == 413
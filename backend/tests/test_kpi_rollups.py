@@ -0,0 +1,75 @@
+"""KPI rollups.
+
+kpi_summary ran three correlated subqueries per KPI stair, and charting a
+long history meant pulling every raw measurement. Both now read tables that
+triggers on kpi_measurements keep current. The triggers need a real
+database; these pin the handlers' side (one join for the summary, the
+bucket and range for a series) and the shape of the maintenance SQL.
+"""
+
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.db import migrations
+from app.helpers import DEFAULT_ORG_ID, DEFAULT_USER_ID, AuthContext, get_auth
+from app.main import app
+
+STAIR = "c0000000-0000-0000-0000-000000000003"
+
+
+@pytest.fixture
+def client():
+    app.dependency_overrides[get_auth] = lambda: AuthContext(DEFAULT_USER_ID, DEFAULT_ORG_ID, "admin")
+    yield TestClient(app)
+    app.dependency_overrides.pop(get_auth, None)
+    from app.main import _rate_limit_store
+    _rate_limit_store.clear()
+
+
+class TestSummary:
+    def test_one_join_no_per_stair_subqueries(self, client, pool, conn):
+        conn.fetch.return_value = [{"id": STAIR, "code": "KR-001", "latest_value": 5.0, "measurement_count": 12}]
+        with patch("app.routers.stairs.get_pool", AsyncMock(return_value=pool)):
+            r = client.get("/api/v1/kpis/summary")
+        assert r.json()[0]["measurement_count"] == 12
+        sql = conn.fetch.await_args.args[0]
+        assert "LEFT JOIN kpi_stats" in sql
+        assert "FROM kpi_measurements" not in sql
+
+
+class TestSeries:
+    def test_reads_the_requested_bucket_and_range(self, client, pool, conn):
+        t = datetime(2026, 3, 2, tzinfo=timezone.utc)
+        conn.fetch.return_value = [{"bucket_start": t, "count": 3, "sum": 30.0, "avg": 10.0, "min": 8.0,
+                                    "max": 12.0, "first": 8.0, "first_at": t, "last": 12.0, "last_at": t}]
+        with patch("app.routers.stairs.get_pool", AsyncMock(return_value=pool)):
+            r = client.get(f"/api/v1/stairs/{STAIR}/kpi/series?bucket=week&from=2026-03-04T00:00:00Z")
+        assert r.status_code == 200
+        assert r.json()[0]["avg"] == 10.0
+        sql, *params = conn.fetch.await_args.args
+        assert "FROM kpi_rollups" in sql and "s.organization_id = $2" in sql
+        assert params[:3] == [STAIR, DEFAULT_ORG_ID, "week"]
+        assert params[3] == datetime(2026, 3, 4, tzinfo=timezone.utc) and params[4] is None
+
+    def test_unknown_bucket_is_rejected(self, client):
+        assert client.get(f"/api/v1/stairs/{STAIR}/kpi/series?bucket=hour").status_code == 422
+
+
+class TestMaintenance:
+    def test_inserts_fold_in_per_statement(self):
+        sql = migrations.KPI_ROLLUPS_SQL
+        assert "AFTER INSERT ON kpi_measurements\n    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT" in sql
+        assert "ON CONFLICT (stair_id, bucket, bucket_start) DO UPDATE" in sql
+
+    def test_updates_and_deletes_rebuild_the_affected_stairs(self):
+        sql = migrations.KPI_ROLLUPS_SQL
+        assert "AFTER UPDATE ON kpi_measurements" in sql and "AFTER DELETE ON kpi_measurements" in sql
+        assert sql.count("kpi_rollup_rebuild(ARRAY(") == 2
+
+    async def test_the_migration_backfills_existing_history(self):
+        conn = AsyncMock()
+        await next(m for m in migrations.MIGRATIONS if m.name == "kpi_rollups").run(conn)
+        assert "kpi_rollup_rebuild" in conn.execute.await_args_list[-1].args[0]
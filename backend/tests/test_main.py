@@ -14,42 +14,37 @@ os.environ["RATE_LIMIT_WINDOW"] = "60"
 
 class TestBuildSystemPrompt:
     def test_basic_system_prompt(self):
-        from app.main import _build_basic_system_prompt
-        prompt = _build_basic_system_prompt()
+        from app.knowledge_cache import build_basic_prompt
+        prompt = build_basic_prompt()
         assert "Stairs" in prompt
         assert "DEVONEERS" in prompt
         assert "Human IS the Loop" in prompt
 
     def test_enriched_system_prompt(self):
-        from app.main import _build_enriched_system_prompt, _knowledge_cache
-        _knowledge_cache["frameworks"] = [
-            {"name": "OKR", "originator": "Intel", "year_introduced": 1983, "phase": "execution", "description": "Objectives and Key Results"}
-        ]
-        _knowledge_cache["failure_patterns"] = [
-            {"name": "Hockey Stick", "severity": "high", "description": "Unrealistic growth projection", "detection_signals": ["Late start"], "statistic": "63%"}
-        ]
-        _knowledge_cache["measurement_tools"] = [
-            {"name": "IFE Matrix", "stage": "analysis", "description": "Internal Factor Evaluation"}
-        ]
-        _knowledge_cache["books_summary"] = "200 books"
-
-        prompt = _build_enriched_system_prompt()
+        from app.knowledge_cache import build_enriched_prompt
+        prompt = build_enriched_prompt(
+            frameworks=[
+                {"name": "OKR", "originator": "Intel", "year_introduced": 1983, "phase": "execution", "description": "Objectives and Key Results"}
+            ],
+            failure_patterns=[
+                {"name": "Hockey Stick", "severity": "high", "description": "Unrealistic growth projection", "detection_signals": ["Late start"], "statistic": "63%"}
+            ],
+            measurement_tools=[
+                {"name": "IFE Matrix", "stage": "analysis", "description": "Internal Factor Evaluation"}
+            ],
+            books_summary="200 books",
+        )
         assert "OKR" in prompt
         assert "Hockey Stick" in prompt
         assert "IFE Matrix" in prompt
         assert "200 books" in prompt
 
-        # Reset
-        _knowledge_cache["frameworks"] = []
-        _knowledge_cache["failure_patterns"] = []
-        _knowledge_cache["measurement_tools"] = []
-        _knowledge_cache["books_summary"] = ""
-
 
 class TestKnowledgeCache:
     def test_cache_structure(self):
-        from app.main import _knowledge_cache
-        assert "frameworks" in _knowledge_cache
-        assert "failure_patterns" in _knowledge_cache
-        assert "system_prompt" in _knowledge_cache
-        assert "loaded_at" in _knowledge_cache
+        from app.knowledge_cache import cache
+        snap = cache.current()
+        assert isinstance(snap.frameworks, list)
+        assert hasattr(snap, "failure_patterns")
+        assert snap.system_prompt
+        assert hasattr(snap, "loaded_at")
@@ -0,0 +1,182 @@
+"""Request timing, Server-Timing and /metrics (app/metrics.py).
+
+A slow request used to leave only its total behind. These pin the phase
+split (pool wait, SQL, AI, serialization), the Server-Timing header it
+produces, route-template labels that do not grow with every id, and the
+exposition endpoint, which is operator data and held to the telemetry roles.
+"""
+
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import ai_providers, metrics
+from app.db.instrument import InstrumentedPool
+from app.helpers import AuthContext, conditional_response, get_auth
+from app.main import app, _rate_limit_store
+from app.responses import fast_response
+
+
+@pytest.fixture(autouse=True)
+def fresh():
+    metrics.reset()
+    yield
+    metrics.reset()
+    _rate_limit_store.clear()
+
+
+def _phases():
+    phases = {}
+    token = metrics._phases.set(phases)
+    return phases, token
+
+
+class TestHistogram:
+    def test_buckets_are_cumulative_in_the_exposition(self):
+        h = metrics.Histogram("t_seconds", "test", ("route",), buckets=(0.1, 1.0))
+        for v in (0.05, 0.5, 0.5, 3.0):
+            h.observe(v, "/x")
+        text = "\n".join(h.render())
+        assert 't_seconds_bucket{route="/x",le="0.1"} 1' in text
+        assert 't_seconds_bucket{route="/x",le="1.0"} 3' in text
+        assert 't_seconds_bucket{route="/x",le="+Inf"} 4' in text
+        assert 't_seconds_count{route="/x"} 4' in text
+        assert 't_seconds_sum{route="/x"} 4.05' in text
+
+    def test_label_values_are_escaped(self):
+        c = metrics.Counter("t_total", "test", ("cache",))
+        c.inc('a"b')
+        assert 't_total{cache="a\\"b"} 1' in c.render()
+
+
+class TestPhases:
+    def test_server_timing_reports_the_remainder_as_app(self):
+        header = metrics.server_timing({"db": 0.030, "ai": 0.050}, 0.100)
+        assert header == "db;dur=30.0, ai;dur=50.0, app;dur=20.0, total;dur=100.0"
+
+    def test_overlapping_phases_never_make_app_negative(self):
+        assert "app;dur=0.0" in metrics.server_timing({"db": 0.08, "ai": 0.08}, 0.1)
+
+    def test_add_outside_a_request_is_a_no_op(self):
+        metrics.add("db", 1.0)  # must not raise
+
+    async def test_pool_wait_and_sql_are_separate_phases(self, pool, conn):
+        conn.fetch.return_value = [{"n": 1}]
+        conn.transaction.return_value = "tx"
+        pool = InstrumentedPool(pool)
+        phases, token = _phases()
+        try:
+            async with pool.acquire() as c:
+                assert await c.fetch("SELECT 1") == [{"n": 1}]
+                assert c.transaction() == "tx"  # everything else passes through
+        finally:
+            metrics._phases.reset(token)
+        assert set(phases) == {"db_acquire", "db"}
+        assert metrics.db_query_seconds.count() == 1
+        assert metrics.db_acquire_seconds.count() == 1
+
+    def test_fast_response_rendering_is_the_serialize_phase(self):
+        phases, token = _phases()
+        try:
+            fast_response({"ok": True})
+        finally:
+            metrics._phases.reset(token)
+        assert "serialize" in phases
+
+
+class TestMiddleware:
+    @pytest.fixture
+    def client(self):
+        inner = FastAPI()
+
+        @inner.get("/items/{item_id}")
+        async def item(item_id: str):
+            metrics.add("db", 0.002)
+            return fast_response({"id": item_id})
+
+        inner.add_middleware(metrics.TimingMiddleware)
+        return TestClient(inner)
+
+    def test_every_response_carries_server_timing(self, client):
+        r = client.get("/items/1")
+        assert r.status_code == 200
+        header = r.headers["server-timing"]
+        assert "db;dur=2.0" in header
+        assert "serialize;dur=" in header
+        assert "total;dur=" in header
+
+    def test_routes_are_labelled_by_template_not_path(self, client):
+        for i in range(3):
+            client.get(f"/items/{i}")
+        client.get("/nowhere")
+        assert metrics.request_seconds.count("GET", "/items/{item_id}", "200") == 3
+        assert metrics.request_seconds.count("GET", "unmatched", "404") == 1
+        assert metrics.phase_seconds.count("/items/{item_id}", "db") == 3
+        assert metrics.phase_seconds.count("/items/{item_id}", "app") == 3
+
+
+class TestAICalls:
+    @pytest.fixture
+    def openai_only(self, monkeypatch):
+        monkeypatch.setattr(ai_providers, "ANTHROPIC_API_KEY", "")
+        monkeypatch.setattr(ai_providers, "OPENAI_API_KEY", "sk-test")
+        monkeypatch.setattr(ai_providers, "GOOGLE_API_KEY", "")
+        monkeypatch.setitem(ai_providers._PROVIDER_CALLERS, ai_providers.PROVIDER_OPENAI,
+                            AsyncMock(return_value=(True, "ok", 10, 200, 4)))
+        for b in ai_providers._breakers.values():
+            b.reset()
+
+    async def test_latency_by_provider_model_and_task(self, openai_only):
+        phases, token = _phases()
+        try:
+            result = await ai_providers.call_ai_with_fallback(
+                messages=[{"role": "user", "content": "hi"}], system="s", task_type="advisor_chat")
+        finally:
+            metrics._phases.reset(token)
+        assert result["ok"] is True
+        assert metrics.ai_call_seconds.count("openai", "gpt-4o", "advisor_chat", "ok") == 1
+        assert {"ai_queue", "ai"} <= set(phases)
+
+
+class TestCaches:
+    def test_etag_revalidation_counts_as_a_hit(self):
+        request = MagicMock()
+        request.headers = {"if-none-match": '"v1"'}
+        assert conditional_response(request, b"{}", '"v1"', "no-cache").status_code == 304
+        request.headers = {}
+        conditional_response(request, b"{}", '"v1"', "no-cache")
+        assert metrics.cache_requests.value("etag", "hit") == 1
+        assert metrics.cache_requests.value("etag", "miss") == 1
+
+
+class TestEndpoint:
+    @pytest.fixture
+    def as_role(self):
+        def _set(role):
+            app.dependency_overrides[get_auth] = lambda: AuthContext("u-1", "org-1", role)
+        yield _set
+        app.dependency_overrides.pop(get_auth, None)
+
+    def test_anonymous_is_refused(self):
+        assert TestClient(app).get("/metrics").status_code == 401
+
+    @pytest.mark.parametrize("role", ["member", "viewer"])
+    def test_a_client_is_refused(self, as_role, role):
+        as_role(role)
+        assert TestClient(app).get("/metrics").status_code == 403
+
+    def test_admin_gets_the_prometheus_exposition(self, as_role):
+        as_role("admin")
+        client = TestClient(app)
+        client.get("/api/cors-test")
+        r = client.get("/metrics")
+        assert r.status_code == 200
+        assert r.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert 'stairs_request_seconds_count{method="GET",route="/api/cors-test",status="200"} 1' in r.text
+        assert "# TYPE stairs_ws_connections gauge" in r.text
+        assert 'stairs_ai_lane_slots{lane="background"}' in r.text
+        assert 'stairs_telemetry_rows_total{result="dropped"}' in r.text
+        assert "# TYPE stairs_telemetry_pending_rows gauge" in r.text
+        assert "server-timing" in r.headers
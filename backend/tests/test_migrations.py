@@ -0,0 +1,145 @@
+"""Migration ledger.
+
+Startup ran every ensure_* function on every boot: a dozen connections, a
+pile of information_schema probes, and two full-table statements over stairs.
+These pin the replacement: an up-to-date database costs one query, pending
+migrations run once each in order under an advisory lock, and an edited or
+failing migration is reported rather than re-run or skipped past.
+"""
+
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, patch
+
+import asyncpg
+import pytest
+
+import app.db.migrations as migrations
+from app.db.migrations import Migration
+
+
+class FakeConn:
+    def __init__(self, applied=None):
+        self.applied = applied  # None: the ledger table does not exist yet
+        self.statements = []
+        self.in_transaction = False
+
+    async def fetch(self, sql, *args):
+        self.statements.append(sql.strip())
+        if self.applied is None:
+            raise asyncpg.UndefinedTableError("relation \"schema_migrations\" does not exist")
+        return [{"version": v, "checksum": c} for v, c in self.applied.items()]
+
+    async def execute(self, sql, *args):
+        self.statements.append(sql.strip())
+        if "CREATE TABLE IF NOT EXISTS schema_migrations" in sql and self.applied is None:
+            self.applied = {}
+        if sql.startswith("INSERT INTO schema_migrations"):
+            assert self.in_transaction, "the ledger row must commit with the migration"
+            self.applied[args[0]] = args[2]
+
+    @asynccontextmanager
+    async def _tx(self):
+        self.in_transaction = True
+        try:
+            yield
+        finally:
+            self.in_transaction = False
+
+    def transaction(self):
+        return self._tx()
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """Three throwaway migrations in place of the real ones."""
+    ran = []
+
+    async def one(conn):
+        ran.append(1)
+
+    async def two(conn):
+        ran.append(2)
+
+    async def three(conn):
+        ran.append(3)
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", [
+        Migration(1, "one", one), Migration(2, "two", two), Migration(3, "three", three)])
+    return ran
+
+
+@pytest.fixture
+def migrate(pool_for):
+    async def _migrate(conn):
+        with patch("app.db.migrations.get_pool", AsyncMock(return_value=pool_for(conn))):
+            return await migrations.migrate()
+    return _migrate
+
+
+class TestUpToDate:
+    async def test_one_query_and_no_lock(self, registry, migrate):
+        conn = FakeConn({m.version: m.checksum for m in migrations.MIGRATIONS})
+        result = await migrate(conn)
+        assert result["applied"] == []
+        assert len(conn.statements) == 1
+        assert not any("pg_advisory_lock" in s for s in conn.statements)
+        assert registry == []
+
+
+class TestPending:
+    async def test_fresh_database_runs_everything_in_order_under_the_lock(self, registry, migrate):
+        conn = FakeConn(applied=None)
+        result = await migrate(conn)
+        assert result["applied"] == [1, 2, 3]
+        assert registry == [1, 2, 3]
+        lock = next(i for i, s in enumerate(conn.statements) if "pg_advisory_lock" in s)
+        unlock = next(i for i, s in enumerate(conn.statements) if "pg_advisory_unlock" in s)
+        first_insert = next(i for i, s in enumerate(conn.statements) if s.startswith("INSERT"))
+        assert lock < first_insert < unlock
+
+    async def test_only_the_missing_ones_run(self, registry, migrate):
+        conn = FakeConn({1: migrations.MIGRATIONS[0].checksum})
+        result = await migrate(conn)
+        assert result["applied"] == [2, 3]
+        assert registry == [2, 3]
+
+    async def test_a_failure_stops_the_run_and_releases_the_lock(self, registry, migrate, monkeypatch):
+        async def broken(conn):
+            raise RuntimeError("relation \"organizations\" does not exist")
+
+        monkeypatch.setattr(migrations, "MIGRATIONS", [
+            migrations.MIGRATIONS[0], Migration(2, "broken", broken), migrations.MIGRATIONS[2]])
+        conn = FakeConn(applied=None)
+        with pytest.raises(RuntimeError):
+            await migrate(conn)
+        assert registry == [1]
+        assert set(conn.applied) == {1}
+        assert "pg_advisory_unlock" in conn.statements[-1]
+
+
+class TestDrift:
+    async def test_an_edited_migration_is_reported_not_rerun(self, registry, migrate, capsys):
+        applied = {m.version: m.checksum for m in migrations.MIGRATIONS}
+        applied[2] = "0" * 64
+        await migrate(FakeConn(applied))
+        assert "Migration 2 (two) was edited" in capsys.readouterr().out
+        assert registry == []
+
+
+class TestRegistry:
+    def test_versions_are_unique_and_contiguous(self):
+        versions = [m.version for m in migrations.MIGRATIONS]
+        assert versions == list(range(1, len(versions) + 1))
+
+    def test_checksums_are_stable(self):
+        assert [m.checksum for m in migrations.MIGRATIONS] == [m.checksum for m in migrations.MIGRATIONS]
+
+    def test_editing_the_sql_a_migration_runs_changes_its_checksum(self):
+        [rollups] = [m for m in migrations.MIGRATIONS if m.name == "kpi_rollups"]
+        assert rollups.sql == migrations.KPI_ROLLUPS_SQL
+        edited = Migration(rollups.version, rollups.name, rollups.run, rollups.sql.replace("BIGINT", "INTEGER"))
+        assert edited.checksum != rollups.checksum
+
+    def test_a_duplicate_version_is_refused(self):
+        with pytest.raises(ValueError):
+            migrations.migration(1, "again")(lambda conn: None)
@@ -0,0 +1,124 @@
+"""The local provider stand-in (benchmarks/mock_provider.py).
+
+Load and failover testing needs a server that answers like the three
+vendors, under real concurrency, without spending tokens. These pin the
+response shapes our clients read, the scripted failures, and an end-to-end
+run of call_ai_with_fallback failing over from a downed Anthropic.
+"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app import ai_client, ai_providers
+from benchmarks.mock_provider import build_config, running
+
+
+@pytest.fixture(scope="module")
+def mock():
+    with running("fast") as handle:
+        yield handle
+
+
+@pytest.fixture(autouse=True)
+def fresh(mock):
+    mock.state.config = build_config("fast", seed=1)
+    mock.state.reset()
+    yield
+
+
+def _post(mock, path, body):
+    return httpx.post(f"{mock.base_url}{path}", json=body, timeout=10)
+
+
+class TestShapes:
+    def test_anthropic_models_and_messages(self, mock):
+        ids = [m["id"] for m in httpx.get(f"{mock.base_url}/v1/models").json()["data"]]
+        assert "claude-sonnet-4-6" in ids
+        r = _post(mock, "/v1/messages", {"model": "claude-sonnet-4-6", "max_tokens": 100,
+                                         "system": "s", "messages": [{"role": "user", "content": "Hello there"}]})
+        body = r.json()
+        assert r.status_code == 200
+        assert "Hello there" in body["content"][0]["text"]
+        assert body["usage"]["output_tokens"] > 0
+
+    def test_openai_and_gemini(self, mock):
+        r = _post(mock, "/v1/chat/completions", {"model": "gpt-4o", "messages": [{"role": "user", "content": "Hi"}]})
+        assert r.json()["choices"][0]["message"]["content"]
+        assert r.json()["usage"]["completion_tokens"] > 0
+        r = _post(mock, "/v1beta/models/gemini-2.0-flash:generateContent",
+                  {"contents": [{"role": "user", "parts": [{"text": "Hi"}]}]})
+        assert r.json()["candidates"][0]["content"]["parts"][0]["text"]
+        assert r.json()["usageMetadata"]["candidatesTokenCount"] > 0
+
+    def test_streams_reassemble_to_the_same_text(self, mock):
+        body = {"model": "claude-sonnet-4-6", "max_tokens": 100, "stream": True,
+                "messages": [{"role": "user", "content": "Stream me a long enough answer please"}]}
+        events = [json.loads(line[6:]) for line in _post(mock, "/v1/messages", body).text.splitlines()
+                  if line.startswith("data: ")]
+        assert events[0]["type"] == "message_start" and events[-1]["type"] == "message_stop"
+        streamed = "".join(e["delta"]["text"] for e in events if e["type"] == "content_block_delta")
+        assert "Stream me a long enough answer please" in streamed
+
+        lines = _post(mock, "/v1/chat/completions", {**body, "model": "gpt-4o"}).text.splitlines()
+        assert lines[-2] == "data: [DONE]"
+
+    def test_canned_response_by_prompt(self, mock):
+        mock.configure({"providers": {"anthropic": {"responses": [{"contains": "Return JSON", "text": '{"risk_score": 42}'}]}}})
+        r = _post(mock, "/v1/messages", {"model": "claude-sonnet-4-6", "max_tokens": 100,
+                                         "messages": [{"role": "user", "content": "Analyze. Return JSON"}]})
+        assert json.loads(r.json()["content"][0]["text"]) == {"risk_score": 42}
+
+
+class TestFailures:
+    def test_retired_model_404s_like_anthropic(self, mock):
+        mock.configure({"providers": {"anthropic": {"retired_models": ["claude-sonnet-4-20250514"]}}})
+        r = _post(mock, "/v1/messages", {"model": "claude-sonnet-4-20250514", "max_tokens": 10, "messages": []})
+        assert r.status_code == 404 and r.json()["error"]["type"] == "not_found_error"
+        ids = [m["id"] for m in httpx.get(f"{mock.base_url}/v1/models").json()["data"]]
+        assert "claude-sonnet-4-20250514" not in ids
+
+    def test_rate_limit_carries_retry_after(self, mock):
+        mock.configure({"providers": {"openai": {"errors": {"429": 1.0}, "retry_after_seconds": 7}}})
+        r = _post(mock, "/v1/chat/completions", {"model": "gpt-4o", "messages": []})
+        assert r.status_code == 429 and r.headers["retry-after"] == "7"
+        assert mock.state.stats()["openai"]["outcomes"] == {"429": 1}
+
+    def test_timeouts_hold_the_connection(self, mock):
+        mock.configure({"providers": {"gemini": {"errors": {"timeout": 1.0}, "timeout_seconds": 1}}})
+        with pytest.raises(httpx.ReadTimeout):
+            httpx.post(f"{mock.base_url}/v1beta/models/gemini-2.0-flash:generateContent",
+                       json={"contents": []}, timeout=0.2)
+
+
+class TestEndToEnd:
+    async def test_a_downed_anthropic_fails_over_to_openai_under_load(self, mock, monkeypatch):
+        mock.configure({"providers": {"anthropic": {"errors": {"529": 1.0}},
+                                      "openai": {"latency_ms": {"p50": 20, "p99": 60}}}})
+        ai_client.reset_state()
+        monkeypatch.setattr(ai_client, "ANTHROPIC_API_KEY", "sk-ant-mock")
+        monkeypatch.setattr(ai_client, "ANTHROPIC_BASE_URL", mock.base_url)
+        monkeypatch.setattr(ai_client, "MAX_BACKOFF_SECONDS", 0.01)
+        monkeypatch.setattr(ai_client, "_retry_delay", lambda resp, attempt: 0.01)
+        monkeypatch.setattr(ai_providers, "ANTHROPIC_API_KEY", "sk-ant-mock")
+        monkeypatch.setattr(ai_providers, "OPENAI_API_KEY", "sk-mock")
+        monkeypatch.setattr(ai_providers, "GOOGLE_API_KEY", "")
+        monkeypatch.setattr(ai_providers, "OPENAI_BASE_URL", mock.base_url)
+        monkeypatch.setattr(ai_providers, "RETRY_DELAY_SECONDS", 0)
+        for b in ai_providers._breakers.values():
+            b.reset()
+        try:
+            results = await asyncio.gather(*[
+                ai_providers.call_ai_with_fallback([{"role": "user", "content": f"q{i}"}], system="s")
+                for i in range(20)
+            ])
+        finally:
+            for b in ai_providers._breakers.values():
+                b.reset()
+            ai_client.reset_state()
+        assert all(r["ok"] and r["provider"] == "openai" for r in results)
+        stats = mock.state.stats()
+        assert stats["openai"]["outcomes"]["ok"] == 20
+        assert stats["openai"]["peak_in_flight"] > 1
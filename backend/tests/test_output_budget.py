@@ -0,0 +1,75 @@
+"""Adaptive max_tokens.
+
+Every agent reserved its hardcoded 1024 or 2048 output tokens whatever the
+task actually produced. app/output_budget.py caps each task type at its
+observed p99 plus headroom. These pin that the cap only ever lowers the
+agent's value, needs enough samples, respects the floor, and reaches the
+provider call.
+"""
+
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app import output_budget
+from app.agents.base_agent import BaseAgent
+from app.output_budget import OutputBudget
+
+
+def _row(task_type, p99, n=500):
+    return {"task_type": task_type, "p99": p99, "n": n}
+
+
+class TestLimit:
+    def test_caps_at_p99_with_headroom(self, monkeypatch):
+        monkeypatch.setattr(output_budget, "OUTPUT_BUDGET_HEADROOM", 1.5)
+        b = OutputBudget()
+        b.load([_row("validate_output", 300)])
+        assert b.limit("validate_output", 1024) == 450
+
+    def test_never_raises_the_agents_value(self):
+        b = OutputBudget()
+        b.load([_row("advisor_chat", 3000)])
+        assert b.limit("advisor_chat", 2048) == 2048
+
+    def test_floor(self, monkeypatch):
+        monkeypatch.setattr(output_budget, "OUTPUT_BUDGET_FLOOR", 256)
+        b = OutputBudget()
+        b.load([_row("validate_output", 20)])
+        assert b.limit("validate_output", 1024) == 256
+
+    def test_too_few_samples_or_unknown_task_keeps_the_request(self, monkeypatch):
+        monkeypatch.setattr(output_budget, "OUTPUT_BUDGET_MIN_SAMPLES", 50)
+        b = OutputBudget()
+        b.load([_row("validate_output", 300, n=10)])
+        assert b.limit("validate_output", 1024) == 1024
+        assert b.limit("never_seen", 1024) == 1024
+
+    async def test_refresh_reads_the_distribution_in_one_query(self):
+        conn = AsyncMock()
+        conn.fetch.return_value = [_row("validate_output", 300.0)]
+        pool = MagicMock()
+        cm = MagicMock()
+        cm.__aenter__ = AsyncMock(return_value=conn)
+        cm.__aexit__ = AsyncMock(return_value=False)
+        pool.acquire = MagicMock(return_value=cm)
+        b = OutputBudget()
+        with patch("app.output_budget.get_pool", AsyncMock(return_value=pool)):
+            await b.refresh()
+        assert conn.fetch.await_count == 1
+        assert "percentile_cont(0.99)" in conn.fetch.await_args.args[0]
+        assert "validate_output" in b.snapshot()
+
+
+class TestAgentUsesTheBudget:
+    async def test_capped_max_tokens_reaches_the_provider_and_output_tokens_are_logged(self, monkeypatch):
+        b = OutputBudget()
+        b.load([_row("validate_output", 200)])
+        monkeypatch.setattr(output_budget, "budget", b)
+        fake = AsyncMock(return_value={"ok": True, "error_kind": None, "text": "82", "tokens": 90,
+                                       "output_tokens": 4, "provider": "claude"})
+        recorded = []
+        with patch("app.agents.base_agent.call_ai_with_fallback", fake), \
+             patch("app.agents.base_agent.telemetry.writer.record", lambda t, row: recorded.append(row)):
+            await BaseAgent().call([{"role": "user", "content": "score"}],
+                                   max_tokens=1024, task_type="validate_output")
+        assert fake.await_args.kwargs["max_tokens"] == 260
+        assert recorded[0][-1] == 4
@@ -0,0 +1,105 @@
+"""Keyset pagination.
+
+List endpoints returned everything, or a LIMIT with no way to ask for the
+rest. They now page on an indexed (sort columns, id) ordering with opaque
+cursors. These pin the cursor format, the SQL each page runs (a row
+comparison and LIMIT n + 1, never OFFSET), and that the body keeps its old
+list shape with the next cursor in a header.
+"""
+
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from app import pagination
+from app.helpers import DEFAULT_ORG_ID, DEFAULT_USER_ID, AuthContext, get_auth
+from app.main import app
+
+NOTE_IDS = [f"d0000000-0000-0000-0000-00000000000{n}" for n in range(1, 6)]
+
+
+def _note(n):
+    return {"id": NOTE_IDS[n], "user_id": DEFAULT_USER_ID, "organization_id": DEFAULT_ORG_ID,
+            "title": f"Note {n}", "content": "", "source": "manual", "tags": [], "pinned": n == 0,
+            "created_at": f"2026-03-0{5 - n}T09:00:00+00:00", "updated_at": f"2026-03-0{5 - n}T09:00:00+00:00"}
+
+
+@pytest.fixture
+def client():
+    app.dependency_overrides[get_auth] = lambda: AuthContext(DEFAULT_USER_ID, DEFAULT_ORG_ID, "admin")
+    yield TestClient(app)
+    app.dependency_overrides.pop(get_auth, None)
+    from app.main import _rate_limit_store
+    _rate_limit_store.clear()
+
+
+class TestCursor:
+    def test_round_trips_the_last_rows_key(self):
+        cursor = pagination.NOTES.cursor(_note(2))
+        assert pagination.NOTES.decode(cursor) == ["false", _note(2)["updated_at"], NOTE_IDS[2]]
+
+    def test_garbage_is_a_400(self):
+        with pytest.raises(HTTPException) as e:
+            pagination.NOTES.decode("not-a-cursor")
+        assert e.value.status_code == 400
+
+    def test_a_cursor_from_another_list_is_refused(self):
+        cursor = pagination.SOURCES.cursor({"created_at": "2026-03-01T00:00:00+00:00", "id": NOTE_IDS[0]})
+        with pytest.raises(HTTPException):
+            pagination.STRATEGY_ARTIFACTS.decode(cursor)
+
+
+class TestQuery:
+    def test_a_page_seeks_instead_of_offsetting(self):
+        cursor = pagination.SOURCES.cursor({"created_at": "2026-03-01T00:00:00+00:00", "id": NOTE_IDS[0]})
+        q, params = pagination.SOURCES.apply("SELECT * FROM strategy_sources WHERE strategy_id = $1", ["s1"],
+                                             cursor, 50)
+        assert "(created_at, id) < ($2::text::timestamptz, $3::text::uuid)" in q
+        assert q.endswith("ORDER BY created_at DESC, id DESC LIMIT $4")
+        assert "OFFSET" not in q
+        assert params == ["s1", "2026-03-01T00:00:00+00:00", NOTE_IDS[0], 51]
+
+    def test_no_limit_and_no_cursor_is_the_whole_list(self):
+        q, params = pagination.SOURCES.apply("SELECT * FROM strategy_sources WHERE strategy_id = $1", ["s1"],
+                                             None, pagination.page_limit(None, None))
+        assert "LIMIT" not in q and params == ["s1"]
+
+    def test_a_cursor_alone_gets_the_default_page_size(self):
+        assert pagination.page_limit(None, "abc") == pagination.PAGE_SIZE_DEFAULT
+
+
+class TestEndpoint:
+    def test_next_cursor_is_a_header_and_the_body_stays_a_list(self, client, pool, conn):
+        conn.fetch.return_value = [_note(n) for n in range(3)]  # limit 2, plus one
+        with patch("app.routers.notes.get_pool", AsyncMock(return_value=pool)):
+            r = client.get("/api/v1/notes?limit=2")
+        assert [n["id"] for n in r.json()] == NOTE_IDS[:2]
+        cursor = r.headers[pagination.NEXT_CURSOR_HEADER]
+        assert pagination.NOTES.decode(cursor)[-1] == NOTE_IDS[1]
+
+        conn.fetch.return_value = [_note(n) for n in range(2, 4)]
+        with patch("app.routers.notes.get_pool", AsyncMock(return_value=pool)):
+            r = client.get(f"/api/v1/notes?limit=2&cursor={cursor}")
+        sql, *params = conn.fetch.await_args.args
+        assert "(pinned, updated_at, id) <" in sql
+        assert params[2:5] == ["false", _note(1)["updated_at"], NOTE_IDS[1]]
+        assert pagination.NEXT_CURSOR_HEADER not in r.headers  # last page
+
+    def test_old_clients_still_get_everything(self, client, pool, conn):
+        conn.fetch.return_value = [_note(n) for n in range(5)]
+        with patch("app.routers.notes.get_pool", AsyncMock(return_value=pool)):
+            r = client.get("/api/v1/notes")
+        assert len(r.json()) == 5
+        assert "LIMIT" not in conn.fetch.await_args.args[0]
+
+    def test_fast_path_lists_carry_the_header_too(self, client, pool, conn):
+        rows = [{"id": NOTE_IDS[n], "organization_id": DEFAULT_ORG_ID, "stair_id": NOTE_IDS[0],
+                 "artifact_type": "solutions", "scope_key": NOTE_IDS[0], "payload": {},
+                 "generated_at": f"2026-03-0{5 - n}T09:00:00+00:00"} for n in range(2)]
+        conn.fetch.return_value = rows
+        with patch("app.routers.artifacts.get_pool", AsyncMock(return_value=pool)):
+            r = client.get(f"/api/v1/stairs/{NOTE_IDS[0]}/artifacts?limit=1")
+        assert len(r.json()) == 1
+        assert pagination.NEXT_CURSOR_HEADER in r.headers
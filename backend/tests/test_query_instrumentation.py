@@ -0,0 +1,218 @@
+"""Query counting, N+1 detection and slow-query logging (app/db/instrument.py).
+
+Handlers that ran one query per item in a loop were found by reading code
+after a page felt slow. These pin the statement shapes the detector groups
+by, the per-request warning when one shape repeats, the slow-query log, and
+the `max_queries` budget that fails a test when an endpoint grows a loop.
+resolve_conflicts and approve_extractions, moved off per-item loops, are
+held to constant budgets here. ai_generate_strategy and onboarding_quickstart
+still insert one element at a time, so their budgets pin today's per-element
+cost and a fixed-size input: those loops cannot get any worse unnoticed. The
+orchestrator builds its strategy context once per request, however many
+agents it chains.
+"""
+
+import json
+import logging
+import uuid
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import metrics
+from app.agents.orchestrator import Orchestrator
+from app.db import instrument
+from app.db.instrument import InstrumentedPool, QueryTracker, normalize
+from app.helpers import DEFAULT_ORG_ID, DEFAULT_USER_ID, AuthContext, get_auth
+from app.main import app, _rate_limit_store
+
+STRATEGY = "d0000000-0000-0000-0000-000000000001"
+SOURCE = "e0000000-0000-0000-0000-000000000001"
+
+
+@pytest.fixture(autouse=True)
+def fresh():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+@pytest.fixture
+def client():
+    app.dependency_overrides[get_auth] = lambda: AuthContext(DEFAULT_USER_ID, DEFAULT_ORG_ID, "admin")
+    yield TestClient(app)
+    app.dependency_overrides.pop(get_auth, None)
+    _rate_limit_store.clear()
+
+
+class TestNormalize:
+    def test_parameters_and_literals_become_placeholders(self):
+        assert normalize("SELECT * FROM stairs WHERE id = $1 AND level > 3 AND status = 'active'") == \
+            "SELECT * FROM stairs WHERE id = ? AND level > ? AND status = ?"
+
+    def test_one_call_site_is_one_shape(self):
+        a = normalize("SELECT metadata\n  FROM strategy_sources  -- per source\n WHERE id = $1")
+        b = normalize("SELECT metadata FROM strategy_sources WHERE id = $1")
+        assert a == b
+
+    def test_in_lists_collapse(self):
+        assert normalize("DELETE FROM notes WHERE id IN (1, 2, 3)") == normalize("DELETE FROM notes WHERE id IN (7)")
+
+    def test_identifiers_with_digits_are_kept(self):
+        assert normalize("SELECT col1 FROM t2") == "SELECT col1 FROM t2"
+
+
+class TestTracker:
+    @pytest.fixture
+    def conn(self, conn):
+        conn.fetchrow.return_value = {"metadata": {}}
+        conn.fetch.return_value = []
+        return conn
+
+    @pytest.fixture
+    def client(self, pool):
+        pool = InstrumentedPool(pool)
+        inner = FastAPI()
+
+        @inner.get("/loop/{n}")
+        async def loop(n: int):
+            async with pool.acquire() as c:
+                for i in range(n):
+                    await c.fetchrow("SELECT metadata FROM strategy_sources WHERE id = $1", str(i))
+            return {"n": n}
+
+        @inner.get("/batched/{n}")
+        async def batched(n: int):
+            async with pool.acquire() as c:
+                await c.fetch("SELECT metadata FROM strategy_sources WHERE id = ANY($1::uuid[])",
+                              [str(i) for i in range(n)])
+            return {"n": n}
+
+        inner.add_middleware(QueryTracker)
+        return TestClient(inner)
+
+    def test_a_repeated_shape_is_flagged_per_route(self, client, caplog):
+        with caplog.at_level(logging.WARNING, logger="stairs.queries"):
+            client.get("/loop/6")
+        assert "Possible N+1 on GET /loop/{n}: 6 runs of SELECT metadata FROM strategy_sources WHERE id = ?" \
+            in caplog.text
+        assert metrics.repeated_statements.value("/loop/{n}") == 1
+        assert metrics.queries_per_request.count("/loop/{n}") == 1
+
+    def test_below_the_threshold_is_quiet(self, client, caplog):
+        with caplog.at_level(logging.WARNING, logger="stairs.queries"):
+            client.get(f"/loop/{instrument.N_PLUS_ONE_THRESHOLD - 1}")
+            client.get("/batched/50")
+        assert "N+1" not in caplog.text
+        assert metrics.repeated_statements.value("/loop/{n}") == 0
+
+    def test_slow_statements_are_logged_by_shape_not_parameters(self, client, caplog, monkeypatch):
+        monkeypatch.setattr(instrument, "SLOW_QUERY_MS", 0)
+        with caplog.at_level(logging.WARNING, logger="stairs.queries"):
+            client.get("/batched/3")
+        assert "Slow query" in caplog.text
+        assert "on /batched/{n}" in caplog.text
+        assert "WHERE id = ANY(?::uuid[])" in caplog.text
+        assert "['0', '1', '2']" not in caplog.text
+        assert metrics.slow_queries.value() == 1
+
+
+class TestBudget:
+    async def test_a_loop_breaks_the_budget(self, pool, max_queries):
+        with pytest.raises(AssertionError, match="N\\+1"):
+            with max_queries(pool, 50) as counted:
+                async with counted.acquire() as c:
+                    for i in range(10):
+                        await c.execute("UPDATE stairs SET level = $1 WHERE id = $2", i, str(i))
+
+    async def test_too_many_statements_break_the_budget(self, pool, max_queries):
+        with pytest.raises(AssertionError, match="3 queries, budget is 2"):
+            with max_queries(pool, 2) as counted:
+                async with counted.acquire() as c:
+                    for table in ("stairs", "strategies", "notes"):
+                        await c.fetchval(f"SELECT COUNT(*) FROM {table}")
+
+
+class TestResolveConflicts:
+    def test_constant_queries_however_many_resolutions(self, client, pool, conn, max_queries):
+        sources = [str(uuid.uuid4()) for _ in range(9)]
+        conn.fetchrow.return_value = {"id": STRATEGY}
+        conn.fetch.return_value = [{"id": s, "metadata": {"dispute_count": 1}} for s in sources]
+        shared = sources[8]
+        resolutions = [{"field": f"f{i}", "chosen_source_id": sources[i], "rejected_source_ids": [sources[i + 4], shared]}
+                       for i in range(4)]
+        with max_queries(pool, 3) as counted, \
+                patch("app.routers.data_qa.get_pool", AsyncMock(return_value=counted)):
+            r = client.post(f"/api/v1/data-qa/{STRATEGY}/resolve-conflicts", json={"resolutions": resolutions})
+        assert r.status_code == 200
+        assert r.json() == {"resolved": 4}
+        rows = conn.executemany.await_args.args[1]
+        assert len(rows) == 9  # each source written once
+        written = {row[2]: row[0] for row in rows}
+        assert '"dispute_count": 5' in written[shared]  # 1 + one per resolution that rejected it
+        assert '"verification_status": "verified"' in written[sources[0]]
+
+    def test_sources_outside_the_strategy_are_left_alone(self, client, pool, conn):
+        conn.fetchrow.return_value = {"id": STRATEGY}
+        conn.fetch.return_value = []
+        with patch("app.routers.data_qa.get_pool", AsyncMock(return_value=pool)):
+            r = client.post(f"/api/v1/data-qa/{STRATEGY}/resolve-conflicts", json={"resolutions": [
+                {"field": "revenue", "chosen_source_id": str(uuid.uuid4()), "rejected_source_ids": []}]})
+        assert r.json() == {"resolved": 1}
+        conn.executemany.assert_not_awaited()
+
+
+class TestApproveExtractions:
+    def test_constant_queries_however_many_items(self, client, pool, conn, max_queries):
+        conn.fetchrow.return_value = {"id": SOURCE, "metadata": {"filename": "plan.pdf"}}
+        items = [{"category": "kpi", "text": f"Revenue grew {i}%"} for i in range(8)] + [{"category": "kpi"}]
+        with max_queries(pool, 3) as counted, \
+                patch("app.routers.sources.get_pool", AsyncMock(return_value=counted)):
+            r = client.post(f"/api/v1/strategies/{STRATEGY}/sources/{SOURCE}/approve-extractions",
+                            json={"items": items})
+        assert r.status_code == 201 and r.json()["approved"] == 8
+        rows = conn.executemany.await_args.args[1]
+        assert len(rows) == 8
+        assert '"parent_filename": "plan.pdf"' in rows[0][4]
+
+
+class TestPerElementLoops:
+    """Known loops, pinned at their current cost for a fixed input."""
+
+    def test_generate_strategy(self, client, pool, conn, max_queries):
+        elements = [{"title": "Grow", "element_type": "objective"}] + \
+                   [{"title": f"KR {i}", "element_type": "key_result", "parent_idx": 0} for i in range(4)]
+        conn.fetchrow.return_value = {"name": "Acme", "industry": "Retail", "level": 0, "strategy_id": None}
+        ai = AsyncMock(return_value={"text": json.dumps(elements), "ok": True})
+        # 1 org + 2 for the root + 4 per child (parent level, stair, two closure rows) + 1 strategy lookup.
+        with max_queries(pool, 20, repeats=len(elements) + 1) as counted, \
+                patch("app.routers.ai.get_pool", AsyncMock(return_value=counted)), \
+                patch("app.routers.ai.call_ai_with_fallback", ai), \
+                patch("app.routers.ai.ws_manager.broadcast_to_org", AsyncMock()):
+            r = client.post("/api/v1/ai/generate", json={"prompt": "Retail growth"})
+        assert r.json()["generated"] == 5
+
+    def test_onboarding_quickstart(self, client, pool, conn, max_queries):
+        conn.fetchrow.return_value = {"level": 0}
+        # The OKR template: 7 stairs, 6 of them with a parent whose level is looked up.
+        with max_queries(pool, 13, repeats=8) as counted, \
+                patch("app.routers.dashboard.get_pool", AsyncMock(return_value=counted)):
+            r = client.post("/api/v1/onboarding/quickstart")
+        assert r.json() == {"created": 7, "framework": "okr"}
+
+
+class TestOrchestratorContext:
+    async def test_built_once_however_many_agents_run(self, pool, conn, max_queries):
+        conn.fetchrow.return_value = {"name": "Plan", "company": "Acme", "industry": "Retail"}
+        conn.fetch.return_value = [{"content": "Revenue 10M", "metadata": {"category": "kpi"}}]
+        orch = Orchestrator()
+        answer = {"text": "advice", "ok": True}
+        low = {"confidence_score": 40, "ok": True, "text": "weak", "issues": ["vague"]}
+        with max_queries(pool, 2) as counted, \
+                patch("app.agents.orchestrator.get_pool", AsyncMock(return_value=counted)), \
+                patch.object(orch.advisor_agent, "chat", AsyncMock(return_value=answer)) as chat, \
+                patch.object(orch.validation_agent, "validate", AsyncMock(return_value=low)):
+            await orch.process("chat", strategy_id=STRATEGY, payload={"message": "How are we doing?"})
+        assert chat.await_count == 2  # answered, then regenerated after a low score
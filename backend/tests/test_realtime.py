@@ -0,0 +1,177 @@
+"""Realtime bridge.
+
+ws_manager is per process, so an update handled by one worker never reached
+sockets held by another. The bridge publishes through Postgres and every
+process fans notifications back into its own manager. These pin the parts
+that do not need a live database: publishing never waits, notifications are
+ordered and deduplicated per org, gaps are backfilled, oversized events
+travel by reference, and a database failure degrades to local delivery.
+"""
+
+import asyncio
+import json
+from unittest.mock import AsyncMock, patch
+
+import app.realtime as realtime
+from app.realtime import RealtimeBridge
+from app.routers.websocket import ConnectionManager
+
+
+class RecordingManager(ConnectionManager):
+    def __init__(self, orgs=("org-1",)):
+        super().__init__()
+        self.delivered = []
+        for org in orgs:
+            self.connections[org] = {"u-1": []}
+
+    async def deliver(self, org_id, message):
+        self.delivered.append((org_id, message))
+
+
+def _note(seq, org="org-1", **message):
+    return {"org": org, "seq": seq, "id": f"id-{seq}", "message": message or {"event": "e", "n": seq}}
+
+
+class TestBroadcastGoesThroughTheBridge:
+    async def test_attached_bridge_takes_the_event(self):
+        mgr = RecordingManager()
+        bridge = RealtimeBridge(mgr)
+        mgr.bridge = bridge
+        await mgr.broadcast_to_org("org-1", {"event": "stair_updated"})
+        assert bridge.outbox.get_nowait() == ("org-1", {"event": "stair_updated"})
+        assert mgr.delivered == []
+
+    async def test_full_outbox_falls_back_to_local_delivery(self, monkeypatch):
+        monkeypatch.setattr(realtime, "REALTIME_OUTBOX_SIZE", 1)
+        mgr = RecordingManager()
+        mgr.bridge = RealtimeBridge(mgr)
+        await mgr.broadcast_to_org("org-1", {"n": 1})
+        await mgr.broadcast_to_org("org-1", {"n": 2})
+        assert mgr.delivered == [("org-1", {"n": 2})]
+        assert mgr.bridge.metrics["outbox_overflow"] == 1
+
+    async def test_no_bridge_means_local_delivery(self):
+        mgr = RecordingManager()
+        await mgr.broadcast_to_org("org-1", {"n": 1})
+        assert mgr.delivered == [("org-1", {"n": 1})]
+
+
+class TestPublish:
+    async def test_one_round_trip_per_batch(self, pool, conn):
+        bridge = RealtimeBridge(RecordingManager())
+        with patch("app.realtime.get_pool", AsyncMock(return_value=pool)):
+            await bridge._publish([("org-1", {"event": "a"}), ("org-1", {"event": "b"})])
+        conn.executemany.assert_awaited_once()
+        sql, rows = conn.executemany.await_args.args
+        assert "pg_notify" in sql and "realtime_org_seq" in sql
+        assert [r[1] for r in rows] == ["a", "b"]
+        assert all(r[3] is True for r in rows)
+
+    async def test_oversized_events_are_announced_by_reference(self, pool, conn):
+        bridge = RealtimeBridge(RecordingManager())
+        big = {"event": "strategy_generated", "data": "x" * (realtime.NOTIFY_INLINE_LIMIT + 1)}
+        with patch("app.realtime.get_pool", AsyncMock(return_value=pool)):
+            await bridge._publish([("org-1", big)])
+        rows = conn.executemany.await_args.args[1]
+        assert rows[0][3] is False
+
+    async def test_rows_lock_orgs_in_a_fixed_order(self, pool, conn):
+        bridge = RealtimeBridge(RecordingManager())
+        batch = [("org-b", {"event": "b1"}), ("org-a", {"event": "a1"}),
+                 ("org-b", {"event": "b2"}), ("org-a", {"event": "a2"})]
+        with patch("app.realtime.get_pool", AsyncMock(return_value=pool)):
+            await bridge._publish(batch)
+        rows = conn.executemany.await_args.args[1]
+        assert [(r[0], r[1]) for r in rows] == [
+            ("org-a", "a1"), ("org-a", "a2"), ("org-b", "b1"), ("org-b", "b2")]
+
+    async def test_database_failure_delivers_locally(self, pool, conn):
+        mgr = RecordingManager()
+        bridge = RealtimeBridge(mgr)
+        conn.executemany.side_effect = OSError("connection refused")
+        bridge.publish("org-1", {"event": "kpi_logged"})
+        with patch("app.realtime.get_pool", AsyncMock(return_value=pool)):
+            task = asyncio.create_task(bridge._publish_loop())
+            for _ in range(20):
+                await asyncio.sleep(0)
+            task.cancel()
+        assert mgr.delivered == [("org-1", {"event": "kpi_logged"})]
+        assert bridge.metrics["publish_failures"] == 1
+
+
+class TestReceive:
+    async def test_in_order_and_deduplicated(self):
+        mgr = RecordingManager()
+        bridge = RealtimeBridge(mgr)
+        for seq in (1, 2, 2, 1, 3):
+            await bridge._receive(_note(seq))
+        assert [m["seq"] for _, m in mgr.delivered] == [1, 2, 3]
+        assert bridge.metrics["duplicates"] == 2
+
+    async def test_a_gap_is_backfilled_before_the_new_event(self, pool, conn):
+        mgr = RecordingManager()
+        bridge = RealtimeBridge(mgr)
+        bridge.last_seq["org-1"] = 1
+        conn.fetch.return_value = [
+            {"seq": 2, "payload": json.dumps({"event": "e", "n": 2})},
+            {"seq": 3, "payload": json.dumps({"event": "e", "n": 3})},
+        ]
+        with patch("app.realtime.get_pool", AsyncMock(return_value=pool)):
+            await bridge._receive(_note(4))
+        assert conn.fetch.await_args.args[1:] == ("org-1", 1, 4)
+        assert [m["seq"] for _, m in mgr.delivered] == [2, 3, 4]
+        assert bridge.metrics["gaps_backfilled"] == 2
+
+    async def test_reference_notifications_read_the_row(self, pool, conn):
+        mgr = RecordingManager()
+        bridge = RealtimeBridge(mgr)
+        conn.fetchval.return_value = json.dumps({"event": "strategy_generated", "data": {"count": 40}})
+        note = {"org": "org-1", "seq": 1, "id": "id-1", "message": None}
+        with patch("app.realtime.get_pool", AsyncMock(return_value=pool)):
+            await bridge._receive(note)
+        assert mgr.delivered == [("org-1", {"event": "strategy_generated", "data": {"count": 40}, "seq": 1})]
+
+    async def test_orgs_without_local_sockets_only_advance_the_cursor(self):
+        mgr = RecordingManager(orgs=())
+        bridge = RealtimeBridge(mgr)
+        await bridge._receive(_note(7))
+        assert mgr.delivered == []
+        assert bridge.last_seq["org-1"] == 7
+
+    async def test_notifications_are_dispatched_in_arrival_order(self):
+        mgr = RecordingManager(orgs=("org-1", "org-2"))
+        bridge = RealtimeBridge(mgr)
+        task = asyncio.create_task(bridge._dispatch())
+        for note in (_note(1), _note(1, org="org-2"), _note(2)):
+            bridge._on_notify(None, 0, realtime.CHANNEL, json.dumps(note))
+        for _ in range(20):
+            await asyncio.sleep(0)
+        task.cancel()
+        assert [(o, m["seq"]) for o, m in mgr.delivered] == [("org-1", 1), ("org-2", 1), ("org-1", 2)]
+
+
+class TestReplay:
+    async def test_missed_events_come_from_realtime_events(self, pool, conn):
+        bridge = RealtimeBridge(RecordingManager())
+        conn.fetchval.return_value = 5
+        conn.fetch.return_value = [
+            {"seq": 4, "payload": json.dumps({"event": "a"})},
+            {"seq": 5, "payload": json.dumps({"event": "b"})},
+        ]
+        with patch("app.realtime.get_pool", AsyncMock(return_value=pool)):
+            missed = await bridge.replay("org-1", 3)
+        assert missed == [{"event": "a", "seq": 4}, {"event": "b", "seq": 5}]
+
+    async def test_pruned_history_needs_a_resync(self, pool, conn):
+        bridge = RealtimeBridge(RecordingManager())
+        conn.fetchval.return_value = 5
+        conn.fetch.return_value = [{"seq": 5, "payload": json.dumps({"event": "b"})}]
+        with patch("app.realtime.get_pool", AsyncMock(return_value=pool)):
+            assert await bridge.replay("org-1", 3) is None
+
+    async def test_too_far_behind_needs_a_resync_without_reading_rows(self, pool, conn):
+        bridge = RealtimeBridge(RecordingManager())
+        conn.fetchval.return_value = realtime.REALTIME_REPLAY_MAX + 10
+        with patch("app.realtime.get_pool", AsyncMock(return_value=pool)):
+            assert await bridge.replay("org-1", 1) is None
+        conn.fetch.assert_not_awaited()
@@ -0,0 +1,116 @@
+"""Fast JSON response path.
+
+The big reads (stair list and tree, artifacts, KPI summary) used to go
+through response_model validation and jsonable_encoder after the rows were
+already API-shaped. They now return a preserialized response. These pin the
+contract that makes that safe: the output has exactly the keys the model
+would have produced, and the model is still enforced whenever
+VALIDATE_RESPONSES is set, as it is for this suite.
+"""
+
+from typing import List
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pydantic
+import pytest
+from fastapi.testclient import TestClient
+
+import app.responses as responses
+from app.helpers import DEFAULT_ORG_ID, DEFAULT_USER_ID, AuthContext, get_auth
+from app.main import app
+from app.models.schemas import StairOut, StairTree
+from app.responses import fast_response, project
+
+ROOT = "c0000000-0000-0000-0000-000000000001"
+CHILD = "c0000000-0000-0000-0000-000000000002"
+GRANDCHILD = "c0000000-0000-0000-0000-000000000003"
+
+
+def _stair(id, parent_id=None, **over):
+    return {"id": id, "parent_id": parent_id, "title": f"Stair {id[-1]}", "element_type": "objective",
+            "organization_id": DEFAULT_ORG_ID, "deleted_at": None, "progress_percent": 40.0,
+            "confidence_percent": 50.0, "level": 0, "sort_order": 0, "status": "active", "health": "on_track",
+            "priority": "medium", "created_at": "2026-03-01T09:30:00+00:00", **over}
+
+
+@pytest.fixture
+def client():
+    app.dependency_overrides[get_auth] = lambda: AuthContext(DEFAULT_USER_ID, DEFAULT_ORG_ID, "admin")
+    yield TestClient(app)
+    app.dependency_overrides.pop(get_auth, None)
+    from app.main import _rate_limit_store
+    _rate_limit_store.clear()
+
+
+def _pool(rows):
+    conn = AsyncMock()
+    conn.fetch.return_value = rows
+    cm = MagicMock()
+    cm.__aenter__ = AsyncMock(return_value=conn)
+    cm.__aexit__ = AsyncMock(return_value=False)
+    pool = MagicMock()
+    pool.acquire = MagicMock(return_value=cm)
+    return pool
+
+
+class TestProjection:
+    def test_keeps_exactly_the_model_fields(self):
+        out = project(StairOut, [_stair(ROOT)])[0]
+        assert set(out) == set(StairOut.model_fields)
+        assert "organization_id" not in out and "deleted_at" not in out
+        assert out["children_count"] == 0  # default filled in
+
+    def test_matches_what_response_model_would_send(self):
+        row = _stair(ROOT, tags=["a"], metadata={"k": 1})
+        slow = StairOut.model_validate(row).model_dump(mode="json")
+        fast = project(StairOut, [row])[0]
+        for key in ("created_at", "id"):  # same instant / value, formatted by different code
+            slow.pop(key), fast.pop(key)
+        assert fast == slow
+
+    def test_rows_do_not_share_mutable_defaults(self):
+        class M(pydantic.BaseModel):
+            tags: List[str] = pydantic.Field(default_factory=list)
+
+        a, b = project(M, [{}, {}])
+        assert a["tags"] == [] and a["tags"] is not b["tags"]
+        first, second = project(StairTree, [{"stair": _stair(ROOT)}, {"stair": _stair(CHILD)}])
+        assert first["children"] is not second["children"]
+
+    def test_a_missing_required_field_is_named(self):
+        class M(pydantic.BaseModel):
+            x: int
+            y: str
+
+        with pytest.raises(ValueError, match=r"M\.y is required"):
+            project(M, [{"x": 1}])
+
+
+class TestValidation:
+    def test_a_schema_mismatch_raises_when_validation_is_on(self, monkeypatch):
+        monkeypatch.setattr(responses, "VALIDATE_RESPONSES", True)
+        with pytest.raises(pydantic.ValidationError):
+            fast_response([{"id": ROOT}], List[StairOut])
+
+    def test_no_validation_in_production(self, monkeypatch):
+        monkeypatch.setattr(responses, "VALIDATE_RESPONSES", False)
+        assert fast_response([{"id": ROOT}], List[StairOut]).status_code == 200
+
+
+class TestEndpoints:
+    def test_tree_nests_by_parent_and_drops_internal_columns(self, client):
+        rows = [_stair(ROOT), _stair(CHILD, ROOT), _stair(GRANDCHILD, CHILD)]
+        with patch("app.routers.stairs.get_pool", AsyncMock(return_value=_pool(rows))):
+            tree = client.get("/api/v1/stairs/tree").json()
+        assert [n["stair"]["id"] for n in tree] == [ROOT]
+        assert tree[0]["children"][0]["stair"]["id"] == CHILD
+        assert tree[0]["children"][0]["children"][0]["stair"]["id"] == GRANDCHILD
+        assert "organization_id" not in tree[0]["stair"]
+        StairTree.model_validate(tree[0])
+
+    def test_list_stairs_skips_the_encoder(self, client):
+        with patch("app.routers.stairs.get_pool", AsyncMock(return_value=_pool([_stair(ROOT)]))), \
+             patch("fastapi.routing.jsonable_encoder", side_effect=AssertionError("slow path")):
+            r = client.get("/api/v1/stairs")
+        assert r.status_code == 200
+        assert r.json()[0]["id"] == ROOT
@@ -0,0 +1,123 @@
+"""Single-flight coalescing.
+
+Several members opening the same stair each paid for the same explanation,
+validation and regeneration. Identical concurrent requests now share one run.
+These pin that sharing, that every caller gets its own copy, and the
+cancellation rules: a leader that disconnects leaves the followers their
+answer, and work nobody is waiting for any more is stopped.
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+from app.agents.base_agent import BaseAgent
+from app.agents.orchestrator import Orchestrator
+from app.governor import current_org
+from app.singleflight import SingleFlight, key
+
+
+def _slow(result, calls, seconds=0.05):
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(seconds)
+        return result
+    return fn
+
+
+class TestSingleFlight:
+    async def test_concurrent_callers_share_one_run(self):
+        flight, calls = SingleFlight("t"), []
+        a, b = await asyncio.gather(flight.do("k", _slow({"text": "x"}, calls)),
+                                    flight.do("k", _slow({"text": "x"}, calls)))
+        assert len(calls) == 1
+        assert a == b and a is not b
+        assert flight.metrics["followers"] == 1 and flight.in_flight() == 0
+
+    async def test_different_keys_run_separately(self):
+        flight, calls = SingleFlight("t"), []
+        await asyncio.gather(flight.do("a", _slow(1, calls)), flight.do("b", _slow(2, calls)))
+        assert len(calls) == 2
+
+    async def test_a_leader_that_leaves_does_not_fail_the_followers(self):
+        flight, calls = SingleFlight("t"), []
+        leader = asyncio.create_task(flight.do("k", _slow("answer", calls)))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do("k", _slow("answer", calls)))
+        await asyncio.sleep(0)
+        leader.cancel()
+        assert await follower == "answer"
+        assert leader.cancelled() and len(calls) == 1
+
+    async def test_work_nobody_waits_for_is_cancelled(self):
+        flight, calls = SingleFlight("t"), []
+        only = asyncio.create_task(flight.do("k", _slow("answer", calls, seconds=5)))
+        await asyncio.sleep(0.01)
+        only.cancel()
+        await asyncio.gather(only, return_exceptions=True)
+        assert flight.metrics["abandoned"] == 1 and flight.in_flight() == 0
+        assert await flight.do("k", _slow("fresh", calls)) == "fresh"
+
+    async def test_an_error_reaches_every_waiter(self):
+        flight = SingleFlight("t")
+
+        async def boom():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("down")
+
+        results = await asyncio.gather(flight.do("k", boom), flight.do("k", boom), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+    def test_keys_ignore_whitespace_but_not_content(self):
+        assert key("explain", {"title": "Grow  ARR\n"}) == key("explain", {"title": "Grow ARR"})
+        assert key("explain", {"title": "Grow ARR"}) != key("explain", {"title": "Grow NRR"})
+
+
+class TestCallSites:
+    async def test_agent_calls_coalesce_into_one_provider_call_and_one_log_row(self):
+        async def provider(**kwargs):
+            await asyncio.sleep(0.05)
+            return {"text": "guide", "tokens": 40, "provider": "claude", "ok": True, "error_kind": None}
+
+        ai = AsyncMock(side_effect=provider)
+        agent = BaseAgent()
+        messages = [{"role": "user", "content": "Explain KR-001"}]
+        with patch("app.agents.base_agent.call_ai_with_fallback", ai), \
+             patch("app.agents.base_agent.telemetry.writer.record") as record:
+            results = await asyncio.gather(*(agent.call(messages, task_type="explain_action") for _ in range(3)))
+        assert ai.await_count == 1 and record.call_count == 1
+        assert all(r["text"] == "guide" for r in results)
+
+    async def test_orchestrator_requests_coalesce(self):
+        async def run(*args):
+            await asyncio.sleep(0.05)
+            return {"text": "plan", "ok": True}
+
+        orch = Orchestrator()
+        with patch.object(Orchestrator, "_process", AsyncMock(side_effect=run)) as process:
+            payload = {"action": "Launch pilot"}
+            results = await asyncio.gather(
+                orch.process("explain_action", payload=payload, strategy_context={"strategy_id": None}),
+                orch.process("explain_action", payload=dict(payload), strategy_context={"strategy_id": None}),
+            )
+        assert process.await_count == 1
+        results[0]["validation"] = "mine"
+        assert "validation" not in results[1]
+
+    async def test_identical_requests_from_different_orgs_do_not_share(self):
+        async def run(*args):
+            await asyncio.sleep(0.05)
+            return {"text": "questionnaire", "ok": True}
+
+        async def as_org(org, call):
+            current_org.set(org)
+            return await call()
+
+        orch, agent = Orchestrator(), BaseAgent()
+        messages = [{"role": "user", "content": "Generate a questionnaire"}]
+        with patch.object(Orchestrator, "_process", AsyncMock(side_effect=run)) as process, \
+             patch.object(BaseAgent, "_call", AsyncMock(side_effect=run)) as call:
+            await asyncio.gather(*(as_org(org, lambda: orch.process("generate_questionnaire", payload={}))
+                                   for org in ("org-a", "org-b", "org-b")))
+            await asyncio.gather(*(as_org(org, lambda: agent.call(messages)) for org in ("org-a", "org-b")))
+        assert process.await_count == 2
+        assert call.await_count == 2
@@ -0,0 +1,136 @@
+"""Telemetry writer.
+
+agent_logs, ai_usage_logs and auto-logged sources were each an inline pool
+checkout and INSERT (two of them behind an information_schema query) on the
+request path. They are now buffered and written in batches in the
+background. These pin the batching, the bounded buffer, the isolation of a
+bad row, and the flush on shutdown.
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+import app.telemetry as telemetry
+from app.telemetry import TelemetryWriter
+
+
+@pytest.fixture
+def conn(conn):
+    conn.fetchval.return_value = True
+    return conn
+
+
+def _usage_row(n):
+    return (f"id-{n}", "claude", True, 120, 300, 200, False, None, None)
+
+
+class TestBatching:
+    async def test_one_checkout_and_one_executemany_per_table(self, pool, conn):
+        writer = TelemetryWriter()
+        for n in range(3):
+            writer.record("ai_usage_logs", _usage_row(n))
+        writer.record("agent_logs", ("id", None, "advisor", "chat", "", "", 0, "Claude", None, True))
+        with patch("app.telemetry.get_pool", AsyncMock(return_value=pool)):
+            await writer.flush()
+        assert pool.acquire.call_count == 1
+        assert conn.executemany.await_count == 2
+        tables = {call.args[0].split()[2]: len(call.args[1]) for call in conn.executemany.await_args_list}
+        assert tables == {"ai_usage_logs": 3, "agent_logs": 1}
+        assert writer.metrics["written"] == 4
+
+    async def test_a_full_batch_wakes_the_writer_early(self, pool, conn, monkeypatch):
+        monkeypatch.setattr(telemetry, "TELEMETRY_BATCH_SIZE", 2)
+        monkeypatch.setattr(telemetry, "TELEMETRY_FLUSH_INTERVAL_SECONDS", 60)
+        writer = TelemetryWriter()
+        with patch("app.telemetry.get_pool", AsyncMock(return_value=pool)):
+            await writer.start()
+            writer.record("ai_usage_logs", _usage_row(1))
+            writer.record("ai_usage_logs", _usage_row(2))
+            for _ in range(20):
+                await asyncio.sleep(0)
+            await writer.stop()
+        assert conn.executemany.await_count == 1
+
+    async def test_stop_flushes_what_is_left(self, pool, conn):
+        writer = TelemetryWriter()
+        with patch("app.telemetry.get_pool", AsyncMock(return_value=pool)):
+            await writer.start()
+            writer.record("ai_usage_logs", _usage_row(1))
+            await writer.stop()
+        assert writer.metrics["written"] == 1
+        assert writer.stats()["pending"] == 0
+
+    async def test_stop_waits_for_a_flush_in_progress(self, pool, conn, monkeypatch):
+        monkeypatch.setattr(telemetry, "TELEMETRY_BATCH_SIZE", 1)
+        release = asyncio.Event()
+
+        async def slow_executemany(sql, rows):
+            await release.wait()
+
+        conn.executemany.side_effect = slow_executemany
+        writer = TelemetryWriter()
+        with patch("app.telemetry.get_pool", AsyncMock(return_value=pool)):
+            await writer.start()
+            writer.record("ai_usage_logs", _usage_row(1))
+            for _ in range(20):
+                await asyncio.sleep(0)
+            assert conn.executemany.await_count == 1
+            stopping = asyncio.create_task(writer.stop())
+            await asyncio.sleep(0)
+            release.set()
+            await stopping
+        assert writer.metrics["written"] == 1
+        assert writer.metrics["failed"] == 0
+
+
+class TestOverload:
+    async def test_rows_past_the_bound_are_dropped_and_counted(self, monkeypatch):
+        monkeypatch.setattr(telemetry, "TELEMETRY_MAX_PENDING", 2)
+        writer = TelemetryWriter()
+        results = [writer.record("ai_usage_logs", _usage_row(n)) for n in range(4)]
+        assert results == [True, True, False, False]
+        assert writer.metrics["dropped"] == 2
+
+    async def test_drops_are_logged_once_per_interval(self, monkeypatch, caplog):
+        monkeypatch.setattr(telemetry, "TELEMETRY_MAX_PENDING", 1)
+        writer = TelemetryWriter()
+        with caplog.at_level("WARNING", logger="stairs.telemetry"):
+            for n in range(5):
+                writer.record("ai_usage_logs", _usage_row(n))
+        assert [r.getMessage() for r in caplog.records if "buffer full" in r.getMessage()] == [
+            "Telemetry buffer full at 1 row(s) — dropping new rows (1 dropped so far)"]
+
+    async def test_one_bad_row_loses_only_itself(self, pool, conn):
+        conn.executemany.side_effect = ValueError("invalid input syntax for type uuid")
+        conn.execute.side_effect = [None, ValueError("invalid input syntax for type uuid"), None]
+        writer = TelemetryWriter()
+        for n in range(3):
+            writer.record("ai_usage_logs", _usage_row(n))
+        with patch("app.telemetry.get_pool", AsyncMock(return_value=pool)):
+            await writer.flush()
+        assert writer.metrics["written"] == 2
+        assert writer.metrics["failed"] == 1
+
+    async def test_a_missing_table_discards_its_rows_without_raising(self, pool, conn):
+        conn.fetchval.return_value = False
+        writer = TelemetryWriter()
+        writer.record("strategy_sources", ("id", "s1", "ai_chat", "text", "{}", None, None))
+        with patch("app.telemetry.get_pool", AsyncMock(return_value=pool)):
+            await writer.flush()
+        conn.executemany.assert_not_awaited()
+        assert writer.metrics["failed"] == 1
+
+
+class TestCallersOnlyQueue:
+    async def test_log_ai_usage_and_log_source_do_not_touch_the_pool(self, monkeypatch):
+        from app.routers.ai import _log_ai_usage
+        from app.routers.sources import log_source
+        writer = TelemetryWriter()
+        monkeypatch.setattr(telemetry, "writer", writer)
+        with patch("app.telemetry.get_pool", AsyncMock(side_effect=AssertionError("inline write"))), \
+             patch("app.routers.sources.get_pool", AsyncMock(side_effect=AssertionError("inline write"))):
+            await _log_ai_usage("claude", True, 120, 300, 200)
+            await log_source("s1", "ai_chat", "text", {"k": "v"}, "u1")
+        assert [t for t, _ in writer._buffer] == ["ai_usage_logs", "strategy_sources"]
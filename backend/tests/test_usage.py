@@ -0,0 +1,203 @@
+"""Per-organization token accounting and quotas.
+
+Nothing added AI usage up per tenant, so one organization's script could
+spend the provider budget for everyone. app/usage.py counts tokens in
+memory, flushes them into ai_usage_daily, and checks daily limits without
+a query. These pin the counting, the flush and its recovery, the quota
+envelope, and the admin report.
+"""
+
+import asyncio
+from datetime import date
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import ai_providers, usage
+from app.governor import current_org
+from app.helpers import DEFAULT_ORG_ID, DEFAULT_USER_ID, AuthContext, get_auth
+from app.main import app
+from app.usage import HARD, OK, SOFT, UsageMeter
+
+ORG = "a0000000-0000-0000-0000-000000000001"
+TODAY = date(2026, 3, 1)
+
+
+@pytest.fixture
+def conn(conn):
+    conn.fetch.return_value = []
+    return conn
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(usage, "AI_DAILY_TOKEN_SOFT_LIMIT", 100)
+    monkeypatch.setattr(usage, "AI_DAILY_TOKEN_HARD_LIMIT", 200)
+
+
+class TestQuota:
+    def test_no_limits_means_ok(self):
+        m = UsageMeter(lambda: TODAY)
+        m.record(ORG, "advisor_chat", 10_000, 10_000)
+        assert m.check(ORG) == OK
+
+    def test_soft_then_hard(self, limits):
+        m = UsageMeter(lambda: TODAY)
+        m.record(ORG, "advisor_chat", 60, 40)
+        assert m.check(ORG) == SOFT
+        m.record(ORG, "advisor_chat", 60, 40)
+        assert m.check(ORG) == HARD
+        assert m.metrics["rejected"] == 1
+
+    def test_calls_without_an_org_are_never_limited(self, limits):
+        m = UsageMeter(lambda: TODAY)
+        m.record("", "chat", 500, 500)
+        assert m.check("") == OK
+
+    def test_org_settings_override_the_defaults(self, limits):
+        m = UsageMeter(lambda: TODAY)
+        m._limits = {ORG: (None, 50)}
+        m.record(ORG, "advisor_chat", 30, 30)
+        assert m.check(ORG) == HARD
+        assert m.limits(ORG) == (100, 50)
+
+    def test_a_new_day_starts_from_zero(self, limits):
+        day = [TODAY]
+        m = UsageMeter(lambda: day[0])
+        m.record(ORG, "advisor_chat", 150, 100)
+        assert m.check(ORG) == HARD
+        day[0] = date(2026, 3, 2)
+        assert m.check(ORG) == OK
+
+
+class TestFlush:
+    async def test_one_upsert_then_totals_from_every_worker(self, pool, conn):
+        m = UsageMeter(lambda: TODAY)
+        m.record(ORG, "advisor_chat", 10, 5)
+        m.record(ORG, "advisor_chat", 20, 5)
+        m.record(ORG, "validate_output", 3, 1)
+        m.record("", "chat", 7, 7)
+        conn.fetch.side_effect = [[{"org": ORG, "tokens": 500}], [{"org": ORG, "soft": None, "hard": "400"}]]
+        with patch("app.usage.get_pool", AsyncMock(return_value=pool)):
+            await m.flush()
+        assert conn.executemany.await_count == 1
+        rows = sorted(conn.executemany.await_args.args[1])
+        assert rows == [(ORG, TODAY, "advisor_chat", 30, 10, 2), (ORG, TODAY, "validate_output", 3, 1, 1)]
+        assert m.used(ORG) == 500
+        assert m.check(ORG) == HARD
+
+    async def test_a_failed_flush_keeps_the_counts(self, pool, conn):
+        m = UsageMeter(lambda: TODAY)
+        m.record(ORG, "advisor_chat", 10, 5)
+        conn.executemany.side_effect = RuntimeError("down")
+        with patch("app.usage.get_pool", AsyncMock(return_value=pool)), pytest.raises(RuntimeError):
+            await m.flush()
+        assert m.used(ORG) == 15
+        assert m._pending[(ORG, TODAY, "advisor_chat")] == [10, 5, 1]
+
+    async def test_a_failed_read_after_the_upsert_rolls_back_and_keeps_the_counts(self, pool, conn):
+        m = UsageMeter(lambda: TODAY)
+        m.record(ORG, "advisor_chat", 10, 5)
+        conn.fetch.side_effect = RuntimeError("connection lost")
+        with patch("app.usage.get_pool", AsyncMock(return_value=pool)), pytest.raises(RuntimeError):
+            await m.flush()
+        conn.executemany.assert_awaited_once()
+        tx = conn.transaction.return_value
+        assert tx.__aexit__.await_args.args[0] is RuntimeError  # the upsert is rolled back with it
+        assert m._pending[(ORG, TODAY, "advisor_chat")] == [10, 5, 1]
+
+        conn.fetch.side_effect = [[{"org": ORG, "tokens": 15}], []]
+        with patch("app.usage.get_pool", AsyncMock(return_value=pool)):
+            await m.flush()
+        assert conn.executemany.await_args.args[1] == [(ORG, TODAY, "advisor_chat", 10, 5, 1)]
+        assert m.used(ORG) == 15
+
+    async def test_a_malformed_org_limit_falls_back_to_the_default(self, pool, conn, limits):
+        m = UsageMeter(lambda: TODAY)
+        conn.fetch.side_effect = [[], [{"org": ORG, "soft": "5e5", "hard": "lots"},
+                                       {"org": "org-2", "soft": "-1", "hard": "100000.0"}]]
+        with patch("app.usage.get_pool", AsyncMock(return_value=pool)):
+            await m.flush()
+        assert m.limits(ORG) == (500_000, 200)
+        assert m.limits("org-2") == (100, 100_000)
+
+    async def test_stop_waits_for_a_flush_in_progress(self, pool, conn, monkeypatch):
+        monkeypatch.setattr(usage, "AI_USAGE_FLUSH_SECONDS", 0)
+        release = asyncio.Event()
+
+        async def slow_executemany(sql, rows):
+            await release.wait()
+
+        conn.executemany.side_effect = slow_executemany
+        m = UsageMeter(lambda: TODAY)
+        m.record(ORG, "advisor_chat", 10, 5)
+        with patch("app.usage.get_pool", AsyncMock(return_value=pool)):
+            await m.start()
+            for _ in range(20):
+                await asyncio.sleep(0)
+            assert conn.executemany.await_count == 1
+            stopping = asyncio.create_task(m.stop())
+            await asyncio.sleep(0)
+            release.set()
+            await stopping
+        assert conn.executemany.await_count == 1
+        assert not m._pending
+        assert m.metrics == {**m.metrics, "flushes": 1, "failed": 0}
+
+
+class TestProviderPath:
+    @pytest.fixture
+    def openai_only(self, monkeypatch):
+        monkeypatch.setattr(ai_providers, "ANTHROPIC_API_KEY", "")
+        monkeypatch.setattr(ai_providers, "OPENAI_API_KEY", "sk-test")
+        monkeypatch.setattr(ai_providers, "GOOGLE_API_KEY", "")
+        openai = AsyncMock(return_value=(True, "ok", 30, 200, 8))
+        monkeypatch.setitem(ai_providers._PROVIDER_CALLERS, ai_providers.PROVIDER_OPENAI, openai)
+        for b in ai_providers._breakers.values():
+            b.reset()
+        meter = UsageMeter()
+        monkeypatch.setattr(ai_providers, "meter", meter)
+        token = current_org.set(ORG)
+        yield openai, meter
+        current_org.reset(token)
+
+    async def _call(self):
+        return await ai_providers.call_ai_with_fallback(
+            messages=[{"role": "user", "content": "hi"}], system="s", task_type="advisor_chat")
+
+    async def test_success_is_counted_against_the_org(self, openai_only):
+        _, meter = openai_only
+        result = await self._call()
+        assert result["ok"] is True
+        assert meter._pending[(ORG, meter._day, "advisor_chat")] == [22, 8, 1]
+
+    async def test_over_the_hard_limit_answers_quota_without_a_provider(self, openai_only, limits):
+        openai, meter = openai_only
+        meter.record(ORG, "advisor_chat", 150, 50)
+        result = await self._call()
+        assert result["ok"] is False
+        assert result["error_kind"] == "quota"
+        openai.assert_not_awaited()
+
+
+class TestAdminReport:
+    def test_usage_per_day_for_the_callers_org(self, pool, conn):
+        app.dependency_overrides[get_auth] = lambda: AuthContext(DEFAULT_USER_ID, DEFAULT_ORG_ID, "admin")
+        conn.fetch.return_value = [
+            {"day": TODAY, "task_type": "advisor_chat", "input_tokens": 100, "output_tokens": 40, "calls": 3},
+            {"day": TODAY, "task_type": "validate_output", "input_tokens": 10, "output_tokens": 2, "calls": 1},
+        ]
+        try:
+            with patch("app.routers.admin.get_pool", AsyncMock(return_value=pool)):
+                r = TestClient(app).get("/api/v1/admin/ai-usage?days=7")
+        finally:
+            app.dependency_overrides.pop(get_auth, None)
+            from app.main import _rate_limit_store
+            _rate_limit_store.clear()
+        assert r.status_code == 200
+        body = r.json()
+        assert conn.fetch.await_args.args[1:] == (DEFAULT_ORG_ID, 7)
+        assert body["days"][0]["input_tokens"] == 110 and body["days"][0]["calls"] == 4
+        assert set(body["days"][0]["by_task"]) == {"advisor_chat", "validate_output"}
+        assert body["today"]["state"] == OK
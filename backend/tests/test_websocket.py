@@ -0,0 +1,343 @@
+"""Websocket fan-out.
+
+broadcast_to_org used to await send_json on every socket in turn, so one
+stalled browser held up the event for its whole organization and held up the
+HTTP write that produced it. These pin the replacement: a broadcast only
+queues, each socket drains on its own writer task, and a full queue is
+handled by a declared policy instead of by waiting.
+"""
+
+import asyncio
+import json
+from unittest.mock import patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.helpers import create_jwt
+import app.routers.websocket as websocket
+from app.routers.websocket import ConnectionManager, router as ws_router
+
+
+class FakeSocket:
+    """Records frames; `gate` makes send_text block until it is set."""
+
+    def __init__(self, gate: asyncio.Event = None):
+        self.sent = []
+        self.gate = gate
+        self.closed_with = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, frame):
+        if self.gate is not None:
+            await self.gate.wait()
+        self.sent.append(json.loads(frame))
+
+    async def close(self, code=1000, reason=""):
+        self.closed_with = code
+
+
+@pytest.fixture(autouse=True)
+def _no_coalescing(monkeypatch):
+    # Fan-out and overflow are about one frame per event; TestCoalescing turns
+    # the window back on.
+    monkeypatch.setattr(websocket, "WS_COALESCE_WINDOW_MS", 0)
+
+
+async def _settle():
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+
+class TestBroadcastDoesNotWait:
+    async def test_a_stalled_client_does_not_delay_the_others(self):
+        mgr = ConnectionManager()
+        stalled, healthy = FakeSocket(gate=asyncio.Event()), FakeSocket()
+        await mgr.connect(stalled, "org-1", "u-1")
+        await mgr.connect(healthy, "org-1", "u-2")
+
+        await asyncio.wait_for(mgr.broadcast_to_org("org-1", {"event": "stair_updated"}), timeout=0.5)
+        await _settle()
+
+        assert healthy.sent == [{"event": "stair_updated", "seq": 1}]
+        assert stalled.sent == []
+        stalled.gate.set()
+        await _settle()
+        assert stalled.sent == [{"event": "stair_updated", "seq": 1}]
+
+    async def test_serialised_once_per_broadcast(self, monkeypatch):
+        mgr = ConnectionManager()
+        for i in range(5):
+            await mgr.connect(FakeSocket(), "org-1", f"u-{i}")
+        calls = []
+        real = websocket.serialize
+        monkeypatch.setattr(websocket, "serialize", lambda m: calls.append(m) or real(m))
+        await mgr.broadcast_to_org("org-1", {"event": "kpi_logged"})
+        assert len(calls) == 1
+
+    async def test_other_organizations_hear_nothing(self):
+        mgr = ConnectionManager()
+        mine, theirs = FakeSocket(), FakeSocket()
+        await mgr.connect(mine, "org-1", "u-1")
+        await mgr.connect(theirs, "org-2", "u-2")
+        await mgr.broadcast_to_org("org-1", {"event": "stair_deleted"})
+        await _settle()
+        assert mine.sent and not theirs.sent
+
+
+class TestOverflow:
+    async def test_drop_oldest_keeps_the_newest_frames(self, monkeypatch):
+        monkeypatch.setattr(websocket, "WS_SEND_QUEUE_SIZE", 2)
+        monkeypatch.setattr(websocket, "WS_OVERFLOW_POLICY", "drop_oldest")
+        mgr = ConnectionManager()
+        sock = FakeSocket(gate=asyncio.Event())
+        await mgr.connect(sock, "org-1", "u-1")
+        await _settle()  # writer is now parked on the gate
+
+        await mgr.broadcast_to_org("org-1", {"n": 0})
+        await _settle()  # the writer takes n=0 and blocks sending it
+        for n in range(1, 6):
+            await mgr.broadcast_to_org("org-1", {"n": n})
+        assert mgr.metrics["frames_dropped"] == 3
+
+        sock.gate.set()
+        await _settle()
+        assert [f["n"] for f in sock.sent] == [0, 4, 5]
+
+    async def test_disconnect_policy_cuts_off_the_slow_consumer(self, monkeypatch):
+        monkeypatch.setattr(websocket, "WS_SEND_QUEUE_SIZE", 1)
+        monkeypatch.setattr(websocket, "WS_OVERFLOW_POLICY", "disconnect")
+        mgr = ConnectionManager()
+        slow, fine = FakeSocket(gate=asyncio.Event()), FakeSocket()
+        await mgr.connect(slow, "org-1", "u-1")
+        await mgr.connect(fine, "org-1", "u-2")
+        await _settle()
+
+        for n in range(3):
+            await mgr.broadcast_to_org("org-1", {"n": n})
+            await _settle()
+
+        assert mgr.metrics["slow_consumers_disconnected"] == 1
+        assert slow.closed_with == 1013
+        assert "u-1" not in mgr.connections["org-1"]
+        assert [f["n"] for f in fine.sent] == [0, 1, 2]
+
+    async def test_a_send_error_removes_the_connection(self):
+        class Broken(FakeSocket):
+            async def send_text(self, frame):
+                raise RuntimeError("socket gone")
+
+        mgr = ConnectionManager()
+        await mgr.connect(Broken(), "org-1", "u-1")
+        await mgr.broadcast_to_org("org-1", {"event": "x"})
+        await _settle()
+        assert mgr.metrics["send_errors"] == 1
+        assert "org-1" not in mgr.connections
+
+
+class TestCoalescing:
+    @pytest.fixture(autouse=True)
+    def _window(self, monkeypatch):
+        monkeypatch.setattr(websocket, "WS_COALESCE_WINDOW_MS", 10)
+
+    async def test_a_burst_becomes_one_batched_frame(self):
+        mgr = ConnectionManager()
+        sock = FakeSocket()
+        await mgr.connect(sock, "org-1", "u-1")
+        await mgr.broadcast_to_org("org-1", {"event": "stair_updated", "data": {"id": "s1", "changes": ["title"]}})
+        await mgr.broadcast_to_org("org-1", {"event": "progress_logged", "data": {"stair_id": "s2", "progress": 10}})
+        await mgr.broadcast_to_org("org-1", {"event": "stair_updated", "data": {"id": "s1", "changes": ["status", "title"]}})
+        await mgr.broadcast_to_org("org-1", {"event": "progress_logged", "data": {"stair_id": "s2", "progress": 20}})
+        await _settle()
+        assert sock.sent == []
+        await asyncio.sleep(0.03)
+        await _settle()
+
+        assert len(sock.sent) == 1
+        frame = sock.sent[0]
+        assert frame["event"] == "batch"
+        assert frame["data"]["events"] == [
+            {"event": "stair_updated", "data": {"id": "s1", "changes": ["title", "status"]}, "seq": 3},
+            {"event": "progress_logged", "data": {"stair_id": "s2", "progress": 20}, "seq": 4},
+        ]
+        assert mgr.metrics["events_coalesced"] == 2
+
+    async def test_a_lone_event_is_sent_unwrapped(self):
+        mgr = ConnectionManager()
+        sock = FakeSocket()
+        await mgr.connect(sock, "org-1", "u-1")
+        await mgr.broadcast_to_org("org-1", {"event": "stair_deleted", "data": {"id": "s1"}})
+        await asyncio.sleep(0.03)
+        await _settle()
+        assert sock.sent == [{"event": "stair_deleted", "data": {"id": "s1"}, "seq": 1}]
+
+    async def test_distinct_events_are_all_kept_in_order(self):
+        events = [
+            {"event": "stair_created", "data": {"id": "a"}},
+            {"event": "stair_updated", "data": {"id": "a", "changes": ["title"]}},
+            {"event": "stair_updated", "data": {"id": "b", "changes": ["title"]}},
+            {"event": "stair_created", "data": {"id": "a"}},
+        ]
+        assert websocket.coalesce(events) == events[1:]
+
+    async def test_a_full_window_flushes_early(self, monkeypatch):
+        monkeypatch.setattr(websocket, "WS_COALESCE_MAX_EVENTS", 3)
+        mgr = ConnectionManager()
+        sock = FakeSocket()
+        await mgr.connect(sock, "org-1", "u-1")
+        for n in range(3):
+            await mgr.broadcast_to_org("org-1", {"event": "kpi_logged", "data": {"stair_id": f"s{n}"}})
+        await _settle()
+        assert len(sock.sent[0]["data"]["events"]) == 3
+        assert not mgr._timers
+
+
+class TestReplay:
+    async def _publish(self, mgr, count, org="org-1"):
+        for n in range(count):
+            await mgr.broadcast_to_org(org, {"event": "kpi_logged", "data": {"stair_id": f"s{n}"}})
+
+    async def test_events_are_numbered_per_org(self):
+        mgr = ConnectionManager()
+        await self._publish(mgr, 3)
+        await self._publish(mgr, 2, org="org-2")
+        assert await mgr.cursor("org-1") == 3
+        assert await mgr.cursor("org-2") == 2
+
+    async def test_replay_returns_only_what_was_missed(self):
+        mgr = ConnectionManager()
+        await self._publish(mgr, 5)
+        missed = await mgr.replay("org-1", 3)
+        assert [m["seq"] for m in missed] == [4, 5]
+        assert await mgr.replay("org-1", 5) == []
+
+    async def test_a_cursor_older_than_the_buffer_needs_a_resync(self, monkeypatch):
+        monkeypatch.setattr(websocket, "WS_REPLAY_BUFFER", 3)
+        mgr = ConnectionManager()
+        await self._publish(mgr, 6)
+        assert await mgr.replay("org-1", 1) is None
+        assert [m["seq"] for m in await mgr.replay("org-1", 3)] == [4, 5, 6]
+
+    async def test_a_cursor_from_the_future_needs_a_resync(self):
+        mgr = ConnectionManager()
+        await self._publish(mgr, 2)
+        assert await mgr.replay("org-1", 40) is None
+
+    async def test_held_frames_wait_for_the_replay_and_skip_what_it_covered(self):
+        mgr = ConnectionManager()
+        sock = FakeSocket()
+        conn = await mgr.connect(sock, "org-1", "u-1", hold=True)
+        await self._publish(mgr, 3)
+        await _settle()
+        assert sock.sent == []
+        conn.send({"event": "batch", "data": {"replay": True}})
+        conn.resume(floor=2)
+        await _settle()
+        assert [f.get("seq") for f in sock.sent] == [None, 3]
+
+    async def test_a_batch_straddling_the_cursor_sends_only_what_was_missed(self, monkeypatch):
+        monkeypatch.setattr(websocket, "WS_COALESCE_WINDOW_MS", 10_000)
+        monkeypatch.setattr(websocket, "WS_COALESCE_MAX_EVENTS", 4)
+        mgr = ConnectionManager()
+        sock = FakeSocket()
+        conn = await mgr.connect(sock, "org-1", "u-1", hold=True)
+        await self._publish(mgr, 4)  # one batch, seq 1..4
+        conn.resume(floor=2)
+        await self._publish(mgr, 1)
+        mgr._flush("org-1")
+        await _settle()
+        batch, single = sock.sent
+        assert [e["seq"] for e in batch["data"]["events"]] == [3, 4]
+        assert single["seq"] == 5
+
+    async def test_a_live_batch_after_resume_skips_replayed_events(self, monkeypatch):
+        monkeypatch.setattr(websocket, "WS_COALESCE_WINDOW_MS", 10_000)
+        monkeypatch.setattr(websocket, "WS_COALESCE_MAX_EVENTS", 3)
+        mgr = ConnectionManager()
+        sock = FakeSocket()
+        conn = await mgr.connect(sock, "org-1", "u-1", hold=True)
+        await self._publish(mgr, 2)  # still in the window when the replay ends
+        conn.resume(floor=2)
+        await self._publish(mgr, 1)
+        await _settle()
+        assert [f["seq"] for f in sock.sent] == [3]
+
+    def test_reconnect_with_since_replays_the_gap(self):
+        app = FastAPI()
+        app.include_router(ws_router)
+        mgr = ConnectionManager()
+        for n in range(1, 5):
+            mgr._seq["org-1"] = n
+            mgr._history.setdefault("org-1", websocket.deque()).append({"event": "kpi_logged", "seq": n})
+        token = create_jwt("u-1", "org-1", "member")
+        with patch.object(websocket, "ws_manager", mgr):
+            with TestClient(app).websocket_connect(f"/ws/org-1/u-1?token={token}&since=2") as ws:
+                hello = ws.receive_json()
+                assert hello["event"] == "connected" and hello["data"]["seq"] == 4
+                replay = ws.receive_json()
+                assert replay["event"] == "batch" and replay["data"]["replay"] is True
+                assert [e["seq"] for e in replay["data"]["events"]] == [3, 4]
+
+    def test_reconnect_with_a_stale_cursor_is_told_to_resync(self):
+        app = FastAPI()
+        app.include_router(ws_router)
+        token = create_jwt("u-1", "org-1", "member")
+        with patch.object(websocket, "ws_manager", ConnectionManager()):
+            with TestClient(app).websocket_connect(f"/ws/org-1/u-1?token={token}&since=9") as ws:
+                assert ws.receive_json()["event"] == "connected"
+                assert ws.receive_json() == {"event": "resync_required", "data": {"seq": 0}}
+
+
+class TestStats:
+    async def test_gauges_report_connections_and_depth(self):
+        mgr = ConnectionManager()
+        await mgr.connect(FakeSocket(gate=asyncio.Event()), "org-1", "u-1")
+        await mgr.connect(FakeSocket(), "org-2", "u-2")
+        await _settle()
+        await mgr.broadcast_to_org("org-1", {"a": 1})
+        await _settle()  # in flight, blocked on the gate
+        await mgr.broadcast_to_org("org-1", {"a": 2})
+        stats = mgr.stats()
+        assert stats["connections"] == 2
+        assert stats["organizations"] == 2
+        assert stats["max_queue_depth"] == 1
+        assert stats["overflow_policy"] in websocket.OVERFLOW_POLICIES
+
+
+class TestEndpoint:
+    def test_handshake_and_ping_go_through_the_writer(self):
+        app = FastAPI()
+        app.include_router(ws_router)
+        token = create_jwt("u-1", "org-1", "member")
+        with TestClient(app).websocket_connect(f"/ws/org-1/u-1?token={token}") as ws:
+            assert ws.receive_json()["event"] == "connected"
+            ws.send_json({"event": "ping"})
+            assert ws.receive_json() == {"event": "pong"}
+
+    def test_org_mismatch_is_refused(self):
+        from starlette.websockets import WebSocketDisconnect
+        app = FastAPI()
+        app.include_router(ws_router)
+        token = create_jwt("u-1", "org-2", "member")
+        with pytest.raises(WebSocketDisconnect) as exc:
+            with TestClient(app).websocket_connect(f"/ws/org-1/u-1?token={token}") as ws:
+                ws.receive_json()
+        assert exc.value.code == 4003
+
+    def test_since_without_a_token_gets_no_history(self):
+        from starlette.websockets import WebSocketDisconnect
+        app = FastAPI()
+        app.include_router(ws_router)
+        mgr = ConnectionManager()
+        mgr._seq["org-1"] = 1
+        mgr._history["org-1"] = websocket.deque([{"event": "kpi_logged", "seq": 1}])
+        with patch.object(websocket, "ws_manager", mgr), patch.object(mgr, "replay") as replay:
+            with pytest.raises(WebSocketDisconnect) as exc:
+                with TestClient(app).websocket_connect("/ws/org-1/u-1?since=0") as ws:
+                    ws.receive_json()
+        assert exc.value.code == 4001
+        replay.assert_not_called()
+        assert not mgr.connections